@@ -31,11 +31,38 @@ class Config:
     UPLOAD_FOLDER = 'uploads'
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
     ALLOWED_EXTENSIONS = {'pdf', 'png', 'jpg', 'jpeg', 'docx'}
+    # Where uploaded documents are stored: 'cloud' (Firebase Storage) or 'local' (UPLOAD_FOLDER)
+    STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'cloud')
+    # Signed upload/download URLs: lifetime, and the local backend's signing key and stand-in server
+    SIGNED_URL_EXPIRES = int(os.getenv('SIGNED_URL_EXPIRES', 900))
+    STORAGE_SIGNING_SECRET = os.getenv('STORAGE_SIGNING_SECRET', SECRET_KEY)
+    LOCAL_STORAGE_URL = os.getenv('LOCAL_STORAGE_URL', 'http://localhost:5001')
+    # nginx internal location mapped to UPLOAD_FOLDER (e.g. /protected-uploads/); when set, local
+    # document downloads are handed to nginx with X-Accel-Redirect instead of being sent by the app
+    DOCUMENT_ACCEL_REDIRECT = os.getenv('DOCUMENT_ACCEL_REDIRECT', '')
+    # Bytes of documents each user may store (0: no limit)
+    DOCUMENT_QUOTA_BYTES = int(os.getenv('DOCUMENT_QUOTA_BYTES', 100 * 1024 * 1024))
+    # Storage GC: files newer than this are never orphans, and orphans stay quarantined this long
+    STORAGE_GC_MIN_AGE_HOURS = float(os.getenv('STORAGE_GC_MIN_AGE_HOURS', 24))
+    STORAGE_GC_QUARANTINE_DAYS = float(os.getenv('STORAGE_GC_QUARANTINE_DAYS', 7))
+    # Longest date window an earliest-availability search may cover
+    AVAILABILITY_SEARCH_DAYS = int(os.getenv('AVAILABILITY_SEARCH_DAYS', 90))
+    # Background document processing: I/O threads, and processes for image/PDF work (0: in the threads)
+    DOCUMENT_PROCESSING_WORKERS = int(os.getenv('DOCUMENT_PROCESSING_WORKERS', 4))
+    DOCUMENT_PROCESSING_PROCESSES = int(os.getenv('DOCUMENT_PROCESSING_PROCESSES', os.cpu_count() or 1))
     
     # Server Configuration
     HOST = os.getenv('HOST', '0.0.0.0')
     PORT = int(os.getenv('PORT', 5000))
     
+    # Serve booking/analytics endpoints through asyncio views on one shared event loop
+    ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', 'false').lower() == 'true'
+    
+    # Health Probe Configuration (seconds)
+    HEALTH_PROBE_ENABLED = os.getenv('HEALTH_PROBE_ENABLED', 'true').lower() == 'true'
+    HEALTH_PROBE_INTERVAL = int(os.getenv('HEALTH_PROBE_INTERVAL', 15))
+    HEALTH_PROBE_TIMEOUT = int(os.getenv('HEALTH_PROBE_TIMEOUT', 5))
+    
     # CORS Configuration
     CORS_ORIGINS = os.getenv('CORS_ORIGINS', '*').split(',')
     
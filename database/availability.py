@@ -0,0 +1,217 @@
+"""
+Slot Availability Index
+Earliest free appointment slots, answered from memory
+
+Finding a free slot used to take one Firestore query per department per
+day. The index keeps, per department, every available slot sorted by
+(date, start time). It is filled from the time slot listeners' initial
+snapshots and kept current by their change events: a slot is in the
+index exactly while its availability is 'available'. The listeners are
+scoped to slots from today on. An earliest-slot search is then a binary
+search to the start of the window and a walk to its end, merged across
+departments.
+"""
+
+import bisect
+import heapq
+import itertools
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from database.change_dispatch import OverflowPolicy
+from database.change_feed import ChangeEvent, ChangeFeedHub, ChangeType, get_change_feed
+from database.schema import DEPARTMENT_COLLECTIONS
+
+logger = logging.getLogger(__name__)
+
+AVAILABLE = 'available'
+# Fields of a slot document kept in the index and returned by searches
+SLOT_FIELDS = ('date', 'startTime', 'endTime', 'capacity')
+
+# (date 'YYYY-MM-DD', start time 'HH:MM', slot id): sorts chronologically, ties by id
+SlotKey = Tuple[str, str, str]
+
+def upcoming_slots(collection):
+    """Scope a time slot collection to today and later; dates are stored as YYYY-MM-DD strings"""
+    return collection.where('date', '>=', datetime.now().strftime('%Y-%m-%d'))
+
+class _DepartmentSlots:
+    """Available slots of one department, in key order"""
+    
+    def __init__(self):
+        self.keys: List[SlotKey] = []
+        self.slots: Dict[str, Tuple[SlotKey, Dict[str, Any]]] = {}
+    
+    def put(self, slot_id: str, key: SlotKey, slot: Dict[str, Any]):
+        self.remove(slot_id)
+        bisect.insort(self.keys, key)
+        self.slots[slot_id] = (key, slot)
+    
+    def remove(self, slot_id: str):
+        entry = self.slots.pop(slot_id, None)
+        if entry is not None:
+            index = bisect.bisect_left(self.keys, entry[0])
+            del self.keys[index]
+    
+    def prune(self, before_date: str) -> int:
+        """Drop slots on days before before_date"""
+        end = bisect.bisect_left(self.keys, (before_date,))
+        for _, _, slot_id in self.keys[:end]:
+            del self.slots[slot_id]
+        del self.keys[:end]
+        return end
+    
+    def window(self, start: Tuple[str, str], end_date: str, limit: int) -> List[Dict[str, Any]]:
+        """Up to limit slots from start (date, time) through end_date"""
+        index = bisect.bisect_left(self.keys, start)
+        found = []
+        for key in itertools.islice(self.keys, index, None):
+            if key[0] > end_date or len(found) >= limit:
+                break
+            found.append(self.slots[key[2]][1])
+        return found
+
+class AvailabilityIndex:
+    """Per-department sorted index of available time slots, fed by the change feed"""
+    
+    def __init__(self, hub: Optional[ChangeFeedHub] = None):
+        self._hub = hub
+        self._departments = {department: _DepartmentSlots() for department in DEPARTMENT_COLLECTIONS}
+        self._collections = {slots: department for department, (slots, _) in DEPARTMENT_COLLECTIONS.items()}
+        self._subscriptions = []
+        # Initial events applied per collection, and collections whose initial snapshot is fully applied
+        self._initial_applied = dict.fromkeys(self._collections, 0)
+        self._loaded = set()
+        self._lock = threading.Lock()
+        # Serialises start/stop; _lock stays free while subscribing, as a replay to a running feed applies events
+        self._start_lock = threading.Lock()
+        self._pruned_before = ''
+        self.counts = {'events': 0, 'searches': 0, 'pruned': 0}
+    
+    @property
+    def hub(self) -> ChangeFeedHub:
+        if self._hub is None:
+            self._hub = get_change_feed()
+        return self._hub
+    
+    def start(self):
+        """Subscribe to every department's upcoming time slots; the first snapshot fills the index"""
+        with self._start_lock:
+            if self._subscriptions:
+                return
+            for collection in self._collections:
+                self.hub.set_scope(collection, upcoming_slots)
+            subscriptions = [
+                # A lost change would leave a slot wrongly listed (or missing) until its next write
+                self.hub.subscribe(collection, self.apply, include_initial=True, name=f"{collection}_availability_index",
+                                   overflow=OverflowPolicy.BLOCK)
+                for collection in self._collections
+            ]
+            with self._lock:
+                self._subscriptions = subscriptions
+    
+    def stop(self):
+        with self._start_lock:
+            with self._lock:
+                subscriptions, self._subscriptions = self._subscriptions, []
+            for subscription in subscriptions:
+                subscription.unsubscribe()
+            with self._lock:
+                for slots in self._departments.values():
+                    slots.keys.clear()
+                    slots.slots.clear()
+                self._initial_applied = dict.fromkeys(self._collections, 0)
+                self._loaded.clear()
+    
+    @property
+    def ready(self) -> bool:
+        """Whether every department's initial snapshot has been applied, not just received"""
+        with self._lock:
+            for subscription in self._subscriptions:
+                expected = subscription.initial_events
+                if expected is not None and self._initial_applied[subscription.collection] >= expected:
+                    self._loaded.add(subscription.collection)
+            return bool(self._subscriptions) and len(self._loaded) == len(self._collections)
+    
+    def apply(self, event: ChangeEvent):
+        """Add, move or drop a slot for one time slot change"""
+        department = self._collections.get(event.collection)
+        if department is None:
+            return
+        data = event.data or {}
+        with self._lock:
+            self.counts['events'] += 1
+            if event.initial:
+                self._initial_applied[event.collection] += 1
+            slots = self._departments[department]
+            if event.type is ChangeType.REMOVED or data.get('availability') != AVAILABLE \
+                    or not data.get('date') or not data.get('startTime'):
+                slots.remove(event.doc_id)
+                return
+            slot = {field: data.get(field) for field in SLOT_FIELDS}
+            slot.update({'id': event.doc_id, 'department': department})
+            slots.put(event.doc_id, (data['date'], data['startTime'], event.doc_id), slot)
+    
+    def earliest(self, departments: Iterable[str], start: datetime, end_date: str,
+                 limit: int = 5) -> List[Dict[str, Any]]:
+        """
+        The earliest available slots across departments
+        
+        Args:
+            departments: Departments to search
+            start: Only slots starting at or after this (local) time
+            end_date: Last day of the window, YYYY-MM-DD
+            limit: Slots to return
+        """
+        start_key = (start.strftime('%Y-%m-%d'), start.strftime('%H:%M'))
+        with self._lock:
+            self.counts['searches'] += 1
+            self._prune(datetime.now().strftime('%Y-%m-%d'))
+            # Each department's window is already in order; merge them and keep the first limit
+            windows = [self._departments[department].window(start_key, end_date, limit)
+                       for department in departments if department in self._departments]
+        merged = heapq.merge(*windows, key=lambda slot: (slot['date'], slot['startTime'], slot['department']))
+        return list(itertools.islice(merged, limit))
+    
+    def earliest_by_department(self, departments: Iterable[str], start: datetime,
+                               end_date: str) -> List[Dict[str, Any]]:
+        """Each department's first available slot in the window, earliest first"""
+        start_key = (start.strftime('%Y-%m-%d'), start.strftime('%H:%M'))
+        with self._lock:
+            firsts = [self._departments[department].window(start_key, end_date, 1)
+                      for department in departments if department in self._departments]
+        return sorted((found[0] for found in firsts if found), key=lambda slot: (slot['date'], slot['startTime']))
+    
+    def stats(self) -> Dict[str, Any]:
+        ready = self.ready
+        with self._lock:
+            return {
+                **self.counts,
+                'ready': ready,
+                'slots': {department: len(slots.keys) for department, slots in self._departments.items()}
+            }
+    
+    def _prune(self, today: str):
+        """Drop past days' slots once a day, on the first search of the day"""
+        if today <= self._pruned_before:
+            return
+        for slots in self._departments.values():
+            self.counts['pruned'] += slots.prune(today)
+        self._pruned_before = today
+
+# Shared index, created on first use rather than at import time
+_availability_index: Optional[AvailabilityIndex] = None
+_availability_index_lock = threading.Lock()
+
+def get_availability_index() -> AvailabilityIndex:
+    """Get the shared AvailabilityIndex, started on first use"""
+    global _availability_index
+    if _availability_index is None:
+        with _availability_index_lock:
+            if _availability_index is None:
+                index = AvailabilityIndex()
+                index.start()
+                _availability_index = index
+    return _availability_index
@@ -0,0 +1,174 @@
+"""
+Backup Type Codec
+Exact JSON encoding of Firestore documents for backups
+
+Values JSON can't hold (timestamps, geo points, document references,
+bytes) are written in a compact primitive form and their paths are listed
+in a per-document type table:
+
+    {"id": "...", "data": {"scheduledDateTime": 1736150400000000000, ...},
+     "types": [["ts", "scheduledDateTime"]]}
+
+Decoding only visits the paths in the table, so plain strings are never
+parsed and its cost is proportional to the number of typed fields.
+
+Backups written before the type table existed carry no type information.
+For those, the collection schemas (ALL_SCHEMAS / EXTENDED_SCHEMAS) decide
+which fields are timestamps instead of guess-parsing every string.
+"""
+
+import base64
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+from database.models import EXTENDED_SCHEMAS
+from database.schema import ALL_SCHEMAS
+
+logger = logging.getLogger(__name__)
+
+CODEC_NAME = 'typed-v1'
+
+# Type tags in the per-document type table
+TIMESTAMP = 'ts'      # integer nanoseconds since the Unix epoch (UTC)
+GEO_POINT = 'geo'     # [latitude, longitude]
+REFERENCE = 'ref'     # document path, e.g. "citizens/200012345678"
+BYTES = 'bytes'       # base64
+
+# (tag, path...) where path items are map keys (str) or list indexes (int)
+TypeEntry = List[Any]
+
+# Write timestamps the app stamps outside the collection schemas
+AUDIT_TIMESTAMP_FIELDS = frozenset({
+    'createdAt', 'updatedAt', 'created_at', 'updated_at', 'bookedAt', 'processedAt', 'processed_at',
+    'feedbackSubmittedAt', 'rescheduled_at', 'read_at', 'last_logout'
+})
+
+_NANOS_PER_SECOND = 1_000_000_000
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_PLAIN_TYPES = (str, int, float, bool, type(None))
+
+def timestamp_fields(collection_name: str) -> FrozenSet[str]:
+    """Top-level fields of a collection that hold timestamps, per its schema"""
+    fields = set(AUDIT_TIMESTAMP_FIELDS)
+    
+    for field, spec in ALL_SCHEMAS.get(collection_name, {}).items():
+        if spec is datetime:
+            fields.add(field)
+    for field, spec in EXTENDED_SCHEMAS.get(collection_name, {}).items():
+        if isinstance(spec, dict) and spec.get('type') == 'timestamp':
+            fields.add(field)
+    
+    return frozenset(fields)
+
+class BackupCodec:
+    """Encodes documents to JSON-safe data plus a type table, and back"""
+    
+    def __init__(self, db=None):
+        # Only needed to rebuild DocumentReference values when decoding
+        self.db = db
+        self._timestamp_fields: Dict[str, FrozenSet[str]] = {}
+    
+    # --- Encoding ---
+    
+    def encode(self, data: Dict[str, Any]) -> Tuple[Dict[str, Any], List[TypeEntry]]:
+        """Document data -> (JSON-safe data, type table)"""
+        types: List[TypeEntry] = []
+        return self._encode_map(data, [], types), types
+    
+    def _encode_map(self, data: Dict[str, Any], path: List[Any], types: List[TypeEntry]) -> Dict[str, Any]:
+        encoded = {}
+        for key, value in data.items():
+            if isinstance(value, _PLAIN_TYPES):
+                encoded[key] = value
+            else:
+                encoded[key] = self._encode_value(value, path + [key], types)
+        return encoded
+    
+    def _encode_value(self, value: Any, path: List[Any], types: List[TypeEntry]) -> Any:
+        if isinstance(value, _PLAIN_TYPES):
+            return value
+        if isinstance(value, dict):
+            return self._encode_map(value, path, types)
+        if isinstance(value, (list, tuple)):
+            return [self._encode_value(item, path + [index], types) for index, item in enumerate(value)]
+        if isinstance(value, datetime):
+            types.append([TIMESTAMP] + path)
+            return _timestamp_to_nanos(value)
+        if isinstance(value, (bytes, bytearray)):
+            types.append([BYTES] + path)
+            return base64.b64encode(bytes(value)).decode('ascii')
+        if hasattr(value, 'latitude') and hasattr(value, 'longitude'):
+            types.append([GEO_POINT] + path)
+            return [value.latitude, value.longitude]
+        if hasattr(value, 'path') and hasattr(value, 'parent'):
+            types.append([REFERENCE] + path)
+            return value.path
+        raise TypeError(f"Cannot encode {type(value).__name__} at {'.'.join(map(str, path))}")
+    
+    # --- Decoding ---
+    
+    def decode(self, data: Dict[str, Any], types: Optional[List[TypeEntry]]) -> Dict[str, Any]:
+        """Restore typed values in place at the paths listed in the type table"""
+        for entry in types or ():
+            tag, path = entry[0], entry[1:]
+            container = data
+            for key in path[:-1]:
+                container = container[key]
+            container[path[-1]] = self._decode_value(tag, container[path[-1]])
+        return data
+    
+    def _decode_value(self, tag: str, value: Any) -> Any:
+        if tag == TIMESTAMP:
+            return _nanos_to_timestamp(value)
+        if tag == BYTES:
+            return base64.b64decode(value)
+        if tag == GEO_POINT:
+            from google.cloud.firestore import GeoPoint
+            return GeoPoint(value[0], value[1])
+        if tag == REFERENCE:
+            if self.db is None:
+                raise ValueError("Decoding document references needs a Firestore client")
+            return self.db.document(value)
+        raise ValueError(f"Unknown type tag: {tag}")
+    
+    def decode_legacy(self, collection_name: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Decode an untyped (pre-codec) backup document using the collection schema
+        
+        Only schema timestamp fields are parsed; everything else stays as stored.
+        """
+        fields = self._timestamp_fields.get(collection_name)
+        if fields is None:
+            fields = self._timestamp_fields[collection_name] = timestamp_fields(collection_name)
+        
+        for field in fields.intersection(data):
+            value = data[field]
+            if isinstance(value, str):
+                try:
+                    data[field] = datetime.fromisoformat(value)
+                except ValueError:
+                    pass
+        return data
+
+def _timestamp_to_nanos(value: datetime) -> int:
+    if value.tzinfo is None:
+        # The app writes naive UTC datetimes (datetime.utcnow())
+        value = value.replace(tzinfo=timezone.utc)
+    delta = value - _EPOCH
+    seconds = delta.days * 86400 + delta.seconds
+    # Firestore's DatetimeWithNanoseconds keeps sub-microsecond precision
+    nanos = getattr(value, 'nanosecond', 0) or value.microsecond * 1000
+    return seconds * _NANOS_PER_SECOND + nanos
+
+def _nanos_to_timestamp(value: int) -> datetime:
+    seconds, nanos = divmod(value, _NANOS_PER_SECOND)
+    if nanos % 1000:
+        try:
+            from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+        except ImportError:
+            logger.debug("google-api-core not installed; truncating timestamp to microseconds")
+        else:
+            base = _EPOCH + timedelta(seconds=seconds)
+            return DatetimeWithNanoseconds(base.year, base.month, base.day, base.hour, base.minute,
+                                           base.second, nanosecond=nanos, tzinfo=timezone.utc)
+    return _EPOCH + timedelta(seconds=seconds, microseconds=nanos // 1000)
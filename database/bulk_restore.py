@@ -0,0 +1,357 @@
+"""
+Bulk Restore Engine
+Parallel, resumable document writes for database restores
+
+Documents are consumed from a stream, never loaded whole. Writes go
+through Firestore's BulkWriter when the client has it (it parallelizes,
+throttles and retries on its own) and otherwise through a bounded pool
+of threads committing 500-write batches. Progress is checkpointed per
+collection as a count of leading documents known to be written, so an
+interrupted restore skips straight past them when it is run again.
+Whole collections can be cleared the same way, a batch of deletes at a
+time.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+Document = Tuple[str, Dict[str, Any]]
+
+# Firestore allows at most 500 writes per batch
+BATCH_SIZE = 500
+DEFAULT_WORKERS = 8
+MAX_ATTEMPTS = 5
+
+# BulkWriter progress is checkpointed after every flush of this many documents
+CHECKPOINT_EVERY = 5000
+
+class RestoreError(Exception):
+    """A collection could not be fully restored; progress up to the failure is checkpointed"""
+
+class RestoreCheckpoint:
+    """Per-collection restore progress persisted to a JSON file"""
+    
+    def __init__(self, path: Optional[str], source: str = ''):
+        self.path = path
+        self.source = source
+        self._lock = threading.Lock()
+        self._state = {'source': source, 'collections': {}}
+        
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if state.get('source') == source:
+                self._state = state
+            else:
+                logger.warning(f"Ignoring checkpoint {path}: it belongs to {state.get('source')}")
+    
+    def offset(self, collection_name: str) -> int:
+        """Leading documents of the collection already written"""
+        return self._state['collections'].get(collection_name, {}).get('documents', 0)
+    
+    def is_done(self, collection_name: str) -> bool:
+        return self._state['collections'].get(collection_name, {}).get('done', False)
+    
+    def record(self, collection_name: str, documents: int, done: bool = False):
+        with self._lock:
+            self._state['collections'][collection_name] = {'documents': documents, 'done': done}
+            self._save()
+    
+    def clear(self):
+        """Drop the checkpoint once the whole restore has succeeded"""
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+    
+    def _save(self):
+        if not self.path:
+            return
+        # Write-then-rename so a crash mid-save never corrupts the checkpoint
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._state, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+class BulkRestorer:
+    """Writes document streams into collections with parallel batched commits"""
+    
+    def __init__(self, db, workers: int = DEFAULT_WORKERS, checkpoint: Optional[RestoreCheckpoint] = None,
+                 use_bulk_writer: bool = True, ops_per_second: Optional[int] = None,
+                 progress_interval: float = 5.0):
+        self.db = db
+        self.workers = workers
+        self.checkpoint = checkpoint or RestoreCheckpoint(None)
+        self.use_bulk_writer = use_bulk_writer and hasattr(db, 'bulk_writer')
+        # None keeps BulkWriter's 500/50/5 ramp-up; set it to restore into an empty project faster
+        self.ops_per_second = ops_per_second
+        self.progress_interval = progress_interval
+    
+    @property
+    def mode(self) -> str:
+        return 'BulkWriter' if self.use_bulk_writer else f'{self.workers} batch workers'
+    
+    def restore_collection(self, collection_name: str, documents: Iterable[Document]) -> Dict[str, Any]:
+        """Write every (id, data) pair, resuming after any checkpointed prefix
+        
+        Returns counts and throughput; raises RestoreError when writes keep
+        failing, after checkpointing the progress made so far.
+        """
+        if self.checkpoint.is_done(collection_name):
+            documents_done = self.checkpoint.offset(collection_name)
+            print(f"   ⏭️  {collection_name}: already restored ({documents_done} documents)")
+            return {'documents': documents_done, 'written': 0, 'seconds': 0.0, 'docs_per_sec': 0.0}
+        
+        skipped = self.checkpoint.offset(collection_name)
+        documents = iter(documents)
+        if skipped:
+            print(f"   ↪️  {collection_name}: resuming after {skipped} documents")
+            for _ in islice(documents, skipped):
+                pass
+        
+        progress = _Progress(collection_name, skipped, self.progress_interval)
+        if self.use_bulk_writer:
+            written = self._restore_with_bulk_writer(collection_name, documents, skipped, progress)
+        else:
+            written = self._restore_with_pool(collection_name, documents, skipped, progress)
+        
+        self.checkpoint.record(collection_name, skipped + written, done=True)
+        return progress.finish(written)
+    
+    def delete_collection(self, collection_name: str) -> Dict[str, Any]:
+        """Delete every document of a collection with parallel batched deletes
+        
+        Ids are read a page at a time without their fields. Nothing is
+        checkpointed: running it again carries on with whatever is left.
+        """
+        collection = self.db.collection(collection_name)
+        progress = _Progress(collection_name, 0, self.progress_interval)
+        deleted = 0
+        
+        def pages() -> Iterator[List[Any]]:
+            query = collection.select(['__name__']).order_by('__name__').limit(BATCH_SIZE)
+            last_doc = None
+            while True:
+                page = list((query.start_after(last_doc) if last_doc is not None else query).stream())
+                if page:
+                    yield [doc.reference for doc in page]
+                if len(page) < BATCH_SIZE:
+                    return
+                last_doc = page[-1]
+        
+        if self.use_bulk_writer:
+            bulk_writer = self._open_bulk_writer()
+            failures: List[str] = []
+            
+            def on_write_error(error, _bulk_writer) -> bool:
+                if error.attempts < MAX_ATTEMPTS:
+                    return True
+                failures.append(f"{error.operation.reference.id}: {error.message}")
+                return False
+            
+            bulk_writer.on_write_error(on_write_error)
+            try:
+                for references in pages():
+                    for reference in references:
+                        bulk_writer.delete(reference)
+                    deleted += len(references)
+                    progress.update(deleted)
+            finally:
+                bulk_writer.close()
+            if failures:
+                raise RestoreError(f"{len(failures)} deletes from {collection_name} failed, first: {failures[0]}")
+            return progress.finish(deleted)
+        
+        def delete_batch(references: List[Any]) -> int:
+            def fill(write_batch):
+                for reference in references:
+                    write_batch.delete(reference)
+            
+            self._commit_with_retry(collection_name, fill)
+            return len(references)
+        
+        in_flight = set()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='delete') as pool:
+            try:
+                for references in pages():
+                    while len(in_flight) >= self.workers * 2:
+                        done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        deleted += sum(future.result() for future in done)
+                        progress.update(deleted)
+                    in_flight.add(pool.submit(delete_batch, references))
+                deleted += sum(future.result() for future in in_flight)
+            except Exception as e:
+                raise RestoreError(f"Deleting from {collection_name} failed after {deleted} documents: {e}") from e
+        
+        return progress.finish(deleted)
+    
+    # --- BulkWriter ---
+    
+    def _restore_with_bulk_writer(self, collection_name: str, documents: Iterator[Document],
+                                  offset: int, progress: '_Progress') -> int:
+        bulk_writer = self._open_bulk_writer()
+        failures: List[str] = []
+        
+        def on_write_error(error, _bulk_writer) -> bool:
+            if error.attempts < MAX_ATTEMPTS:
+                return True
+            failures.append(f"{error.operation.reference.id}: {error.message}")
+            return False
+        
+        bulk_writer.on_write_error(on_write_error)
+        collection = self.db.collection(collection_name)
+        written = 0
+        pending = 0
+        
+        try:
+            for doc_id, doc_data in documents:
+                bulk_writer.set(collection.document(doc_id), doc_data)
+                pending += 1
+                
+                if pending >= CHECKPOINT_EVERY:
+                    # flush() waits for every queued write, so the prefix is durable
+                    bulk_writer.flush()
+                    if failures:
+                        break
+                    written += pending
+                    pending = 0
+                    self.checkpoint.record(collection_name, offset + written)
+                    progress.update(written)
+            
+            if not failures:
+                bulk_writer.flush()
+                if not failures:
+                    written += pending
+        finally:
+            bulk_writer.close()
+        
+        if failures:
+            raise RestoreError(f"{len(failures)} writes to {collection_name} failed, "
+                               f"first: {failures[0]}; {offset + written} documents checkpointed")
+        return written
+    
+    def _open_bulk_writer(self):
+        if self.ops_per_second is None:
+            return self.db.bulk_writer()
+        
+        from google.cloud.firestore_v1.bulk_writer import BulkWriterOptions
+        return self.db.bulk_writer(options=BulkWriterOptions(
+            initial_ops_per_second=self.ops_per_second,
+            max_ops_per_second=self.ops_per_second
+        ))
+    
+    # --- Batch worker pool ---
+    
+    def _restore_with_pool(self, collection_name: str, documents: Iterator[Document],
+                           offset: int, progress: '_Progress') -> int:
+        batch_sizes: List[int] = []
+        completed = set()
+        in_flight = {}
+        next_unconfirmed = 0
+        written = 0
+        error: Optional[BaseException] = None
+        
+        def collect(done_futures):
+            nonlocal next_unconfirmed, written, error
+            for future in done_futures:
+                index = in_flight.pop(future)
+                if future.exception() is not None:
+                    error = error or future.exception()
+                else:
+                    completed.add(index)
+            
+            # Only a contiguous prefix of finished batches can be checkpointed
+            advanced = False
+            while next_unconfirmed in completed:
+                completed.remove(next_unconfirmed)
+                written += batch_sizes[next_unconfirmed]
+                next_unconfirmed += 1
+                advanced = True
+            if advanced:
+                self.checkpoint.record(collection_name, offset + written)
+                progress.update(written)
+        
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='restore') as pool:
+            for batch in _chunks(documents, BATCH_SIZE):
+                collect([future for future in in_flight if future.done()])
+                # Bound the documents held in memory to a couple of batches per worker
+                while len(in_flight) >= self.workers * 2:
+                    done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+                    collect(done)
+                if error is not None:
+                    break
+                
+                batch_sizes.append(len(batch))
+                in_flight[pool.submit(self._commit_batch, collection_name, batch)] = len(batch_sizes) - 1
+            
+            while in_flight:
+                done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+                collect(done)
+        
+        if error is not None:
+            raise RestoreError(f"Restoring {collection_name} failed: {error}; "
+                               f"{offset + written} documents checkpointed") from error
+        return written
+    
+    def _commit_batch(self, collection_name: str, batch: List[Document]):
+        collection = self.db.collection(collection_name)
+        
+        def fill(write_batch):
+            for doc_id, doc_data in batch:
+                write_batch.set(collection.document(doc_id), doc_data)
+        
+        self._commit_with_retry(collection_name, fill)
+    
+    def _commit_with_retry(self, collection_name: str, fill: Callable[[Any], None]):
+        """Build a write batch with fill() and commit it, retrying with backoff"""
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            try:
+                write_batch = self.db.batch()
+                fill(write_batch)
+                write_batch.commit()
+                return
+            except Exception as e:
+                if attempt == MAX_ATTEMPTS:
+                    raise
+                delay = 0.5 * 2 ** (attempt - 1)
+                logger.warning(f"Batch commit to {collection_name} failed ({e}); retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+class _Progress:
+    """Throttled docs/sec reporting for one collection"""
+    
+    def __init__(self, collection_name: str, skipped: int, interval: float):
+        self.collection_name = collection_name
+        self.skipped = skipped
+        self.interval = interval
+        self.start = time.perf_counter()
+        self._last_report = self.start
+    
+    def update(self, written: int):
+        now = time.perf_counter()
+        if now - self._last_report >= self.interval:
+            self._last_report = now
+            rate = written / (now - self.start)
+            print(f"   ⏳ {self.collection_name}: {self.skipped + written} documents ({rate:,.0f} docs/sec)")
+    
+    def finish(self, written: int) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - self.start
+        return {
+            'documents': self.skipped + written,
+            'written': written,
+            'seconds': round(elapsed, 2),
+            'docs_per_sec': round(written / elapsed, 1) if elapsed > 0 else 0.0
+        }
+
+def _chunks(documents: Iterator[Document], size: int) -> Iterator[List[Document]]:
+    while True:
+        chunk = list(islice(documents, size))
+        if not chunk:
+            return
+        yield chunk
@@ -0,0 +1,239 @@
+"""
+Change Dispatcher
+Runs change feed handlers on a bounded worker pool instead of the watch thread
+
+Every subscriber gets its own bounded queue, so a slow handler only backs
+up its own events. A queue is split into lanes by document id; a lane is
+worked by one thread at a time, so each subscriber sees the changes to a
+document in order while different documents are handled in parallel.
+
+When a subscriber's queue is full its overflow policy applies: BLOCK
+holds the watch thread until there is room (backpressure, nothing lost),
+DROP_OLDEST discards the subscriber's oldest queued event and
+DROP_NEWEST the incoming one. Queue depth, lag behind the snapshot read
+time and dropped events are reported per subscriber.
+"""
+
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from enum import Enum
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DISPATCH_WORKERS = 4
+QUEUE_CAPACITY = 1000
+# Lanes per subscriber queue; events for one document always share a lane
+QUEUE_LANES = 8
+
+class OverflowPolicy(Enum):
+    """What happens to an event arriving at a full subscriber queue"""
+    BLOCK = "block"
+    DROP_OLDEST = "drop_oldest"
+    DROP_NEWEST = "drop_newest"
+
+class _Lane:
+    __slots__ = ('queue', 'events', 'scheduled')
+    
+    def __init__(self, queue: '_SubscriberQueue'):
+        self.queue = queue
+        self.events = deque()
+        self.scheduled = False
+
+class _SubscriberQueue:
+    """One subscriber's pending events and queue metrics"""
+    
+    def __init__(self, subscription, lanes: int, capacity: int, overflow: OverflowPolicy):
+        self.subscription = subscription
+        self.lanes = [_Lane(self) for _ in range(lanes)]
+        self.capacity = capacity
+        self.overflow = overflow
+        self.closed = False
+        self.depth = 0
+        self.max_depth = 0
+        self.enqueued = 0
+        self.dropped = 0
+        self.blocked_seconds = 0.0
+        self.lag_seconds = 0.0
+        self.max_lag_seconds = 0.0
+    
+    def drop_oldest(self) -> bool:
+        heads = [lane for lane in self.lanes if lane.events]
+        if not heads:
+            return False
+        oldest = min(heads, key=lambda lane: lane.events[0][0])
+        oldest.events.popleft()
+        self.depth -= 1
+        self.dropped += 1
+        return True
+    
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            'overflow': self.overflow.value,
+            'queue_depth': self.depth,
+            'max_queue_depth': self.max_depth,
+            'capacity': self.capacity,
+            'enqueued': self.enqueued,
+            'dropped': self.dropped,
+            'blocked_seconds': round(self.blocked_seconds, 4),
+            'lag_seconds': round(self.lag_seconds, 3),
+            'max_lag_seconds': round(self.max_lag_seconds, 3)
+        }
+
+class ChangeDispatcher:
+    """Bounded, per-subscriber, per-document-ordered delivery of change events"""
+    
+    def __init__(self, workers: int = DISPATCH_WORKERS, capacity: int = QUEUE_CAPACITY,
+                 overflow: OverflowPolicy = OverflowPolicy.BLOCK, block_timeout: Optional[float] = None,
+                 lanes: int = QUEUE_LANES):
+        """
+        Args:
+            workers: Threads running handlers, shared by all subscribers
+            capacity: Queued events per subscriber
+            overflow: Default policy for full queues; subscriptions may set their own
+            block_timeout: Longest a BLOCK submit waits before dropping the event (None waits)
+            lanes: Lanes per subscriber queue, the most events of one subscriber run at once
+        """
+        self.workers = workers
+        self.capacity = capacity
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.lanes = lanes
+        self._queues: Dict[int, _SubscriberQueue] = {}
+        self._ready = deque()
+        self._lock = threading.Lock()
+        self._work = threading.Condition(self._lock)
+        self._room = threading.Condition(self._lock)
+        self._sequence = itertools.count()
+        self._threads: List[threading.Thread] = []
+        self._shutdown = False
+    
+    def submit(self, subscription, event) -> bool:
+        """Queue event for subscription; False if it was dropped"""
+        with self._lock:
+            if self._shutdown:
+                return False
+            if not self._threads:
+                self._start_workers()
+            queue = self._queues.get(subscription.id)
+            if queue is None:
+                queue = _SubscriberQueue(subscription, self.lanes, self.capacity,
+                                         getattr(subscription, 'overflow', None) or self.overflow)
+                self._queues[subscription.id] = queue
+            
+            if queue.depth >= queue.capacity and not self._make_room(queue):
+                queue.dropped += 1
+                if queue.overflow is OverflowPolicy.BLOCK:
+                    logger.warning(f"Subscriber {getattr(subscription, 'name', subscription.id)} stayed full "
+                                   f"for {self.block_timeout}s; dropped {event.collection}/{event.doc_id}")
+                return False
+            if queue.closed:
+                return False
+            
+            lane = queue.lanes[hash(event.doc_id) % len(queue.lanes)]
+            lane.events.append((next(self._sequence), event))
+            queue.depth += 1
+            queue.enqueued += 1
+            queue.max_depth = max(queue.max_depth, queue.depth)
+            if not lane.scheduled:
+                lane.scheduled = True
+                self._ready.append(lane)
+                self._work.notify()
+            return True
+    
+    def discard(self, subscription):
+        """Forget a subscriber and its queued events"""
+        with self._lock:
+            queue = self._queues.pop(subscription.id, None)
+            if queue is None:
+                return
+            queue.closed = True
+            for lane in queue.lanes:
+                lane.events.clear()
+            queue.depth = 0
+            self._room.notify_all()
+    
+    def shutdown(self, wait: bool = True):
+        """Stop the workers once queued events are delivered"""
+        with self._lock:
+            self._shutdown = True
+            self._work.notify_all()
+            self._room.notify_all()
+            threads = list(self._threads)
+        if wait:
+            for thread in threads:
+                thread.join()
+    
+    def queue_metrics(self, subscription) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            queue = self._queues.get(subscription.id)
+            return queue.metrics() if queue else None
+    
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            queues = list(self._queues.values())
+            return {
+                'workers': len(self._threads),
+                'ready_lanes': len(self._ready),
+                'queued': sum(queue.depth for queue in queues),
+                'dropped': sum(queue.dropped for queue in queues)
+            }
+    
+    # --- Internals (called with the lock held unless noted) ---
+    
+    def _make_room(self, queue: _SubscriberQueue) -> bool:
+        if queue.overflow is OverflowPolicy.DROP_OLDEST:
+            return queue.drop_oldest()
+        if queue.overflow is OverflowPolicy.DROP_NEWEST:
+            return False
+        
+        start = time.monotonic()
+        deadline = None if self.block_timeout is None else start + self.block_timeout
+        while queue.depth >= queue.capacity and not queue.closed and not self._shutdown:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                break
+            self._room.wait(remaining)
+        queue.blocked_seconds += time.monotonic() - start
+        return queue.depth < queue.capacity
+    
+    def _start_workers(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work_loop, name=f"change-dispatch-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+    
+    def _work_loop(self):
+        """Worker thread: take a ready lane, deliver its next event, requeue the lane if it has more"""
+        while True:
+            with self._lock:
+                while not self._ready and not self._shutdown:
+                    self._work.wait()
+                if not self._ready:
+                    return
+                lane = self._ready.popleft()
+                queue = lane.queue
+                if not lane.events:
+                    lane.scheduled = False
+                    continue
+                _, event = lane.events.popleft()
+                queue.depth -= 1
+                self._room.notify_all()
+            
+            if event.read_time is not None:
+                lag = max(0.0, (datetime.now(timezone.utc) - event.read_time).total_seconds())
+                queue.lag_seconds = lag
+                queue.max_lag_seconds = max(queue.max_lag_seconds, lag)
+            if not queue.closed:
+                queue.subscription.deliver(event)
+            
+            with self._lock:
+                if lane.events:
+                    self._ready.append(lane)
+                    self._work.notify()
+                else:
+                    lane.scheduled = False
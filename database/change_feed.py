@@ -0,0 +1,453 @@
+"""
+Change Feed Hub
+One Firestore snapshot listener per collection, shared by every consumer
+
+Each collection that has subscribers is watched by a single on_snapshot
+listener, optionally scoped by a query (e.g. to recent or upcoming
+appointments), and its changes are dispatched as ChangeEvents to every
+subscriber. Adding a consumer adds a callback, not another listener, so
+Firestore listener load and reads stay flat.
+
+A listener's first snapshot is the current contents of its query rather
+than a change; those events are marked initial and only delivered to
+subscribers that ask for them. The documents of the last snapshot are
+kept, so a subscriber that asks for them after the listener started is
+sent them as its own initial snapshot. A document already in the
+collection that newly matches a scope (a write moved it into the query)
+arrives from Firestore as ADDED; it is reported as MODIFIED and marked
+entered_scope. The read time of the last snapshot is
+kept per collection. When a listener is restarted (its scope changed or
+its watch stopped), the replayed snapshot is compared against it using
+each document's update time, so subscribers see only the changes they
+missed. The Python client doesn't expose watch resume tokens, so a
+restart re-reads the scoped collection once.
+
+Without a dispatcher, handlers run on the listener's watch thread. With
+one (the shared hub has a ChangeDispatcher) they run on its bounded
+worker pool, and the watch thread only queues events. Either way the
+watch-thread time per snapshot and each subscriber's handler time are
+reported, with the dispatcher's queue metrics.
+"""
+
+import itertools
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from enum import Enum
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from database.change_dispatch import ChangeDispatcher, OverflowPolicy
+from database.firebase_config import get_db
+
+logger = logging.getLogger(__name__)
+
+class ChangeType(Enum):
+    """Kinds of document change"""
+    ADDED = "added"
+    MODIFIED = "modified"
+    REMOVED = "removed"
+
+@dataclass
+class ChangeEvent:
+    """One document change, as dispatched to subscribers"""
+    collection: str
+    doc_id: str
+    type: ChangeType
+    data: Optional[Dict[str, Any]]
+    read_time: Optional[datetime]
+    update_time: Optional[datetime] = None
+    # Part of a listener's first snapshot: the document existed, it didn't just change
+    initial: bool = False
+    # An existing document that a write moved into the feed's scope; its previous values were never seen
+    entered_scope: bool = False
+
+Handler = Callable[[ChangeEvent], None]
+# Builds the watched query from the collection reference
+Scope = Callable[[Any], Any]
+
+def recent_scope(field: str, lookback: timedelta) -> Scope:
+    """Scope to documents whose field is at most lookback in the past (or in the future)"""
+    def scope(collection):
+        return collection.where(field, '>=', datetime.utcnow() - lookback)
+    return scope
+
+def _as_utc(moment: Optional[datetime]) -> Optional[datetime]:
+    if moment is None or moment.tzinfo is not None:
+        return moment
+    return moment.replace(tzinfo=timezone.utc)
+
+class Subscription:
+    """A handler attached to one collection's feed"""
+    
+    def __init__(self, hub: 'ChangeFeedHub', subscription_id: int, collection: str, handler: Handler,
+                 types: Optional[Iterable[ChangeType]], include_initial: bool, name: Optional[str],
+                 overflow: Optional[OverflowPolicy] = None):
+        self.hub = hub
+        self.id = subscription_id
+        self.collection = collection
+        self.handler = handler
+        self.types = frozenset(types) if types else frozenset(ChangeType)
+        self.include_initial = include_initial
+        self.overflow = overflow
+        self.name = name or getattr(handler, '__name__', f"subscriber-{subscription_id}")
+        # Initial events queued for this subscriber; None until its listener's first snapshot
+        self.initial_events: Optional[int] = None
+        self.delivered = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self._stats_lock = threading.Lock()
+    
+    def wants(self, event: ChangeEvent) -> bool:
+        return event.type in self.types and (self.include_initial or not event.initial)
+    
+    def unsubscribe(self):
+        self.hub.unsubscribe(self)
+    
+    def deliver(self, event: ChangeEvent):
+        """Run the handler, recording its time and failures"""
+        start = time.perf_counter()
+        failed = False
+        try:
+            self.handler(event)
+        except Exception as e:
+            failed = True
+            logger.error(f"Change feed subscriber {self.name} failed on "
+                         f"{event.collection}/{event.doc_id}: {e}")
+        elapsed = time.perf_counter() - start
+        # Several dispatcher workers may deliver to one subscriber at once
+        with self._stats_lock:
+            if failed:
+                self.errors += 1
+            else:
+                self.delivered += 1
+            self.seconds += elapsed
+            self.max_seconds = max(self.max_seconds, elapsed)
+    
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'collection': self.collection,
+            'delivered': self.delivered,
+            'errors': self.errors,
+            'handler_seconds': round(self.seconds, 4),
+            'max_handler_seconds': round(self.max_seconds, 4)
+        }
+
+class _CollectionFeed:
+    """The listener and dispatch state of one collection"""
+    
+    def __init__(self, name: str):
+        self.name = name
+        self.scope: Optional[Scope] = None
+        self.watch = None
+        self.subscribers: List[Subscription] = []
+        # Snapshots of the current watch; 0 until its initial snapshot arrives
+        self.snapshots = 0
+        # Documents of the last snapshot, replayed to subscribers that join later
+        self.documents: List[Any] = []
+        # Held while a snapshot is dispatched or replayed, so a joining subscriber misses nothing in between
+        self.lock = threading.RLock()
+        self.resume_after: Optional[datetime] = None
+        self.last_read_time: Optional[datetime] = None
+        self.started_at: Optional[float] = None
+        self.restarts = 0
+        self.counts = {'snapshots': 0, 'changes': 0, 'initial': 0, 'skipped': 0, 'dispatched': 0}
+        self.dispatch_seconds = 0.0
+        self.max_dispatch_seconds = 0.0
+        self.lag_seconds = 0.0
+        self.max_lag_seconds = 0.0
+
+class ChangeFeedHub:
+    """Multiplexes one snapshot listener per collection to many subscribers"""
+    
+    def __init__(self, db=None, dispatcher: Optional[ChangeDispatcher] = None):
+        self._db = db
+        self.dispatcher = dispatcher
+        self._feeds: Dict[str, _CollectionFeed] = {}
+        self._lock = threading.RLock()
+        self._ids = itertools.count(1)
+    
+    @property
+    def db(self):
+        """Firestore client, resolved when the first listener is started"""
+        if self._db is None:
+            self._db = get_db()
+        return self._db
+    
+    def set_scope(self, collection: str, scope: Optional[Scope]):
+        """Watch only the documents scope(collection_ref) matches; restarts a running listener if it changed
+        
+        The scope applies to every subscriber of the collection, so changing
+        it under existing subscribers is logged.
+        """
+        with self._lock:
+            feed = self._feed(collection)
+            if scope is feed.scope:
+                return
+            if feed.subscribers:
+                logger.warning(f"Change feed {collection}: scope changed under "
+                               f"{', '.join(s.name for s in feed.subscribers)}")
+            feed.scope = scope
+            if feed.watch is not None:
+                self._restart(feed)
+    
+    def subscribe(self, collection: str, handler: Handler, types: Optional[Iterable[ChangeType]] = None,
+                  include_initial: bool = False, name: Optional[str] = None,
+                  overflow: Optional[OverflowPolicy] = None) -> Subscription:
+        """
+        Deliver a collection's changes to handler
+        
+        Args:
+            collection: Collection to follow; its listener starts with the first subscriber
+            handler: Called with each ChangeEvent, on the dispatcher (or listener) thread
+            types: Change types to deliver (default all)
+            include_initial: Also deliver the documents of the first snapshot (or, joining a running
+                listener, of its last one)
+            name: Label for metrics
+            overflow: Policy when this subscriber's dispatcher queue is full (default the dispatcher's)
+        """
+        with self._lock:
+            feed = self._feed(collection)
+            subscription = Subscription(self, next(self._ids), collection, handler, types, include_initial,
+                                        name, overflow)
+            with feed.lock:
+                feed.subscribers = feed.subscribers + [subscription]
+                if include_initial and feed.watch is not None and feed.snapshots > 0:
+                    subscription.initial_events = self._replay(feed, subscription, feed.documents,
+                                                               feed.last_read_time)
+            if feed.watch is None:
+                self._start(feed)
+        return subscription
+    
+    def unsubscribe(self, subscription: Subscription):
+        """Detach a subscriber; the collection's listener stops with its last one"""
+        with self._lock:
+            feed = self._feeds.get(subscription.collection)
+            if not feed or subscription not in feed.subscribers:
+                return
+            feed.subscribers = [s for s in feed.subscribers if s is not subscription]
+            if self.dispatcher:
+                self.dispatcher.discard(subscription)
+            if not feed.subscribers:
+                self._stop(feed)
+    
+    def restart_stopped(self) -> List[str]:
+        """Restart listeners whose watch has shut down; returns their collections"""
+        restarted = []
+        with self._lock:
+            for feed in self._feeds.values():
+                if feed.watch is not None and not getattr(feed.watch, 'is_active', True):
+                    self._restart(feed)
+                    restarted.append(feed.name)
+        return restarted
+    
+    def stop_all(self):
+        """Stop every listener and drop all subscribers"""
+        with self._lock:
+            for feed in self._feeds.values():
+                self._stop(feed)
+                if self.dispatcher:
+                    for subscription in feed.subscribers:
+                        self.dispatcher.discard(subscription)
+                feed.subscribers = []
+    
+    def metrics(self) -> Dict[str, Any]:
+        """Per-collection listener, lag and dispatch-time metrics, with per-subscriber ones"""
+        with self._lock:
+            feeds = list(self._feeds.values())
+        return {
+            'listeners': sum(1 for feed in feeds if feed.watch is not None),
+            'subscribers': sum(len(feed.subscribers) for feed in feeds),
+            'dispatcher': self.dispatcher.metrics() if self.dispatcher else None,
+            'collections': {
+                feed.name: {
+                    'listening': feed.watch is not None,
+                    'scoped': feed.scope is not None,
+                    'restarts': feed.restarts,
+                    'last_read_time': feed.last_read_time.isoformat() if feed.last_read_time else None,
+                    **feed.counts,
+                    'dispatch_seconds': round(feed.dispatch_seconds, 4),
+                    'max_dispatch_seconds': round(feed.max_dispatch_seconds, 4),
+                    'lag_seconds': round(feed.lag_seconds, 3),
+                    'max_lag_seconds': round(feed.max_lag_seconds, 3),
+                    'subscribers': [self._subscriber_metrics(subscription) for subscription in feed.subscribers]
+                }
+                for feed in feeds
+            }
+        }
+    
+    def _subscriber_metrics(self, subscription: Subscription) -> Dict[str, Any]:
+        metrics = subscription.metrics()
+        queue = self.dispatcher.queue_metrics(subscription) if self.dispatcher else None
+        if queue:
+            metrics.update(queue)
+        return metrics
+    
+    # --- Listener lifecycle ---
+    
+    def _feed(self, collection: str) -> _CollectionFeed:
+        if collection not in self._feeds:
+            self._feeds[collection] = _CollectionFeed(collection)
+        return self._feeds[collection]
+    
+    def _start(self, feed: _CollectionFeed):
+        reference = self.db.collection(feed.name)
+        query = feed.scope(reference) if feed.scope else reference
+        feed.snapshots = 0
+        feed.documents = []
+        feed.resume_after = feed.last_read_time
+        feed.started_at = time.monotonic()
+        
+        def on_snapshot(documents, changes, read_time):
+            self._on_snapshot(feed, watch, documents, changes, read_time)
+        
+        watch = query.on_snapshot(on_snapshot)
+        feed.watch = watch
+        logger.info(f"Change feed listening to {feed.name}"
+                    + (f" (resuming after {feed.resume_after.isoformat()})" if feed.resume_after else ""))
+    
+    def _stop(self, feed: _CollectionFeed):
+        watch, feed.watch = feed.watch, None
+        if watch is not None:
+            watch.unsubscribe()
+            logger.info(f"Change feed stopped listening to {feed.name}")
+    
+    def _restart(self, feed: _CollectionFeed):
+        self._stop(feed)
+        feed.restarts += 1
+        self._start(feed)
+    
+    # --- Dispatch (runs on the watch thread) ---
+    
+    def _on_snapshot(self, feed: _CollectionFeed, watch, documents, changes, read_time):
+        if watch is not feed.watch:
+            return  # a late snapshot from a listener that has since been replaced
+        
+        with feed.lock:
+            self._dispatch_snapshot(feed, documents, changes, _as_utc(read_time))
+    
+    def _dispatch_snapshot(self, feed: _CollectionFeed, documents, changes, read_time: Optional[datetime]):
+        initial = feed.snapshots == 0
+        feed.snapshots += 1
+        feed.counts['snapshots'] += 1
+        feed.counts['changes'] += len(changes)
+        if read_time:
+            feed.lag_seconds = max(0.0, (datetime.now(timezone.utc) - read_time).total_seconds())
+            feed.max_lag_seconds = max(feed.max_lag_seconds, feed.lag_seconds)
+        
+        events = []
+        for change in changes:
+            event = self._to_event(feed, change, read_time, initial)
+            if event is not None:
+                events.append(event)
+        
+        start = time.perf_counter()
+        subscribers = feed.subscribers
+        # Subscribers still owed an initial snapshot get this one whole, rather than its changes
+        owed = [s for s in subscribers if s.include_initial and s.initial_events is None]
+        for event in events:
+            for subscription in subscribers:
+                if subscription not in owed and subscription.wants(event):
+                    self._dispatch(feed, subscription, event)
+        for subscription in owed:
+            # Queued events may still be running: a subscriber compares this with the ones it has handled
+            subscription.initial_events = self._replay(feed, subscription, documents, read_time)
+        elapsed = time.perf_counter() - start
+        feed.dispatch_seconds += elapsed
+        feed.max_dispatch_seconds = max(feed.max_dispatch_seconds, elapsed)
+        
+        feed.documents = documents
+        if read_time:
+            feed.last_read_time = read_time
+        if initial:
+            logger.info(f"Change feed {feed.name}: initial snapshot of {len(changes)} documents "
+                        f"in {time.monotonic() - feed.started_at:.2f}s")
+    
+    def _dispatch(self, feed: _CollectionFeed, subscription: Subscription, event: ChangeEvent) -> bool:
+        """Deliver or queue one event; False if the subscriber's queue dropped it"""
+        if self.dispatcher is None:
+            subscription.deliver(event)
+        elif not self.dispatcher.submit(subscription, event):
+            return False
+        feed.counts['dispatched'] += 1
+        return True
+    
+    def _replay(self, feed: _CollectionFeed, subscription: Subscription, documents,
+                read_time: Optional[datetime]) -> int:
+        """Send a snapshot's documents to one subscriber as initial events; returns how many were queued"""
+        queued = 0
+        for document in documents:
+            event = ChangeEvent(
+                collection=feed.name,
+                doc_id=document.id,
+                type=ChangeType.ADDED,
+                data=document.to_dict(),
+                read_time=read_time,
+                update_time=_as_utc(getattr(document, 'update_time', None)),
+                initial=True
+            )
+            if subscription.wants(event) and self._dispatch(feed, subscription, event):
+                queued += 1
+        return queued
+    
+    def _to_event(self, feed: _CollectionFeed, change, read_time: Optional[datetime],
+                  initial: bool) -> Optional[ChangeEvent]:
+        document = change.document
+        change_type = ChangeType[change.type.name]
+        update_time = _as_utc(getattr(document, 'update_time', None))
+        
+        if initial and feed.resume_after is not None:
+            # Replay after a restart: documents unchanged since the last snapshot were already seen
+            if update_time is not None and update_time <= feed.resume_after:
+                feed.counts['skipped'] += 1
+                return None
+            create_time = _as_utc(getattr(document, 'create_time', None))
+            if create_time is not None and create_time <= feed.resume_after:
+                change_type = ChangeType.MODIFIED
+            initial = False
+        
+        entered_scope = False
+        if not initial and change_type is ChangeType.ADDED and feed.last_read_time is not None:
+            # Created before the last snapshot yet not in it: a write moved it into the scope
+            create_time = _as_utc(getattr(document, 'create_time', None))
+            if create_time is not None and create_time <= feed.last_read_time:
+                change_type = ChangeType.MODIFIED
+                entered_scope = True
+        
+        if initial:
+            feed.counts['initial'] += 1
+        return ChangeEvent(
+            collection=feed.name,
+            doc_id=document.id,
+            type=change_type,
+            data=document.to_dict(),
+            read_time=read_time,
+            update_time=update_time,
+            initial=initial,
+            entered_scope=entered_scope
+        )
+
+# Longest the shared hub's watch thread waits on a full BLOCK subscriber before dropping the event
+SHARED_BLOCK_TIMEOUT = 5.0  # seconds
+
+# Shared hub, created on first use rather than at import time
+_change_feed: Optional[ChangeFeedHub] = None
+_change_feed_lock = threading.Lock()
+
+def get_change_feed() -> ChangeFeedHub:
+    """Get the shared ChangeFeedHub, which runs handlers on a ChangeDispatcher
+    
+    Subscribers block by default, but only for SHARED_BLOCK_TIMEOUT, so a
+    stalled one can't hold a collection's watch thread (and every other
+    subscriber of it) indefinitely. Subscribers with side effects that can
+    afford to miss an event pass a drop policy instead.
+    """
+    global _change_feed
+    if _change_feed is None:
+        with _change_feed_lock:
+            if _change_feed is None:
+                _change_feed = ChangeFeedHub(dispatcher=ChangeDispatcher(block_timeout=SHARED_BLOCK_TIMEOUT))
+    return _change_feed
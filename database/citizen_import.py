@@ -0,0 +1,390 @@
+"""
+Bulk Citizen Import
+Registers citizens from CSV or NDJSON uploads in the background
+
+An upload is spooled to a temporary file as it arrives, so it is never
+held in memory whole, and then processed on a worker thread a chunk of
+IMPORT_CHUNK rows at a time. Rows are validated with the shared
+DataValidator and checked against citizens and Auth accounts already
+on file. Valid rows become Firebase Auth users through one import_users call per chunk (the
+API takes at most 1000). The profiles of the users created are written
+in 500-document batches. Progress and a per-row error report are kept
+on the job, which the admin API polls by id.
+
+Columns (CSV header or NDJSON keys) match the register endpoint: nic,
+name and email are required; phone, date_of_birth (YYYY-MM-DD), gender,
+blood_group, address and city are optional. Auth uids are derived from
+the NIC. Importing the same file again creates no duplicates: rows whose
+NIC is already registered, or whose email belongs to another Auth
+account, are rejected and leave the existing citizen as it is.
+
+Imported accounts have no password. Nothing is sent to the citizens:
+each one sets a password through the forgot-password flow
+(POST /api/auth/forgot-password with the imported email) before first
+signing in, and the admin running the import tells them to.
+"""
+
+import csv
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from itertools import islice
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from database.firebase_config import firebase_manager
+from database.repositories import CitizenRepository, ID_ONLY_FIELDS
+from database.validation import get_validator
+
+logger = logging.getLogger(__name__)
+
+# Firebase Auth import_users takes at most 1000 users per call, get_users 100 identifiers
+IMPORT_CHUNK = 1000
+LOOKUP_CHUNK = 100
+MAX_ATTEMPTS = 3
+SPOOL_BUFFER = 1024 * 1024
+
+REQUIRED_FIELDS = ('nic', 'name', 'email')
+FORMATS = ('csv', 'ndjson')
+
+# Finished jobs kept for polling; the oldest are dropped first
+MAX_FINISHED_JOBS = 100
+# Row errors a job keeps in full; past this only the count grows
+MAX_ROW_ERRORS = 50000
+
+Row = Tuple[int, Dict[str, Any]]
+
+def detect_format(content_type: Optional[str], filename: Optional[str] = None) -> Optional[str]:
+    """'csv' or 'ndjson' from an upload's content type or file extension"""
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    extension = os.path.splitext(filename or '')[1].lower()
+    if content_type in ('text/csv', 'application/csv') or extension == '.csv':
+        return 'csv'
+    if content_type in ('application/x-ndjson', 'application/ndjson', 'application/jsonl') \
+            or extension in ('.ndjson', '.jsonl'):
+        return 'ndjson'
+    return None
+
+def citizen_uid(nic: str) -> str:
+    """Firebase Auth uid of an imported citizen"""
+    return f"citizen-{nic}"
+
+def citizen_profile(data: Dict[str, Any], uid: str, date_of_birth: Optional[datetime] = None) -> Dict[str, Any]:
+    """Citizens document for register-style fields (name, phone, blood_group, ...)"""
+    return {
+        'fullName': data['name'],
+        'email': data['email'],
+        'nic': data['nic'],
+        'phoneNumber': data.get('phone', ''),
+        'bloodGroup': data.get('blood_group', 'O+'),
+        'address': {
+            'addressLine1': data.get('address', ''),
+            'addressLine2': '',
+            'city': data.get('city', '')
+        },
+        'dateOfBirth': date_of_birth or datetime(1990, 1, 1),
+        'gender': data.get('gender', 'other'),
+        'firebaseUid': uid,
+        'isActive': True,
+        'profileImage': ''
+    }
+
+def iter_rows(path: str, fmt: str) -> Iterator[Row]:
+    """(row number, fields) per record; a malformed NDJSON line yields its error instead of fields"""
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        if fmt == 'csv':
+            # Row 1 is the first record after the header
+            for number, record in enumerate(csv.DictReader(f), 1):
+                yield number, {
+                    key.strip().lower(): value.strip() if isinstance(value, str) else value
+                    for key, value in record.items() if key
+                }
+            return
+        
+        number = 0
+        for line in f:
+            if not line.strip():
+                continue
+            number += 1
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield number, {'_error': f"Invalid JSON: {e}"}
+                continue
+            if not isinstance(record, dict):
+                yield number, {'_error': "Each line must be a JSON object"}
+                continue
+            yield number, {
+                str(key).strip().lower(): value.strip() if isinstance(value, str) else value
+                for key, value in record.items()
+            }
+
+class ImportJob:
+    """Progress and row errors of one upload"""
+    
+    def __init__(self, fmt: str, created_by: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.format = fmt
+        self.created_by = created_by
+        self.status = 'queued'
+        self.error: Optional[str] = None
+        self.created_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.counts = {'rows': 0, 'valid': 0, 'imported': 0, 'written': 0, 'failed': 0}
+        self.errors: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+    
+    @property
+    def finished(self) -> bool:
+        return self.status in ('completed', 'failed')
+    
+    def add(self, **counts: int):
+        with self._lock:
+            for key, value in counts.items():
+                self.counts[key] += value
+    
+    def reject(self, row: int, nic: Optional[str], errors: List[str]):
+        with self._lock:
+            self.counts['failed'] += 1
+            if len(self.errors) < MAX_ROW_ERRORS:
+                self.errors.append({'row': row, 'nic': nic, 'errors': errors})
+    
+    def sort_errors(self, start: int):
+        """Order errors recorded since start by row; a chunk's rows are rejected in stages"""
+        with self._lock:
+            self.errors[start:] = sorted(self.errors[start:], key=lambda error: error['row'])
+    
+    def to_dict(self, errors_offset: int = 0, errors_limit: int = 100) -> Dict[str, Any]:
+        with self._lock:
+            seconds = ((self.finished_at or datetime.utcnow()) - self.started_at).total_seconds() \
+                if self.started_at else 0.0
+            return {
+                'job_id': self.id,
+                'status': self.status,
+                'format': self.format,
+                'error': self.error,
+                'created_at': self.created_at.isoformat(),
+                'started_at': self.started_at.isoformat() if self.started_at else None,
+                'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+                'progress': dict(self.counts),
+                'rows_per_sec': round(self.counts['rows'] / seconds, 1) if seconds else 0.0,
+                'errors_total': self.counts['failed'],
+                'errors': self.errors[errors_offset:errors_offset + errors_limit]
+            }
+
+class CitizenImporter:
+    """Runs import jobs on a small worker pool and keeps them for polling"""
+    
+    def __init__(self, workers: int = 2, chunk_size: int = IMPORT_CHUNK,
+                 spool_dir: Optional[str] = None, citizens: Optional[CitizenRepository] = None):
+        self.chunk_size = min(chunk_size, IMPORT_CHUNK)
+        self.spool_dir = spool_dir
+        self.citizens = citizens or CitizenRepository()
+        self._jobs: 'OrderedDict[str, ImportJob]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='citizen-import')
+    
+    def start(self, stream: BinaryIO, fmt: str, created_by: Optional[str] = None) -> ImportJob:
+        """Spool an upload to disk and queue it; returns once the upload has been read"""
+        if fmt not in FORMATS:
+            raise ValueError(f"Unsupported format: {fmt}")
+        
+        job = ImportJob(fmt, created_by)
+        fd, path = tempfile.mkstemp(prefix=f"import-{job.id}-", suffix=f".{fmt}", dir=self.spool_dir)
+        try:
+            with os.fdopen(fd, 'wb') as spool:
+                shutil.copyfileobj(stream, spool, SPOOL_BUFFER)
+        except Exception:
+            os.remove(path)
+            raise
+        
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        self._executor.submit(self._run, job, path)
+        logger.info(f"Citizen import {job.id} queued ({os.path.getsize(path)} bytes of {fmt})")
+        return job
+    
+    def get(self, job_id: str) -> Optional[ImportJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+    
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+    
+    def _run(self, job: ImportJob, path: str):
+        job.status = 'running'
+        job.started_at = datetime.utcnow()
+        seen: Dict[str, set] = {'nic': set(), 'email': set()}
+        try:
+            rows = iter_rows(path, job.format)
+            while True:
+                chunk = list(islice(rows, self.chunk_size))
+                if not chunk:
+                    break
+                self._import_chunk(job, chunk, seen)
+            job.status = 'completed'
+        except Exception as e:
+            logger.error(f"Citizen import {job.id} failed: {e}")
+            job.error = str(e)
+            job.status = 'failed'
+        finally:
+            job.finished_at = datetime.utcnow()
+            os.remove(path)
+        
+        counts = job.counts
+        logger.info(f"Citizen import {job.id} {job.status}: {counts['written']} of {counts['rows']} "
+                    f"rows imported, {counts['failed']} rejected")
+    
+    def _import_chunk(self, job: ImportJob, chunk: List[Row], seen: Dict[str, set]):
+        first_error = len(job.errors)
+        try:
+            self._import_rows(job, chunk, seen)
+        finally:
+            job.sort_errors(first_error)
+    
+    def _import_rows(self, job: ImportJob, chunk: List[Row], seen: Dict[str, set]):
+        job.add(rows=len(chunk))
+        candidates = self._validate(job, chunk, seen)
+        
+        # Citizens already on file keep their existing account and profile
+        existing = self.citizens.get_many([data['nic'] for _, data, _ in candidates], fields=ID_ONLY_FIELDS)
+        unregistered = []
+        for number, data, date_of_birth in candidates:
+            if data['nic'] in existing:
+                job.reject(number, data['nic'], ["NIC: Citizen is already registered"])
+            else:
+                unregistered.append((number, data, date_of_birth))
+        
+        # An email may already belong to another Auth account; only the NIC's own uid may reuse it
+        accounts = self._email_accounts([data['email'] for _, data, _ in unregistered])
+        valid = []
+        for number, data, date_of_birth in unregistered:
+            if accounts.get(data['email'].lower(), citizen_uid(data['nic'])) != citizen_uid(data['nic']):
+                job.reject(number, data['nic'], ["Email: Already used by another account"])
+            else:
+                valid.append((number, data, date_of_birth))
+        job.add(valid=len(valid))
+        if not valid:
+            return
+        
+        created = self._import_users(job, valid)
+        job.add(imported=len(created))
+        if not created:
+            return
+        
+        profiles = {
+            data['nic']: citizen_profile(data, citizen_uid(data['nic']), date_of_birth)
+            for _, data, date_of_birth in created
+        }
+        try:
+            self.citizens.set_many(profiles)
+        except Exception as e:
+            # Rows may be partly written; a rerun rewrites them under the same uids
+            for number, data, _ in created:
+                job.reject(number, data['nic'], [f"Profile write failed: {e}"])
+            return
+        job.add(written=len(profiles))
+    
+    def _validate(self, job: ImportJob, chunk: List[Row], seen: Dict[str, set]) -> List[Tuple[int, Dict[str, Any], Optional[datetime]]]:
+        """Rows that pass validation, normalized, with their parsed date of birth; rejects the rest"""
+        validator = get_validator()
+        candidates = []
+        for number, record in chunk:
+            if '_error' in record:
+                job.reject(number, None, [record['_error']])
+                continue
+            
+            data = {key: str(value) for key, value in record.items() if value not in (None, '')}
+            errors = [f"{field} is required" for field in REQUIRED_FIELDS if not data.get(field)]
+            if errors:
+                job.reject(number, data.get('nic'), errors)
+                continue
+            
+            fields = {'nic': data['nic'], 'email': data['email']}
+            if 'phone' in data:
+                fields['phoneNumber'] = data['phone']
+            if 'date_of_birth' in data:
+                fields['dateOfBirth'] = data['date_of_birth']
+            result = validator.validate_citizen_data(fields)
+            if not result['valid']:
+                job.reject(number, data['nic'], result['errors'])
+                continue
+            
+            sanitized = result['sanitized_data']
+            data['nic'] = sanitized['nic']
+            data['email'] = sanitized['email']
+            if 'phoneNumber' in sanitized:
+                data['phone'] = sanitized['phoneNumber']
+            
+            duplicates = [f"Duplicate {field} in upload" for field in ('nic', 'email') if data[field] in seen[field]]
+            if duplicates:
+                job.reject(number, data['nic'], duplicates)
+                continue
+            seen['nic'].add(data['nic'])
+            seen['email'].add(data['email'])
+            
+            parsed = sanitized.get('dateOfBirth')
+            candidates.append((number, data, datetime.combine(parsed, datetime.min.time()) if parsed else None))
+        return candidates
+    
+    def _email_accounts(self, emails: List[str]) -> Dict[str, str]:
+        """Uids of the Auth users holding these emails, looked up LOOKUP_CHUNK at a time"""
+        from firebase_admin import auth
+        firebase_manager.initialize()
+        
+        accounts = {}
+        for start in range(0, len(emails), LOOKUP_CHUNK):
+            identifiers = [auth.EmailIdentifier(email) for email in emails[start:start + LOOKUP_CHUNK]]
+            for user in auth.get_users(identifiers).users:
+                if user.email:
+                    accounts[user.email.lower()] = user.uid
+        return accounts
+    
+    def _import_users(self, job: ImportJob, rows: list) -> list:
+        """Create Auth users for rows with one import_users call; returns the rows that succeeded
+        
+        No password hash is imported: the users sign in once they have set a
+        password through a reset link.
+        """
+        from firebase_admin import auth
+        firebase_manager.initialize()
+        
+        records = [
+            auth.ImportUserRecord(
+                uid=citizen_uid(data['nic']),
+                email=data['email'],
+                display_name=data['name'],
+                phone_number=data.get('phone'),
+                custom_claims={'role': 'citizen'}
+            )
+            for _, data, _ in rows
+        ]
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            try:
+                result = auth.import_users(records)
+                break
+            except Exception as e:
+                if attempt == MAX_ATTEMPTS:
+                    for number, data, _ in rows:
+                        job.reject(number, data['nic'], [f"Auth import failed: {e}"])
+                    return []
+                # Uids are derived from NICs, so a retried import rewrites the same users
+                logger.warning(f"import_users attempt {attempt} failed ({e}); retrying")
+                time.sleep(2 ** attempt)
+        
+        failed = {error.index: error.reason for error in result.errors}
+        for index, reason in failed.items():
+            number, data, _ = rows[index]
+            job.reject(number, data['nic'], [f"Auth: {reason}"])
+        return [row for index, row in enumerate(rows) if index not in failed]
@@ -0,0 +1,183 @@
+"""
+Content-Addressed Document Storage
+Stores each distinct uploaded file once, keyed by its SHA-256
+
+Citizens upload the same NIC scan or birth certificate for each of their
+appointments. Uploads are streamed to a staging key while their SHA-256
+is computed. The file is then kept at blobs/<aa>/<sha256> if that content
+is new, or the staged copy is dropped if it is already stored. Each
+stored blob has a record in the documentBlobs collection (document id =
+SHA-256) counting the documents records that reference it. Deleting a
+document releases its reference, and the blob is removed only when the
+count reaches zero. The last release leaves a 'deleting' tombstone on
+the record until the file is gone, so an upload of the same content
+waits instead of having its new file deleted under it.
+"""
+
+import logging
+import time
+import uuid
+from datetime import datetime
+from typing import Any, BinaryIO, Callable, Dict, Optional, Tuple
+
+from database.firebase_config import get_db
+from database.storage import StorageBackend, StoredObject
+
+logger = logging.getLogger(__name__)
+
+BLOB_COLLECTION = 'documentBlobs'
+BLOB_PREFIX = 'blobs'
+STAGING_PREFIX = 'incoming'
+
+# Blob record states: file not yet confirmed in place, in place, being deleted
+PENDING = 'pending'
+STORED = 'stored'
+DELETING = 'deleting'
+# A release that hasn't removed its tombstone after this long is assumed to have died
+TOMBSTONE_TIMEOUT = 60  # seconds
+TOMBSTONE_POLL = 0.2  # seconds
+
+def content_key(sha256: str) -> str:
+    """Storage key of the blob with this SHA-256"""
+    return f"{BLOB_PREFIX}/{sha256[:2]}/{sha256}"
+
+def is_content_key(key: Optional[str]) -> bool:
+    return bool(key) and key.startswith(BLOB_PREFIX + '/')
+
+class ContentStore:
+    """Deduplicating, reference-counted blob storage on top of a StorageBackend"""
+    
+    def __init__(self, storage: StorageBackend, db=None):
+        self.storage = storage
+        self._db = db
+    
+    @property
+    def db(self):
+        if self._db is None:
+            self._db = get_db()
+        return self._db
+    
+    def put(self, stream: BinaryIO, content_type: Optional[str] = None, size: Optional[int] = None,
+            max_size: Optional[int] = None) -> Tuple[StoredObject, bool]:
+        """
+        Store a file and take a reference to its blob
+        
+        Returns:
+            The stored blob, and whether identical content was already stored
+        """
+        staged = self.storage.upload(stream, f"{STAGING_PREFIX}/{uuid.uuid4().hex}", content_type, size, max_size)
+        key = content_key(staged.sha256)
+        try:
+            while True:
+                references, state = self._add_reference(staged, key)
+                if state != DELETING:
+                    break
+                # The blob is being deleted; store this copy once that has finished
+                time.sleep(TOMBSTONE_POLL)
+        except Exception:
+            self.storage.delete(staged.key)
+            raise
+        
+        if state == STORED:
+            self.storage.delete(staged.key)
+        else:
+            # The first uploader's move may not have happened yet, or may fail: put this copy in place too
+            try:
+                self.storage.move(staged.key, key)
+            except Exception:
+                self.release(staged.sha256)
+                self.storage.delete(staged.key)
+                raise
+            self._mark_stored(staged.sha256)
+        
+        stored = StoredObject(key, staged.size, staged.sha256, staged.md5, content_type, self.storage.name)
+        return stored, references > 1
+    
+    def release(self, sha256: str, document_ref=None) -> Optional[bool]:
+        """
+        Drop one reference to a blob; returns True if that deleted the blob
+        
+        With document_ref, the referencing document is deleted in the same
+        transaction, so a retried delete can't release its reference twice;
+        returns None (releasing nothing) if that document is already gone.
+        """
+        token = uuid.uuid4().hex
+        
+        def decrement(transaction, blob_ref, record) -> Optional[bool]:
+            if document_ref is not None:
+                if not document_ref.get(transaction=transaction).exists:
+                    return None
+                transaction.delete(document_ref)
+            if record is None or record.get('state') == DELETING:
+                return False
+            references = record.get('ref_count', 1) - 1
+            if references > 0:
+                transaction.update(blob_ref, {'ref_count': references, 'updated_at': datetime.utcnow()})
+                return False
+            # Tombstone: puts of this content wait until the file is gone rather than reuse it
+            transaction.update(blob_ref, {
+                'ref_count': 0, 'state': DELETING, 'release_token': token,
+                'deleting_since': time.time(), 'updated_at': datetime.utcnow()
+            })
+            return True
+        
+        def clear_tombstone(transaction, blob_ref, record):
+            # A put that found the tombstone stale may have taken the record over since
+            if record is not None and record.get('release_token') == token:
+                transaction.delete(blob_ref)
+        
+        released = self._transact(sha256, decrement)
+        if not released:
+            return released
+        self.storage.delete(content_key(sha256))
+        self._transact(sha256, clear_tombstone)
+        logger.info(f"Deleted unreferenced blob {sha256}")
+        return True
+    
+    def _add_reference(self, stored: StoredObject, key: str) -> Tuple[int, str]:
+        """Count one more reference to the blob, creating its record if new; returns the new count and the blob's state"""
+        def increment(transaction, blob_ref, record) -> Tuple[int, str]:
+            if record is not None and record.get('state') == DELETING:
+                if time.time() - record.get('deleting_since', 0) < TOMBSTONE_TIMEOUT:
+                    return 0, DELETING
+                # Its release died before removing the record
+                record = None
+            now = datetime.utcnow()
+            if record is not None:
+                references = record.get('ref_count', 0) + 1
+                transaction.update(blob_ref, {'ref_count': references, 'updated_at': now})
+                return references, record.get('state', STORED)
+            transaction.set(blob_ref, {
+                'storage_key': key,
+                'size': stored.size,
+                'md5': stored.md5,
+                'content_type': stored.content_type,
+                'ref_count': 1,
+                'state': PENDING,
+                'created_at': now,
+                'updated_at': now
+            })
+            return 1, PENDING
+        
+        return self._transact(stored.sha256, increment)
+    
+    def _mark_stored(self, sha256: str):
+        """Record that the blob's file is in place, unless its references were released meanwhile"""
+        def mark(transaction, blob_ref, record):
+            if record is not None and record.get('state') == PENDING:
+                transaction.update(blob_ref, {'state': STORED, 'updated_at': datetime.utcnow()})
+        
+        self._transact(sha256, mark)
+    
+    def _transact(self, sha256: str, change: Callable[[Any, Any, Optional[Dict[str, Any]]], Any]) -> Any:
+        """Run change(transaction, blob_ref, record or None) in a transaction on one blob's record"""
+        from google.cloud import firestore
+        
+        blob_ref = self.db.collection(BLOB_COLLECTION).document(sha256)
+        
+        @firestore.transactional
+        def run(transaction):
+            snapshot = blob_ref.get(transaction=transaction)
+            return change(transaction, blob_ref, snapshot.to_dict() if snapshot.exists else None)
+        
+        return run(self.db.transaction())
@@ -0,0 +1,245 @@
+"""
+Document Post-Processing
+Inspects uploaded documents in the background instead of on the upload request
+
+Each upload is queued to a small thread pool that:
+  - sniffs the MIME type from the first few KB of the stored file and
+    rejects files whose content doesn't match their extension
+  - for photos, writes a JPEG thumbnail and, if the photo is oversized,
+    a downscaled, recompressed copy (the original is kept)
+  - for PDFs, counts the pages
+and writes the results back to the documents record with a
+processing_status of done, rejected or failed.
+
+Image decoding and encoding, and PDF scanning, run in a process pool so
+they use every core and don't hold the GIL of the web process.
+"""
+
+import io
+import logging
+import multiprocessing
+import os
+import re
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from database.storage import StorageBackend
+
+logger = logging.getLogger(__name__)
+
+# Bytes read to sniff a file's type
+SNIFF_BYTES = 8192
+THUMBNAIL_SIZE = (256, 256)
+# Photos larger than this (pixels on the long side, or bytes) get a recompressed copy
+MAX_IMAGE_DIMENSION = 1600
+RECOMPRESS_BYTES = 2 * 1024 * 1024
+JPEG_QUALITY = 85
+PROCESSING_WORKERS = 4
+
+IMAGE_TYPES = {'image/jpeg', 'image/png'}
+PDF_TYPE = 'application/pdf'
+
+# Sniffed types each extension may have
+EXTENSION_TYPES = {
+    '.pdf': {PDF_TYPE},
+    '.jpg': {'image/jpeg'},
+    '.jpeg': {'image/jpeg'},
+    '.png': {'image/png'},
+    '.doc': {'application/msword', 'application/x-ole-storage', 'application/CDFV2'},
+    '.docx': {'application/vnd.openxmlformats-officedocument.wordprocessingml.document', 'application/zip'}
+}
+
+# Used when libmagic isn't available
+_SIGNATURES = [
+    (b'%PDF-', PDF_TYPE),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', 'application/x-ole-storage'),
+    (b'PK\x03\x04', 'application/zip')
+]
+
+ORIENTATION_TAG = 0x0112
+
+_PDF_PAGE = re.compile(rb'/Type\s*/Page(?![A-Za-z])')
+
+def sniff_mime(head: bytes) -> str:
+    """MIME type of a file from its first bytes"""
+    try:
+        import magic
+        return magic.from_buffer(head, mime=True)
+    except ImportError:  # python-magic without libmagic installed
+        pass
+    for signature, mime in _SIGNATURES:
+        if head.startswith(signature):
+            return mime
+    return 'application/octet-stream'
+
+def derived_keys(document: Dict[str, Any]) -> List[str]:
+    """Storage keys of the files processing created for a document"""
+    return [document[field] for field in ('thumbnail_key', 'optimized_key') if document.get(field)]
+
+# --- CPU-bound steps, run in the process pool ---
+
+def render_image(data: bytes, thumbnail_size=THUMBNAIL_SIZE, max_dimension: int = MAX_IMAGE_DIMENSION,
+                 recompress_bytes: int = RECOMPRESS_BYTES, quality: int = JPEG_QUALITY) -> Dict[str, Any]:
+    """Dimensions, a JPEG thumbnail and, for oversized photos, a smaller JPEG copy"""
+    from PIL import Image, ImageOps
+    
+    with Image.open(io.BytesIO(data)) as image:
+        width, height = image.size
+        oversized = max(width, height) > max_dimension or len(data) > recompress_bytes
+        # JPEGs can decode straight at 1/2, 1/4 or 1/8 scale, far cheaper than in full;
+        # draft() keeps a scale only if both sides stay at least the requested size
+        target = max_dimension if oversized else max(thumbnail_size)
+        ratio = min(1.0, target / max(width, height))
+        image.draft('RGB', (int(width * ratio), int(height * ratio)))
+        
+        orientation = image.getexif().get(ORIENTATION_TAG, 1)
+        if orientation != 1:
+            image = ImageOps.exif_transpose(image)
+            if orientation in (5, 6, 7, 8):  # rotated a quarter turn
+                width, height = height, width
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        
+        # Each step shrinks the image in place: full size -> optimized copy -> thumbnail
+        result: Dict[str, Any] = {'width': width, 'height': height}
+        if oversized:
+            image.thumbnail((max_dimension, max_dimension))
+            out = io.BytesIO()
+            image.save(out, 'JPEG', quality=quality, optimize=True)
+            if out.tell() < len(data):
+                result['optimized'] = out.getvalue()
+                result['optimized_width'], result['optimized_height'] = image.size
+        
+        image.thumbnail(thumbnail_size)
+        out = io.BytesIO()
+        image.save(out, 'JPEG', quality=80)
+        result['thumbnail'] = out.getvalue()
+    return result
+
+def count_pdf_pages(data: bytes) -> Optional[int]:
+    """Page objects in a PDF; None when they're hidden in compressed object streams"""
+    return len(_PDF_PAGE.findall(data)) or None
+
+# --- Pipeline ---
+
+def _update_document(document_id: str, fields: Dict[str, Any]):
+    from database.firebase_config import get_db
+    from database.repositories import stamp_updated_at
+    
+    get_db().collection('documents').document(document_id).update(stamp_updated_at(fields))
+
+class DocumentProcessor:
+    """Background post-processing of uploaded documents"""
+    
+    def __init__(self, storage: StorageBackend, workers: int = PROCESSING_WORKERS,
+                 process_workers: Optional[int] = None,
+                 update: Optional[Callable[[str, Dict[str, Any]], None]] = None):
+        """
+        Args:
+            storage: Backend the documents are stored in
+            workers: Threads fetching files and writing results
+            process_workers: Processes for image and PDF work (default one per core; 0 runs it in the thread)
+            update: Writes result fields to a document (default: the documents collection)
+        """
+        self.storage = storage
+        self.process_workers = process_workers
+        self._update = update or _update_document
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix='document-processing')
+        self._processes: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.counts = {'queued': 0, 'done': 0, 'rejected': 0, 'failed': 0}
+        self.seconds = 0.0
+    
+    def submit(self, document_id: str, document: Dict[str, Any]) -> Future:
+        """Queue a stored document; its record should already have processing_status 'pending'"""
+        with self._lock:
+            self.counts['queued'] += 1
+        return self._executor.submit(self.process, document_id, document)
+    
+    def process(self, document_id: str, document: Dict[str, Any]) -> Dict[str, Any]:
+        """Inspect one document and write the results to its record"""
+        start = time.perf_counter()
+        try:
+            result = self._inspect(document)
+        except Exception as e:
+            logger.error(f"Processing document {document_id} failed: {e}")
+            result = {'processing_status': 'failed', 'processing_error': str(e)}
+        result['processed_at'] = datetime.utcnow()
+        
+        with self._lock:
+            self.counts[result['processing_status']] += 1
+            self.seconds += time.perf_counter() - start
+        try:
+            self._update(document_id, result)
+        except Exception as e:
+            logger.error(f"Saving processing results for document {document_id} failed: {e}")
+        return result
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            finished = self.counts['done'] + self.counts['rejected'] + self.counts['failed']
+            return {
+                **self.counts,
+                'in_progress': self.counts['queued'] - finished,
+                'avg_seconds': round(self.seconds / finished, 4) if finished else 0
+            }
+    
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+        if self._processes is not None:
+            self._processes.shutdown(wait=wait)
+    
+    def _inspect(self, document: Dict[str, Any]) -> Dict[str, Any]:
+        key = document['storage_key']
+        extension = os.path.splitext(document.get('filename', ''))[1].lower()
+        
+        mime = sniff_mime(self.storage.read_range(key, 0, SNIFF_BYTES))
+        result: Dict[str, Any] = {'mime_type': mime}
+        allowed = EXTENSION_TYPES.get(extension)
+        if allowed is not None and mime not in allowed:
+            result['processing_status'] = 'rejected'
+            result['processing_error'] = f"File content is {mime}, not {extension}"
+            return result
+        
+        if mime in IMAGE_TYPES:
+            result.update(self._process_image(key))
+        elif mime == PDF_TYPE:
+            result['page_count'] = self._run_cpu(count_pdf_pages, self._read(key))
+        result['processing_status'] = 'done'
+        return result
+    
+    def _process_image(self, key: str) -> Dict[str, Any]:
+        rendered = self._run_cpu(render_image, self._read(key))
+        base = os.path.splitext(key)[0]
+        result = {'width': rendered['width'], 'height': rendered['height']}
+        
+        thumbnail = self.storage.upload(io.BytesIO(rendered['thumbnail']), f"{base}.thumb.jpg", 'image/jpeg')
+        result['thumbnail_key'] = thumbnail.key
+        if 'optimized' in rendered:
+            optimized = self.storage.upload(io.BytesIO(rendered['optimized']), f"{base}.optimized.jpg", 'image/jpeg')
+            result.update({
+                'optimized_key': optimized.key,
+                'optimized_size': optimized.size,
+                'optimized_width': rendered['optimized_width'],
+                'optimized_height': rendered['optimized_height']
+            })
+        return result
+    
+    def _read(self, key: str) -> bytes:
+        with self.storage.open(key) as stored:
+            return stored.read()
+    
+    def _run_cpu(self, function: Callable, *args):
+        if self.process_workers == 0:
+            return function(*args)
+        with self._lock:
+            if self._processes is None:
+                # Spawned rather than forked: the web process has threads running
+                self._processes = ProcessPoolExecutor(self.process_workers,
+                                                      mp_context=multiprocessing.get_context('spawn'))
+        return self._processes.submit(function, *args).result()
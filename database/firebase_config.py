@@ -2,10 +2,12 @@
 Firebase Configuration and Connection Management
 """
 
-import firebase_admin
-from firebase_admin import credentials, firestore, storage
+import asyncio
+import concurrent.futures
+import contextvars
 import os
-from typing import Optional
+import threading
+from typing import Optional, Callable, Any
 import logging
 
 # Configure logging
@@ -13,43 +15,71 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class FirebaseManager:
-    """Singleton class for managing Firebase connections"""
+    """Singleton class for managing Firebase connections
+    
+    Nothing is imported from firebase_admin and no connection is opened
+    until the first client is requested, so importing this module (and
+    everything that imports it) stays cheap.
+    """
     
     _instance = None
     _db = None
+    # The asyncio client and the one event loop it lives on (grpc.aio channels are bound to their loop)
+    _loop = None
+    _async_db = None
     _bucket = None
     _initialized = False
+    _service_account_path = None
+    _lock = threading.Lock()
     
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(FirebaseManager, cls).__new__(cls)
         return cls._instance
     
+    def configure(self, service_account_path: Optional[str] = None):
+        """Record credentials for a later, on-demand initialize()"""
+        self._service_account_path = service_account_path
+    
     def initialize(self, service_account_path: Optional[str] = None):
         """Initialize Firebase Admin SDK"""
         if self._initialized:
             return
         
-        try:
-            if service_account_path and os.path.exists(service_account_path):
-                # Use service account key file
-                cred = credentials.Certificate(service_account_path)
-                firebase_admin.initialize_app(cred, {
-                    'storageBucket': 'nova-veritas.appspot.com'  
-                })
-            else:
-                # Use default credentials (for deployed environments)
-                firebase_admin.initialize_app()
+        with self._lock:
+            if self._initialized:
+                return
             
-            self._db = firestore.client()
-            self._bucket = storage.bucket()
-            self._initialized = True
+            import firebase_admin
+            from firebase_admin import credentials, firestore, storage
             
-            logger.info("Firebase initialized successfully")
+            service_account_path = service_account_path or self._service_account_path
             
-        except Exception as e:
-            logger.error(f"Failed to initialize Firebase: {str(e)}")
-            raise
+            try:
+                if service_account_path and os.path.exists(service_account_path):
+                    # Use service account key file
+                    cred = credentials.Certificate(service_account_path)
+                    firebase_admin.initialize_app(cred, {
+                        'storageBucket': 'nova-veritas.appspot.com'  
+                    })
+                else:
+                    # Use default credentials (for deployed environments)
+                    firebase_admin.initialize_app()
+                
+                self._db = firestore.client()
+                self._bucket = storage.bucket()
+                self._initialized = True
+                
+                logger.info("Firebase initialized successfully")
+            
+            except Exception as e:
+                logger.error(f"Failed to initialize Firebase: {str(e)}")
+                raise
+    
+    @property
+    def initialized(self) -> bool:
+        """Whether the SDK has been initialized yet"""
+        return self._initialized
     
     @property
     def db(self):
@@ -58,6 +88,56 @@ class FirebaseManager:
             self.initialize()
         return self._db
     
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """The event loop shared by all async Firestore work, run by a daemon thread started on first use"""
+        if self._loop is None:
+            with self._lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(target=loop.run_forever, name='firestore-async-loop', daemon=True).start()
+                    self._loop = loop
+        return self._loop
+    
+    def run(self, coroutine):
+        """
+        Run a coroutine on the shared loop and wait for its result
+        
+        The task runs in a copy of the caller's context, so context variables
+        (like Flask's request and g) stay visible to it.
+        """
+        context = contextvars.copy_context()
+        outcome = concurrent.futures.Future()
+        
+        def finish(task):
+            if task.cancelled():
+                outcome.cancel()
+            elif task.exception() is not None:
+                outcome.set_exception(task.exception())
+            else:
+                outcome.set_result(task.result())
+        
+        def start():
+            context.run(self.loop.create_task, coroutine).add_done_callback(finish)
+        
+        self.loop.call_soon_threadsafe(start)
+        return outcome.result()
+    
+    @property
+    def async_db(self):
+        """Get the asyncio Firestore client (created on first use); only usable on the shared loop"""
+        if asyncio.get_running_loop() is not self._loop:
+            raise RuntimeError("The async Firestore client lives on firebase_manager.loop; "
+                               "run coroutines with firebase_manager.run()")
+        if self._async_db is None:
+            if not self._initialized:
+                self.initialize()
+            from firebase_admin import firestore_async
+            
+            # Built on the loop thread, the only thread that gets here
+            self._async_db = firestore_async.client()
+        return self._async_db
+    
     @property
     def bucket(self):
         """Get Storage bucket instance"""
@@ -65,15 +145,34 @@ class FirebaseManager:
             self.initialize()
         return self._bucket
     
-    def health_check(self) -> bool:
+    def health_check(self, timeout: Optional[float] = None) -> bool:
         """Check if Firebase connection is healthy"""
         try:
             # Try to read from a system collection
-            self.db.collection('_health').limit(1).get()
+            self.db.collection('_health').limit(1).get(timeout=timeout)
             return True
         except Exception as e:
             logger.error(f"Firebase health check failed: {str(e)}")
             return False
+    
+    def storage_health_check(self, timeout: Optional[float] = None) -> bool:
+        """Check if the Storage bucket is reachable"""
+        try:
+            # Listing needs only object read access, unlike bucket metadata
+            list(self.bucket.list_blobs(max_results=1, timeout=timeout or 60))
+            return True
+        except Exception as e:
+            logger.error(f"Storage health check failed: {str(e)}")
+            return False
+
+class LazyClient:
+    """Stand-in for a Firebase client that is resolved on first attribute access"""
+    
+    def __init__(self, resolve: Callable[[], Any]):
+        self._resolve = resolve
+    
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
 
 # Global instance
 firebase_manager = FirebaseManager()
@@ -82,10 +181,31 @@ def get_db():
     """Get Firestore database instance"""
     return firebase_manager.db
 
+def get_async_db():
+    """Get the asyncio Firestore client, from a coroutine running on firebase_manager.loop"""
+    return firebase_manager.async_db
+
 def get_storage():
     """Get Storage bucket instance"""
     return firebase_manager.bucket
 
+def get_auth():
+    """firebase_admin.auth, imported on first use with Firebase initialized"""
+    firebase_manager.initialize()
+    from firebase_admin import auth
+    return auth
+
 def initialize_firebase(service_account_path: Optional[str] = None):
     """Initialize Firebase with optional service account path"""
     firebase_manager.initialize(service_account_path)
+
+def configure_firebase(service_account_path: Optional[str] = None):
+    """Defer Firebase initialization until the first database/storage access"""
+    firebase_manager.configure(service_account_path)
+
+# Handles that connect on first use, for long-lived processes like the API server
+lazy_db = LazyClient(get_db)
+lazy_bucket = LazyClient(get_storage)
+lazy_auth = LazyClient(get_auth)
+# Resolved on every attribute access, so it is only touched from the shared loop
+lazy_async_db = LazyClient(get_async_db)
@@ -6,6 +6,7 @@ Creates and manages Firestore indexes for optimal query performance
 from database.firebase_config import get_db
 from database.schema import FIRESTORE_INDEXES
 from database.models import ADDITIONAL_INDEXES
+from database.repositories import DocumentRepository
 import json
 
 class IndexManager:
@@ -17,8 +18,8 @@ class IndexManager:
     def generate_index_config(self) -> dict:
         """Generate complete index configuration for Firebase CLI"""
         
-        # Combine original and additional indexes
-        all_indexes = FIRESTORE_INDEXES + ADDITIONAL_INDEXES
+        # Combine original, additional and repository query indexes
+        all_indexes = FIRESTORE_INDEXES + ADDITIONAL_INDEXES + DocumentRepository.required_indexes()
         
         config = {
             "indexes": all_indexes,
@@ -80,7 +81,7 @@ class IndexManager:
         print("📊 Required Firestore Indexes:")
         print("=" * 50)
         
-        all_indexes = FIRESTORE_INDEXES + ADDITIONAL_INDEXES
+        all_indexes = FIRESTORE_INDEXES + ADDITIONAL_INDEXES + DocumentRepository.required_indexes()
         
         for i, index in enumerate(all_indexes, 1):
             collection = index['collectionGroup']
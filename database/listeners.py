@@ -3,124 +3,243 @@ Real-time Database Listeners
 Monitors database changes for notifications and real-time updates
 """
 
-from firebase_admin import firestore
-from database.firebase_config import get_db
+from database.change_dispatch import OverflowPolicy
+from database.change_feed import ChangeEvent, ChangeFeedHub, ChangeType, get_change_feed, recent_scope
+from database.repositories import UPDATED_AT_FIELD
 from database.schema import CollectionNames
-from typing import Callable, Dict, Any
+from datetime import timedelta
+from typing import Callable, Dict, Any, Iterable, List, Optional, Tuple
 import logging
+import threading
 
 logger = logging.getLogger(__name__)
 
+APPOINTMENT_COLLECTIONS = [
+    CollectionNames.PASSPORT_APPOINTMENTS,
+    CollectionNames.LICENSE_APPOINTMENTS,
+    CollectionNames.MEDICAL_APPOINTMENTS
+]
+
+TIME_SLOT_COLLECTIONS = [
+    CollectionNames.PASSPORT_TIME_SLOTS,
+    CollectionNames.LICENSE_TIME_SLOTS,
+    CollectionNames.MEDICAL_TIME_SLOTS
+]
+
+# Appointment fields whose old and new values are reported on change
+APPOINTMENT_WATCHED_FIELDS = ('status', 'scheduledDateTime', 'timeSlotId')
+
+# Final appointment statuses; appointments reaching one are dropped from the state cache
+TERMINAL_APPOINTMENT_STATUSES = frozenset(['completed', 'cancelled', 'passed', 'failed'])
+
+FieldDiff = Dict[str, Dict[str, Any]]
+
+class _Unknown:
+    """Old value of a field on a document the feed had not seen before"""
+    
+    def __repr__(self) -> str:
+        return 'unknown'
+    
+    __str__ = __repr__
+
+UNKNOWN = _Unknown()
+
+class DocumentStateCache:
+    """Last known values of a few watched fields per document
+    
+    Filled from a listener's initial snapshot and kept current by its
+    changes, so each change can be reported as {field: {'old', 'new'}}
+    without reading the document again. Only the watched fields are
+    kept, as a tuple per document, and documents whose status is
+    terminal are evicted. A later modification of an evicted document
+    is ignored while its status stays terminal. A document that a write
+    moved into the feed's scope is reported with every old value UNKNOWN.
+    """
+    
+    def __init__(self, fields: Iterable[str], status_field: str = 'status',
+                 terminal_statuses: Iterable[str] = ()):
+        self.fields = tuple(fields)
+        self._status_index = self.fields.index(status_field)
+        self.terminal_statuses = frozenset(terminal_statuses)
+        self._states: Dict[Tuple[str, str], tuple] = {}
+        self._lock = threading.Lock()
+        self.evicted = 0
+    
+    def __len__(self) -> int:
+        return len(self._states)
+    
+    def apply(self, event: ChangeEvent) -> FieldDiff:
+        """Record the event's document state and return the watched fields it changed"""
+        key = (event.collection, event.doc_id)
+        if event.type is ChangeType.REMOVED:
+            with self._lock:
+                self._states.pop(key, None)
+            return {}
+        
+        state = tuple(event.data.get(field) for field in self.fields)
+        terminal = state[self._status_index] in self.terminal_statuses
+        with self._lock:
+            previous = self._states.get(key)
+            if terminal:
+                if self._states.pop(key, None) is not None or event.initial:
+                    self.evicted += 1
+            else:
+                self._states[key] = state
+        
+        if event.initial:
+            return {}
+        if previous is None:
+            if event.entered_scope:
+                previous = (UNKNOWN,) * len(self.fields)
+            elif event.type is ChangeType.MODIFIED and terminal:
+                return {}  # already terminal when it was evicted
+            else:
+                previous = (None,) * len(self.fields)
+        return {
+            field: {'old': old, 'new': new}
+            for field, old, new in zip(self.fields, previous, state)
+            if old != new
+        }
+    
+    def clear(self):
+        with self._lock:
+            self._states.clear()
+    
+    def info(self) -> Dict[str, int]:
+        return {'documents': len(self._states), 'evicted': self.evicted}
+
 class DatabaseListener:
-    """Real-time database listeners for GovConnect"""
+    """Real-time database listeners for GovConnect
+    
+    Each listen_* call subscribes to the shared change feed, so every
+    collection is watched by one snapshot listener however many
+    callbacks follow it. Callbacks receive changes made after they were
+    registered, not the documents that already existed.
+    """
     
-    def __init__(self):
-        self.db = get_db()
+    def __init__(self, hub: Optional[ChangeFeedHub] = None):
+        self._hub = hub
         self.listeners = {}
+        self.appointment_states = DocumentStateCache(
+            APPOINTMENT_WATCHED_FIELDS, terminal_statuses=TERMINAL_APPOINTMENT_STATUSES
+        )
+        self._appointment_callbacks: List[Callable[[ChangeEvent, FieldDiff], None]] = []
+    
+    @property
+    def hub(self) -> ChangeFeedHub:
+        """Change feed the listeners subscribe to, the shared one by default"""
+        if self._hub is None:
+            self._hub = get_change_feed()
+        return self._hub
+    
+    def scope_appointments(self, lookback: timedelta):
+        """Only follow appointments written no more than lookback ago
+        
+        scheduledDateTime is stored as a string, so the scope compares the
+        updated_at timestamp every write stamps instead. The cutoff is fixed
+        when the listener starts: an older appointment written later enters
+        the scope, and is reported as modified (entered_scope) rather than new.
+        """
+        for collection_name in APPOINTMENT_COLLECTIONS:
+            self.hub.set_scope(collection_name, recent_scope(UPDATED_AT_FIELD, lookback))
+    
+    def _subscribe(self, name: str, collection_name: str, handler: Callable[[ChangeEvent], None],
+                   *types: ChangeType, include_initial: bool = False,
+                   overflow: OverflowPolicy = OverflowPolicy.DROP_OLDEST):
+        """Subscribe a handler; notification side effects drop their oldest events rather than stall the feed"""
+        self.listeners[name] = self.hub.subscribe(collection_name, handler, types=types,
+                                                  include_initial=include_initial, name=name, overflow=overflow)
+    
+    def _on_appointment_event(self, event: ChangeEvent):
+        diff = self.appointment_states.apply(event)
+        if diff:
+            for callback in self._appointment_callbacks:
+                callback(event, diff)
+    
+    def _follow_appointment_state(self, callback: Callable[[ChangeEvent, FieldDiff], None]):
+        """Route diffed appointment changes to callback, subscribing the state cache once"""
+        self._appointment_callbacks = self._appointment_callbacks + [callback]
+        for collection_name in APPOINTMENT_COLLECTIONS:
+            name = f"{collection_name}_state"
+            if name not in self.listeners:
+                # The initial snapshot is what fills the cache, and a lost change would leave it wrong
+                self._subscribe(name, collection_name, self._on_appointment_event, include_initial=True,
+                                overflow=OverflowPolicy.BLOCK)
+    
+    def listen_appointment_changes(self, callback: Callable[[str, Dict[str, Any], FieldDiff], None]):
+        """Listen for changes to watched appointment fields, with each field's old and new value"""
+        
+        def on_appointment_change(event: ChangeEvent, diff: FieldDiff):
+            callback(event.doc_id, event.data, diff)
+        
+        self._follow_appointment_state(on_appointment_change)
     
     def listen_appointment_status_changes(self, callback: Callable[[str, Dict[str, Any]], None]):
         """Listen for appointment status changes"""
         
-        def on_appointment_change(doc_snapshot, changes, read_time):
-            for change in changes:
-                if change.type.name == 'MODIFIED':
-                    doc_data = change.document.to_dict()
-                    old_status = getattr(change.document, '_old_status', None)
-                    new_status = doc_data.get('status')
-                    
-                    if old_status != new_status:
-                        logger.info(f"Appointment {change.document.id} status changed: {old_status} -> {new_status}")
-                        callback(change.document.id, doc_data)
-        
-        # Listen to all appointment collections
-        collections = [
-            CollectionNames.PASSPORT_APPOINTMENTS,
-            CollectionNames.LICENSE_APPOINTMENTS,
-            CollectionNames.MEDICAL_APPOINTMENTS
-        ]
+        def on_appointment_change(event: ChangeEvent, diff: FieldDiff):
+            if event.type is ChangeType.MODIFIED and 'status' in diff:
+                change = diff['status']
+                logger.info(f"Appointment {event.doc_id} status changed: {change['old']} -> {change['new']}")
+                callback(event.doc_id, event.data)
         
-        for collection_name in collections:
-            listener = self.db.collection(collection_name).on_snapshot(on_appointment_change)
-            self.listeners[f"{collection_name}_status"] = listener
+        self._follow_appointment_state(on_appointment_change)
     
     def listen_new_appointments(self, callback: Callable[[str, Dict[str, Any]], None]):
         """Listen for new appointment creations"""
         
-        def on_new_appointment(doc_snapshot, changes, read_time):
-            for change in changes:
-                if change.type.name == 'ADDED':
-                    doc_data = change.document.to_dict()
-                    logger.info(f"New appointment created: {change.document.id}")
-                    callback(change.document.id, doc_data)
+        def on_new_appointment(event: ChangeEvent):
+            logger.info(f"New appointment created: {event.doc_id}")
+            callback(event.doc_id, event.data)
         
-        collections = [
-            CollectionNames.PASSPORT_APPOINTMENTS,
-            CollectionNames.LICENSE_APPOINTMENTS,
-            CollectionNames.MEDICAL_APPOINTMENTS
-        ]
-        
-        for collection_name in collections:
-            listener = self.db.collection(collection_name).on_snapshot(on_new_appointment)
-            self.listeners[f"{collection_name}_new"] = listener
+        for collection_name in APPOINTMENT_COLLECTIONS:
+            self._subscribe(f"{collection_name}_new", collection_name, on_new_appointment, ChangeType.ADDED)
     
     def listen_citizen_updates(self, callback: Callable[[str, Dict[str, Any]], None]):
         """Listen for citizen profile updates"""
         
-        def on_citizen_change(doc_snapshot, changes, read_time):
-            for change in changes:
-                if change.type.name in ['ADDED', 'MODIFIED']:
-                    doc_data = change.document.to_dict()
-                    logger.info(f"Citizen profile updated: {change.document.id}")
-                    callback(change.document.id, doc_data)
+        def on_citizen_change(event: ChangeEvent):
+            logger.info(f"Citizen profile updated: {event.doc_id}")
+            callback(event.doc_id, event.data)
         
-        listener = self.db.collection(CollectionNames.CITIZENS).on_snapshot(on_citizen_change)
-        self.listeners['citizens_updates'] = listener
+        self._subscribe('citizens_updates', CollectionNames.CITIZENS, on_citizen_change,
+                        ChangeType.ADDED, ChangeType.MODIFIED)
     
     def listen_complaint_submissions(self, callback: Callable[[str, Dict[str, Any]], None]):
         """Listen for new complaint submissions"""
         
-        def on_new_complaint(doc_snapshot, changes, read_time):
-            for change in changes:
-                if change.type.name == 'ADDED':
-                    doc_data = change.document.to_dict()
-                    logger.info(f"New complaint submitted: {change.document.id}")
-                    callback(change.document.id, doc_data)
+        def on_new_complaint(event: ChangeEvent):
+            logger.info(f"New complaint submitted: {event.doc_id}")
+            callback(event.doc_id, event.data)
         
-        listener = self.db.collection(CollectionNames.COMPLAINTS).on_snapshot(on_new_complaint)
-        self.listeners['complaints_new'] = listener
+        self._subscribe('complaints_new', CollectionNames.COMPLAINTS, on_new_complaint, ChangeType.ADDED)
     
     def listen_time_slot_changes(self, callback: Callable[[str, Dict[str, Any]], None]):
         """Listen for time slot availability changes"""
         
-        def on_slot_change(doc_snapshot, changes, read_time):
-            for change in changes:
-                if change.type.name == 'MODIFIED':
-                    doc_data = change.document.to_dict()
-                    if doc_data.get('availability') == 'available':
-                        logger.info(f"Time slot became available: {change.document.id}")
-                        callback(change.document.id, doc_data)
-        
-        collections = [
-            CollectionNames.PASSPORT_TIME_SLOTS,
-            CollectionNames.LICENSE_TIME_SLOTS,
-            CollectionNames.MEDICAL_TIME_SLOTS
-        ]
+        def on_slot_change(event: ChangeEvent):
+            if event.data.get('availability') == 'available':
+                logger.info(f"Time slot became available: {event.doc_id}")
+                callback(event.doc_id, event.data)
         
-        for collection_name in collections:
-            listener = self.db.collection(collection_name).on_snapshot(on_slot_change)
-            self.listeners[f"{collection_name}_availability"] = listener
+        for collection_name in TIME_SLOT_COLLECTIONS:
+            self._subscribe(f"{collection_name}_availability", collection_name, on_slot_change, ChangeType.MODIFIED)
     
     def stop_all_listeners(self):
         """Stop all active listeners"""
-        for name, listener in self.listeners.items():
-            listener.unsubscribe()
+        for name, subscription in self.listeners.items():
+            subscription.unsubscribe()
             logger.info(f"Stopped listener: {name}")
         self.listeners.clear()
+        self._appointment_callbacks = []
+        self.appointment_states.clear()
 
 # Example usage functions
 def setup_notification_listeners():
     """Setup listeners for notification system (Person 5 will use this)"""
     listener = DatabaseListener()
+    # Notifications concern appointments being booked or changed; don't watch the whole history
+    listener.scope_appointments(timedelta(days=1))
     
     def on_status_change(appointment_id: str, data: Dict[str, Any]):
         # Person 5 will implement notification logic here
@@ -135,5 +254,13 @@ def setup_notification_listeners():
     
     return listener
 
-# Global listener instance
-db_listener = DatabaseListener()
+# Shared listener instance, created on first use rather than at import time
+_db_listener: Optional[DatabaseListener] = None
+
+def get_db_listener() -> DatabaseListener:
+    """Get the shared DatabaseListener"""
+    global _db_listener
+    if _db_listener is None:
+        _db_listener = DatabaseListener()
+    return _db_listener
+
@@ -0,0 +1,355 @@
+"""
+Migration Runner
+Versioned, resumable data migrations over whole collections
+
+Migrations are modules in database/migrations/ named vNNNN_<name>.py that
+define MIGRATION. The ones newer than the schema version recorded in
+_metadata/schema are applied in order, bumping the version after each.
+
+Each collection is split into key ranges with Firestore's partition query
+and the ranges are scanned in parallel with __name__ cursors, one page of
+PAGE_SIZE documents at a time. A page's updates are committed in a single
+batch together with its range's checkpoint (_migrations/<id>/partitions),
+so the checkpoint never runs ahead of the writes and an interrupted run
+resumes after the last committed page. Dry runs scan and count affected
+documents without writing anything.
+"""
+
+import importlib.util
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+
+from google.cloud import firestore
+
+from database.bulk_restore import BATCH_SIZE, MAX_ATTEMPTS
+from database.repositories import stamp_updated_at
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+MIGRATION_FILE_PATTERN = re.compile(r'^v(\d{4})_\w+\.py$')
+
+METADATA_COLLECTION = '_metadata'
+MIGRATIONS_COLLECTION = '_migrations'
+
+# A page's updates plus its range checkpoint fill at most one batch
+PAGE_SIZE = BATCH_SIZE - 1
+DEFAULT_WORKERS = 8
+DEFAULT_PARTITIONS = 16
+
+class MigrationError(Exception):
+    """A migration stopped part-way; every committed page is checkpointed"""
+
+class Migration:
+    """A per-document change applied across one or more collections
+    
+    Subclasses implement apply(). fields projects the scan onto the fields
+    apply() reads, which keeps scans of large collections cheap; None
+    reads whole documents.
+    """
+    
+    def __init__(self, description: str, collections: Sequence[str],
+                 fields: Optional[Sequence[str]] = None, migration_id: Optional[str] = None):
+        self.description = description
+        self.collections = list(collections)
+        self.fields = list(fields) if fields is not None else None
+        # Versioned migrations get their id and version from their file name
+        self.id = migration_id
+        self.version: Optional[int] = None
+    
+    def apply(self, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Field updates for one document, or None to leave it unchanged"""
+        raise NotImplementedError
+
+class AddFieldMigration(Migration):
+    """Set a field to a default value on documents that don't have it"""
+    
+    def __init__(self, collections: Sequence[str], field: str, default: Any,
+                 migration_id: Optional[str] = None):
+        super().__init__(f"Add '{field}' (default {default!r})", collections, [field], migration_id)
+        self.field = field
+        self.default = default
+    
+    def apply(self, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if self.field in data:
+            return None
+        return {self.field: self.default}
+
+class RenameFieldMigration(Migration):
+    """Move a field's value to a new name"""
+    
+    def __init__(self, collections: Sequence[str], old_field: str, new_field: str,
+                 migration_id: Optional[str] = None):
+        super().__init__(f"Rename '{old_field}' to '{new_field}'", collections, [old_field], migration_id)
+        self.old_field = old_field
+        self.new_field = new_field
+    
+    def apply(self, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if self.old_field not in data:
+            return None
+        return {self.new_field: data[self.old_field], self.old_field: firestore.DELETE_FIELD}
+
+def discover_migrations(directory: str = MIGRATIONS_DIR) -> List[Migration]:
+    """Versioned migrations in the migrations directory, oldest first"""
+    migrations = []
+    for filename in sorted(os.listdir(directory)):
+        match = MIGRATION_FILE_PATTERN.match(filename)
+        if not match:
+            continue
+        
+        module_name = filename[:-len('.py')]
+        spec = importlib.util.spec_from_file_location(f'database.migrations.{module_name}',
+                                                      os.path.join(directory, filename))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        
+        migration = module.MIGRATION
+        migration.id = module_name
+        migration.version = int(match.group(1))
+        migrations.append(migration)
+    return migrations
+
+def get_schema_version(db) -> int:
+    """Schema version recorded in _metadata/schema; 0 if none"""
+    snapshot = db.collection(METADATA_COLLECTION).document('schema').get()
+    version = (snapshot.to_dict() or {}).get('version') if snapshot.exists else None
+    try:
+        return int(version or 0)
+    except (TypeError, ValueError):
+        logger.warning(f"Unrecognized schema version {version!r}; treating it as 0")
+        return 0
+
+def set_schema_version(db, version: str):
+    db.collection(METADATA_COLLECTION).document('schema').set(stamp_updated_at({'version': version}))
+
+class MigrationRunner:
+    """Applies migrations with parallel range scans and checkpointed batch commits"""
+    
+    def __init__(self, db, workers: int = DEFAULT_WORKERS, partitions: int = DEFAULT_PARTITIONS,
+                 dry_run: bool = False, progress_interval: float = 5.0):
+        self.db = db
+        self.workers = workers
+        # Ranges per collection requested from the partition query
+        self.partitions = partitions
+        self.dry_run = dry_run
+        self.progress_interval = progress_interval
+    
+    def pending(self, migrations: List[Migration]) -> List[Migration]:
+        current = get_schema_version(self.db)
+        return [migration for migration in migrations if migration.version > current]
+    
+    def migrate(self, migrations: Optional[List[Migration]] = None) -> List[Dict[str, Any]]:
+        """Apply every pending versioned migration in order"""
+        migrations = discover_migrations() if migrations is None else migrations
+        pending = self.pending(migrations)
+        if not pending:
+            print(f"✅ Schema is up to date (version {get_schema_version(self.db):04d})")
+            return []
+        
+        reports = []
+        for migration in pending:
+            reports.append(self.run(migration))
+            if not self.dry_run:
+                set_schema_version(self.db, f'{migration.version:04d}')
+                print(f"   🏷️  Schema version is now {migration.version:04d}")
+        return reports
+    
+    def run(self, migration: Migration, rerun_completed: bool = False) -> Dict[str, Any]:
+        """Apply one migration, resuming from its checkpoint
+        
+        A completed migration is skipped unless rerun_completed is set (for
+        one-off migrations that may be run again later). Returns scanned
+        and updated counts per collection; raises MigrationError if any
+        range failed.
+        """
+        state_ref = self.db.collection(MIGRATIONS_COLLECTION).document(migration.id)
+        partitions_ref = state_ref.collection('partitions')
+        print(f"🔧 {migration.id}: {migration.description}{' (dry run)' if self.dry_run else ''}")
+        
+        ranges = None
+        if not self.dry_run:
+            snapshot = state_ref.get()
+            state = snapshot.to_dict() if snapshot.exists else None
+            if state and state.get('status') == 'done':
+                if not rerun_completed:
+                    print(f"   ⏭️  Already applied on {state.get('completed_at')}")
+                    return {'id': migration.id, 'dry_run': False, 'collections': state.get('results', {}),
+                            'seconds': 0.0}
+                self._clear_ranges(partitions_ref)
+            elif state:
+                ranges = sorted((doc.to_dict() for doc in partitions_ref.stream()), key=lambda r: r['key'])
+                print(f"   ↪️  Resuming: {sum(1 for r in ranges if r['done'])}/{len(ranges)} ranges done")
+        
+        if not ranges:
+            ranges = self._plan_ranges(migration)
+            if not self.dry_run:
+                self._save_plan(state_ref, partitions_ref, migration, ranges)
+        
+        print(f"   ⚙️  {len(ranges)} ranges over {len(migration.collections)} collections, "
+              f"{self.workers} workers")
+        
+        tally = _Tally(migration.id, self.progress_interval)
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='migrate') as pool:
+            futures = [pool.submit(self._run_range, migration, partitions_ref, scan_range, tally)
+                       for scan_range in ranges if not scan_range['done']]
+            errors = [future.exception() for future in futures if future.exception() is not None]
+        
+        results = {name: {'scanned': 0, 'updated': 0} for name in migration.collections}
+        for scan_range in ranges:
+            results[scan_range['collection']]['scanned'] += scan_range['scanned']
+            results[scan_range['collection']]['updated'] += scan_range['updated']
+        
+        verb = 'would update' if self.dry_run else 'updated'
+        for name, counts in results.items():
+            print(f"   {'🔍' if self.dry_run else '✅'} {name}: {counts['scanned']:,} scanned, "
+                  f"{verb} {counts['updated']:,}")
+        
+        if errors:
+            raise MigrationError(f"{len(errors)} of {len(futures)} ranges of {migration.id} failed, "
+                                 f"first: {errors[0]}; run it again to resume") from errors[0]
+        
+        if not self.dry_run:
+            state_ref.update({'status': 'done', 'completed_at': datetime.utcnow(), 'results': results})
+        return {'id': migration.id, 'dry_run': self.dry_run, 'collections': results,
+                'seconds': round(tally.elapsed(), 2)}
+    
+    # --- Planning ---
+    
+    def _plan_ranges(self, migration: Migration) -> List[Dict[str, Any]]:
+        ranges = []
+        for name in migration.collections:
+            edges = [None] + self._split_points(name) + [None]
+            for index, (start, end) in enumerate(zip(edges, edges[1:])):
+                ranges.append({
+                    'key': f'{name}__{index:04d}',
+                    'collection': name,
+                    'start': start,        # first document id in the range (inclusive)
+                    'end': end,            # first document id past the range
+                    'last_id': None,       # last document id committed
+                    'scanned': 0,
+                    'updated': 0,
+                    'done': False
+                })
+        return ranges
+    
+    def _split_points(self, collection_name: str) -> List[str]:
+        """Document ids splitting a collection into about self.partitions ranges"""
+        if self.partitions <= 1:
+            return []
+        try:
+            partitions = self.db.collection_group(collection_name).get_partitions(self.partitions)
+            references = [partition.end_at for partition in partitions if partition.end_at is not None]
+        except Exception as e:
+            logger.warning(f"Partition query on {collection_name} failed ({e}); scanning it as one range")
+            return []
+        # A collection group also spans same-named subcollections; keep top-level documents only
+        return sorted({reference.id for reference in references
+                       if reference.parent.id == collection_name and reference.parent.parent is None})
+    
+    def _save_plan(self, state_ref, partitions_ref, migration: Migration, ranges: List[Dict[str, Any]]):
+        state_ref.set({
+            'description': migration.description,
+            'version': migration.version,
+            'collections': migration.collections,
+            'status': 'running',
+            'started_at': datetime.utcnow()
+        })
+        for offset in range(0, len(ranges), BATCH_SIZE):
+            batch = self.db.batch()
+            for scan_range in ranges[offset:offset + BATCH_SIZE]:
+                batch.set(partitions_ref.document(scan_range['key']), scan_range)
+            batch.commit()
+    
+    def _clear_ranges(self, partitions_ref):
+        references = [doc.reference for doc in partitions_ref.stream()]
+        for offset in range(0, len(references), BATCH_SIZE):
+            batch = self.db.batch()
+            for reference in references[offset:offset + BATCH_SIZE]:
+                batch.delete(reference)
+            batch.commit()
+    
+    # --- Scanning ---
+    
+    def _run_range(self, migration: Migration, partitions_ref, scan_range: Dict[str, Any], tally: '_Tally'):
+        collection = self.db.collection(scan_range['collection'])
+        checkpoint_ref = partitions_ref.document(scan_range['key'])
+        
+        while True:
+            query = collection.order_by('__name__')
+            if migration.fields is not None:
+                query = query.select(migration.fields)
+            if scan_range['last_id'] is not None:
+                query = query.start_after((collection.document(scan_range['last_id']),))
+            elif scan_range['start'] is not None:
+                query = query.start_at((collection.document(scan_range['start']),))
+            if scan_range['end'] is not None:
+                query = query.end_before((collection.document(scan_range['end']),))
+            page = list(query.limit(PAGE_SIZE).stream())
+            
+            updates = []
+            for doc in page:
+                change = migration.apply(doc.to_dict() or {})
+                if change:
+                    updates.append((doc.reference, change))
+            
+            progress = {
+                'last_id': page[-1].id if page else scan_range['last_id'],
+                'scanned': scan_range['scanned'] + len(page),
+                'updated': scan_range['updated'] + len(updates),
+                'done': len(page) < PAGE_SIZE
+            }
+            if not self.dry_run:
+                self._commit_page(scan_range['collection'], updates, checkpoint_ref, progress)
+            scan_range.update(progress)
+            tally.add(len(page), len(updates))
+            
+            if progress['done']:
+                return
+    
+    def _commit_page(self, collection_name: str, updates: list, checkpoint_ref, progress: Dict[str, Any]):
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            try:
+                batch = self.db.batch()
+                for reference, change in updates:
+                    # The change wins over the stamp, so migrations can set updated_at themselves
+                    batch.update(reference, {**stamp_updated_at({}), **change})
+                batch.set(checkpoint_ref, progress, merge=True)
+                batch.commit()
+                return
+            except Exception as e:
+                if attempt == MAX_ATTEMPTS:
+                    raise
+                delay = 0.5 * 2 ** (attempt - 1)
+                logger.warning(f"Migration batch on {collection_name} failed ({e}); retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+class _Tally:
+    """Scanned/updated totals across ranges, reported every few seconds"""
+    
+    def __init__(self, label: str, interval: float):
+        self.label = label
+        self.interval = interval
+        self.scanned = 0
+        self.updated = 0
+        self._lock = threading.Lock()
+        self.start = time.perf_counter()
+        self._last_report = self.start
+    
+    def add(self, scanned: int, updated: int):
+        with self._lock:
+            self.scanned += scanned
+            self.updated += updated
+            now = time.perf_counter()
+            if now - self._last_report >= self.interval:
+                self._last_report = now
+                print(f"   ⏳ {self.label}: {self.scanned:,} scanned, {self.updated:,} updated "
+                      f"({self.scanned / (now - self.start):,.0f} docs/sec)")
+    
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
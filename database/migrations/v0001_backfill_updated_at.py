@@ -0,0 +1,31 @@
+"""
+Backfill updated_at
+Stamp documents written before every write set updated_at
+
+Firestore leaves documents without the field out of updated_at range
+queries and orderings, so incremental dumps can't see them change until
+they are next written. Their own createdAt/updatedAt is used when it is a
+timestamp, otherwise the time of the migration.
+"""
+
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from database.migration_runner import Migration
+from database.repositories import UPDATED_AT_FIELD
+from database.schema import ALL_SCHEMAS
+
+class BackfillUpdatedAt(Migration):
+    def apply(self, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if UPDATED_AT_FIELD in data:
+            return None
+        for field in ('updatedAt', 'createdAt'):
+            if isinstance(data.get(field), datetime):
+                return {UPDATED_AT_FIELD: data[field]}
+        return {UPDATED_AT_FIELD: datetime.utcnow()}
+
+MIGRATION = BackfillUpdatedAt(
+    "Backfill updated_at on documents written before it was stamped",
+    collections=list(ALL_SCHEMAS),
+    fields=[UPDATED_AT_FIELD, 'updatedAt', 'createdAt']
+)
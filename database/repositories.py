@@ -0,0 +1,531 @@
+"""
+Repository Layer
+Single place where Firestore queries are built and run
+
+Handlers ask a repository for records instead of composing collection
+names and queries by hand. Every read goes through fetch/stream/get, so
+field projection, batching, caching and query instrumentation are
+applied in one place.
+"""
+
+import base64
+import binascii
+import itertools
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from database.firebase_config import get_db
+from database.schema import CollectionNames, DEPARTMENT_COLLECTIONS
+
+logger = logging.getLogger(__name__)
+
+# (field, operator, value) triples passed to Query.where
+Filter = Tuple[str, str, Any]
+
+# Firestore allows at most 500 writes per batch
+MAX_BATCH_SIZE = 500
+
+# Stamped on every write; incremental backups export documents changed since their last run
+UPDATED_AT_FIELD = 'updated_at'
+
+# Field projections for reads that only aggregate a few fields
+# select() with no fields returns whole documents; projecting __name__ reads just the id
+ID_ONLY_FIELDS = ['__name__']
+STATUS_FIELDS = ['status']
+SCHEDULE_FIELDS = ['scheduledDateTime', 'status']
+PROCESSING_TIME_FIELDS = ['createdAt', 'created_at', 'processedAt', 'processed_at']
+
+# Compact appointment shape for list endpoints; the detail endpoint returns the rest
+# (qrCode, supportingDocuments, remarks and other large or free-text fields)
+APPOINTMENT_SUMMARY_FIELDS = [
+    'appointmentId', 'reference', 'nic', 'timeSlotId', 'scheduledDateTime',
+    'status', 'appointmentType', 'deliveryStatus'
+]
+
+# Document listing: optional equality filters, page sizes, and where per-user totals are kept
+DOCUMENT_LIST_FILTERS = ('document_type', 'appointment_id')
+DOCUMENT_PAGE_SIZE = 20
+MAX_DOCUMENT_PAGE_SIZE = 100
+STORAGE_USAGE_COLLECTION = 'storageUsage'
+
+# Top-level or dotted field paths a client may ask to project
+FIELD_PATH_PATTERN = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)*$')
+MAX_PROJECTED_FIELDS = 32
+
+def parse_field_list(raw: str) -> List[str]:
+    """Parse a comma-separated ?fields= value into field paths for select()"""
+    fields = []
+    for field in raw.split(','):
+        field = field.strip()
+        if not field or field in fields:
+            continue
+        if not FIELD_PATH_PATTERN.match(field):
+            raise ValueError(f"Invalid field name: {field}")
+        fields.append(field)
+    
+    if not fields:
+        raise ValueError("fields must name at least one field")
+    if len(fields) > MAX_PROJECTED_FIELDS:
+        raise ValueError(f"At most {MAX_PROJECTED_FIELDS} fields can be requested")
+    return fields
+
+class QueryStats:
+    """Per collection/operation counters for every repository read"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, Any]] = {}
+    
+    def record(self, collection: str, operation: str, documents: int, seconds: float):
+        key = f"{collection}.{operation}"
+        with self._lock:
+            entry = self._stats.setdefault(key, {'calls': 0, 'documents': 0, 'seconds': 0.0})
+            entry['calls'] += 1
+            entry['documents'] += documents
+            entry['seconds'] += seconds
+        logger.debug(f"{key}: {documents} documents in {seconds * 1000:.1f} ms")
+    
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                key: {**entry, 'seconds': round(entry['seconds'], 4)}
+                for key, entry in self._stats.items()
+            }
+    
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+# Global instance
+query_stats = QueryStats()
+
+def stamp_updated_at(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Set updated_at on document data about to be written; returns the same dict"""
+    data[UPDATED_AT_FIELD] = datetime.utcnow()
+    return data
+
+def _to_record(snapshot) -> Optional[Dict[str, Any]]:
+    """Document snapshot -> dict with its id, or None for an empty document"""
+    data = snapshot.to_dict()
+    if data is None:
+        return None
+    data['id'] = snapshot.id
+    return data
+
+class BaseRepository:
+    """Query construction and instrumented reads/writes for one collection"""
+    
+    collection_name: str = None
+    
+    def __init__(self, collection_name: Optional[str] = None, db=None):
+        self.collection_name = collection_name or self.collection_name
+        # Either the sync or the async Firestore client; resolved lazily
+        self._db = db
+    
+    @property
+    def db(self):
+        return self._db if self._db is not None else get_db()
+    
+    @property
+    def collection(self):
+        return self.db.collection(self.collection_name)
+    
+    def query(self, filters: Sequence[Filter] = (), order_by: Optional[str] = None,
+              direction: str = 'ASCENDING', limit: Optional[int] = None,
+              fields: Optional[List[str]] = None):
+        """Build a query; fields=None reads whole documents, a list projects them"""
+        query = self.collection
+        for field, op, value in filters:
+            query = query.where(field, op, value)
+        if fields is not None:
+            query = query.select(fields)
+        if order_by:
+            query = query.order_by(order_by, direction=direction)
+        if limit:
+            query = query.limit(limit)
+        return query
+    
+    # --- Reads ---
+    
+    def fetch(self, operation: str, query) -> List[Dict[str, Any]]:
+        """Run a query and return its records"""
+        start = time.perf_counter()
+        records = [record for record in map(_to_record, query.stream()) if record is not None]
+        query_stats.record(self.collection_name, operation, len(records), time.perf_counter() - start)
+        return records
+    
+    def stream(self, operation: str, query) -> Iterator[Dict[str, Any]]:
+        """Run a query and yield records as they arrive"""
+        start = time.perf_counter()
+        count = 0
+        try:
+            for snapshot in query.stream():
+                record = _to_record(snapshot)
+                if record is not None:
+                    count += 1
+                    yield record
+        finally:
+            query_stats.record(self.collection_name, operation, count, time.perf_counter() - start)
+    
+    def find_one(self, filters: Sequence[Filter], fields: Optional[List[str]] = None,
+                 operation: str = 'find_one') -> Optional[Dict[str, Any]]:
+        records = self.fetch(operation, self.query(filters, limit=1, fields=fields))
+        return records[0] if records else None
+    
+    def get(self, doc_id: str, fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """Read one document by id; None if it doesn't exist"""
+        start = time.perf_counter()
+        snapshot = self.collection.document(doc_id).get(field_paths=fields)
+        record = _to_record(snapshot) if snapshot.exists else None
+        query_stats.record(self.collection_name, 'get', int(record is not None), time.perf_counter() - start)
+        return record
+    
+    def get_many(self, doc_ids: Sequence[str], fields: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """Read many documents in one batched round trip"""
+        start = time.perf_counter()
+        refs = [self.collection.document(doc_id) for doc_id in doc_ids]
+        records = {}
+        for snapshot in self.db.get_all(refs, field_paths=fields):
+            if snapshot.exists:
+                records[snapshot.id] = _to_record(snapshot)
+        query_stats.record(self.collection_name, 'get_many', len(records), time.perf_counter() - start)
+        return records
+    
+    # --- Writes ---
+    
+    def add(self, data: Dict[str, Any]) -> str:
+        """Create a document with a generated id; returns the id"""
+        _, doc_ref = self.collection.add(stamp_updated_at(data))
+        return doc_ref.id
+    
+    def set(self, doc_id: str, data: Dict[str, Any], merge: bool = False):
+        self.collection.document(doc_id).set(stamp_updated_at(data), merge=merge)
+    
+    def update(self, doc_id: str, data: Dict[str, Any]):
+        self.collection.document(doc_id).update(stamp_updated_at(data))
+    
+    def set_many(self, documents: Dict[str, Dict[str, Any]]) -> int:
+        """Write {doc_id: data} documents in batched commits"""
+        batch = self.db.batch()
+        pending = 0
+        for doc_id, data in documents.items():
+            batch.set(self.collection.document(doc_id), stamp_updated_at(data))
+            pending += 1
+            if pending == MAX_BATCH_SIZE:
+                batch.commit()
+                batch = self.db.batch()
+                pending = 0
+        if pending:
+            batch.commit()
+        return len(documents)
+    
+    def update_many(self, updates: Dict[str, Dict[str, Any]]) -> int:
+        """Apply {doc_id: fields} updates in batched commits"""
+        batch = self.db.batch()
+        pending = 0
+        for doc_id, data in updates.items():
+            batch.update(self.collection.document(doc_id), stamp_updated_at(data))
+            pending += 1
+            if pending == MAX_BATCH_SIZE:
+                batch.commit()
+                batch = self.db.batch()
+                pending = 0
+        if pending:
+            batch.commit()
+        return len(updates)
+    
+    # --- Async client variants (repository built with db=get_async_db()) ---
+    
+    async def fetch_async(self, operation: str, query) -> List[Dict[str, Any]]:
+        start = time.perf_counter()
+        records = [record async for record in self._stream_async(query) if record is not None]
+        query_stats.record(self.collection_name, operation, len(records), time.perf_counter() - start)
+        return records
+    
+    async def _stream_async(self, query):
+        async for snapshot in query.stream():
+            yield _to_record(snapshot)
+    
+    async def find_one_async(self, filters: Sequence[Filter], fields: Optional[List[str]] = None,
+                             operation: str = 'find_one') -> Optional[Dict[str, Any]]:
+        records = await self.fetch_async(operation, self.query(filters, limit=1, fields=fields))
+        return records[0] if records else None
+    
+    async def get_async(self, doc_id: str, fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        start = time.perf_counter()
+        snapshot = await self.collection.document(doc_id).get(field_paths=fields)
+        record = _to_record(snapshot) if snapshot.exists else None
+        query_stats.record(self.collection_name, 'get', int(record is not None), time.perf_counter() - start)
+        return record
+    
+    async def set_async(self, doc_id: str, data: Dict[str, Any], merge: bool = False):
+        await self.collection.document(doc_id).set(stamp_updated_at(data), merge=merge)
+    
+    async def update_async(self, doc_id: str, data: Dict[str, Any]):
+        await self.collection.document(doc_id).update(stamp_updated_at(data))
+
+class AppointmentRepository(BaseRepository):
+    """Appointments of one department"""
+    
+    def __init__(self, department: str, db=None):
+        super().__init__(DEPARTMENT_COLLECTIONS[department][1], db)
+        self.department = department
+    
+    @classmethod
+    def for_department(cls, department: Optional[str], db=None) -> Optional['AppointmentRepository']:
+        """Repository for a department name, or None if it isn't one"""
+        department = (department or '').lower()
+        if department not in DEPARTMENT_COLLECTIONS:
+            return None
+        return cls(department, db)
+    
+    @classmethod
+    def all_departments(cls, db=None) -> List['AppointmentRepository']:
+        return [cls(department, db) for department in DEPARTMENT_COLLECTIONS]
+    
+    def by_nic_query(self, nic: str, fields: Optional[List[str]] = None):
+        return self.query([('nic', '==', nic)], fields=fields)
+    
+    def find_by_nic(self, nic: str, fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        return self.fetch('find_by_nic', self.by_nic_query(nic, fields))
+    
+    def list(self, status: Optional[str] = None, fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Appointments ordered by scheduled time, optionally of one status"""
+        filters = [('status', '==', status)] if status else []
+        return self.fetch('list', self.query(filters, order_by='scheduledDateTime', fields=fields))
+    
+    def scan(self, fields: Optional[List[str]] = None) -> Iterator[Dict[str, Any]]:
+        """Stream the whole collection, projected to the given fields"""
+        return self.stream('scan', self.query(fields=fields))
+    
+    def count(self) -> int:
+        """Number of appointments, reading document names only"""
+        return sum(1 for _ in self.stream('count', self.query(fields=ID_ONLY_FIELDS)))
+
+class TimeSlotRepository(BaseRepository):
+    """Time slots of one department"""
+    
+    def __init__(self, department: str, db=None):
+        super().__init__(DEPARTMENT_COLLECTIONS[department][0], db)
+        self.department = department
+    
+    @classmethod
+    def for_department(cls, department: Optional[str], db=None) -> Optional['TimeSlotRepository']:
+        """Repository for a department name, or None if it isn't one"""
+        department = (department or '').lower()
+        if department not in DEPARTMENT_COLLECTIONS:
+            return None
+        return cls(department, db)
+    
+    def available_on(self, date: str, fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Available slots for a YYYY-MM-DD date, by start time"""
+        query = self.query(
+            [('date', '==', date), ('availability', '==', 'available')],
+            order_by='startTime',
+            fields=fields
+        )
+        return self.fetch('available_on', query)
+
+class CitizenRepository(BaseRepository):
+    """Citizen profiles (document id is the NIC)"""
+    
+    collection_name = CollectionNames.CITIZENS
+    
+    # firebaseUid -> NIC never changes after registration, so it is cached
+    UID_CACHE_SIZE = 10000
+    UID_CACHE_TTL = 300  # seconds
+    _uid_cache: 'OrderedDict[str, Tuple[float, str]]' = OrderedDict()
+    _uid_cache_lock = threading.Lock()
+    
+    def find_by_firebase_uid(self, uid: str, fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        citizen = self.find_one([('firebaseUid', '==', uid)], fields=fields, operation='find_by_firebase_uid')
+        if citizen:
+            self._cache_nic(uid, citizen['id'])
+        return citizen
+    
+    def nic_for_firebase_uid(self, uid: str) -> Optional[str]:
+        """NIC of the citizen with this Firebase UID, served from cache when possible"""
+        with self._uid_cache_lock:
+            cached = self._uid_cache.get(uid)
+            if cached and time.monotonic() - cached[0] < self.UID_CACHE_TTL:
+                self._uid_cache.move_to_end(uid)
+                return cached[1]
+        
+        citizen = self.find_by_firebase_uid(uid, fields=ID_ONLY_FIELDS)
+        return citizen['id'] if citizen else None
+    
+    def _cache_nic(self, uid: str, nic: str):
+        with self._uid_cache_lock:
+            self._uid_cache[uid] = (time.monotonic(), nic)
+            self._uid_cache.move_to_end(uid)
+            while len(self._uid_cache) > self.UID_CACHE_SIZE:
+                self._uid_cache.popitem(last=False)
+
+class DocumentRepository(BaseRepository):
+    """Uploaded document records, listed newest first a page at a time"""
+    
+    collection_name = 'documents'
+    
+    @classmethod
+    def required_indexes(cls) -> List[Dict[str, Any]]:
+        """Composite indexes for every combination of list filters"""
+        indexes = []
+        for count in range(len(DOCUMENT_LIST_FILTERS) + 1):
+            for filters in itertools.combinations(DOCUMENT_LIST_FILTERS, count):
+                fields = [{"fieldPath": field, "order": "ASCENDING"} for field in ('user_id',) + filters]
+                fields.append({"fieldPath": "uploaded_at", "order": "DESCENDING"})
+                indexes.append({"collectionGroup": cls.collection_name, "queryScope": "COLLECTION", "fields": fields})
+        return indexes
+    
+    def list_for_user(self, uid: str, filters: Optional[Dict[str, Any]] = None, limit: int = DOCUMENT_PAGE_SIZE,
+                      cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        One page of a user's documents, newest first
+        
+        Args:
+            filters: Equality filters on DOCUMENT_LIST_FILTERS fields
+            cursor: next_cursor of the previous page
+        
+        Returns:
+            The documents, and the cursor of the next page (None on the last page)
+        """
+        conditions = [('user_id', '==', uid)]
+        conditions += [(field, '==', value) for field, value in (filters or {}).items()
+                       if field in DOCUMENT_LIST_FILTERS and value]
+        limit = min(max(limit, 1), MAX_DOCUMENT_PAGE_SIZE)
+        # Document id breaks ties between equal upload times so pages never skip or repeat
+        query = self.query(conditions, order_by='uploaded_at', direction='DESCENDING')\
+            .order_by('__name__', direction='DESCENDING')
+        if cursor:
+            uploaded_at, doc_id = self.decode_cursor(cursor)
+            query = query.start_after((uploaded_at, self.collection.document(doc_id)))
+        
+        # One extra document tells whether there is another page
+        documents = self.fetch('list_for_user', query.limit(limit + 1))
+        if len(documents) <= limit:
+            return documents, None
+        documents = documents[:limit]
+        return documents, self.encode_cursor(documents[-1])
+    
+    def mark_uploaded(self, doc_id: str, updates: Dict[str, Any]) -> bool:
+        """Apply updates to a pending upload in a transaction; False if it is missing or no longer pending"""
+        return self._change_pending(doc_id, lambda transaction, doc_ref:
+                                    transaction.update(doc_ref, stamp_updated_at(dict(updates))))
+    
+    def discard_pending(self, doc_id: str) -> bool:
+        """Delete a rejected pending upload's record; False if it is missing or no longer pending"""
+        return self._change_pending(doc_id, lambda transaction, doc_ref: transaction.delete(doc_ref))
+    
+    def _change_pending(self, doc_id: str, change: Callable[[Any, Any], None]) -> bool:
+        from google.cloud import firestore
+        
+        doc_ref = self.collection.document(doc_id)
+        
+        @firestore.transactional
+        def apply(transaction) -> bool:
+            snapshot = doc_ref.get(transaction=transaction)
+            if not snapshot.exists or snapshot.to_dict().get('status') != 'pending_upload':
+                return False
+            change(transaction, doc_ref)
+            return True
+        
+        return apply(self.db.transaction())
+    
+    @staticmethod
+    def encode_cursor(document: Dict[str, Any]) -> str:
+        position = {'uploaded_at': document['uploaded_at'].isoformat(), 'id': document['id']}
+        return base64.urlsafe_b64encode(json.dumps(position).encode('utf-8')).decode('ascii')
+    
+    @staticmethod
+    def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+        """Raises ValueError for a cursor this repository didn't issue"""
+        try:
+            position = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+            return datetime.fromisoformat(position['uploaded_at']), position['id']
+        except (TypeError, KeyError, UnicodeError, json.JSONDecodeError, binascii.Error) as e:
+            raise ValueError(f"Invalid cursor: {cursor}") from e
+
+class StorageUsageRepository(BaseRepository):
+    """Per-user totals of stored document bytes and count (document id is the Firebase UID)
+    
+    Uploads and deletes adjust the totals with atomic increments, so a quota
+    check reads one document instead of summing the user's documents.
+    """
+    
+    collection_name = STORAGE_USAGE_COLLECTION
+    
+    USAGE_CACHE_SIZE = 10000
+    USAGE_CACHE_TTL = 60  # seconds
+    _usage_cache: 'OrderedDict[str, Tuple[float, Dict[str, int]]]' = OrderedDict()
+    _usage_cache_lock = threading.Lock()
+    
+    def usage(self, uid: str) -> Dict[str, int]:
+        """{'bytes', 'count'} stored by a user, served from cache when possible"""
+        with self._usage_cache_lock:
+            cached = self._usage_cache.get(uid)
+            if cached and time.monotonic() - cached[0] < self.USAGE_CACHE_TTL:
+                self._usage_cache.move_to_end(uid)
+                return dict(cached[1])
+        
+        record = self.get(uid, fields=['bytes', 'count'])
+        if record is None:
+            # Users from before usage tracking: count their documents once
+            usage = self.recount(uid)
+        else:
+            usage = {'bytes': record.get('bytes', 0), 'count': record.get('count', 0)}
+        self._cache_usage(uid, usage)
+        return usage
+    
+    def record(self, uid: str, size: int, count: int = 1):
+        """Add an upload (or, with negative size and count, a deletion) to a user's totals
+        
+        Call it after writing the document: a user without totals yet has
+        them recounted from their documents, this one included.
+        """
+        from google.cloud import firestore
+        
+        usage_ref = self.collection.document(uid)
+        
+        @firestore.transactional
+        def increment(transaction) -> bool:
+            if not usage_ref.get(transaction=transaction).exists:
+                return False
+            transaction.update(usage_ref, stamp_updated_at({
+                'bytes': firestore.Increment(size), 'count': firestore.Increment(count)
+            }))
+            return True
+        
+        if not increment(self.db.transaction()):
+            # Users from before usage tracking: an increment alone would leave partial or negative totals
+            self._cache_usage(uid, self.recount(uid))
+            return
+        with self._usage_cache_lock:
+            cached = self._usage_cache.get(uid)
+            if cached:
+                cached[1]['bytes'] += size
+                cached[1]['count'] += count
+    
+    def recount(self, uid: str) -> Dict[str, int]:
+        """Recompute a user's totals from their documents and store them"""
+        documents = DocumentRepository(db=self._db)
+        query = documents.query([('user_id', '==', uid)], fields=['file_size', 'status'])
+        usage = {'bytes': 0, 'count': 0}
+        for document in documents.stream('recount_usage', query):
+            if document.get('status') != 'pending_upload':
+                usage['bytes'] += document.get('file_size') or 0
+                usage['count'] += 1
+        self.set(uid, dict(usage))
+        return usage
+    
+    def _cache_usage(self, uid: str, usage: Dict[str, int]):
+        with self._usage_cache_lock:
+            self._usage_cache[uid] = (time.monotonic(), dict(usage))
+            self._usage_cache.move_to_end(uid)
+            while len(self._usage_cache) > self.USAGE_CACHE_SIZE:
+                self._usage_cache.popitem(last=False)
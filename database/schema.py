@@ -191,3 +191,10 @@ ALL_SCHEMAS = {
     CollectionNames.MEDICAL_STAFF: MEDICAL_STAFF_SCHEMA,
     CollectionNames.COMPLAINTS: COMPLAINTS_SCHEMA
 }
+
+# Department -> (time slot collection, appointment collection), in reporting order
+DEPARTMENT_COLLECTIONS = {
+    'medical': (CollectionNames.MEDICAL_TIME_SLOTS, CollectionNames.MEDICAL_APPOINTMENTS),
+    'passport': (CollectionNames.PASSPORT_TIME_SLOTS, CollectionNames.PASSPORT_APPOINTMENTS),
+    'license': (CollectionNames.LICENSE_TIME_SLOTS, CollectionNames.LICENSE_APPOINTMENTS)
+}
@@ -0,0 +1,443 @@
+"""
+Document Storage Backends
+Streams uploaded files to Cloud Storage, or to a local directory for tests and offline use
+
+Uploads are read from the request in chunks and written straight to the
+backend; the size and checksums (SHA-256, and MD5 to check against what
+Cloud Storage reports) are computed in the same pass, so a file is never
+buffered whole or read twice. Cloud uploads of unknown or large size use
+resumable, chunked uploads.
+
+Backends can also issue short-lived signed URLs, so clients upload and
+download directly against storage: V4 signed URLs for Cloud Storage,
+and HMAC-signed URLs served by scripts/local_storage_server.py for the
+local backend.
+"""
+
+import base64
+import hashlib
+import hmac
+import logging
+import os
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, BinaryIO, Dict, Iterator, Mapping, Optional, Tuple
+from urllib.parse import quote, urlencode
+
+from database.firebase_config import get_storage
+
+logger = logging.getLogger(__name__)
+
+# Resumable upload chunk; Cloud Storage needs a multiple of 256 KB
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+# Known-size uploads up to this are sent in a single request
+RESUMABLE_THRESHOLD = 5 * 1024 * 1024
+READ_CHUNK_SIZE = 1024 * 1024
+# Lifetime of signed upload/download URLs (seconds)
+SIGNED_URL_EXPIRES = 15 * 60
+
+BACKENDS = ('cloud', 'local')
+
+# (key, size, modified as a Unix timestamp) of a listed object
+ListedObject = Tuple[str, int, float]
+
+class StorageError(Exception):
+    """A storage backend operation failed"""
+
+class UploadTooLarge(StorageError):
+    """The upload exceeded the allowed size"""
+
+class ChecksumMismatch(StorageError):
+    """The stored object doesn't match the bytes that were sent"""
+
+@dataclass
+class StoredObject:
+    """Where an upload was stored and what it contained"""
+    key: str
+    size: int
+    sha256: Optional[str]  # not known for objects uploaded straight to Cloud Storage
+    md5: str  # base64, as Cloud Storage reports it
+    content_type: Optional[str]
+    backend: str
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'storage_backend': self.backend,
+            'storage_key': self.key,
+            'file_size': self.size,
+            'sha256': self.sha256,
+            'md5': self.md5,
+            'content_type': self.content_type
+        }
+
+@dataclass
+class SignedUrl:
+    """A URL a client can use once, before it expires, without other credentials"""
+    url: str
+    method: str
+    expires_at: datetime
+    # Headers the client must send with the request
+    headers: Dict[str, str] = field(default_factory=dict)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'url': self.url,
+            'method': self.method,
+            'headers': self.headers,
+            'expires_at': self.expires_at.isoformat() + 'Z'
+        }
+
+class HashingReader:
+    """File-like wrapper that counts and hashes bytes as they are read
+    
+    Bytes are hashed the first time they are read, so a backend that
+    seeks back to retry a chunk doesn't hash them twice.
+    """
+    
+    def __init__(self, stream: BinaryIO, max_size: Optional[int] = None):
+        self._stream = stream
+        self._max_size = max_size
+        self._position = 0
+        self._hashed = 0
+        self._sha256 = hashlib.sha256()
+        self._md5 = hashlib.md5()
+    
+    @property
+    def size(self) -> int:
+        return self._hashed
+    
+    @property
+    def sha256(self) -> str:
+        return self._sha256.hexdigest()
+    
+    @property
+    def md5(self) -> str:
+        return base64.b64encode(self._md5.digest()).decode('ascii')
+    
+    def read(self, size: int = -1) -> bytes:
+        data = self._stream.read(size if size is not None else -1)
+        end = self._position + len(data)
+        if end > self._hashed:
+            new = data[self._hashed - self._position:] if self._hashed > self._position else data
+            if self._max_size is not None and end > self._max_size:
+                raise UploadTooLarge(f"Upload exceeds {self._max_size} bytes")
+            self._sha256.update(new)
+            self._md5.update(new)
+            self._hashed = end
+        self._position = end
+        return data
+    
+    def tell(self) -> int:
+        return self._position
+    
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence != os.SEEK_SET or offset > self._hashed:
+            raise StorageError("Upload streams can only seek back to bytes already read")
+        if offset != self._position:
+            self._stream.seek(offset)
+            self._position = offset
+        return offset
+    
+    def seekable(self) -> bool:
+        return True
+
+class StorageBackend:
+    """Common interface of the document storage backends"""
+    name = ''
+    
+    def upload(self, stream: BinaryIO, key: str, content_type: Optional[str] = None,
+               size: Optional[int] = None, max_size: Optional[int] = None) -> StoredObject:
+        """
+        Stream a file to key
+        
+        Args:
+            stream: Readable binary stream, consumed in chunks
+            key: Object path, e.g. documents/<uid>/<name>
+            content_type: MIME type to store with the object
+            size: Byte count if known up front (e.g. Content-Length)
+            max_size: Fail with UploadTooLarge past this many bytes
+        """
+        raise NotImplementedError
+    
+    def open(self, key: str) -> BinaryIO:
+        """Open a stored object for reading"""
+        raise NotImplementedError
+    
+    def read_range(self, key: str, start: int, length: int) -> bytes:
+        """Up to length bytes of a stored object from offset start, without fetching the rest"""
+        raise NotImplementedError
+    
+    def delete(self, key: str) -> bool:
+        """Delete a stored object; False if it didn't exist"""
+        raise NotImplementedError
+    
+    def move(self, source: str, destination: str):
+        """Rename a stored object, replacing any object at destination"""
+        raise NotImplementedError
+    
+    def exists(self, key: str) -> bool:
+        raise NotImplementedError
+    
+    def local_path(self, key: str) -> Optional[str]:
+        """Filesystem path of a stored object, if the backend keeps objects on local disk"""
+        return None
+    
+    def list_objects(self, prefix: str = '') -> Iterator[ListedObject]:
+        """Objects under a key prefix ending in '/' (or all), in key order, without reading them"""
+        raise NotImplementedError
+    
+    def stat(self, key: str) -> Optional[StoredObject]:
+        """Size, checksums and type of a stored object, or None if it doesn't exist"""
+        raise NotImplementedError
+    
+    def signed_upload_url(self, key: str, content_type: Optional[str] = None,
+                          max_size: Optional[int] = None, expires_in: int = SIGNED_URL_EXPIRES) -> SignedUrl:
+        """URL the client PUTs the file to"""
+        raise NotImplementedError
+    
+    def signed_download_url(self, key: str, filename: Optional[str] = None,
+                            expires_in: int = SIGNED_URL_EXPIRES) -> SignedUrl:
+        """URL the client GETs the file from, saved as filename"""
+        raise NotImplementedError
+
+class LocalStorage(StorageBackend):
+    """Objects as files under a local directory
+    
+    Signed URLs point at base_url, where scripts/local_storage_server.py
+    checks their HMAC signature (made with secret) and serves the files.
+    """
+    name = 'local'
+    
+    def __init__(self, root: str, secret: Optional[str] = None, base_url: str = 'http://localhost:5001'):
+        self.root = os.path.abspath(root)
+        self.secret = (secret or '').encode('utf-8')
+        self.base_url = base_url.rstrip('/')
+    
+    def path(self, key: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise StorageError(f"Invalid storage key: {key}")
+        return path
+    
+    def upload(self, stream: BinaryIO, key: str, content_type: Optional[str] = None,
+               size: Optional[int] = None, max_size: Optional[int] = None) -> StoredObject:
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        reader = HashingReader(stream, max_size)
+        # Written under a temporary name so a failed upload never leaves a partial object
+        partial = f"{path}.{uuid.uuid4().hex}.part"
+        try:
+            with open(partial, 'wb') as out:
+                while True:
+                    chunk = reader.read(READ_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    out.write(chunk)
+            os.replace(partial, path)
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+        return StoredObject(key, reader.size, reader.sha256, reader.md5, content_type, self.name)
+    
+    def open(self, key: str) -> BinaryIO:
+        return open(self.path(key), 'rb')
+    
+    def read_range(self, key: str, start: int, length: int) -> bytes:
+        with self.open(key) as stored:
+            stored.seek(start)
+            return stored.read(length)
+    
+    def delete(self, key: str) -> bool:
+        try:
+            os.remove(self.path(key))
+            return True
+        except FileNotFoundError:
+            return False
+    
+    def move(self, source: str, destination: str):
+        path = self.path(destination)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(self.path(source), path)
+    
+    def exists(self, key: str) -> bool:
+        return os.path.isfile(self.path(key))
+    
+    def local_path(self, key: str) -> Optional[str]:
+        return self.path(key)
+    
+    def list_objects(self, prefix: str = '') -> Iterator[ListedObject]:
+        directory = self.path(prefix) if prefix else self.root
+        if os.path.isdir(directory):
+            yield from self._walk(directory, prefix)
+    
+    def _walk(self, directory: str, prefix: str) -> Iterator[ListedObject]:
+        with os.scandir(directory) as scan:
+            entries = list(scan)
+        # A directory's keys continue with '/', so sorting it as name + '/' keeps whole keys in order
+        entries.sort(key=lambda entry: entry.name + '/' if entry.is_dir(follow_symlinks=False) else entry.name)
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from self._walk(entry.path, f"{prefix}{entry.name}/")
+            elif entry.is_file(follow_symlinks=False):
+                stat = entry.stat()
+                yield f"{prefix}{entry.name}", stat.st_size, stat.st_mtime
+    
+    def stat(self, key: str) -> Optional[StoredObject]:
+        if not self.exists(key):
+            return None
+        with self.open(key) as stored:
+            reader = HashingReader(stored)
+            while reader.read(READ_CHUNK_SIZE):
+                pass
+        return StoredObject(key, reader.size, reader.sha256, reader.md5, None, self.name)
+    
+    def signed_upload_url(self, key: str, content_type: Optional[str] = None,
+                          max_size: Optional[int] = None, expires_in: int = SIGNED_URL_EXPIRES) -> SignedUrl:
+        params = {'content_type': content_type, 'max_size': max_size}
+        headers = {'Content-Type': content_type} if content_type else {}
+        return self._signed_url('PUT', key, params, expires_in, headers)
+    
+    def signed_download_url(self, key: str, filename: Optional[str] = None,
+                            expires_in: int = SIGNED_URL_EXPIRES) -> SignedUrl:
+        return self._signed_url('GET', key, {'filename': filename}, expires_in)
+    
+    def verify(self, method: str, key: str, params: Mapping[str, str]) -> bool:
+        """Whether a request's signature is valid for its method, key and parameters and hasn't expired"""
+        try:
+            expires = int(params.get('expires', ''))
+        except ValueError:
+            return False
+        if not self.secret or expires < time.time():
+            return False
+        signed = {name: params.get(name) for name in ('content_type', 'max_size', 'filename')}
+        expected = self._signature(method, key, expires, signed)
+        return hmac.compare_digest(expected, params.get('signature', ''))
+    
+    def _signature(self, method: str, key: str, expires: int, params: Mapping[str, Any]) -> str:
+        message = '\n'.join([method, key, str(expires)] + [
+            f"{name}={params.get(name) if params.get(name) is not None else ''}"
+            for name in ('content_type', 'max_size', 'filename')
+        ])
+        return hmac.new(self.secret, message.encode('utf-8'), hashlib.sha256).hexdigest()
+    
+    def _signed_url(self, method: str, key: str, params: Dict[str, Any], expires_in: int,
+                    headers: Optional[Dict[str, str]] = None) -> SignedUrl:
+        if not self.secret:
+            raise StorageError("Local signed URLs need a signing secret")
+        self.path(key)  # reject keys outside the root
+        expires = int(time.time()) + expires_in
+        query = {name: value for name, value in params.items() if value is not None}
+        query['expires'] = expires
+        query['signature'] = self._signature(method, key, expires, params)
+        return SignedUrl(
+            url=f"{self.base_url}/{quote(key)}?{urlencode(query)}",
+            method=method,
+            expires_at=datetime.utcfromtimestamp(expires),
+            headers=headers or {}
+        )
+
+class CloudStorage(StorageBackend):
+    """Objects in the Firebase Storage bucket"""
+    name = 'cloud'
+    
+    def __init__(self, bucket=None, chunk_size: int = UPLOAD_CHUNK_SIZE):
+        self._bucket = bucket
+        self.chunk_size = chunk_size
+    
+    @property
+    def bucket(self):
+        """Storage bucket, resolved on first use"""
+        if self._bucket is None:
+            self._bucket = get_storage()
+        return self._bucket
+    
+    def upload(self, stream: BinaryIO, key: str, content_type: Optional[str] = None,
+               size: Optional[int] = None, max_size: Optional[int] = None) -> StoredObject:
+        if size is not None and max_size is not None and size > max_size:
+            raise UploadTooLarge(f"Upload exceeds {max_size} bytes")
+        
+        blob = self.bucket.blob(key)
+        if size is None or size > RESUMABLE_THRESHOLD:
+            # Chunked resumable upload: at most one chunk is held in memory
+            blob.chunk_size = self.chunk_size
+        reader = HashingReader(stream, max_size)
+        blob.upload_from_file(reader, size=size, content_type=content_type)
+        
+        if blob.md5_hash and blob.md5_hash != reader.md5:
+            blob.delete()
+            raise ChecksumMismatch(f"Stored object {key} doesn't match the upload")
+        return StoredObject(key, reader.size, reader.sha256, reader.md5, content_type, self.name)
+    
+    def open(self, key: str) -> BinaryIO:
+        return self.bucket.blob(key).open('rb')
+    
+    def read_range(self, key: str, start: int, length: int) -> bytes:
+        if length <= 0:
+            return b''
+        # end is inclusive
+        return self.bucket.blob(key).download_as_bytes(start=start, end=start + length - 1)
+    
+    def delete(self, key: str) -> bool:
+        from google.api_core.exceptions import NotFound
+        
+        try:
+            self.bucket.blob(key).delete()
+            return True
+        except NotFound:
+            return False
+    
+    def move(self, source: str, destination: str):
+        self.bucket.rename_blob(self.bucket.blob(source), destination)
+    
+    def list_objects(self, prefix: str = '') -> Iterator[ListedObject]:
+        # Listed a page at a time, in key order
+        for blob in self.bucket.list_blobs(prefix=prefix or None):
+            yield blob.name, blob.size, blob.updated.timestamp()
+    
+    def exists(self, key: str) -> bool:
+        return self.bucket.blob(key).exists()
+    
+    def stat(self, key: str) -> Optional[StoredObject]:
+        blob = self.bucket.get_blob(key)
+        if blob is None:
+            return None
+        return StoredObject(key, blob.size, None, blob.md5_hash, blob.content_type, self.name)
+    
+    def signed_upload_url(self, key: str, content_type: Optional[str] = None,
+                          max_size: Optional[int] = None, expires_in: int = SIGNED_URL_EXPIRES) -> SignedUrl:
+        headers = {}
+        if max_size is not None:
+            # Cloud Storage rejects uploads outside this range
+            headers['x-goog-content-length-range'] = f"0,{max_size}"
+        url = self.bucket.blob(key).generate_signed_url(
+            version='v4',
+            expiration=timedelta(seconds=expires_in),
+            method='PUT',
+            content_type=content_type,
+            headers=headers or None
+        )
+        if content_type:
+            headers['Content-Type'] = content_type
+        return SignedUrl(url, 'PUT', datetime.utcnow() + timedelta(seconds=expires_in), headers)
+    
+    def signed_download_url(self, key: str, filename: Optional[str] = None,
+                            expires_in: int = SIGNED_URL_EXPIRES) -> SignedUrl:
+        url = self.bucket.blob(key).generate_signed_url(
+            version='v4',
+            expiration=timedelta(seconds=expires_in),
+            method='GET',
+            response_disposition=f'attachment; filename="{filename}"' if filename else None
+        )
+        return SignedUrl(url, 'GET', datetime.utcnow() + timedelta(seconds=expires_in))
+
+def create_storage(backend: str = 'cloud', local_root: str = 'uploads', signing_secret: Optional[str] = None,
+                   local_url: str = 'http://localhost:5001') -> StorageBackend:
+    """Storage backend by name: 'cloud' (Firebase Storage) or 'local' (files under local_root)"""
+    if backend == 'cloud':
+        return CloudStorage()
+    if backend == 'local':
+        return LocalStorage(local_root, signing_secret, local_url)
+    raise ValueError(f"Unknown storage backend: {backend} (expected one of {', '.join(BACKENDS)})")
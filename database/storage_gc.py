@@ -0,0 +1,349 @@
+"""
+Storage Garbage Collection
+Finds stored files that no document record references, and removes them
+
+A document's file and its Firestore record are written and deleted
+separately, so a crash between the two, or an upload that failed after
+the file was written, leaves a file nothing points to. A GC run
+reconciles the two sides without a lookup per file:
+  - the store is listed in key order, and the referenced keys
+    (documents' storage, thumbnail and optimized keys, content blobs and
+    legacy file paths) are read from Firestore in key order, a page at a
+    time, each on its own thread
+  - the two sorted streams are merged; a stored key the merge doesn't
+    meet on the referenced side is an orphan
+  - orphans older than min_age are moved under quarantine/<run time>/
+    rather than deleted, and quarantined files are deleted after
+    quarantine_days, which is when their bytes are reclaimed
+  - a referenced key the merge doesn't meet in the store is a stale
+    record: its file is gone. Stale records are reported by id, for an
+    admin to repair or delete
+Signed uploads still pending_upload after min_age were abandoned; their
+records (and any file) are deleted before the merge.
+"""
+
+import heapq
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from database.content_store import BLOB_COLLECTION
+from database.firebase_config import get_db
+from database.repositories import DocumentRepository
+from database.storage import LocalStorage, StorageBackend, StorageError
+
+logger = logging.getLogger(__name__)
+
+QUARANTINE_PREFIX = 'quarantine'
+QUARANTINE_STAMP = '%Y%m%dT%H%M%SZ'
+# Files younger than this may belong to an upload still in progress
+ORPHAN_MIN_AGE = 24 * 60 * 60  # seconds
+QUARANTINE_DAYS = 7
+# Referenced keys read per Firestore page, and items buffered ahead of the merge on each side
+GC_PAGE_SIZE = 500
+PREFETCH_SIZE = 2000
+MAX_FINISHED_RUNS = 10
+# Stale records a run lists in full; past this only the count grows
+MAX_STALE_REPORTED = 1000
+
+# (collection, field) pairs holding storage keys
+REFERENCE_FIELDS = [
+    ('documents', 'storage_key'),
+    ('documents', 'thumbnail_key'),
+    ('documents', 'optimized_key'),
+    (BLOB_COLLECTION, 'storage_key')
+]
+
+# (storage key, collection, document id, pending upload): sorts by key
+Reference = Tuple[str, str, str, bool]
+
+# Byte totals kept alongside counts
+COUNTED_BYTES = {'objects': 'scanned', 'orphans': 'orphaned', 'quarantined': 'quarantined', 'purged': 'reclaimed'}
+
+def _prefetch(items: Iterable, size: int = PREFETCH_SIZE) -> Iterator:
+    """Iterate items on a background thread, buffering up to size of them ahead"""
+    buffer: queue.Queue = queue.Queue(size)
+    stop = threading.Event()
+    end = object()
+    
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def produce():
+        try:
+            for item in items:
+                if not put(item):
+                    return
+            put(end)
+        except BaseException as e:
+            put(e)
+    
+    threading.Thread(target=produce, name='storage-gc-prefetch', daemon=True).start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is end:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+class GCRun:
+    """Counts and reclaimed bytes of one GC run"""
+    
+    def __init__(self, dry_run: bool = False, started_by: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.dry_run = dry_run
+        self.started_by = started_by
+        self.status = 'queued'
+        self.error: Optional[str] = None
+        self.created_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.counts = {
+            'objects': 0, 'referenced': 0, 'missing': 0, 'stale': 0, 'recent': 0,
+            'orphans': 0, 'quarantined': 0, 'purged': 0, 'expired': 0
+        }
+        self.bytes = {'scanned': 0, 'orphaned': 0, 'quarantined': 0, 'reclaimed': 0}
+        self.stale: List[Dict[str, str]] = []
+        self.quarantine_prefix: Optional[str] = None
+        self._lock = threading.Lock()
+    
+    @property
+    def finished(self) -> bool:
+        return self.status in ('completed', 'failed')
+    
+    def add(self, size: int = 0, **counts: int):
+        """Add to counts, and size bytes per file to their byte totals"""
+        with self._lock:
+            for key, value in counts.items():
+                self.counts[key] += value
+                if key in COUNTED_BYTES:
+                    self.bytes[COUNTED_BYTES[key]] += size * value
+    
+    def add_stale(self, reference: Reference):
+        """Record a document whose referenced file is gone"""
+        with self._lock:
+            self.counts['stale'] += 1
+            if len(self.stale) < MAX_STALE_REPORTED:
+                key, collection, doc_id, _ = reference
+                self.stale.append({'collection': collection, 'id': doc_id, 'key': key})
+    
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            seconds = ((self.finished_at or datetime.utcnow()) - self.started_at).total_seconds() \
+                if self.started_at else 0.0
+            return {
+                'run_id': self.id,
+                'status': self.status,
+                'dry_run': self.dry_run,
+                'error': self.error,
+                'created_at': self.created_at.isoformat(),
+                'started_at': self.started_at.isoformat() if self.started_at else None,
+                'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+                'quarantine_prefix': self.quarantine_prefix,
+                'counts': dict(self.counts),
+                'bytes': dict(self.bytes),
+                'stale_records': list(self.stale),
+                'objects_per_sec': round(self.counts['objects'] / seconds, 1) if seconds else 0.0
+            }
+
+class StorageGC:
+    """Reconciles the document store against Firestore, one run at a time"""
+    
+    def __init__(self, storage: StorageBackend, db=None, min_age: float = ORPHAN_MIN_AGE,
+                 quarantine_days: float = QUARANTINE_DAYS, page_size: int = GC_PAGE_SIZE):
+        self.storage = storage
+        self._db = db
+        self.min_age = min_age
+        self.quarantine_days = quarantine_days
+        self.page_size = page_size
+        self._runs: 'OrderedDict[str, GCRun]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='storage-gc')
+    
+    @property
+    def db(self):
+        return self._db if self._db is not None else get_db()
+    
+    def start(self, dry_run: bool = False, started_by: Optional[str] = None) -> GCRun:
+        """Queue a run in the background; returns the unfinished run instead if there is one"""
+        with self._lock:
+            for run in self._runs.values():
+                if not run.finished:
+                    return run
+            run = GCRun(dry_run, started_by)
+            self._runs[run.id] = run
+            finished = [run_id for run_id, existing in self._runs.items() if existing.finished]
+            for run_id in finished[:max(0, len(finished) - MAX_FINISHED_RUNS)]:
+                del self._runs[run_id]
+        self._executor.submit(self.run, run)
+        return run
+    
+    def get(self, run_id: str) -> Optional[GCRun]:
+        with self._lock:
+            return self._runs.get(run_id)
+    
+    def run(self, run: Optional[GCRun] = None) -> GCRun:
+        """Purge expired quarantine and abandoned uploads, then quarantine orphans; runs in the calling thread"""
+        run = run or GCRun()
+        run.status = 'running'
+        run.started_at = datetime.utcnow()
+        try:
+            self._purge_quarantine(run)
+            self._expire_pending_uploads(run)
+            self._reconcile(run)
+            run.status = 'completed'
+        except Exception as e:
+            logger.error(f"Storage GC {run.id} failed: {e}")
+            run.error = str(e)
+            run.status = 'failed'
+        finally:
+            run.finished_at = datetime.utcnow()
+        
+        counts, sizes = run.counts, run.bytes
+        logger.info(f"Storage GC {run.id} {run.status}{' (dry run)' if run.dry_run else ''}: "
+                    f"{counts['objects']} objects, {counts['orphans']} orphans ({sizes['orphaned']} bytes), "
+                    f"{counts['quarantined']} quarantined, {counts['purged']} purged ({sizes['reclaimed']} bytes reclaimed), "
+                    f"{counts['stale']} stale records, {counts['expired']} abandoned uploads expired")
+        return run
+    
+    def referenced_keys(self) -> Iterator[Reference]:
+        """Every storage key Firestore references, with its record, in key order (repeats included)"""
+        streams = [_prefetch(self._field_values(collection, field), self.page_size)
+                   for collection, field in REFERENCE_FIELDS]
+        if isinstance(self.storage, LocalStorage):
+            streams.append(iter(self._legacy_keys()))
+        return heapq.merge(*streams)
+    
+    def _reconcile(self, run: GCRun):
+        """Merge the store's keys against the referenced keys, quarantining orphans"""
+        if not run.dry_run:
+            run.quarantine_prefix = f"{QUARANTINE_PREFIX}/{datetime.utcnow().strftime(QUARANTINE_STAMP)}/"
+        cutoff = time.time() - self.min_age
+        references = _prefetch(self.referenced_keys())
+        previous = ''
+        
+        def advance() -> Optional[Reference]:
+            nonlocal previous
+            reference = next(references, None)
+            if reference is not None and reference[0] < previous:
+                # Deleting on a mis-ordered merge would remove referenced files
+                raise StorageError(f"Referenced keys out of order: {reference[0]!r} after {previous!r}")
+            previous = reference[0] if reference is not None else previous
+            return reference
+        
+        reference = advance()
+        
+        def skip_missing(until: Optional[str]):
+            """Pass the references to keys before until (to every key with None); their files are gone"""
+            nonlocal reference
+            while reference is not None and (until is None or reference[0] < until):
+                key = reference[0]
+                # An upload still pending hasn't written its file yet; that is not a stale record
+                stale = []
+                while reference is not None and reference[0] == key:
+                    if not reference[3]:
+                        stale.append(reference)
+                    reference = advance()
+                if stale:
+                    run.add(missing=1)
+                    for record in stale:
+                        run.add_stale(record)
+        
+        for key, size, modified in _prefetch(self.storage.list_objects()):
+            if key.startswith(QUARANTINE_PREFIX + '/'):
+                continue
+            run.add(size, objects=1)
+            skip_missing(key)
+            if reference is not None and reference[0] == key:
+                run.add(referenced=1)
+                while reference is not None and reference[0] == key:
+                    reference = advance()
+                continue
+            
+            if modified > cutoff:
+                run.add(recent=1)
+                continue
+            run.add(size, orphans=1)
+            if not run.dry_run:
+                self.storage.move(key, run.quarantine_prefix + key)
+                run.add(size, quarantined=1)
+        
+        skip_missing(None)
+    
+    def _expire_pending_uploads(self, run: GCRun):
+        """Delete signed uploads still pending after min_age, with any file written for them"""
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.min_age)
+        documents = DocumentRepository(db=self.db)
+        query = documents.query([('status', '==', 'pending_upload')], fields=['requested_at', 'storage_key'])
+        for document in documents.stream('expire_pending_uploads', query):
+            requested_at = document.get('requested_at')
+            if requested_at is None:
+                continue
+            if requested_at.tzinfo is None:
+                requested_at = requested_at.replace(tzinfo=timezone.utc)
+            if requested_at >= cutoff:
+                continue
+            if not run.dry_run:
+                # A complete that lands first keeps its record
+                if not documents.discard_pending(document['id']):
+                    continue
+                if document.get('storage_key'):
+                    self.storage.delete(document['storage_key'])
+            run.add(expired=1)
+    
+    def _purge_quarantine(self, run: GCRun):
+        """Delete files quarantined more than quarantine_days ago"""
+        cutoff = datetime.utcnow() - timedelta(days=self.quarantine_days)
+        for key, size, _ in self.storage.list_objects(QUARANTINE_PREFIX + '/'):
+            try:
+                quarantined_at = datetime.strptime(key.split('/')[1], QUARANTINE_STAMP)
+            except (IndexError, ValueError):
+                continue
+            if quarantined_at >= cutoff:
+                # Later keys are from later runs
+                break
+            if not run.dry_run:
+                self.storage.delete(key)
+            run.add(size, purged=1)
+    
+    def _field_values(self, collection_name: str, field: str) -> Iterator[Reference]:
+        """Values of one field across a collection, with their records, in order, a page at a time"""
+        query = self.db.collection(collection_name).select([field, 'status']).order_by(field).limit(self.page_size)
+        last_doc = None
+        while True:
+            page = list((query.start_after(last_doc) if last_doc is not None else query).stream())
+            for snapshot in page:
+                data = snapshot.to_dict() or {}
+                value = data.get(field)
+                if isinstance(value, str) and value:
+                    yield value, collection_name, snapshot.id, data.get('status') == 'pending_upload'
+            if len(page) < self.page_size:
+                return
+            last_doc = page[-1]
+    
+    def _legacy_keys(self) -> List[Reference]:
+        """file_path of documents saved before storage backends, as sorted keys under the local root"""
+        keys = []
+        for file_path, collection_name, doc_id, pending in self._field_values('documents', 'file_path'):
+            key = os.path.relpath(os.path.abspath(file_path), self.storage.root)
+            if not key.startswith('..'):
+                keys.append((key.replace(os.sep, '/'), collection_name, doc_id, pending))
+        # Paths sort differently from the keys they map to once their prefix is stripped
+        return sorted(keys)
@@ -6,30 +6,37 @@ Comprehensive validation for Sri Lankan government data formats
 """
 
 import re
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, date
-from typing import Dict, Any, List, Optional, Union
+from typing import TYPE_CHECKING, Dict, Any, List, Optional, Union
 import html
 
+if TYPE_CHECKING:
+    import pandas as pd
+
 class DataValidator:
     """Comprehensive data validation for GovConnect application"""
     
-    def __init__(self):
-        # Sri Lankan NIC patterns
-        self.old_nic_pattern = re.compile(r'^[0-9]{9}[VvXx]$')
-        self.new_nic_pattern = re.compile(r'^[0-9]{12}$')
-        
-        # Phone number patterns
-        self.mobile_pattern = re.compile(r'^\+94[0-9]{9}$')
-        self.landline_pattern = re.compile(r'^\+94[0-9]{9}$')
-        
-        # Email pattern
-        self.email_pattern = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
-        
-        # Passport pattern (Sri Lankan)
-        self.passport_pattern = re.compile(r'^[N][0-9]{7}$')
-        
-        # License number pattern
-        self.license_pattern = re.compile(r'^[B][0-9]{7}$')
+    # Patterns are compiled once, at import, and shared by every instance
+    
+    # Sri Lankan NIC patterns
+    old_nic_pattern = re.compile(r'^[0-9]{9}[VvXx]$')
+    new_nic_pattern = re.compile(r'^[0-9]{12}$')
+    
+    # Phone number patterns
+    mobile_pattern = re.compile(r'^\+94[0-9]{9}$')
+    landline_pattern = re.compile(r'^\+94[0-9]{9}$')
+    
+    # Email pattern
+    email_pattern = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+    
+    # Passport pattern (Sri Lankan)
+    passport_pattern = re.compile(r'^[N][0-9]{7}$')
+    
+    # License number pattern
+    license_pattern = re.compile(r'^[B][0-9]{7}$')
     
     def validate_nic(self, nic: str) -> Dict[str, Any]:
         """
@@ -446,22 +453,411 @@ class DataValidator:
             "errors": errors,
             "sanitized_data": sanitized_data
         }
+    
+    # --- Batch validation ---
+    #
+    # Column-at-a-time counterparts of validate_nic, validate_phone and
+    # validate_email for bulk imports. Each returns a DataFrame aligned with
+    # its input whose rows hold what the scalar function returns for that
+    # value (other columns are None), so results are interchangeable; valid
+    # NIC rows also carry the normalized NIC.
+    #
+    # Values are checked as rows of a fixed-width ASCII code matrix with
+    # NumPy comparisons and digit arithmetic instead of a regex per value.
+    # Missing values and the rare rows that can't take that path (longer
+    # than the matrix, non-ASCII, embedded NULs) go through the scalar
+    # validator, so every row gets exactly the scalar result.
+    
+    def validate_nic_batch(self, nics) -> "pd.DataFrame":
+        """
+        Validate a column of NIC numbers
+        
+        Args:
+            nics: List, NumPy array or pandas Series of NIC numbers
+        
+        Returns:
+            DataFrame with valid, normalized, format, birth_year, gender,
+            day_of_year and error columns
+        """
+        return _run_batch(nics, 16, 16, self._nic_kernel, self._validate_nic_normalized, {
+            "valid": "bool", "normalized": "object", "format": "object", "birth_year": "Int64",
+            "gender": "object", "day_of_year": "Int64", "error": "object"
+        })
+    
+    def validate_phone_batch(self, phones) -> "pd.DataFrame":
+        """
+        Validate a column of Sri Lankan phone numbers
+        
+        Args:
+            phones: List, NumPy array or pandas Series of phone numbers
+        
+        Returns:
+            DataFrame with valid, normalized, type and error columns
+        """
+        return _run_batch(phones, 12, 24, self._phone_kernel, self.validate_phone, {
+            "valid": "bool", "normalized": "object", "type": "object", "error": "object"
+        })
+    
+    def validate_email_batch(self, emails) -> "pd.DataFrame":
+        """
+        Validate a column of email addresses
+        
+        Args:
+            emails: List, NumPy array or pandas Series of email addresses
+        
+        Returns:
+            DataFrame with valid, normalized, domain, is_government and
+            error columns
+        """
+        return _run_batch(emails, 8, 64, self._email_kernel, self.validate_email, {
+            "valid": "bool", "normalized": "object", "domain": "object",
+            "is_government": "boolean", "error": "object"
+        })
+    
+    def _validate_nic_normalized(self, nic: str) -> Dict[str, Any]:
+        """validate_nic plus the normalized NIC when valid"""
+        result = self.validate_nic(nic)
+        if result["valid"]:
+            result["normalized"] = nic.strip().upper()
+        return result
+    
+    def _nic_kernel(self, codes, lengths) -> Dict[str, Any]:
+        """validate_nic over stripped ASCII rows (see _run_batch)"""
+        _, np = _load_pandas()
+        codes = _ascii_case(codes, upper=True)
+        digits = _between(codes, '0', '9')
+        is_old = (lengths == 10) & digits[:, :9].all(axis=1) & ((codes[:, 9] == ord('V')) | (codes[:, 9] == ord('X')))
+        is_new = (lengths == 12) & digits[:, :12].all(axis=1)
+        matched = is_old | is_new
+        
+        # Rows that didn't match hold junk here and are masked below
+        d = codes[:, :7].astype(np.int64) - ord('0')
+        year_part = np.where(is_new, d[:, 0] * 1000 + d[:, 1] * 100 + d[:, 2] * 10 + d[:, 3], d[:, 0] * 10 + d[:, 1])
+        day_part = np.where(is_new, d[:, 4] * 100 + d[:, 5] * 10 + d[:, 6], d[:, 2] * 100 + d[:, 3] * 10 + d[:, 4])
+        
+        current_year = datetime.now().year
+        century = np.where(year_part <= current_year % 100, 2000, 1900)
+        birth_year = np.where(is_old, century + year_part, year_part)
+        female = day_part > 500
+        day_of_year = np.where(female, day_part - 500, day_part)
+        
+        bad_year = is_new & ((year_part < 1900) | (year_part > current_year))
+        bad_day = matched & ~bad_year & ((day_of_year < 1) | (day_of_year > 366))
+        valid = matched & ~bad_year & ~bad_day
+        return {
+            "valid": valid,
+            "normalized": _strings(codes[valid], valid),
+            "format": _choose([valid & is_old, valid & is_new], ["old", "new"]),
+            "birth_year": birth_year,
+            "gender": _choose([valid & female, valid], ["Female", "Male"]),
+            "day_of_year": day_of_year,
+            "error": _choose([~matched, bad_year, bad_day], [
+                "Invalid NIC format. Use 9 digits + V/X or 12 digits",
+                "Invalid birth year in NIC",
+                "Invalid day of year in NIC"
+            ])
+        }
+    
+    def _phone_kernel(self, codes, lengths) -> Dict[str, Any]:
+        """validate_phone over stripped ASCII rows (see _run_batch)"""
+        _, np = _load_pandas()
+        # Remove separators, shifting what's left to the front of the row
+        separator = _whitespace(codes) | _one_of(codes, "-()")
+        separated = np.flatnonzero(separator.any(axis=1))
+        if len(separated):
+            columns = np.arange(codes.shape[1])
+            keep = ~separator[separated] & (columns < lengths[separated, None])
+            order = np.argsort(~keep, axis=1, kind='stable')
+            lengths = lengths.copy()
+            lengths[separated] = keep.sum(axis=1)
+            codes[separated] = np.where(columns < lengths[separated, None],
+                                        np.take_along_axis(codes[separated], order, axis=1), 0)
+        
+        # Local numbers drop their 0 and bare ones get +94; either way 9 digits must follow
+        local = codes[:, 0] == ord('0')
+        international = ~local & (codes[:, 0] == ord('+')) & (codes[:, 1] == ord('9')) & (codes[:, 2] == ord('4'))
+        offset = np.where(local, 1, np.where(international, 3, 0))
+        number = np.take_along_axis(codes, offset[:, None] + np.arange(9), axis=1)
+        valid = (lengths == offset + 9) & _between(number, '0', '9').all(axis=1)
+        
+        normalized = np.empty((len(codes), 12), dtype=np.uint8)
+        normalized[:, :3] = np.frombuffer(b"+94", dtype=np.uint8)
+        normalized[:, 3:] = number
+        return {
+            "valid": valid,
+            "normalized": _strings(normalized[valid], valid),
+            "type": _choose([valid], ["mobile"]),
+            "error": _choose([~valid], ["Invalid Sri Lankan phone number format"])
+        }
+    
+    def _email_kernel(self, codes, lengths) -> Dict[str, Any]:
+        """validate_email over stripped ASCII rows (see _run_batch)"""
+        _, np = _load_pandas()
+        rows = np.arange(len(codes))
+        width = codes.shape[1]
+        
+        def last(mask):
+            return width - 1 - mask[:, ::-1].argmax(axis=1)
+        
+        # local@domain.tld holds when the first character not allowed in local
+        # parts is a single '@' with something before it, the last character
+        # not allowed in domains is that same '@', and the last non-letter is a
+        # '.' with something between it and the '@' and 2+ letters after it.
+        # Padding counts as a letter so it never offends.
+        letter = _between(codes | 0x20, 'a', 'z') | (codes == 0)
+        domain_char = letter | _between(codes, '0', '9') | _one_of(codes, ".-")
+        at = (~(domain_char | _one_of(codes, "_%+"))).argmax(axis=1)
+        dot = last(~letter)
+        valid = ((codes[rows, at] == ord('@')) & (at >= 1) & (last(~domain_char) == at)
+                 & (codes[rows, dot] == ord('.')) & (dot > at + 1) & (dot <= lengths - 3))
+        
+        normalized = _ascii_case(codes[valid], upper=False)
+        at, lengths = at[valid], lengths[valid]
+        suffix = np.take_along_axis(normalized, np.maximum(lengths[:, None] - 7 + np.arange(7), 0), axis=1)
+        government = np.zeros(len(codes), dtype=bool)
+        government[valid] = (lengths >= 7) & (suffix == np.frombuffer(b".gov.lk", dtype=np.uint8)).all(axis=1)
+        return {
+            "valid": valid,
+            "normalized": _strings(normalized, valid),
+            "domain": _strings(_shift_left(normalized, at + 1), valid),
+            "is_government": government,
+            "error": _choose([~valid], ["Invalid email format"])
+        }
+
+# Helpers for the batch validators; pandas is only imported when they're used
+_BATCH_ROWS = 65536
+
+def _load_pandas():
+    import numpy as np
+    import pandas as pd
+    return pd, np
+
+# Character classes over uint8 code matrices, as range comparisons (much
+# faster than fancy-indexing a lookup table)
+def _between(codes, low: str, high: str):
+    return (codes - ord(low)).astype(codes.dtype) <= ord(high) - ord(low)
+
+def _one_of(codes, characters: str):
+    mask = codes == ord(characters[0])
+    for character in characters[1:]:
+        mask |= codes == ord(character)
+    return mask
+
+def _whitespace(codes):
+    """What str.strip() and re's \\s match in ASCII: \\t-\\r, \\x1c-\\x1f and space"""
+    return _between(codes, '\t', '\r') | _between(codes, '\x1c', ' ')
+
+def _ascii_case(codes, upper: bool):
+    """ASCII str.upper()/str.lower(): flip the 0x20 bit of letters in the other case"""
+    _, np = _load_pandas()
+    letters = _between(codes, 'a', 'z') if upper else _between(codes, 'A', 'Z')
+    return codes ^ (letters.view(np.uint8) << 5)
+
+def _shift_left(codes, offsets):
+    """Drop the first offsets[i] codes of each row i, zero-filling on the right"""
+    _, np = _load_pandas()
+    rows, width = codes.shape
+    padded = np.zeros((rows, 2 * width), dtype=codes.dtype)
+    padded[:, :width] = codes
+    windows = np.lib.stride_tricks.sliding_window_view(padded, width, axis=1)
+    return windows[np.arange(rows), np.minimum(offsets, width)]
+
+def _strings(selected, mask):
+    """Object array with the str of each row of zero-padded codes where mask is set, None elsewhere"""
+    _, np = _load_pandas()
+    strings = np.full(len(mask), None, dtype=object)
+    strings[mask] = selected.astype(np.uint32).view(f"<U{selected.shape[1]}").ravel().astype(object)
+    return strings
+
+def _choose(conditions, choices):
+    """Object array holding the first matching choice per row, None where nothing matched"""
+    _, np = _load_pandas()
+    return np.select(conditions, [np.asarray(choice, dtype=object) for choice in choices], default=None)
+
+def _ascii_rows(texts: List[str], eligible, min_width: int, max_width: int):
+    """
+    Strip a chunk of values into a fixed-width code matrix
+    
+    Returns:
+        (codes, lengths, fast): uint8 codes of the rows the matrix holds
+        exactly (eligible, ASCII, no NULs, at most max_width long), left-
+        aligned and zero-padded after str.strip(); their stripped lengths;
+        and the mask of those rows in texts
+    """
+    _, np = _load_pandas()
+    lengths = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))
+    width = int(min(max(lengths.max(initial=0), min_width), max_width))
+    try:
+        codes = np.array(texts, dtype=f"S{width}").view(np.uint8).reshape(len(texts), width)
+        is_ascii = True
+    except UnicodeEncodeError:
+        wide = np.array(texts, dtype=f"<U{width}").view(np.uint32).reshape(len(texts), width)
+        is_ascii = wide.max(axis=1, initial=0) <= 127
+        codes = wide.astype(np.uint8)
+    # Longer rows are cut off at width, and a NUL would read as padding
+    fast = eligible & is_ascii & (lengths <= width) & (np.count_nonzero(codes, axis=1) == lengths)
+    codes = codes[fast]
+    lengths = lengths[fast]
+    
+    # Only rows starting or ending in whitespace need stripping. Padding
+    # counts as whitespace here; it's only NUL in fast rows.
+    padded = np.flatnonzero(_whitespace(codes[:, 0]) | _whitespace(codes[np.arange(len(codes)), lengths - 1]))
+    if len(padded):
+        content = ~(_whitespace(codes[padded]) | (codes[padded] == 0))
+        start = content.argmax(axis=1)
+        end = np.where(content.any(axis=1), width - content[:, ::-1].argmax(axis=1), 0)
+        trailing = np.arange(width) >= end[:, None]
+        codes[padded] = _shift_left(np.where(trailing, 0, codes[padded]), start)
+        lengths[padded] = end - start
+    return codes, lengths, fast
+
+def _as_text(value) -> str:
+    """Non-str column value -> str, '' for None, NaN and pd.NA"""
+    pd, _ = _load_pandas()
+    return '' if pd.isna(value) else str(value)
+
+def _run_batch(values, min_width: int, max_width: int, kernel, scalar, columns: Dict[str, str]) -> "pd.DataFrame":
+    """
+    Validate a column with kernel(codes, lengths) in chunks of _BATCH_ROWS,
+    calling scalar(value) for missing values and rows the code matrix
+    can't hold. columns maps result columns to bool, object, Int64 or
+    boolean; the last two are masked where the row isn't valid.
+    """
+    pd, np = _load_pandas()
+    index = values.index if isinstance(values, pd.Series) else None
+    items = values.tolist() if hasattr(values, 'tolist') else list(values)
+    # The scalar validators treat every falsy value (None, '') as missing; so does NaN here
+    texts = [value if type(value) is str else _as_text(value) for value in items]
+    missing = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts)) == 0
+    
+    dtypes = {"bool": bool, "Int64": np.int64, "boolean": bool, "object": object}
+    results = {name: np.zeros(len(texts), dtype=dtypes[kind]) if kind != "object"
+               else np.full(len(texts), None, dtype=object) for name, kind in columns.items()}
+    for start in range(0, len(texts), _BATCH_ROWS):
+        stop = min(start + _BATCH_ROWS, len(texts))
+        codes, lengths, fast = _ascii_rows(texts[start:stop], ~missing[start:stop], min_width, max_width)
+        for name, result in kernel(codes, lengths).items():
+            results[name][start:stop][fast] = result
+        for row in start + np.flatnonzero(~fast):
+            result = scalar(texts[row])
+            for name in columns:
+                if name in result:
+                    results[name][row] = result[name]
+    
+    invalid = ~results["valid"]
+    for name, kind in columns.items():
+        if kind == "Int64":
+            results[name] = pd.arrays.IntegerArray(results[name], invalid)
+        elif kind == "boolean":
+            results[name] = pd.arrays.BooleanArray(results[name], invalid)
+        elif kind == "object":
+            # Kept as object (str or None) rather than converted to a string dtype
+            results[name] = pd.Series(results[name], index=index, dtype=object, copy=False)
+    return pd.DataFrame(results, index=index)
+
+class CachedValidator(DataValidator):
+    """
+    DataValidator that memoizes NIC, email and phone results
+    
+    The same citizens register, log in and update their profiles over and
+    over, so these values repeat heavily. Results are kept in bounded LRUs
+    keyed by the raw value and handed out as copies, so a caller mutating
+    one can't change what the next caller sees. NIC results depend on the
+    current year, so that cache is emptied when the year changes. Safe to
+    share between threads.
+    """
+    
+    CACHE_SIZE = 10000
+    
+    def __init__(self, cache_size: int = CACHE_SIZE):
+        super().__init__()
+        self.cache_size = cache_size
+        self._caches: Dict[str, 'OrderedDict[str, Dict[str, Any]]'] = {
+            "nic": OrderedDict(), "email": OrderedDict(), "phone": OrderedDict()
+        }
+        self._lock = threading.Lock()
+        self._year_ends = 0.0
+        self.hits = 0
+        self.misses = 0
+    
+    def validate_nic(self, nic: str) -> Dict[str, Any]:
+        if time.time() >= self._year_ends:
+            self._start_year()
+        return self._cached("nic", nic, DataValidator.validate_nic)
+    
+    def validate_email(self, email: str) -> Dict[str, Any]:
+        return self._cached("email", email, DataValidator.validate_email)
+    
+    def validate_phone(self, phone: str) -> Dict[str, Any]:
+        return self._cached("phone", phone, DataValidator.validate_phone)
+    
+    def cache_info(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": sum(len(cache) for cache in self._caches.values()),
+                "max_size": self.cache_size * len(self._caches)
+            }
+    
+    def clear_cache(self):
+        with self._lock:
+            for cache in self._caches.values():
+                cache.clear()
+            self.hits = self.misses = 0
+    
+    def _start_year(self):
+        """Drop NIC results computed against last year's date"""
+        now = datetime.now()
+        with self._lock:
+            self._caches["nic"].clear()
+            self._year_ends = datetime(now.year + 1, 1, 1).timestamp()
+    
+    def _cached(self, kind: str, value: Any, validate) -> Dict[str, Any]:
+        # Missing and non-string values are cheap (or errors) and not worth a slot
+        if not value or type(value) is not str:
+            return validate(self, value)
+        
+        cache = self._caches[kind]
+        with self._lock:
+            result = cache.get(value)
+            if result is not None:
+                cache.move_to_end(value)
+                self.hits += 1
+                return result.copy()
+            self.misses += 1
+        
+        result = validate(self, value)
+        with self._lock:
+            cache[value] = result
+            if len(cache) > self.cache_size:
+                cache.popitem(last=False)
+        return result.copy()
+
+_shared_validator: Optional[CachedValidator] = None
+_shared_validator_lock = threading.Lock()
+
+def get_validator() -> CachedValidator:
+    """The process-wide CachedValidator, created on first use"""
+    global _shared_validator
+    if _shared_validator is None:
+        with _shared_validator_lock:
+            if _shared_validator is None:
+                _shared_validator = CachedValidator()
+    return _shared_validator
 
 # Convenience functions for quick validation
 def validate_nic(nic: str) -> bool:
     """Quick NIC validation"""
-    validator = DataValidator()
-    return validator.validate_nic(nic)["valid"]
+    return get_validator().validate_nic(nic)["valid"]
 
 def validate_email(email: str) -> bool:
     """Quick email validation"""
-    validator = DataValidator()
-    return validator.validate_email(email)["valid"]
+    return get_validator().validate_email(email)["valid"]
 
 def validate_phone(phone: str) -> bool:
     """Quick phone validation"""
-    validator = DataValidator()
-    return validator.validate_phone(phone)["valid"]
+    return get_validator().validate_phone(phone)["valid"]
 
 # Example usage
 if __name__ == "__main__":
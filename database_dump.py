@@ -1,59 +1,253 @@
 """
 Firebase Database Dump Script
 Creates a local backup of all Firestore collections
+
+Each collection is paged through with query cursors and streamed to its
+own compressed newline-delimited JSON file, several collections at a
+time. Only one page per worker is ever held in memory, so memory use
+stays flat however large the database grows. A manifest.json next to the
+files records per-collection document counts and checksums.
+
+Incremental dumps (--incremental) export only documents whose updated_at
+is past the high-water mark the previous dump recorded for that
+collection, and link back to that dump so database_restore.py can
+rebuild a point-in-time state from a full dump plus its chain of deltas.
+
+Usage:
+  python database_dump.py [--incremental [--track-deletes]] [--workers N]
+                          [--compression gzip|zstd|none] [--page-size N]
+                          [--collections a,b,...]
+  python database_dump.py --verify database_backups/firestore_dump_YYYYMMDD_HHMMSS
 """
 
-import sys
-import os
+import argparse
+import gzip
+import hashlib
+import io
 import json
-from datetime import datetime
-from typing import Dict, Any
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple
 
 # Add database directory to path
 sys.path.append('database')
 from firebase_config import initialize_firebase, get_db
+from database.repositories import ID_ONLY_FIELDS, UPDATED_AT_FIELD
+from database.backup_codec import CODEC_NAME, BackupCodec
 
-def convert_firestore_data(data: Any) -> Any:
-    """Convert Firestore data types to JSON-serializable format"""
-    if hasattr(data, 'to_dict'):
-        return data.to_dict()
-    elif isinstance(data, dict):
-        return {k: convert_firestore_data(v) for k, v in data.items()}
-    elif isinstance(data, list):
-        return [convert_firestore_data(item) for item in data]
-    elif hasattr(data, 'isoformat'):  # datetime objects
-        return data.isoformat()
-    elif hasattr(data, '__dict__'):  # Firestore references
-        return str(data)
-    else:
-        return data
-
-def dump_collection(db, collection_name: str) -> Dict[str, Any]:
-    """Dump a single collection to dictionary"""
-    print(f"📦 Dumping collection: {collection_name}")
-    
-    collection_data = {}
-    try:
-        docs = db.collection(collection_name).get()
+try:
+    import zstandard
+except ImportError:  # optional; gzip is always available
+    zstandard = None
+
+DUMP_VERSION = '3.0'
+BACKUP_DIR = 'database_backups'
+MANIFEST_FILENAME = 'manifest.json'
+
+# Per-collection high-water marks of the last successful dump
+STATE_PATH = os.path.join(BACKUP_DIR, 'backup_state.json')
+
+# Incremental dumps re-read changes stamped this long before the previous
+# mark, covering clock skew between app servers and writes still in flight
+# while the previous dump ran. Re-exported documents are harmless.
+HIGH_WATER_OVERLAP = timedelta(minutes=5)
+
+# Documents fetched per cursor page; bounds memory per worker
+PAGE_SIZE = 1000
+DEFAULT_WORKERS = 4
+
+COMPRESSION_EXTENSIONS = {
+    'gzip': '.ndjson.gz',
+    'zstd': '.ndjson.zst',
+    'none': '.ndjson'
+}
+
+# Collections to dump
+COLLECTIONS = [
+    'citizens',
+    'passports',
+    'licenses',
+    'passportAppointments',
+    'licenseAppointments',
+    'medicalAppointments',
+    'passportTimeSlots',
+    'licenseTimeSlots',
+    'medicalTimeSlots',
+    'passportStaff',
+    'rmvStaff',
+    'medicalStaff',
+    'complaints',
+    'analytics_events'
+]
+
+def default_compression() -> str:
+    return 'zstd' if zstandard is not None else 'gzip'
+
+def compression_for_file(path: str) -> str:
+    """Compression of a dump file, from its extension"""
+    for compression, extension in COMPRESSION_EXTENSIONS.items():
+        if path.endswith(extension):
+            return compression
+    raise ValueError(f"Unknown dump file type: {path}")
+
+def open_dump_file(path: str, mode: str, compression: str):
+    """Open a dump file as a text stream ('r' or 'w'), compressing transparently"""
+    if compression == 'gzip':
+        return gzip.open(path, mode + 't', encoding='utf-8', compresslevel=6)
+    if compression == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("zstd dump files need the zstandard package (pip install zstandard)")
+        raw = open(path, mode + 'b')
+        if mode == 'w':
+            stream = zstandard.ZstdCompressor(level=3).stream_writer(raw, closefd=True)
+        else:
+            stream = zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+        return io.TextIOWrapper(stream, encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+def iter_collection(db, collection_name: str, page_size: int = PAGE_SIZE,
+                    since: Optional[datetime] = None, ids_only: bool = False) -> Iterator[Any]:
+    """Yield the documents of a collection, one cursor page at a time
+    
+    since limits the scan to documents updated after it; ids_only reads
+    document names without their fields.
+    """
+    query = db.collection(collection_name)
+    if since is not None:
+        query = query.where(UPDATED_AT_FIELD, '>', since).order_by(UPDATED_AT_FIELD)
+    if ids_only:
+        query = query.select(ID_ONLY_FIELDS)
+    query = query.order_by('__name__').limit(page_size)
+    last_doc = None
+    
+    while True:
+        page_query = query.start_after(last_doc) if last_doc is not None else query
+        page = list(page_query.stream())
+        yield from page
         
-        for doc in docs:
-            doc_id = doc.id
-            doc_data = doc.to_dict()
-            
-            # Convert any special Firestore types
-            cleaned_data = convert_firestore_data(doc_data)
-            collection_data[doc_id] = cleaned_data
+        if len(page) < page_size:
+            return
+        last_doc = page[-1]
+
+def iter_dump_file(path: str, codec: Optional[BackupCodec] = None,
+                   legacy_collection: Optional[str] = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Yield (document id, data) pairs from a collection dump file
+    
+    With a codec, typed values are restored from each record's type table.
+    Dumps older than the codec have no type table; pass legacy_collection
+    to decode their timestamps from that collection's schema instead.
+    """
+    with open_dump_file(path, 'r', compression_for_file(path)) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                data = record['data']
+                if codec is not None:
+                    if legacy_collection is not None:
+                        codec.decode_legacy(legacy_collection, data)
+                    else:
+                        codec.decode(data, record.get('types'))
+                yield record['id'], data
+
+def iter_id_file(path: str) -> Iterator[str]:
+    """Yield the document ids listed in a --track-deletes id file"""
+    with open_dump_file(path, 'r', compression_for_file(path)) as f:
+        for line in f:
+            if line.strip():
+                yield line.rstrip('\n')
+
+def write_id_file(db, collection_name: str, dump_dir: str, compression: str,
+                  page_size: int = PAGE_SIZE) -> Dict[str, Any]:
+    """List every current document id, so a restore can drop documents deleted since the full dump"""
+    filename = collection_name + '.ids' + COMPRESSION_EXTENSIONS[compression]
+    id_count = 0
+    with open_dump_file(os.path.join(dump_dir, filename), 'w', compression) as f:
+        for doc in iter_collection(db, collection_name, page_size, ids_only=True):
+            f.write(doc.id + '\n')
+            id_count += 1
+    return {'ids_file': filename, 'id_count': id_count}
+
+def write_dump_file(path: str, compression: str,
+                    documents: Iterable[Tuple[str, Dict[str, Any]]]) -> Tuple[int, str]:
+    """Stream (document id, data) pairs to a dump file; returns (count, sha256)"""
+    codec = BackupCodec()
+    checksum = hashlib.sha256()
+    doc_count = 0
+    
+    with open_dump_file(path, 'w', compression) as f:
+        for doc_id, doc_data in documents:
+            data, types = codec.encode(doc_data)
+            record = {'id': doc_id, 'data': data}
+            if types:
+                record['types'] = types
+            line = json.dumps(record, ensure_ascii=False) + '\n'
+            f.write(line)
+            # Checksum covers the uncompressed lines, so it can be checked while streaming
+            checksum.update(line.encode('utf-8'))
+            doc_count += 1
+    
+    return doc_count, checksum.hexdigest()
+
+def dump_collection(db, collection_name: str, dump_dir: str, compression: str,
+                    page_size: int = PAGE_SIZE, since: Optional[datetime] = None,
+                    track_deletes: bool = False) -> Dict[str, Any]:
+    """Stream a single collection to <dump_dir>/<collection><ext>
+    
+    With since, only documents updated after it are exported.
+    """
+    mode = 'incremental' if since is not None else 'full'
+    print(f"📦 Dumping collection: {collection_name} ({mode})")
+    
+    filename = collection_name + COMPRESSION_EXTENSIONS[compression]
+    path = os.path.join(dump_dir, filename)
+    start = time.perf_counter()
+    
+    try:
+        documents = ((doc.id, doc.to_dict() or {})
+                     for doc in iter_collection(db, collection_name, page_size, since=since))
+        doc_count, sha256 = write_dump_file(path, compression, documents)
         
-        print(f"   ✅ Exported {len(collection_data)} documents")
+        result = {
+            'file': filename,
+            'mode': mode,
+            'since': since.isoformat() if since is not None else None,
+            'documents': doc_count,
+            'sha256': sha256,
+            'bytes': os.path.getsize(path)
+        }
+        if track_deletes and since is not None:
+            result.update(write_id_file(db, collection_name, dump_dir, compression, page_size))
         
+        elapsed = time.perf_counter() - start
+        result['seconds'] = round(elapsed, 2)
+        print(f"   ✅ {collection_name}: exported {doc_count} documents in {elapsed:.1f}s")
+        return result
+    
     except Exception as e:
         print(f"   ❌ Error dumping {collection_name}: {str(e)}")
-        collection_data = {"error": str(e)}
-    
-    return collection_data
+        return {'file': filename, 'error': str(e)}
+
+def load_backup_state() -> Dict[str, Any]:
+    """High-water marks and the latest dump, as left by the last dump run"""
+    if not os.path.exists(STATE_PATH):
+        return {'last_dump': None, 'collections': {}}
+    with open(STATE_PATH, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_backup_state(state: Dict[str, Any]):
+    # Write-then-rename so an interrupted run never leaves a truncated state file
+    tmp_path = STATE_PATH + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, STATE_PATH)
 
-def create_database_dump():
-    """Create complete database dump"""
+def create_database_dump(collections: Optional[List[str]] = None, workers: int = DEFAULT_WORKERS,
+                         compression: Optional[str] = None, page_size: int = PAGE_SIZE,
+                         incremental: bool = False, track_deletes: bool = False) -> Optional[str]:
+    """Create a full or incremental database dump; returns the dump directory"""
     print("🚀 Starting Firebase Database Dump")
     print("=" * 50)
     
@@ -64,93 +258,142 @@ def create_database_dump():
         print("✅ Firebase connection established")
     except Exception as e:
         print(f"❌ Firebase initialization failed: {e}")
-        return
-    
-    # Define collections to dump
-    collections = [
-        'citizens',
-        'passports', 
-        'licenses',
-        'passportAppointments',
-        'licenseAppointments',
-        'medicalAppointments',
-        'passportTimeSlots',
-        'licenseTimeSlots',
-        'medicalTimeSlots',
-        'passportStaff',
-        'rmvStaff',
-        'medicalStaff',
-        'complaints',
-        'analytics_events'
-    ]
-    
-    # Create dump data structure
-    dump_data = {
+        return None
+    
+    collections = collections or COLLECTIONS
+    compression = compression or default_compression()
+    state = load_backup_state()
+    if incremental and not state['last_dump']:
+        print("⚠️  No previous dump recorded; taking a full dump instead")
+        incremental = False
+    
+    # Taken before any reads: everything written after it lands in the next delta
+    backup_started = datetime.utcnow()
+    
+    # Delta since each collection's mark; collections without one are dumped in full
+    since = {}
+    if incremental:
+        for name in collections:
+            mark = state['collections'].get(name, {}).get('high_water_mark')
+            since[name] = datetime.fromisoformat(mark) - HIGH_WATER_OVERLAP if mark else None
+    
+    # One directory per dump: a file per collection plus the manifest
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    prefix = 'firestore_delta' if incremental else 'firestore_dump'
+    dump_dir = os.path.join(BACKUP_DIR, f'{prefix}_{timestamp}')
+    os.makedirs(dump_dir, exist_ok=True)
+    
+    print(f"⚙️  {'Incremental' if incremental else 'Full'} dump: {len(collections)} collections, "
+          f"{workers} workers, {compression} compression, pages of {page_size}")
+    
+    # Dump collections concurrently; each worker holds at most one page
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            name: pool.submit(dump_collection, db, name, dump_dir, compression, page_size,
+                              since.get(name), track_deletes)
+            for name in collections
+        }
+        results = {name: future.result() for name, future in futures.items()}
+    elapsed = time.perf_counter() - start
+    
+    total_documents = sum(result.get('documents', 0) for result in results.values())
+    manifest = {
         'metadata': {
             'dump_timestamp': datetime.now().isoformat(),
-            'dump_version': '1.0',
+            'dump_version': DUMP_VERSION,
+            'type': 'incremental' if incremental else 'full',
+            # Previous dump in the restore chain, and the point in time this dump captures
+            'base_dump': state['last_dump'] if incremental else None,
+            'backup_started': backup_started.isoformat(),
+            'format': 'ndjson',
+            # Typed values are listed per document; see database/backup_codec.py
+            'codec': CODEC_NAME,
+            'compression': compression,
+            'page_size': page_size,
             'total_collections': len(collections),
+            'total_documents': total_documents,
+            'duration_seconds': round(elapsed, 2),
             'source': 'Firebase Firestore',
             'project_id': 'nova-veritas'
         },
-        'collections': {}
+        'collections': results
     }
+
+    manifest_path = os.path.join(dump_dir, MANIFEST_FILENAME)
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
     
-    # Dump each collection
-    total_documents = 0
-    for collection_name in collections:
-        collection_data = dump_collection(db, collection_name)
-        dump_data['collections'][collection_name] = collection_data
-        
-        if isinstance(collection_data, dict) and 'error' not in collection_data:
-            total_documents += len(collection_data)
-    
-    # Update metadata
-    dump_data['metadata']['total_documents'] = total_documents
+    # Advance the marks only for collections that dumped cleanly
+    for name, result in results.items():
+        if 'error' not in result:
+            state['collections'][name] = {
+                'high_water_mark': backup_started.isoformat(),
+                'dump': os.path.basename(dump_dir)
+            }
+    state['last_dump'] = os.path.basename(dump_dir)
+    save_backup_state(state)
     
-    # Create backup directory
-    backup_dir = 'database_backups'
-    os.makedirs(backup_dir, exist_ok=True)
+    total_bytes = sum(result.get('bytes', 0) for result in results.values())
+    print(f"\n🎉 Database dump completed in {elapsed:.1f}s")
+    print(f"📁 Dump directory: {dump_dir}")
+    print(f"📊 Total collections: {len(collections)}")
+    print(f"📄 Total documents: {total_documents}")
+    print(f"💾 Size on disk: {total_bytes / (1024 * 1024):.2f} MB")
     
-    # Generate filename with timestamp
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    dump_filename = f'firestore_dump_{timestamp}.json'
-    dump_path = os.path.join(backup_dir, dump_filename)
+    create_dump_summary(manifest, dump_dir)
+    return dump_dir
+
+def load_manifest(dump_dir: str) -> Dict[str, Any]:
+    with open(os.path.join(dump_dir, MANIFEST_FILENAME), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def verify_dump(dump_dir: str) -> bool:
+    """Re-read every collection file and check counts and checksums against the manifest"""
+    manifest = load_manifest(dump_dir)
+    valid = True
     
-    # Save dump to file
-    try:
-        with open(dump_path, 'w', encoding='utf-8') as f:
-            json.dump(dump_data, f, indent=2, ensure_ascii=False, default=str)
-        
-        print(f"\n🎉 Database dump completed successfully!")
-        print(f"📁 File saved: {dump_path}")
-        print(f"📊 Total collections: {len(collections)}")
-        print(f"📄 Total documents: {total_documents}")
+    for collection_name, entry in manifest['collections'].items():
+        if 'error' in entry:
+            print(f"   ⚠️  {collection_name}: dump failed ({entry['error']})")
+            valid = False
+            continue
         
-        # Get file size
-        file_size = os.path.getsize(dump_path)
-        file_size_mb = file_size / (1024 * 1024)
-        print(f"💾 File size: {file_size_mb:.2f} MB")
+        path = os.path.join(dump_dir, entry['file'])
+        checksum = hashlib.sha256()
+        doc_count = 0
+        with open_dump_file(path, 'r', compression_for_file(path)) as f:
+            for line in f:
+                checksum.update(line.encode('utf-8'))
+                doc_count += 1
         
-        # Create summary report
-        create_dump_summary(dump_data, dump_path)
-        
-    except Exception as e:
-        print(f"❌ Failed to save dump: {e}")
+        if doc_count == entry['documents'] and checksum.hexdigest() == entry['sha256']:
+            print(f"   ✅ {collection_name}: {doc_count} documents")
+        else:
+            print(f"   ❌ {collection_name}: expected {entry['documents']} documents, found {doc_count}"
+                  f"{'' if checksum.hexdigest() == entry['sha256'] else ' (checksum mismatch)'}")
+            valid = False
+    
+    return valid
 
-def create_dump_summary(dump_data: Dict, dump_path: str):
+def create_dump_summary(manifest: Dict, dump_dir: str):
     """Create a summary report of the dump"""
-    summary_path = dump_path.replace('.json', '_summary.txt')
+    summary_path = os.path.join(dump_dir, 'summary.txt')
     
     with open(summary_path, 'w', encoding='utf-8') as f:
         f.write("FIREBASE DATABASE DUMP SUMMARY\n")
         f.write("=" * 40 + "\n\n")
         
         # Metadata
-        metadata = dump_data['metadata']
+        metadata = manifest['metadata']
         f.write(f"Dump Timestamp: {metadata['dump_timestamp']}\n")
+        f.write(f"Dump Type: {metadata['type']}\n")
+        if metadata.get('base_dump'):
+            f.write(f"Base Dump: {metadata['base_dump']}\n")
         f.write(f"Total Collections: {metadata['total_collections']}\n")
         f.write(f"Total Documents: {metadata['total_documents']}\n")
+        f.write(f"Compression: {metadata['compression']}\n")
+        f.write(f"Duration: {metadata['duration_seconds']}s\n")
         f.write(f"Source: {metadata['source']}\n")
         f.write(f"Project ID: {metadata['project_id']}\n\n")
         
@@ -158,11 +401,10 @@ def create_dump_summary(dump_data: Dict, dump_path: str):
         f.write("COLLECTION DETAILS:\n")
         f.write("-" * 20 + "\n")
         
-        collections = dump_data['collections']
-        for collection_name, collection_data in collections.items():
-            if isinstance(collection_data, dict) and 'error' not in collection_data:
-                doc_count = len(collection_data)
-                f.write(f"{collection_name:<25} {doc_count:>5} documents\n")
+        for collection_name, entry in manifest['collections'].items():
+            if 'error' not in entry:
+                f.write(f"{collection_name:<25} {entry['documents']:>8} documents  "
+                        f"{entry['bytes'] / 1024:>10.1f} KB\n")
             else:
                 f.write(f"{collection_name:<25} ERROR\n")
         
@@ -170,26 +412,41 @@ def create_dump_summary(dump_data: Dict, dump_path: str):
     
     print(f"📋 Summary report: {summary_path}")
 
-def restore_instructions():
+def restore_instructions(dump_dir: str):
     """Print restore instructions"""
     print("\n" + "=" * 50)
     print("📖 RESTORE INSTRUCTIONS")
     print("=" * 50)
     print("To restore this backup:")
-    print("1. Use the Firebase Admin SDK")
-    print("2. Read the JSON file")
-    print("3. Iterate through collections and documents")
-    print("4. Use batch writes for efficiency")
-    print("\nExample restore code:")
-    print("```python")
-    print("import json")
-    print("with open('firestore_dump_YYYYMMDD_HHMMSS.json', 'r') as f:")
-    print("    dump_data = json.load(f)")
-    print("    for collection_name, docs in dump_data['collections'].items():")
-    print("        for doc_id, doc_data in docs.items():")
-    print("            db.collection(collection_name).document(doc_id).set(doc_data)")
-    print("```")
+    print(f"   python database_restore.py {dump_dir}")
+    print("To check the files against the manifest first:")
+    print(f"   python database_dump.py --verify {dump_dir}")
 
 if __name__ == '__main__':
-    create_database_dump()
-    restore_instructions()
+    parser = argparse.ArgumentParser(description='Dump Firestore collections to compressed NDJSON')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Collections dumped concurrently')
+    parser.add_argument('--compression', choices=sorted(COMPRESSION_EXTENSIONS),
+                        help='Default: zstd if zstandard is installed, else gzip')
+    parser.add_argument('--page-size', type=int, default=PAGE_SIZE, help='Documents per cursor page')
+    parser.add_argument('--collections', help='Comma-separated collections (default: all)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Export only documents updated since the previous dump')
+    parser.add_argument('--track-deletes', action='store_true',
+                        help='With --incremental, also list current ids so restores drop deleted documents')
+    parser.add_argument('--verify', metavar='DUMP_DIR', help='Verify an existing dump instead')
+    args = parser.parse_args()
+    
+    if args.verify:
+        print(f"🔍 Verifying {args.verify}")
+        sys.exit(0 if verify_dump(args.verify) else 1)
+    
+    dump_dir = create_database_dump(
+        collections=args.collections.split(',') if args.collections else None,
+        workers=args.workers,
+        compression=args.compression,
+        page_size=args.page_size,
+        incremental=args.incremental,
+        track_deletes=args.track_deletes
+    )
+    if dump_dir:
+        restore_instructions(dump_dir)
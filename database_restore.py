@@ -1,23 +1,164 @@
 """
 Firebase Database Restore Script
 Restores database from a local backup dump
+
+Reads dump directories written by database_dump.py (streamed one document
+at a time) as well as legacy single-file JSON dumps. Restoring an
+incremental dump rebuilds the state at that dump from its full base dump
+plus every delta in between.
+
+Writes are committed concurrently (BulkWriter, or a pool of batch
+workers) and checkpointed, so re-running an interrupted restore resumes
+where it stopped.
+
+Usage:
+  python database_restore.py <dump> [--confirm] [--workers N] [--no-bulk-writer]
+                             [--ops-per-second N] [--restart]
+  python database_restore.py --at 2025-08-20T03:00 [--confirm] [...]
 """
 
+import argparse
 import sys
 import os
 import json
+import time
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, Iterator, List, Optional, Tuple, Union
 
 # Add database directory to path
 sys.path.append('database')
 from firebase_config import initialize_firebase, get_db
+from database_dump import BACKUP_DIR, MANIFEST_FILENAME, iter_dump_file, iter_id_file, load_manifest
+from database.bulk_restore import DEFAULT_WORKERS, BulkRestorer, RestoreCheckpoint
+from database.backup_codec import BackupCodec
+
+def resolve_chain(dump_dir: str) -> List[Tuple[str, Dict[str, Any]]]:
+    """(dump directory, manifest) from this dump back to its full base, newest first"""
+    chain = []
+    current = dump_dir.rstrip(os.sep)
+    
+    while current:
+        if not os.path.exists(os.path.join(current, MANIFEST_FILENAME)):
+            raise ValueError(f"Dump in restore chain is missing: {current}")
+        manifest = load_manifest(current)
+        chain.append((current, manifest))
+        
+        base = manifest['metadata'].get('base_dump')
+        current = os.path.join(os.path.dirname(current), base) if base else None
+    
+    return chain
+
+def chain_documents(chain: List[Tuple[str, Dict[str, Any]]], collection_name: str,
+                    codec: BackupCodec) -> Union[Iterator[Tuple[str, Dict[str, Any]]], Dict[str, str]]:
+    """Documents of one collection as of the newest dump in the chain
+    
+    Walks from the newest delta back to the dump that holds the collection
+    in full; the newest version of each document wins and older copies are
+    skipped. Returns an error entry if the chain has no usable full copy.
+    """
+    files = []
+    live_ids = None
+    
+    for dump_dir, manifest in chain:
+        entry = manifest['collections'].get(collection_name)
+        if entry is None:
+            continue
+        
+        is_full = entry.get('mode', 'full') == 'full'
+        if 'error' in entry:
+            if is_full:
+                return {'error': f"Full dump of {collection_name} failed in {dump_dir}: {entry['error']}"}
+            # A failed delta didn't advance the mark, so the next delta covers its changes
+            continue
+        
+        if not files and entry.get('ids_file'):
+            live_ids = set(iter_id_file(os.path.join(dump_dir, entry['ids_file'])))
+        # Dumps written before the typed codec are decoded from the schema
+        legacy = 'codec' not in manifest.get('metadata', {})
+        files.append((os.path.join(dump_dir, entry['file']), legacy))
+        if is_full:
+            break
+    else:
+        return {'error': f"No full dump of {collection_name} in the restore chain"}
+    
+    def iter_documents():
+        seen = set()
+        for position, (path, legacy) in enumerate(files):
+            is_base = position == len(files) - 1
+            for doc_id, doc_data in iter_dump_file(path, codec, collection_name if legacy else None):
+                if doc_id in seen or (live_ids is not None and doc_id not in live_ids):
+                    continue
+                if not is_base:
+                    seen.add(doc_id)
+                yield doc_id, doc_data
+    
+    return iter_documents()
+
+def find_dump_at(point_in_time: datetime, backup_dir: str = BACKUP_DIR) -> Optional[str]:
+    """Latest dump directory taken at or before the given UTC time"""
+    latest = None
+    for name in os.listdir(backup_dir):
+        dump_dir = os.path.join(backup_dir, name)
+        if not os.path.exists(os.path.join(dump_dir, MANIFEST_FILENAME)):
+            continue
+        started = load_manifest(dump_dir)['metadata'].get('backup_started')
+        if started and datetime.fromisoformat(started) <= point_in_time:
+            if latest is None or started > latest[0]:
+                latest = (started, dump_dir)
+    return latest[1] if latest else None
+
+def load_dump(dump_path: str, codec: Optional[BackupCodec] = None) -> Dict[str, Any]:
+    """Metadata and per-collection document sources of a dump
+    
+    Accepts a dump directory (manifest + one NDJSON file per collection,
+    streamed document by document; incremental dumps are merged with
+    their chain) or a legacy single-file JSON dump. Documents come out
+    decoded by codec (a BackupCodec with the target client, so document
+    references can be rebuilt).
+    """
+    codec = codec or BackupCodec()
+    if os.path.isdir(dump_path):
+        chain = resolve_chain(dump_path)
+        collection_names = []
+        for _, manifest in chain:
+            collection_names.extend(name for name in manifest['collections'] if name not in collection_names)
+        
+        metadata = dict(chain[0][1].get('metadata', {}))
+        metadata['chain'] = [os.path.basename(dump_dir) for dump_dir, _ in reversed(chain)]
+        return {
+            'metadata': metadata,
+            'collections': {name: chain_documents(chain, name, codec) for name in collection_names}
+        }
+    
+    with open(dump_path, 'r', encoding='utf-8') as f:
+        dump_data = json.load(f)
+    if 'collections' not in dump_data:
+        raise ValueError("Invalid dump file format - missing 'collections'")
+    
+    collections = {}
+    for collection_name, documents in dump_data['collections'].items():
+        if isinstance(documents, dict) and 'error' not in documents:
+            # Single-file dumps predate the codec: timestamps were written as ISO strings
+            collections[collection_name] = (
+                (doc_id, codec.decode_legacy(collection_name, doc_data))
+                for doc_id, doc_data in documents.items()
+            )
+        else:
+            collections[collection_name] = documents
+    return {'metadata': dump_data.get('metadata', {}), 'collections': collections}
 
-def restore_from_dump(dump_file_path: str, confirm_restore: bool = False):
-    """Restore database from dump file"""
+def checkpoint_path_for(dump_path: str) -> str:
+    if os.path.isdir(dump_path):
+        return os.path.join(dump_path, 'restore_checkpoint.json')
+    return dump_path + '.restore_checkpoint.json'
+
+def restore_from_dump(dump_file_path: str, confirm_restore: bool = False, workers: int = DEFAULT_WORKERS,
+                      use_bulk_writer: bool = True, ops_per_second: Optional[int] = None,
+                      resume: bool = True):
+    """Restore database from dump file, resuming from its checkpoint if one exists"""
     
     if not os.path.exists(dump_file_path):
-        print(f"❌ Dump file not found: {dump_file_path}")
+        print(f"❌ Dump not found: {dump_file_path}")
         return False
     
     print("🔄 Starting Firebase Database Restore")
@@ -44,70 +185,66 @@ def restore_from_dump(dump_file_path: str, confirm_restore: bool = False):
     
     # Load dump data
     try:
-        with open(dump_file_path, 'r', encoding='utf-8') as f:
-            dump_data = json.load(f)
-        print("✅ Dump file loaded successfully")
+        dump_data = load_dump(dump_file_path, BackupCodec(db))
+        print("✅ Dump loaded successfully")
     except Exception as e:
-        print(f"❌ Failed to load dump file: {e}")
+        print(f"❌ Failed to load dump: {e}")
         return False
     
-    # Validate dump structure
-    if 'collections' not in dump_data:
-        print("❌ Invalid dump file format - missing 'collections'")
-        return False
-    
-    metadata = dump_data.get('metadata', {})
+    metadata = dump_data['metadata']
     print(f"📊 Dump info: {metadata.get('total_collections', 'Unknown')} collections, {metadata.get('total_documents', 'Unknown')} documents")
     print(f"📅 Created: {metadata.get('dump_timestamp', 'Unknown')}")
+    if len(metadata.get('chain', [])) > 1:
+        print(f"🔗 Applying {len(metadata['chain'])} dumps: {' -> '.join(metadata['chain'])}")
     
     # Restore collections
+    checkpoint_path = checkpoint_path_for(dump_file_path)
+    if not resume and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    checkpoint = RestoreCheckpoint(checkpoint_path, source=os.path.abspath(dump_file_path))
+    restorer = BulkRestorer(db, workers=workers, checkpoint=checkpoint,
+                            use_bulk_writer=use_bulk_writer, ops_per_second=ops_per_second)
+    print(f"⚙️  Writing with {restorer.mode}; checkpoint: {checkpoint_path}")
+    
     collections = dump_data['collections']
     total_restored = 0
+    total_written = 0
     failed_collections = []
+    start = time.perf_counter()
     
     for collection_name, documents in collections.items():
-        if isinstance(documents, dict) and 'error' not in documents:
-            print(f"\n📦 Restoring collection: {collection_name}")
-            
-            try:
-                # Use batch writes for efficiency
-                batch = db.batch()
-                batch_count = 0
-                
-                for doc_id, doc_data in documents.items():
-                    doc_ref = db.collection(collection_name).document(doc_id)
-                    batch.set(doc_ref, doc_data)
-                    batch_count += 1
-                    
-                    # Commit batch every 500 operations (Firestore limit)
-                    if batch_count >= 500:
-                        batch.commit()
-                        batch = db.batch()
-                        batch_count = 0
-                
-                # Commit remaining operations
-                if batch_count > 0:
-                    batch.commit()
-                
-                doc_count = len(documents)
-                total_restored += doc_count
-                print(f"   ✅ Restored {doc_count} documents")
-                
-            except Exception as e:
-                print(f"   ❌ Failed to restore {collection_name}: {e}")
-                failed_collections.append(collection_name)
-        else:
+        if isinstance(documents, dict):
+            # Error entry recorded by the dump
             print(f"\n📦 Skipping {collection_name} (contains errors)")
             failed_collections.append(collection_name)
+            continue
+        
+        print(f"\n📦 Restoring collection: {collection_name}")
+        
+        try:
+            stats = restorer.restore_collection(collection_name, documents)
+            total_restored += stats['documents']
+            total_written += stats['written']
+            print(f"   ✅ Restored {stats['documents']} documents "
+                  f"({stats['docs_per_sec']:,.0f} docs/sec)")
+        
+        except Exception as e:
+            print(f"   ❌ Failed to restore {collection_name}: {e}")
+            failed_collections.append(collection_name)
     
     # Summary
-    print(f"\n🎉 Restore completed!")
+    elapsed = time.perf_counter() - start
+    print(f"\n🎉 Restore completed in {elapsed:.1f}s!")
     print(f"📄 Total documents restored: {total_restored}")
+    if elapsed > 0:
+        print(f"⚡ Throughput: {total_written / elapsed:,.0f} docs/sec")
     
     if failed_collections:
         print(f"❌ Failed collections: {', '.join(failed_collections)}")
+        print(f"↪️  Run the restore again to resume from {checkpoint_path}")
     else:
         print("✅ All collections restored successfully")
+        checkpoint.clear()
     
     return len(failed_collections) == 0
 
@@ -119,16 +256,25 @@ def list_available_dumps():
         print("❌ No backup directory found")
         return []
     
-    dump_files = [f for f in os.listdir(backup_dir) if f.endswith('.json')]
+    # Dump directories (with a manifest) and legacy single-file JSON dumps
+    dump_files = sorted(
+        f for f in os.listdir(backup_dir)
+        if f.endswith('.json') or os.path.exists(os.path.join(backup_dir, f, MANIFEST_FILENAME))
+    )
     
     if not dump_files:
         print("❌ No dump files found")
         return []
     
-    print("📁 Available backup files:")
+    print("📁 Available backups:")
     for i, filename in enumerate(dump_files, 1):
         filepath = os.path.join(backup_dir, filename)
-        file_size = os.path.getsize(filepath) / (1024 * 1024)  # MB
+        if os.path.isdir(filepath):
+            file_size = sum(
+                os.path.getsize(os.path.join(filepath, name)) for name in os.listdir(filepath)
+            ) / (1024 * 1024)  # MB
+        else:
+            file_size = os.path.getsize(filepath) / (1024 * 1024)  # MB
         mod_time = datetime.fromtimestamp(os.path.getmtime(filepath))
         print(f"   {i}. {filename}")
         print(f"      Size: {file_size:.2f} MB, Modified: {mod_time.strftime('%Y-%m-%d %H:%M:%S')}")
@@ -158,11 +304,40 @@ def interactive_restore():
         print("❌ Please enter a valid number")
 
 if __name__ == '__main__':
-    if len(sys.argv) > 1:
-        # Command line mode
-        dump_file = sys.argv[1]
-        confirm = len(sys.argv) > 2 and sys.argv[2] == '--confirm'
-        restore_from_dump(dump_file, confirm)
-    else:
+    if len(sys.argv) == 1:
         # Interactive mode
         interactive_restore()
+        sys.exit(0)
+    
+    parser = argparse.ArgumentParser(description='Restore Firestore from a dump')
+    parser.add_argument('dump', nargs='?', help='Dump directory or legacy JSON dump file')
+    parser.add_argument('--at', help='Restore the latest dump taken at or before this UTC time')
+    parser.add_argument('--confirm', action='store_true', help='Skip the confirmation prompt')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Concurrent batch commits')
+    parser.add_argument('--no-bulk-writer', action='store_true', help='Use batch workers instead of BulkWriter')
+    parser.add_argument('--ops-per-second', type=int,
+                        help="Fixed BulkWriter rate instead of its ramp-up (for empty projects)")
+    parser.add_argument('--restart', action='store_true', help='Ignore any checkpoint and start over')
+    args = parser.parse_args()
+    
+    if args.at:
+        # Point-in-time mode: latest dump taken at or before the given UTC time
+        point_in_time = datetime.fromisoformat(args.at)
+        dump_path = find_dump_at(point_in_time)
+        if not dump_path:
+            print(f"❌ No dump taken at or before {point_in_time.isoformat()}")
+            sys.exit(1)
+    elif args.dump:
+        dump_path = args.dump
+    else:
+        parser.error('a dump path or --at is required')
+    
+    success = restore_from_dump(
+        dump_path,
+        args.confirm,
+        workers=args.workers,
+        use_bulk_writer=not args.no_bulk_writer,
+        ops_per_second=args.ops_per_second,
+        resume=not args.restart
+    )
+    sys.exit(0 if success else 1)
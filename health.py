@@ -0,0 +1,179 @@
+"""
+Background Health Prober
+Checks backing services on an interval and caches the results
+
+Health endpoints read the cached snapshot, so load balancer probes never
+touch Firestore themselves and never block when a dependency is slow.
+"""
+
+import logging
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import datetime
+from typing import Callable, Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+class HealthProber:
+    """Runs registered checks on a background thread and caches their results"""
+    
+    def __init__(self, interval: float = 15, timeout: float = 5, stale_after: Optional[float] = None):
+        self.interval = interval
+        self.timeout = timeout
+        # A snapshot older than this counts as unknown, e.g. if the prober thread died
+        self.stale_after = stale_after or interval * 3
+        
+        self._checks: Dict[str, Dict[str, Any]] = {}
+        self._results: Dict[str, Dict[str, Any]] = {}
+        self._in_flight: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.started_at = datetime.utcnow()
+    
+    def register(self, name: str, check: Callable[[float], bool], critical: bool = True):
+        """Register a check; it receives the timeout and returns True when healthy"""
+        self._checks[name] = {'check': check, 'critical': critical}
+    
+    def start(self):
+        """Start probing in a daemon thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='health-prober', daemon=True)
+        self._thread.start()
+        logger.info(f"Health prober started ({len(self._checks)} checks every {self.interval}s)")
+    
+    def stop(self):
+        """Stop probing"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.timeout)
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+    
+    @property
+    def running(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+    
+    def _run(self):
+        while not self._stop.is_set():
+            self.probe_once()
+            self._stop.wait(self.interval)
+    
+    def probe_once(self):
+        """Run every check concurrently, each bounded by the timeout"""
+        if self._executor is None:
+            # One worker per check: a hung check can hold at most its own worker
+            self._executor = ThreadPoolExecutor(max_workers=max(len(self._checks), 1),
+                                                thread_name_prefix='health-check')
+        pending = {}
+        
+        for name, entry in self._checks.items():
+            previous = self._in_flight.get(name)
+            if previous is not None and not previous.done():
+                # Last run is still hung; don't pile another call onto the dependency
+                self._record(name, False, None, 'Previous check still running')
+                continue
+            
+            future = self._executor.submit(self._timed, entry['check'])
+            self._in_flight[name] = future
+            pending[name] = future
+        
+        deadline = time.monotonic() + self.timeout
+        for name, future in pending.items():
+            try:
+                healthy, latency = future.result(timeout=max(deadline - time.monotonic(), 0))
+                self._record(name, healthy, latency, None)
+            except FutureTimeoutError:
+                self._record(name, False, None, f'Timed out after {self.timeout}s')
+            except Exception as e:
+                self._record(name, False, None, str(e))
+    
+    def _timed(self, check: Callable[[float], bool]):
+        start = time.perf_counter()
+        healthy = bool(check(self.timeout))
+        return healthy, (time.perf_counter() - start) * 1000
+    
+    def _record(self, name: str, healthy: bool, latency_ms: Optional[float], error: Optional[str]):
+        result = {
+            'healthy': healthy,
+            'critical': self._checks[name]['critical'],
+            'checked_at': datetime.utcnow().isoformat(),
+            'checked_monotonic': time.monotonic(),
+            'latency_ms': round(latency_ms, 1) if latency_ms is not None else None
+        }
+        if error:
+            result['error'] = error
+        
+        with self._lock:
+            previous = self._results.get(name)
+            self._results[name] = result
+        
+        # Log transitions only; the prober runs far too often to log every result
+        if not healthy and (previous is None or previous['healthy']):
+            logger.warning(f"Health check '{name}' failed: {error or 'unhealthy'}")
+        elif healthy and previous is not None and not previous['healthy']:
+            logger.info(f"Health check '{name}' recovered")
+    
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Cached result of every check, with staleness applied"""
+        now = time.monotonic()
+        with self._lock:
+            results = {name: dict(result) for name, result in self._results.items()}
+        
+        for name, result in results.items():
+            checked = result.pop('checked_monotonic')
+            result['age_seconds'] = round(now - checked, 1)
+            if now - checked > self.stale_after:
+                result['healthy'] = False
+                result['error'] = 'Result is stale'
+        
+        for name, entry in self._checks.items():
+            results.setdefault(name, {
+                'healthy': False,
+                'critical': entry['critical'],
+                'checked_at': None,
+                'error': 'Not checked yet'
+            })
+        
+        return results
+    
+    def is_healthy(self, name: str) -> bool:
+        """Cached health of a single check"""
+        return self.snapshot().get(name, {}).get('healthy', False)
+    
+    def readiness(self) -> Dict[str, Any]:
+        """Ready when every critical check last succeeded and is fresh"""
+        checks = self.snapshot()
+        failing = [name for name, result in checks.items() if result['critical'] and not result['healthy']]
+        
+        return {
+            'ready': not failing,
+            'failing': failing,
+            'checks': checks
+        }
+    
+    def liveness(self) -> Dict[str, Any]:
+        """Process-local only: never consults a dependency"""
+        return {
+            'alive': True,
+            'prober_running': self.running,
+            'uptime_seconds': round((datetime.utcnow() - self.started_at).total_seconds(), 1)
+        }
+
+def smtp_check(host: str, port: int, use_tls: bool = False) -> Callable[[float], bool]:
+    """Build a check that opens an SMTP session and issues NOOP"""
+    def check(timeout: float) -> bool:
+        with smtplib.SMTP(host, port, timeout=timeout) as smtp:
+            if use_tls:
+                smtp.starttls()
+            code, _ = smtp.noop()
+            return code == 250
+    
+    return check
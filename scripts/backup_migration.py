@@ -6,10 +6,13 @@ Person 2 - Database Setup
 import json
 import os
 from datetime import datetime
-from google.cloud import firestore
+from database.backup_codec import CODEC_NAME, BackupCodec
+from database.bulk_restore import BulkRestorer, RestoreCheckpoint
 from database.firebase_config import get_db
+from database.migration_runner import (DEFAULT_WORKERS, AddFieldMigration, MigrationRunner,
+                                       RenameFieldMigration, set_schema_version)
 from database.schema import ALL_SCHEMAS, CollectionNames
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 
 class DatabaseBackup:
     """Database backup and restoration utilities"""
@@ -17,6 +20,7 @@ class DatabaseBackup:
     def __init__(self):
         self.db = get_db()
         self.backup_dir = "backups"
+        self.codec = BackupCodec(self.db)
         os.makedirs(self.backup_dir, exist_ok=True)
     
     def backup_collection(self, collection_name: str) -> Dict[str, Any]:
@@ -27,9 +31,9 @@ class DatabaseBackup:
         backup_data = {}
         
         for doc in docs:
-            doc_data = doc.to_dict()
-            # Convert datetime objects to ISO strings
-            backup_data[doc.id] = self._serialize_data(doc_data)
+            # Typed values (timestamps, references, ...) are listed alongside the data
+            doc_data, types = self.codec.encode(doc.to_dict() or {})
+            backup_data[doc.id] = {"data": doc_data, "types": types}
         
         print(f"Backed up {len(backup_data)} documents from {collection_name}")
         return backup_data
@@ -42,6 +46,7 @@ class DatabaseBackup:
         
         full_backup = {
             "backup_date": datetime.now().isoformat(),
+            "codec": CODEC_NAME,
             "collections": {}
         }
         
@@ -60,36 +65,43 @@ class DatabaseBackup:
         print(f"✅ Full backup completed: {backup_path}")
         return backup_path
     
-    def restore_collection(self, collection_name: str, data: Dict[str, Any]):
-        """Restore a single collection from backup data"""
-        print(f"Restoring collection: {collection_name}")
-        
-        collection_ref = self.db.collection(collection_name)
-        restored_count = 0
+    def restore_collection(self, collection_name: str, data: Dict[str, Any],
+                           restorer: Optional[BulkRestorer] = None, typed: bool = True):
+        """Restore a single collection from backup data with parallel batched writes
         
-        for doc_id, doc_data in data.items():
-            if doc_data.get("error"):
-                print(f"Skipping {doc_id} due to backup error: {doc_data['error']}")
-                continue
-            
-            try:
-                # Deserialize data (convert ISO strings back to datetime)
-                deserialized_data = self._deserialize_data(doc_data)
-                collection_ref.document(doc_id).set(deserialized_data)
-                restored_count += 1
-            except Exception as e:
-                print(f"Error restoring document {doc_id}: {e}")
+        typed=False reads backups written before the codec (plain documents
+        with ISO timestamp strings), decoding timestamps from the schema.
+        """
+        print(f"Restoring collection: {collection_name}")
         
-        print(f"Restored {restored_count} documents to {collection_name}")
+        def documents():
+            for doc_id, doc_data in data.items():
+                if doc_data.get("error"):
+                    print(f"Skipping {doc_id} due to backup error: {doc_data['error']}")
+                    continue
+                if typed:
+                    yield doc_id, self.codec.decode(doc_data["data"], doc_data.get("types"))
+                else:
+                    yield doc_id, self.codec.decode_legacy(collection_name, doc_data)
+        
+        restorer = restorer or BulkRestorer(self.db)
+        stats = restorer.restore_collection(collection_name, documents())
+        print(f"Restored {stats['documents']} documents to {collection_name} "
+              f"({stats['docs_per_sec']:,.0f} docs/sec)")
     
     def restore_from_backup(self, backup_file_path: str):
-        """Restore all collections from a backup file"""
+        """Restore all collections from a backup file, resuming an interrupted run"""
         print(f"Restoring from backup: {backup_file_path}")
         
         with open(backup_file_path, 'r', encoding='utf-8') as f:
             backup_data = json.load(f)
         
         collections_data = backup_data.get("collections", {})
+        typed = backup_data.get("codec") == CODEC_NAME
+        checkpoint = RestoreCheckpoint(backup_file_path + '.restore_checkpoint.json',
+                                       source=os.path.abspath(backup_file_path))
+        restorer = BulkRestorer(self.db, checkpoint=checkpoint)
+        failed = False
         
         for collection_name, collection_data in collections_data.items():
             if collection_data.get("error"):
@@ -97,84 +109,57 @@ class DatabaseBackup:
                 continue
             
             try:
-                self.restore_collection(collection_name, collection_data)
+                self.restore_collection(collection_name, collection_data, restorer, typed)
             except Exception as e:
                 print(f"Error restoring collection {collection_name}: {e}")
+                failed = True
         
-        print("✅ Restoration completed")
-    
-    def _serialize_data(self, data: Any) -> Any:
-        """Convert datetime objects to ISO strings for JSON serialization"""
-        if isinstance(data, datetime):
-            return data.isoformat()
-        elif isinstance(data, dict):
-            return {k: self._serialize_data(v) for k, v in data.items()}
-        elif isinstance(data, list):
-            return [self._serialize_data(item) for item in data]
-        else:
-            return data
-    
-    def _deserialize_data(self, data: Any) -> Any:
-        """Convert ISO strings back to datetime objects"""
-        if isinstance(data, str):
-            # Try to parse as datetime
-            try:
-                return datetime.fromisoformat(data)
-            except (ValueError, TypeError):
-                return data
-        elif isinstance(data, dict):
-            return {k: self._deserialize_data(v) for k, v in data.items()}
-        elif isinstance(data, list):
-            return [self._deserialize_data(item) for item in data]
+        if failed:
+            print(f"⚠️ Restoration incomplete; run it again to resume from {checkpoint.path}")
         else:
-            return data
+            checkpoint.clear()
+            print("✅ Restoration completed")
 
 class DatabaseMigration:
-    """Database migration utilities"""
+    """Database migration utilities
     
-    def __init__(self):
+    Field changes run through MigrationRunner: parallel range scans, batched
+    writes and a checkpoint per migration, so they resume if interrupted.
+    """
+    
+    def __init__(self, workers: int = DEFAULT_WORKERS, dry_run: bool = False):
         self.db = get_db()
+        self.runner = MigrationRunner(self.db, workers=workers, dry_run=dry_run)
+    
+    def migrate(self) -> List[Dict[str, Any]]:
+        """Apply pending versioned migrations from database/migrations/"""
+        return self.runner.migrate()
     
     def add_field_to_collection(self, collection_name: str, field_name: str, default_value: Any):
         """Add a new field to all documents in a collection"""
         print(f"Adding field '{field_name}' to collection '{collection_name}'")
         
-        docs = self.db.collection(collection_name).get()
-        updated_count = 0
-        
-        for doc in docs:
-            doc_data = doc.to_dict()
-            if field_name not in doc_data:
-                doc.reference.update({field_name: default_value})
-                updated_count += 1
+        migration = AddFieldMigration([collection_name], field_name, default_value,
+                                      migration_id=f"add_field-{collection_name}-{field_name}")
+        report = self.runner.run(migration, rerun_completed=True)
         
-        print(f"Added field to {updated_count} documents")
+        verb = "Would add" if report['dry_run'] else "Added"
+        print(f"{verb} field to {report['collections'][collection_name]['updated']} documents")
     
     def rename_field_in_collection(self, collection_name: str, old_field: str, new_field: str):
         """Rename a field in all documents of a collection"""
         print(f"Renaming field '{old_field}' to '{new_field}' in collection '{collection_name}'")
         
-        docs = self.db.collection(collection_name).get()
-        updated_count = 0
-        
-        for doc in docs:
-            doc_data = doc.to_dict()
-            if old_field in doc_data:
-                value = doc_data[old_field]
-                doc.reference.update({
-                    new_field: value,
-                    old_field: firestore.DELETE_FIELD
-                })
-                updated_count += 1
+        migration = RenameFieldMigration([collection_name], old_field, new_field,
+                                         migration_id=f"rename_field-{collection_name}-{old_field}-{new_field}")
+        report = self.runner.run(migration, rerun_completed=True)
         
-        print(f"Renamed field in {updated_count} documents")
+        verb = "Would rename" if report['dry_run'] else "Renamed"
+        print(f"{verb} field in {report['collections'][collection_name]['updated']} documents")
     
     def update_schema_version(self, version: str):
         """Update schema version in database"""
-        self.db.collection('_metadata').document('schema').set({
-            'version': version,
-            'updated_at': datetime.now()
-        })
+        set_schema_version(self.db, version)
         print(f"Updated schema version to {version}")
 
 # Command-line interface
@@ -185,27 +170,39 @@ if __name__ == "__main__":
         print("Usage:")
         print("  python backup_migration.py backup")
         print("  python backup_migration.py restore <backup_file>")
-        print("  python backup_migration.py add_field <collection> <field> <value>")
+        print("  python backup_migration.py migrate [--dry-run]")
+        print("  python backup_migration.py add_field <collection> <field> <value> [--dry-run]")
+        print("  python backup_migration.py rename_field <collection> <old_field> <new_field> [--dry-run]")
         sys.exit(1)
     
-    command = sys.argv[1]
+    dry_run = "--dry-run" in sys.argv
+    args = [arg for arg in sys.argv[1:] if arg != "--dry-run"]
+    command = args[0]
     
     if command == "backup":
         backup = DatabaseBackup()
         backup_file = backup.backup_all_collections()
         print(f"Backup saved to: {backup_file}")
     
-    elif command == "restore" and len(sys.argv) == 3:
-        backup_file = sys.argv[2]
+    elif command == "restore" and len(args) == 2:
+        backup_file = args[1]
         backup = DatabaseBackup()
         backup.restore_from_backup(backup_file)
     
-    elif command == "add_field" and len(sys.argv) == 5:
-        collection = sys.argv[2]
-        field = sys.argv[3]
-        value = sys.argv[4]
-        migration = DatabaseMigration()
+    elif command == "migrate" and len(args) == 1:
+        migration = DatabaseMigration(dry_run=dry_run)
+        migration.migrate()
+    
+    elif command == "add_field" and len(args) == 4:
+        collection = args[1]
+        field = args[2]
+        value = args[3]
+        migration = DatabaseMigration(dry_run=dry_run)
         migration.add_field_to_collection(collection, field, value)
     
+    elif command == "rename_field" and len(args) == 4:
+        migration = DatabaseMigration(dry_run=dry_run)
+        migration.rename_field_in_collection(args[1], args[2], args[3])
+    
     else:
         print("Invalid command or arguments")
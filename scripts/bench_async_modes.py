@@ -0,0 +1,208 @@
+"""
+Sync vs Async Views Benchmark
+Drives the real API handlers in both ASYNC_VIEWS modes against stubbed Firestore
+
+Each run boots the app with create_app() in one mode, replaces the sync and
+async Firestore clients with in-memory ones that wait a fixed latency per
+round trip, and fires concurrent requests through Flask's test client from
+a pool of request threads (one per in-flight request, as a threaded WSGI
+server would). Sync handlers make their round trips one after another; the
+async handlers fan independent ones out on the shared event loop.
+
+Endpoints:
+  user-appointments   GET /api/appointments/user/<nic> as a citizen
+  analytics-summary   GET /api/analytics/summary as an admin
+
+Usage:
+  python scripts/bench_async_modes.py [latency_ms] [concurrency ...]
+  python scripts/bench_async_modes.py 40 10 50 200
+"""
+
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+ENDPOINTS = ('user-appointments', 'analytics-summary')
+REQUESTS_PER_CLIENT = 5
+CITIZEN_NIC = '199012345678'
+CITIZEN_UID = 'bench-citizen'
+APPOINTMENTS_PER_DEPARTMENT = 50
+
+
+class StubSnapshot:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self._data = data
+        self.exists = True
+    
+    def to_dict(self):
+        return dict(self._data)
+
+
+class StubQuery:
+    """Ignores filters and projections; every stream() costs one round trip"""
+    
+    def __init__(self, client, documents):
+        self._client = client
+        self._documents = documents
+    
+    def where(self, *args, **kwargs):
+        return self
+    
+    select = order_by = limit = where
+    
+    def _snapshots(self):
+        return [StubSnapshot(doc_id, data) for doc_id, data in self._documents.items()]
+    
+    def stream(self):
+        if self._client.is_async:
+            return self._stream_async()
+        time.sleep(self._client.latency)
+        return iter(self._snapshots())
+    
+    async def _stream_async(self):
+        await asyncio.sleep(self._client.latency)
+        for snapshot in self._snapshots():
+            yield snapshot
+
+
+class StubFirestore:
+    """Sync or async Firestore client serving fixed collections"""
+    
+    def __init__(self, collections, latency: float, is_async: bool):
+        self._collections = collections
+        self.latency = latency
+        self.is_async = is_async
+    
+    def collection(self, name):
+        return StubQuery(self, self._collections.get(name, {}))
+
+
+def seed_collections():
+    from database.schema import CollectionNames, DEPARTMENT_COLLECTIONS
+    
+    statuses = ('pending', 'confirmed', 'completed', 'cancelled')
+    collections = {CollectionNames.CITIZENS: {CITIZEN_NIC: {'firebaseUid': CITIZEN_UID, 'nic': CITIZEN_NIC}}}
+    for department, (_, appointments) in DEPARTMENT_COLLECTIONS.items():
+        collections[appointments] = {
+            f"{department}-{i}": {
+                'appointmentId': f"{department}-{i}",
+                'nic': CITIZEN_NIC,
+                'status': statuses[i % len(statuses)],
+                'scheduledDateTime': '2026-01-05T09:00:00'
+            }
+            for i in range(APPOINTMENTS_PER_DEPARTMENT)
+        }
+    return collections
+
+
+def build_app(mode: str, latency: float):
+    """create_app() in the given mode with both Firestore clients stubbed"""
+    os.environ.update({
+        'ASYNC_VIEWS': 'true' if mode == 'async' else 'false',
+        'HEALTH_PROBE_ENABLED': 'false',
+        # Only checked for existence: the stubs stand in for the initialized SDK
+        'FIREBASE_KEY_PATH': os.devnull
+    })
+    
+    from database.firebase_config import firebase_manager
+    from server import create_app
+    
+    collections = seed_collections()
+    firebase_manager._db = StubFirestore(collections, latency, is_async=False)
+    firebase_manager._async_db = StubFirestore(collections, latency, is_async=True)
+    firebase_manager._initialized = True
+    return create_app()
+
+
+def bearer(app, uid: str, role: str) -> dict:
+    import jwt
+    
+    now = datetime.utcnow()
+    token = jwt.encode({'uid': uid, 'role': role, 'iat': now, 'exp': now + timedelta(hours=1)},
+                       app.config['SECRET_KEY'], algorithm='HS256')
+    return {'Authorization': f"Bearer {token}"}
+
+
+def measure(mode: str, endpoint: str, concurrency: int, latency: float) -> dict:
+    """Serve concurrency * REQUESTS_PER_CLIENT requests in this process; report timings and peak RSS"""
+    app = build_app(mode, latency)
+    if endpoint == 'user-appointments':
+        path, headers = f"/api/appointments/user/{CITIZEN_NIC}", bearer(app, CITIZEN_UID, 'citizen')
+    else:
+        path, headers = '/api/analytics/summary', bearer(app, 'bench-admin', 'admin')
+    
+    def client_session():
+        client = app.test_client()
+        timings = []
+        for _ in range(REQUESTS_PER_CLIENT):
+            start = time.perf_counter()
+            response = client.get(path, headers=headers)
+            timings.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                raise RuntimeError(f"{path} returned {response.status_code}: {response.get_data(as_text=True)}")
+        return timings
+
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        timings = sorted(t for session in pool.map(lambda _: client_session(), range(concurrency)) for t in session)
+    elapsed = time.perf_counter() - start
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    
+    return {
+        'mode': mode,
+        'endpoint': endpoint,
+        'concurrency': concurrency,
+        'requests': len(timings),
+        'elapsed_s': round(elapsed, 3),
+        'requests_per_s': round(len(timings) / elapsed, 1),
+        'mean_ms': round(sum(timings) / len(timings) * 1000, 1),
+        'p95_ms': round(timings[int(len(timings) * 0.95) - 1] * 1000, 1),
+        'peak_rss_delta_mb': round((peak_kb - baseline_kb) / 1024, 2)
+    }
+
+
+def run_benchmark(latency_ms: float, concurrency_levels: list):
+    """Run every (endpoint, concurrency, mode) in a fresh interpreter so modes and peak RSS are isolated"""
+    print("🚀 Sync vs async views benchmark")
+    print(f"   Stubbed Firestore latency: {latency_ms:.0f} ms per round trip, "
+          f"{REQUESTS_PER_CLIENT} requests per client")
+    
+    for endpoint in ENDPOINTS:
+        print("=" * 80)
+        print(f"📊 {endpoint}")
+        print(f"{'mode':<6} {'in-flight':>10} {'req/s':>10} {'mean (ms)':>10} {'p95 (ms)':>10} {'peak RSS Δ (MB)':>17}")
+        
+        for concurrency in concurrency_levels:
+            for mode in ('sync', 'async'):
+                output = subprocess.run(
+                    [sys.executable, __file__, '--worker', mode, endpoint, str(concurrency), str(latency_ms)],
+                    capture_output=True, text=True
+                )
+                if output.returncode != 0:
+                    error = (output.stderr.strip().splitlines() or ['worker failed'])[-1]
+                    print(f"{mode:<6} {concurrency:>10} ❌ {error}")
+                    continue
+                
+                result = json.loads(output.stdout.strip().splitlines()[-1])
+                print(f"{result['mode']:<6} {result['concurrency']:>10} {result['requests_per_s']:>10} "
+                      f"{result['mean_ms']:>10} {result['p95_ms']:>10} {result['peak_rss_delta_mb']:>17}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == '--worker':
+        mode, endpoint, concurrency, latency_ms = sys.argv[2], sys.argv[3], int(sys.argv[4]), float(sys.argv[5])
+        print(json.dumps(measure(mode, endpoint, concurrency, latency_ms / 1000)))
+    else:
+        latency_ms = float(sys.argv[1]) if len(sys.argv) > 1 else 40
+        levels = [int(arg) for arg in sys.argv[2:]] or [10, 50, 200]
+        run_benchmark(latency_ms, levels)
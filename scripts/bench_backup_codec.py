@@ -0,0 +1,182 @@
+"""
+Backup Codec Benchmark
+Encode/decode throughput and fidelity of backup serialization
+
+Compares the original backup serialization (datetimes written as ISO
+strings, every string in every document run through
+datetime.fromisoformat on restore) with the typed codec in
+database/backup_codec.py, on a seeded synthetic dataset shaped like the
+citizens, appointment, time slot and analytics documents the app writes.
+Both sides include the json.dumps/json.loads a backup file goes through.
+
+Fidelity counts documents whose restored data differs from the original:
+the legacy decoder turns slot 'date' strings and date-like text such as
+'19901231' into datetimes, and drops timezones and nanoseconds.
+
+Usage:
+  python scripts/bench_backup_codec.py [documents ...]
+  python scripts/bench_backup_codec.py 10000 50000
+"""
+
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.backup_codec import BackupCodec
+
+SEED = 42
+REPEATS = 3
+
+
+def legacy_serialize(data):
+    """DatabaseBackup._serialize_data as it was before the codec"""
+    if isinstance(data, datetime):
+        return data.isoformat()
+    elif isinstance(data, dict):
+        return {k: legacy_serialize(v) for k, v in data.items()}
+    elif isinstance(data, list):
+        return [legacy_serialize(item) for item in data]
+    else:
+        return data
+
+
+def legacy_deserialize(data):
+    """DatabaseBackup._deserialize_data as it was before the codec"""
+    if isinstance(data, str):
+        try:
+            return datetime.fromisoformat(data)
+        except (ValueError, TypeError):
+            return data
+    elif isinstance(data, dict):
+        return {k: legacy_deserialize(v) for k, v in data.items()}
+    elif isinstance(data, list):
+        return [legacy_deserialize(item) for item in data]
+    else:
+        return data
+
+
+def build_dataset(count: int) -> list:
+    """Seeded (collection, document) pairs in the app's document shapes"""
+    rng = random.Random(SEED)
+    start = datetime(2025, 1, 6, 8, 0, tzinfo=timezone.utc)
+    documents = []
+    
+    for i in range(count):
+        moment = start + timedelta(days=rng.randint(0, 60), minutes=30 * rng.randint(0, 16),
+                                   microseconds=rng.randint(0, 999999))
+        kind = i % 4
+        if kind == 0:
+            documents.append(('citizens', {
+                'nic': f"{rng.randint(1960, 2005)}{rng.randint(1000, 1231):04d}",
+                'fullName': f"Citizen {i}",
+                'email': f"citizen{i}@example.lk",
+                'phoneNumber': f"07{rng.randint(10000000, 99999999)}",
+                'address': f"{rng.randint(1, 400)} Galle Road, Colombo",
+                'dateOfBirth': f"{rng.randint(1960, 2005)}-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}",
+                'firebase_uid': f"uid{rng.getrandbits(64):016x}",
+                'createdAt': moment,
+                'updated_at': moment
+            }))
+        elif kind == 1:
+            documents.append(('passportAppointments', {
+                'nic': f"{rng.randint(1960, 2005)}{rng.randint(10000000, 99999999)}",
+                'timeSlotId': f"slot-{rng.getrandbits(48):012x}",
+                'scheduledDateTime': moment,
+                'status': rng.choice(['confirmed', 'pending', 'completed']),
+                'reference': f"PASSPORT-{moment.strftime('%Y%m%d%H%M')}-{rng.randint(1000, 9999)}",
+                'supportingDocuments': [f"https://storage.googleapis.com/govconnect/{i}/{n}.pdf"
+                                        for n in range(rng.randint(1, 4))],
+                'remarks': '',
+                'bookedAt': moment - timedelta(days=3),
+                'updated_at': moment
+            }))
+        elif kind == 2:
+            documents.append(('medicalTimeSlots', {
+                'date': moment.strftime('%Y-%m-%d'),
+                'startTime': moment,
+                'endTime': moment + timedelta(minutes=30),
+                'isAvailable': rng.random() < 0.5,
+                'capacity': 1,
+                'updated_at': moment
+            }))
+        else:
+            documents.append(('analytics_events', {
+                'event_type': rng.choice(['login', 'booking', 'page_view']),
+                'user_id': f"uid{rng.getrandbits(64):016x}",
+                'timestamp': moment.isoformat(),
+                'metadata': {'path': f"/api/appointments/{i}", 'day': moment.strftime('%Y%m%d')}
+            }))
+    
+    return documents
+
+
+def best_of(function) -> float:
+    best = float('inf')
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_legacy(documents: list):
+    lines = []
+    
+    def encode():
+        lines[:] = [json.dumps(legacy_serialize(data)) for _, data in documents]
+    
+    restored = []
+    
+    def decode():
+        restored[:] = [legacy_deserialize(json.loads(line)) for line in lines]
+    
+    return best_of(encode), best_of(decode), restored
+
+
+def run_codec(documents: list):
+    codec = BackupCodec()
+    lines = []
+    
+    def encode():
+        lines[:] = []
+        for _, data in documents:
+            encoded, types = codec.encode(data)
+            lines.append(json.dumps({'data': encoded, 'types': types} if types else {'data': encoded}))
+    
+    restored = []
+    
+    def decode():
+        restored[:] = []
+        for line in lines:
+            record = json.loads(line)
+            restored.append(codec.decode(record['data'], record.get('types')))
+    
+    return best_of(encode), best_of(decode), restored
+
+
+def mismatches(documents: list, restored: list) -> int:
+    return sum(1 for (_, original), copy in zip(documents, restored) if original != copy)
+
+
+def run_benchmark(counts: list):
+    print("🧬 Backup codec benchmark")
+    print(f"   seed {SEED}, best of {REPEATS}, times include json.dumps/json.loads")
+    print("=" * 78)
+    print(f"{'docs':>7}  {'codec':<8} {'encode docs/s':>14} {'decode docs/s':>14} {'changed docs':>13}")
+    
+    for count in counts:
+        documents = build_dataset(count)
+        for label, run in (('legacy', run_legacy), ('typed', run_codec)):
+            encode_seconds, decode_seconds, restored = run(documents)
+            print(f"{count:>7}  {label:<8} {count / encode_seconds:>14,.0f} "
+                  f"{count / decode_seconds:>14,.0f} {mismatches(documents, restored):>13,}")
+
+
+if __name__ == "__main__":
+    counts = [int(arg) for arg in sys.argv[1:]] or [10000, 50000]
+    run_benchmark(counts)
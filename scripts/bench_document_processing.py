@@ -0,0 +1,143 @@
+"""
+Document Processing Benchmark
+Throughput of document post-processing on an image-heavy batch
+
+Writes a seeded batch of phone-camera-sized JPEG photos, PNG scans and
+small PDFs to a local storage backend, then processes the batch:
+
+  naive     full-resolution decode, thumbnail and recompress per file,
+            one after another (what doing it inline in each upload would cost)
+  threads   DocumentProcessor with image work in its threads (process_workers=0)
+  processes DocumentProcessor with a process pool, one process per core
+
+Results are collected in memory instead of Firestore. The submit column
+is the time upload handlers spend queueing the batch.
+
+Usage:
+  python scripts/bench_document_processing.py [photos] [scans] [pdfs]
+  python scripts/bench_document_processing.py 40 10 10
+"""
+
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.document_processing import (
+    JPEG_QUALITY, MAX_IMAGE_DIMENSION, THUMBNAIL_SIZE, DocumentProcessor, count_pdf_pages
+)
+from database.storage import LocalStorage
+
+SEED = 42
+THREADS = 4
+
+
+def make_image(rng: random.Random, size, fmt: str) -> bytes:
+    """Gradient with noise, so it compresses like a photo rather than a flat fill"""
+    import numpy as np
+    from PIL import Image
+    
+    width, height = size
+    y, x = np.mgrid[0:height, 0:width]
+    base = np.stack([x * 255 // width, y * 255 // height, (x + y) * 255 // (width + height)], axis=-1)
+    noise = np.random.default_rng(rng.randint(0, 2**32)).integers(0, 40, (height, width, 3))
+    image = Image.fromarray((base + noise).clip(0, 255).astype('uint8'))
+    out = io.BytesIO()
+    image.save(out, fmt, **({'quality': 95} if fmt == 'JPEG' else {}))
+    return out.getvalue()
+
+
+def make_pdf(pages: int) -> bytes:
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>",
+               b"<< /Type /Pages /Count %d /Kids [] >>" % pages]
+    objects += [b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] >>"] * pages
+    body = b"".join(b"%d 0 obj\n%s\nendobj\n" % (i + 1, obj) for i, obj in enumerate(objects))
+    return b"%PDF-1.4\n" + body + b"%%EOF\n"
+
+
+def build_batch(storage: LocalStorage, photos: int, scans: int, pdfs: int) -> list:
+    rng = random.Random(SEED)
+    files = (
+        [(f"photo{i}.jpg", make_image(rng, (4032, 3024), 'JPEG')) for i in range(photos)]
+        + [(f"scan{i}.png", make_image(rng, (1240, 1754), 'PNG')) for i in range(scans)]
+        + [(f"form{i}.pdf", make_pdf(rng.randint(1, 12))) for i in range(pdfs)]
+    )
+    documents = []
+    for name, data in files:
+        stored = storage.upload(io.BytesIO(data), f"documents/bench/{name}")
+        documents.append({'filename': name, 'storage_key': stored.key, 'file_size': stored.size})
+    return documents
+
+
+def naive(storage: LocalStorage, documents: list) -> float:
+    from PIL import Image
+    
+    start = time.perf_counter()
+    for document in documents:
+        with storage.open(document['storage_key']) as stored:
+            data = stored.read()
+        if document['filename'].endswith('.pdf'):
+            count_pdf_pages(data)
+            continue
+        with Image.open(io.BytesIO(data)) as image:
+            image = image.convert('RGB')
+            optimized = image.copy()
+            optimized.thumbnail((MAX_IMAGE_DIMENSION, MAX_IMAGE_DIMENSION))
+            optimized.save(io.BytesIO(), 'JPEG', quality=JPEG_QUALITY, optimize=True)
+            image.thumbnail(THUMBNAIL_SIZE)
+            image.save(io.BytesIO(), 'JPEG', quality=80)
+    return time.perf_counter() - start
+
+
+def pipelined(storage: LocalStorage, documents: list, process_workers):
+    results = {}
+    processor = DocumentProcessor(storage, workers=THREADS, process_workers=process_workers,
+                                  update=lambda document_id, fields: results.__setitem__(document_id, fields))
+    if process_workers != 0:
+        # Start the pool before timing; spawning is a one-off server cost
+        processor.process('warmup', documents[-1])
+    start = time.perf_counter()
+    futures = [processor.submit(str(i), document) for i, document in enumerate(documents)]
+    submitted = time.perf_counter() - start
+    for future in futures:
+        future.result()
+    seconds = time.perf_counter() - start
+    processor.shutdown()
+    return submitted, seconds, results
+
+
+def run_benchmark(photos: int, scans: int, pdfs: int):
+    root = tempfile.mkdtemp(prefix='govconnect-processing-')
+    try:
+        storage = LocalStorage(root)
+        documents = build_batch(storage, photos, scans, pdfs)
+        total_mb = sum(document['file_size'] for document in documents) / 1e6
+        
+        print("🖼️  Document processing benchmark")
+        print(f"   seed {SEED}, {photos} photos (4032x3024 JPEG), {scans} scans (A4 PNG), {pdfs} PDFs, "
+              f"{total_mb:.1f} MB, {os.cpu_count()} cores")
+        print("=" * 78)
+        print(f"{'mode':<10} {'submit ms':>10} {'seconds':>9} {'docs/s':>8} {'MB/s':>8} {'speedup':>8}")
+        
+        baseline = naive(storage, documents)
+        print(f"{'naive':<10} {'-':>10} {baseline:>9.2f} {len(documents) / baseline:>8.1f} "
+              f"{total_mb / baseline:>8.1f} {1:>7.1f}x")
+        for mode, process_workers in (('threads', 0), ('processes', None)):
+            submitted, seconds, results = pipelined(storage, documents, process_workers)
+            failed = sum(1 for fields in results.values() if fields['processing_status'] != 'done')
+            print(f"{mode:<10} {submitted * 1000:>10.1f} {seconds:>9.2f} {len(documents) / seconds:>8.1f} "
+                  f"{total_mb / seconds:>8.1f} {baseline / seconds:>7.1f}x"
+                  + (f"  ({failed} not done)" if failed else ""))
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    counts = [int(arg) for arg in sys.argv[1:4]]
+    photos, scans, pdfs = counts + [40, 10, 10][len(counts):]
+    run_benchmark(photos, scans, pdfs)
@@ -0,0 +1,144 @@
+"""
+Appointment List Payload Benchmark
+Response size of the appointment list endpoints per projection
+
+Builds a seeded synthetic dataset shaped like the documents written by
+POST /api/appointments/<department> (base64 QR code PNG, supporting
+document URLs, remarks) and measures the JSON body the list endpoints
+return for full documents, the default summary shape and a custom
+?fields= projection, raw and gzip-compressed.
+
+Projections are applied the way Firestore select() applies them: only the
+requested fields (plus the document id) leave the server.
+
+Usage:
+  python scripts/bench_payload_size.py [rows ...]
+  python scripts/bench_payload_size.py 1000 5000 20000
+"""
+
+import base64
+import gzip
+import io
+import json
+import os
+import random
+import sys
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.repositories import APPOINTMENT_SUMMARY_FIELDS
+from database.schema import DEPARTMENT_COLLECTIONS
+
+SEED = 42
+CUSTOM_FIELDS = ['status', 'scheduledDateTime', 'reference']
+
+# Size of a qrcode PNG for a booking reference, used when qrcode isn't installed
+FALLBACK_QR_PNG_BYTES = 650
+
+
+def qr_code_factory():
+    """Return (render(data) -> base64 PNG, source label)"""
+    try:
+        import qrcode
+    except ImportError:
+        def render(data: str) -> str:
+            return base64.b64encode(os.urandom(FALLBACK_QR_PNG_BYTES)).decode()
+        return render, f'random {FALLBACK_QR_PNG_BYTES}-byte stand-in (qrcode not installed)'
+    
+    def render(data: str) -> str:
+        qr = qrcode.QRCode(version=1, box_size=10, border=5)
+        qr.add_data(data)
+        qr.make(fit=True)
+        buffer = io.BytesIO()
+        qr.make_image(fill_color="black", back_color="white").save(buffer, format='PNG')
+        return base64.b64encode(buffer.getvalue()).decode()
+    return render, 'qrcode'
+
+
+def build_dataset(rows: int, render_qr) -> list:
+    """Seeded appointments spread across departments, as the booking handler writes them"""
+    rng = random.Random(SEED)
+    departments = list(DEPARTMENT_COLLECTIONS)
+    start = datetime(2025, 1, 6, 8, 0)
+    appointments = []
+    
+    for i in range(rows):
+        department = departments[i % len(departments)]
+        scheduled = start + timedelta(days=rng.randint(0, 60), minutes=30 * rng.randint(0, 16))
+        reference = f"{department.upper()}-{scheduled.strftime('%Y%m%d%H%M')}-{rng.randint(1000, 9999)}"
+        appointment = {
+            'id': str(uuid.UUID(int=rng.getrandbits(128))),
+            'nic': f"{rng.randint(1960, 2005)}{rng.randint(10000000, 99999999)}",
+            'timeSlotId': f"slot-{rng.getrandbits(48):012x}",
+            'scheduledDateTime': scheduled.isoformat(),
+            'status': rng.choice(['confirmed', 'pending', 'completed', 'cancelled', 'no-show']),
+            'qrCode': render_qr(reference),
+            'reference': reference,
+            'feedback': ''
+        }
+        appointment['appointmentId'] = appointment['id']
+        
+        if department == 'medical':
+            appointment['reports'] = ''
+        else:
+            appointment.update({
+                'applicationForm': f"https://storage.googleapis.com/govconnect/forms/{appointment['id']}.pdf",
+                'supportingDocuments': [
+                    f"https://storage.googleapis.com/govconnect/documents/{appointment['id']}/{n}.pdf"
+                    for n in range(rng.randint(1, 4))
+                ],
+                'deliveryStatus': 'pending'
+            })
+            if department == 'passport':
+                appointment['remarks'] = ' '.join(rng.choice(['urgent', 'renewal', 'lost', 'travel', 'visa',
+                                                              'collect', 'in', 'person', 'please'])
+                                                  for _ in range(rng.randint(0, 30)))
+            else:
+                appointment['appointmentType'] = rng.choice(['new license', 'renewal'])
+        
+        appointments.append(appointment)
+    
+    return appointments
+
+
+def project(appointments: list, fields) -> list:
+    """Apply a select() projection; None keeps whole documents"""
+    if fields is None:
+        return appointments
+    keep = set(fields) | {'id'}
+    return [{key: value for key, value in appointment.items() if key in keep} for appointment in appointments]
+
+
+def payload_size(appointments: list) -> tuple:
+    body = json.dumps({'appointments': appointments}, default=str).encode()
+    return len(body), len(gzip.compress(body, compresslevel=6))
+
+
+def run_benchmark(row_counts: list):
+    render_qr, qr_source = qr_code_factory()
+    projections = [
+        ('fields=all', None),
+        ('default summary', APPOINTMENT_SUMMARY_FIELDS),
+        (f"fields={','.join(CUSTOM_FIELDS)}", CUSTOM_FIELDS)
+    ]
+    
+    print("📦 Appointment list payload benchmark")
+    print(f"   QR codes: {qr_source}, seed {SEED}")
+    print("=" * 82)
+    print(f"{'rows':>7}  {'projection':<42} {'JSON (KB)':>10} {'gzip (KB)':>10} {'vs full':>8}")
+    
+    for rows in row_counts:
+        appointments = build_dataset(rows, render_qr)
+        full_raw = None
+        for label, fields in projections:
+            raw, compressed = payload_size(project(appointments, fields))
+            full_raw = full_raw or raw
+            print(f"{rows:>7}  {label:<42} {raw / 1024:>10.1f} {compressed / 1024:>10.1f} "
+                  f"{raw / full_raw:>7.1%}")
+
+
+if __name__ == "__main__":
+    counts = [int(arg) for arg in sys.argv[1:]] or [1000, 5000]
+    run_benchmark(counts)
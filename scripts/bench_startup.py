@@ -0,0 +1,89 @@
+"""
+Server Startup Benchmark
+Measures `import server` and `create_app()` separately
+
+Every run happens in a fresh interpreter so module caches don't hide
+import cost. Also lists the slowest imports (from -X importtime) for
+the first run, which is where startup regressions usually come from.
+
+Usage:
+  python scripts/bench_startup.py [runs]
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, time
+t0 = time.perf_counter()
+import server
+t1 = time.perf_counter()
+server.create_app()
+t2 = time.perf_counter()
+print(json.dumps({'import_s': t1 - t0, 'create_app_s': t2 - t1}))
+"""
+
+
+def run_probe(importtime: bool = False) -> dict:
+    """Run one cold start; returns timings (and raw importtime output if asked)"""
+    command = [sys.executable]
+    if importtime:
+        command += ['-X', 'importtime']
+    command += ['-c', PROBE]
+    
+    output = subprocess.run(command, cwd=PROJECT_ROOT, capture_output=True, text=True)
+    if output.returncode != 0:
+        raise RuntimeError(output.stderr.strip().splitlines()[-1])
+    
+    result = json.loads(output.stdout.strip().splitlines()[-1])
+    result['importtime'] = output.stderr if importtime else ''
+    return result
+
+
+def slowest_imports(importtime_log: str, top: int = 15) -> list:
+    """Parse `-X importtime` output into (cumulative_us, module) pairs"""
+    rows = []
+    for line in importtime_log.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _self_us, cumulative_us, module = line[len('import time:'):].split('|')
+        rows.append((int(cumulative_us), module.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def run_benchmark(runs: int):
+    print("🚀 Server startup benchmark")
+    print("=" * 50)
+    
+    try:
+        first = run_probe(importtime=True)
+    except RuntimeError as e:
+        print(f"❌ Startup failed: {e}")
+        return
+    
+    import_times = [first['import_s']]
+    create_times = [first['create_app_s']]
+    for _ in range(runs - 1):
+        result = run_probe()
+        import_times.append(result['import_s'])
+        create_times.append(result['create_app_s'])
+    
+    print(f"Runs: {runs}")
+    print(f"import server  median {statistics.median(import_times) * 1000:8.1f} ms   "
+          f"min {min(import_times) * 1000:8.1f} ms")
+    print(f"create_app()   median {statistics.median(create_times) * 1000:8.1f} ms   "
+          f"min {min(create_times) * 1000:8.1f} ms")
+    
+    print("\n📋 Slowest imports (cumulative, first run):")
+    for cumulative_us, module in slowest_imports(first['importtime']):
+        print(f"   {cumulative_us / 1000:8.1f} ms  {module}")
+
+
+if __name__ == "__main__":
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    run_benchmark(runs)
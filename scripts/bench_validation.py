@@ -0,0 +1,153 @@
+"""
+Bulk Validation Benchmark
+Scalar vs column-at-a-time NIC, phone and email validation
+
+Builds a seeded set of citizen records (valid NICs in both formats,
+lower-case suffixes, padding, impossible days and years, malformed and
+missing values; local, international and separated phone numbers;
+mixed-case and broken emails) and validates every column twice: one
+DataValidator.validate_* call per value, and one validate_*_batch call
+per column. Every batch row is checked against the scalar result for the
+same value before timings are reported.
+
+Usage:
+  python scripts/bench_validation.py [records ...]
+  python scripts/bench_validation.py 1000000
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.validation import DataValidator
+
+SEED = 42
+
+# Columns each scalar result dict can hold, valid or not
+RESULT_KEYS = {
+    'nic': ['valid', 'format', 'birth_year', 'gender', 'day_of_year', 'error'],
+    'phone': ['valid', 'normalized', 'type', 'error'],
+    'email': ['valid', 'normalized', 'domain', 'is_government', 'error']
+}
+
+
+def random_nic(rng: random.Random) -> str:
+    roll = rng.random()
+    if roll < 0.02:
+        return rng.choice(['', None])
+    if roll < 0.05:
+        return rng.choice(['12345', 'ABCDEFGHIJ', '99123456Z', '2001234567890'])
+    day = rng.randint(1, 366) + rng.choice([0, 500])
+    if roll < 0.07:
+        day = rng.choice([0, 367, 500, 867, 999])
+    if roll < 0.35:
+        nic = f"{rng.randint(30, 99):02d}{day:03d}{rng.randint(0, 9999):04d}{rng.choice('VvXx')}"
+    else:
+        year = rng.randint(1935, 2008) if roll > 0.09 else rng.choice([1850, 2099])
+        nic = f"{year}{day:03d}{rng.randint(0, 99999):05d}"
+    return f"  {nic} " if rng.random() < 0.05 else nic
+
+
+def random_phone(rng: random.Random) -> str:
+    roll = rng.random()
+    if roll < 0.02:
+        return rng.choice(['', None])
+    number = f"7{rng.randint(0, 8)}{rng.randint(0, 9999999):07d}"
+    if roll < 0.4:
+        return '+94' + number
+    if roll < 0.7:
+        return '0' + number
+    if roll < 0.85:
+        return f"0{number[:2]} {number[2:5]}-{number[5:]}"
+    if roll < 0.95:
+        return number
+    return rng.choice(['12345', '+1 555 0100', '077-ABC-1234'])
+
+
+def random_email(rng: random.Random, index: int) -> str:
+    roll = rng.random()
+    if roll < 0.02:
+        return rng.choice(['', None])
+    domain = rng.choice(['gmail.com', 'yahoo.com', 'example.lk', 'immigration.gov.lk', 'gov.lk'])
+    email = f"user.{index}@{domain}"
+    if roll < 0.1:
+        return email.upper()
+    if roll < 0.13:
+        return f" {email} "
+    if roll < 0.17:
+        return rng.choice(['user@@example.com', 'no-at-sign.lk', 'user@host', 'user @example.com'])
+    return email
+
+
+def build_records(count: int) -> dict:
+    rng = random.Random(SEED)
+    return {
+        'nic': [random_nic(rng) for _ in range(count)],
+        'phone': [random_phone(rng) for _ in range(count)],
+        'email': [random_email(rng, index) for index in range(count)]
+    }
+
+
+def scalar_view(row: dict, keys: list) -> dict:
+    """A batch row in the shape of the scalar result: only the keys it would have"""
+    result = {}
+    for key in keys:
+        value = row[key]
+        if value is None or value != value:  # None, NaN, pd.NA
+            continue
+        result[key] = value.item() if hasattr(value, 'item') else value
+    return result
+
+
+def check_identical(kind: str, values: list, scalar_results: list, frame) -> int:
+    mismatches = 0
+    for value, expected, row in zip(values, scalar_results, frame.to_dict('records')):
+        actual = scalar_view(row, RESULT_KEYS[kind])
+        if actual != expected:
+            mismatches += 1
+            if mismatches <= 3:
+                print(f"   ❌ {kind} {value!r}: scalar {expected}, batch {actual}")
+    return mismatches
+
+
+def run_benchmark(counts: list):
+    validator = DataValidator()
+    scalar = {
+        'nic': validator.validate_nic,
+        'phone': validator.validate_phone,
+        'email': validator.validate_email
+    }
+    batch = {
+        'nic': validator.validate_nic_batch,
+        'phone': validator.validate_phone_batch,
+        'email': validator.validate_email_batch
+    }
+    
+    print("🧮 Bulk validation benchmark")
+    print(f"   seed {SEED}; batch results are checked row by row against the scalar validators")
+    print("=" * 78)
+    print(f"{'records':>9}  {'column':<7} {'scalar rec/s':>14} {'batch rec/s':>14} {'speedup':>8} {'mismatches':>11}")
+    
+    for count in counts:
+        records = build_records(count)
+        for kind, values in records.items():
+            start = time.perf_counter()
+            scalar_results = [scalar[kind](value) for value in values]
+            scalar_seconds = time.perf_counter() - start
+            
+            batch[kind](values[:100])  # import pandas and build lookup tables outside the timing
+            start = time.perf_counter()
+            frame = batch[kind](values)
+            batch_seconds = time.perf_counter() - start
+            
+            mismatches = check_identical(kind, values, scalar_results, frame)
+            print(f"{count:>9,}  {kind:<7} {count / scalar_seconds:>14,.0f} {count / batch_seconds:>14,.0f} "
+                  f"{scalar_seconds / batch_seconds:>7.1f}x {mismatches:>11,}")
+
+
+if __name__ == "__main__":
+    counts = [int(arg) for arg in sys.argv[1:]] or [1000000]
+    run_benchmark(counts)
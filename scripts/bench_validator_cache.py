@@ -0,0 +1,125 @@
+"""
+Validator Cache Benchmark
+Per-call cost of NIC, email and phone validation
+
+Replays a seeded stream of lookups in which a few thousand citizens'
+values repeat with a skewed (Zipf-like) frequency, as logins and profile
+updates do, through three validators:
+
+  per-call  a new DataValidator per call, compiling its patterns, as the
+            module-level validate_* helpers used to
+  shared    one DataValidator with precompiled patterns, no cache
+  cached    a CachedValidator, the kind get_validator() shares
+
+The cached stream is also replayed from several threads at once, and
+every result is checked against the uncached validator.
+
+Usage:
+  python scripts/bench_validator_cache.py [lookups] [citizens]
+  python scripts/bench_validator_cache.py 200000 5000
+"""
+
+import os
+import random
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.validation import CachedValidator, DataValidator
+
+SEED = 42
+THREADS = 8
+
+
+class PerCallValidator(DataValidator):
+    """DataValidator as it was constructed before patterns moved to the class"""
+    
+    def __init__(self):
+        self.old_nic_pattern = re.compile(r'^[0-9]{9}[VvXx]$')
+        self.new_nic_pattern = re.compile(r'^[0-9]{12}$')
+        self.mobile_pattern = re.compile(r'^\+94[0-9]{9}$')
+        self.landline_pattern = re.compile(r'^\+94[0-9]{9}$')
+        self.email_pattern = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+        self.passport_pattern = re.compile(r'^[N][0-9]{7}$')
+        self.license_pattern = re.compile(r'^[B][0-9]{7}$')
+
+
+def build_stream(lookups: int, citizens: int) -> dict:
+    """Seeded lookups per kind, citizen i drawn with weight 1/(i+1)"""
+    rng = random.Random(SEED)
+    people = []
+    for i in range(citizens):
+        year = rng.randint(1950, 2005)
+        day = rng.randint(1, 365) + rng.choice([0, 500])
+        nic = (f"{year}{day:03d}{rng.randint(0, 99999):05d}" if rng.random() < 0.6
+               else f"{year % 100:02d}{day:03d}{rng.randint(0, 9999):04d}{rng.choice('Vv')}")
+        people.append({
+            'nic': nic,
+            'email': f"Citizen.{i}@{rng.choice(['gmail.com', 'yahoo.com', 'health.gov.lk'])}",
+            'phone': rng.choice(['0', '+94', '']) + f"7{rng.randint(0, 8)}{rng.randint(0, 9999999):07d}"
+        })
+    weights = [1 / (i + 1) for i in range(citizens)]
+    chosen = rng.choices(people, weights=weights, k=lookups)
+    return {kind: [person[kind] for person in chosen] for kind in ('nic', 'email', 'phone')}
+
+
+def per_call(kind: str):
+    def validate(value):
+        return getattr(PerCallValidator(), f"validate_{kind}")(value)
+    return validate
+
+
+def time_calls(validate, values: list):
+    start = time.perf_counter()
+    results = [validate(value) for value in values]
+    return time.perf_counter() - start, results
+
+
+def threaded(validate, values: list):
+    chunks = [values[i::THREADS] for i in range(THREADS)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(THREADS) as pool:
+        parts = list(pool.map(lambda chunk: [validate(value) for value in chunk], chunks))
+    seconds = time.perf_counter() - start
+    results = [None] * len(values)
+    for i, part in enumerate(parts):
+        results[i::THREADS] = part
+    return seconds, results
+
+
+def run_benchmark(lookups: int, citizens: int):
+    stream = build_stream(lookups, citizens)
+    shared = DataValidator()
+    
+    print("🗃️  Validator cache benchmark")
+    print(f"   seed {SEED}, {lookups:,} lookups over {citizens:,} citizens, Zipf-weighted")
+    print("=" * 78)
+    print(f"{'column':<7} {'per-call ns':>12} {'shared ns':>10} {'cached ns':>10} "
+          f"{'threads ns':>11} {'hit rate':>9} {'mismatches':>11}")
+    
+    for kind, values in stream.items():
+        per_call_seconds, _ = time_calls(per_call(kind), values)
+        shared_seconds, expected = time_calls(getattr(shared, f"validate_{kind}"), values)
+        
+        cached = CachedValidator()
+        cached_seconds, results = time_calls(getattr(cached, f"validate_{kind}"), values)
+        info = cached.cache_info()
+        
+        threaded_validator = CachedValidator()
+        threaded_seconds, threaded_results = threaded(getattr(threaded_validator, f"validate_{kind}"), values)
+        
+        mismatches = sum(1 for want, got, got_threaded in zip(expected, results, threaded_results)
+                         if want != got or want != got_threaded)
+        ns = 1e9 / len(values)
+        print(f"{kind:<7} {per_call_seconds * ns:>12,.0f} {shared_seconds * ns:>10,.0f} "
+              f"{cached_seconds * ns:>10,.0f} {threaded_seconds * ns:>11,.0f} "
+              f"{info['hits'] / (info['hits'] + info['misses']):>8.1%} {mismatches:>11,}")
+
+
+if __name__ == "__main__":
+    lookups = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    citizens = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    run_benchmark(lookups, citizens)
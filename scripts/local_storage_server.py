@@ -0,0 +1,108 @@
+"""
+Local Storage Server
+Offline stand-in for Cloud Storage signed URLs
+
+Serves the HMAC-signed upload (PUT) and download (GET) URLs that the
+local storage backend issues when STORAGE_BACKEND=local, so the signed
+upload flow can be exercised without a Cloud Storage bucket. Files are
+kept under UPLOAD_FOLDER and requests are refused unless their
+signature, expiry, content type and size limit check out.
+
+Usage:
+  python scripts/local_storage_server.py [--port 5001] [--root uploads]
+"""
+
+import argparse
+import os
+import sys
+from typing import Optional
+from urllib.parse import parse_qsl, unquote
+from wsgiref.simple_server import make_server
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.storage import READ_CHUNK_SIZE, LocalStorage, UploadTooLarge
+
+class BodyReader:
+    """Request body limited to its Content-Length"""
+    
+    def __init__(self, stream, length: int):
+        self._stream = stream
+        self._remaining = length
+    
+    def read(self, size: int = -1) -> bytes:
+        if self._remaining <= 0:
+            return b''
+        size = self._remaining if size is None or size < 0 else min(size, self._remaining)
+        data = self._stream.read(size)
+        self._remaining -= len(data)
+        return data
+
+def _stream_file(handle):
+    try:
+        while True:
+            chunk = handle.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        handle.close()
+
+def make_app(storage: LocalStorage):
+    """WSGI app serving storage's signed URLs"""
+    
+    def respond(start_response, status: str, message: str = ''):
+        body = message.encode('utf-8')
+        start_response(status, [('Content-Type', 'text/plain'), ('Content-Length', str(len(body)))])
+        return [body]
+    
+    def app(environ, start_response):
+        method = environ['REQUEST_METHOD']
+        key = unquote(environ.get('PATH_INFO', '').lstrip('/'))
+        params = dict(parse_qsl(environ.get('QUERY_STRING', '')))
+        
+        if method not in ('PUT', 'GET'):
+            return respond(start_response, '405 Method Not Allowed')
+        if not key or not storage.verify(method, key, params):
+            return respond(start_response, '403 Forbidden', 'Invalid or expired signature')
+        
+        if method == 'GET':
+            if not storage.exists(key):
+                return respond(start_response, '404 Not Found')
+            headers = [
+                ('Content-Type', 'application/octet-stream'),
+                ('Content-Length', str(os.path.getsize(storage.path(key))))
+            ]
+            if params.get('filename'):
+                headers.append(('Content-Disposition', f'attachment; filename="{params["filename"]}"'))
+            start_response('200 OK', headers)
+            return _stream_file(storage.open(key))
+        
+        content_type: Optional[str] = params.get('content_type')
+        if content_type and environ.get('CONTENT_TYPE', '').split(';')[0].strip() != content_type:
+            return respond(start_response, '400 Bad Request', f"Content-Type must be {content_type}")
+        max_size = int(params['max_size']) if params.get('max_size') else None
+        length = int(environ.get('CONTENT_LENGTH') or 0)
+        try:
+            stored = storage.upload(BodyReader(environ['wsgi.input'], length), key, content_type, length, max_size)
+        except UploadTooLarge as e:
+            return respond(start_response, '413 Payload Too Large', str(e))
+        return respond(start_response, '200 OK', stored.sha256)
+    
+    return app
+
+def main():
+    from config import Config
+    
+    parser = argparse.ArgumentParser(description="Serve local-backend signed storage URLs")
+    parser.add_argument('--port', type=int, default=5001)
+    parser.add_argument('--root', default=Config.UPLOAD_FOLDER, help="storage directory (default: UPLOAD_FOLDER)")
+    args = parser.parse_args()
+    
+    storage = LocalStorage(args.root, Config.STORAGE_SIGNING_SECRET, f"http://localhost:{args.port}")
+    print(f"🗄️  Local storage server on http://localhost:{args.port}, files under {storage.root}")
+    with make_server('', args.port, make_app(storage)) as server:
+        server.serve_forever()
+
+if __name__ == "__main__":
+    main()
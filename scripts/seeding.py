@@ -6,9 +6,12 @@ Creates initial data for development and testing
 """
 
 from datetime import datetime, timedelta
+from typing import Optional
+from database.bulk_restore import DEFAULT_WORKERS, BulkRestorer
 from database.firebase_config import get_db
-from database.schema import CollectionNames
+from database.schema import ALL_SCHEMAS, CollectionNames
 from database.validation import DataValidator
+from scripts.synthetic_data import SyntheticDataGenerator
 import random
 
 class DatabaseSeeder:
@@ -265,6 +268,23 @@ class DatabaseSeeder:
         
         print(f"✅ Seeded {len(sample_appointments)} sample appointments")
     
+    def seed_synthetic(self, citizens: int, appointments: Optional[int] = None,
+                       workers: int = DEFAULT_WORKERS, **options):
+        """Seed a large synthetic dataset for load testing
+        
+        Documents are streamed from SyntheticDataGenerator and written with
+        parallel batched writes; options go to the generator (days_back,
+        days_ahead, seed, today).
+        """
+        generator = SyntheticDataGenerator(citizens, appointments, **options)
+        print(f"🧪 Seeding {citizens:,} citizens and ~{generator.appointment_count:,} appointments...")
+        
+        writer = BulkRestorer(self.db, workers=workers)
+        for collection_name, documents in generator.collections():
+            stats = writer.restore_collection(collection_name, documents)
+            print(f"✅ Seeded {stats['documents']:,} documents into {collection_name} "
+                  f"({stats['docs_per_sec']:,.0f} docs/sec)")
+    
     def seed_all(self):
         """Seed all initial data"""
         print("🌱 Starting database seeding...")
@@ -282,30 +302,14 @@ class DatabaseSeeder:
             print(f"❌ Error during seeding: {e}")
             raise
     
-    def clear_all_data(self):
-        """Clear all data from collections (for testing)"""
+    def clear_all_data(self, workers: int = DEFAULT_WORKERS):
+        """Clear all data from collections (for testing) with parallel batched deletes"""
         print("⚠️ Clearing all data...")
         
-        collections = [
-            CollectionNames.CITIZENS,
-            CollectionNames.APPOINTMENTS,
-            CollectionNames.STAFF,
-            CollectionNames.TIME_SLOTS,
-            CollectionNames.SERVICE_CATEGORIES,
-            CollectionNames.PASSPORT_APPOINTMENTS,
-            CollectionNames.LICENSE_APPOINTMENTS,
-            CollectionNames.NIC_APPOINTMENTS,
-            CollectionNames.BIRTH_CERTIFICATE_APPOINTMENTS,
-            CollectionNames.MARRIAGE_CERTIFICATE_APPOINTMENTS,
-            CollectionNames.COMPLAINTS,
-            CollectionNames.FEEDBACK
-        ]
-        
-        for collection_name in collections:
-            docs = self.db.collection(collection_name).stream()
-            for doc in docs:
-                doc.reference.delete()
-            print(f"Cleared {collection_name}")
+        deleter = BulkRestorer(self.db, workers=workers)
+        for collection_name in ALL_SCHEMAS:
+            stats = deleter.delete_collection(collection_name)
+            print(f"Cleared {collection_name} ({stats['documents']:,} documents)")
         
         print("✅ All data cleared")
 
@@ -336,6 +340,10 @@ if __name__ == "__main__":
             seeder.seed_sample_citizens()
         elif command == "appointments":
             seeder.seed_sample_appointments()
+        elif command == "synthetic" and len(sys.argv) > 2:
+            citizens = int(sys.argv[2])
+            appointments = int(sys.argv[3]) if len(sys.argv) > 3 else None
+            seeder.seed_synthetic(citizens, appointments)
         else:
             print("Unknown command")
     else:
@@ -347,3 +355,4 @@ if __name__ == "__main__":
         print("  python seeding.py slots         # Seed time slots only")
         print("  python seeding.py citizens      # Seed citizens only")
         print("  python seeding.py appointments  # Seed appointments only")
+        print("  python seeding.py synthetic <citizens> [appointments]  # Seed a load-testing dataset")
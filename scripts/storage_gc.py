@@ -0,0 +1,62 @@
+"""
+Storage GC
+Quarantine uploaded files that no document references, purge old quarantine,
+expire abandoned signed uploads and list records whose file is gone
+
+Runs the same reconciliation as POST /api/admin/storage/gc, in the
+foreground, against the configured storage backend. Suitable for cron.
+
+Usage:
+  python scripts/storage_gc.py [--dry-run] [--min-age-hours 24] [--quarantine-days 7]
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def format_bytes(count: float) -> str:
+    for unit in ('B', 'KB', 'MB'):
+        if count < 1024:
+            return f"{count:.1f} {unit}"
+        count /= 1024
+    return f"{count:.1f} GB"
+
+def main():
+    from config import Config
+    from database.storage import create_storage
+    from database.storage_gc import GCRun, StorageGC
+    
+    parser = argparse.ArgumentParser(description="Reconcile document storage against Firestore")
+    parser.add_argument('--dry-run', action='store_true', help="count orphans without moving or deleting anything")
+    parser.add_argument('--min-age-hours', type=float, default=Config.STORAGE_GC_MIN_AGE_HOURS)
+    parser.add_argument('--quarantine-days', type=float, default=Config.STORAGE_GC_QUARANTINE_DAYS)
+    args = parser.parse_args()
+    
+    storage = create_storage(Config.STORAGE_BACKEND, Config.UPLOAD_FOLDER)
+    gc = StorageGC(storage, min_age=args.min_age_hours * 3600, quarantine_days=args.quarantine_days)
+    print(f"🧹 Storage GC on {storage.name} storage{' (dry run)' if args.dry_run else ''}")
+    run = gc.run(GCRun(dry_run=args.dry_run))
+    
+    report = run.to_dict()
+    counts, sizes = report['counts'], report['bytes']
+    print("=" * 60)
+    print(f"   Objects scanned:   {counts['objects']} ({format_bytes(sizes['scanned'])})")
+    print(f"   Referenced:        {counts['referenced']}")
+    print(f"   Too recent:        {counts['recent']}")
+    print(f"   Orphans:           {counts['orphans']} ({format_bytes(sizes['orphaned'])})")
+    print(f"   Quarantined:       {counts['quarantined']}" + (f" under {run.quarantine_prefix}" if counts['quarantined'] else ''))
+    print(f"   Missing files:     {counts['missing']} ({counts['stale']} records whose file is gone)")
+    for record in report['stale_records'][:20]:
+        print(f"      {record['collection']}/{record['id']} -> {record['key']}")
+    if counts['stale'] > 20:
+        print(f"      ... and {counts['stale'] - 20} more")
+    print(f"   Expired uploads:   {counts['expired']} (signed uploads never completed)")
+    print(f"   💾 Reclaimed:       {format_bytes(sizes['reclaimed'])} from {counts['purged']} expired quarantined files")
+    if run.status != 'completed':
+        print(f"❌ GC failed: {run.error}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
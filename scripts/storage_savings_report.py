@@ -0,0 +1,105 @@
+"""
+Storage Savings Report
+How much of an uploads tree content-addressed storage would save
+
+Walks an existing uploads directory (per-user folders of timestamped
+copies) and finds files with identical content. Files are grouped by
+size first, so only files whose size matches another file are hashed,
+and hashing streams each file in chunks.
+
+Usage:
+  python scripts/storage_savings_report.py [uploads_dir] [--top 10]
+"""
+
+import argparse
+import hashlib
+import os
+import sys
+from collections import defaultdict
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.storage import READ_CHUNK_SIZE
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        while True:
+            chunk = handle.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def scan(root: str) -> Dict[str, List[str]]:
+    """Paths under root grouped by content; files with a unique size get a placeholder key"""
+    by_size = defaultdict(list)
+    for directory, _, names in os.walk(root):
+        for name in names:
+            if name.endswith('.part'):
+                continue
+            path = os.path.join(directory, name)
+            by_size[os.path.getsize(path)].append(path)
+    
+    groups = {}
+    for size, paths in by_size.items():
+        if len(paths) == 1:
+            groups[f"size:{size}:{paths[0]}"] = paths
+            continue
+        for path in paths:
+            groups.setdefault(file_sha256(path), []).append(path)
+    return groups
+
+def format_bytes(count: float) -> str:
+    for unit in ('B', 'KB', 'MB'):
+        if count < 1024:
+            return f"{count:.1f} {unit}"
+        count /= 1024
+    return f"{count:.1f} GB"
+
+def report(root: str, top: int = 10):
+    groups = scan(root)
+    files = sum(len(paths) for paths in groups.values())
+    total = sum(os.path.getsize(paths[0]) * len(paths) for paths in groups.values())
+    unique = sum(os.path.getsize(paths[0]) for paths in groups.values())
+    duplicates = sorted(
+        ((os.path.getsize(paths[0]) * (len(paths) - 1), key, paths) for key, paths in groups.items() if len(paths) > 1),
+        reverse=True
+    )
+    
+    print(f"📦 Storage savings report for {os.path.abspath(root)}")
+    print("=" * 60)
+    print(f"   Files:            {files}")
+    print(f"   Distinct files:   {len(groups)}")
+    print(f"   Stored bytes:     {format_bytes(total)}")
+    print(f"   Unique bytes:     {format_bytes(unique)}")
+    print(f"   Duplicate bytes:  {format_bytes(total - unique)}")
+    print(f"   💾 Savings:        {(total - unique) / total * 100 if total else 0:.1f}%")
+    
+    if duplicates:
+        print(f"\n🔁 Largest duplicate groups (top {min(top, len(duplicates))} of {len(duplicates)})")
+        for wasted, sha256, paths in duplicates[:top]:
+            print(f"   {sha256[:12]}  {len(paths)} copies, {format_bytes(wasted)} redundant")
+            for path in paths[:3]:
+                print(f"      {os.path.relpath(path, root)}")
+            if len(paths) > 3:
+                print(f"      ... and {len(paths) - 3} more")
+
+def main():
+    parser = argparse.ArgumentParser(description="Report duplicate content in an uploads tree")
+    parser.add_argument('root', nargs='?', help="uploads directory (default: UPLOAD_FOLDER)")
+    parser.add_argument('--top', type=int, default=10, help="duplicate groups to list")
+    args = parser.parse_args()
+    
+    root = args.root
+    if root is None:
+        from config import Config
+        root = Config.UPLOAD_FOLDER
+    if not os.path.isdir(root):
+        print(f"❌ {root} is not a directory")
+        sys.exit(1)
+    report(root, args.top)
+
+if __name__ == "__main__":
+    main()
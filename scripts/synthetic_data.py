@@ -0,0 +1,411 @@
+"""
+Synthetic Data Generator
+Seeded, high-volume citizens, time slots and appointments for load testing
+
+Generates N citizens whose NICs pass DataValidator.validate_nic, a
+working-day slot calendar for each department and appointments booked
+into it. Demand peaks mid-morning, early in the week and over the next
+few days. Past appointments are mostly completed (with some no-shows and
+cancellations) and upcoming ones mostly confirmed. Documents have the
+shapes the API writes.
+
+Every stream is derived from the seed, so slots and their appointments
+come from separate passes over the same calendar and still agree; memory
+stays flat apart from the list of citizen NICs appointments draw from.
+
+Documents go to Firestore through DatabaseSeeder.seed_synthetic (parallel
+batched writes) or, with --out, to a dump directory of NDJSON files plus
+manifest that database_restore.py and offline benchmarks can read.
+
+Usage:
+  python scripts/synthetic_data.py <citizens> --out DIR [--appointments N]
+                                   [--days-back N] [--days-ahead N] [--seed N]
+                                   [--compression gzip|zstd|none]
+  python scripts/seeding.py synthetic <citizens> [appointments]
+"""
+
+import argparse
+import base64
+import json
+import math
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.repositories import UPDATED_AT_FIELD
+from database.schema import DEPARTMENT_COLLECTIONS, CollectionNames
+from database.validation import DataValidator
+
+Document = Tuple[str, Dict[str, Any]]
+
+SEED = 42
+
+# Share of appointments per department
+DEPARTMENT_SHARES = {'passport': 0.4, 'license': 0.35, 'medical': 0.25}
+
+# Opening hours (first slot, closing time), slot length and location per department
+DEPARTMENT_HOURS = {
+    'passport': {'weekday': ('08:30', '15:30'), 'saturday': None, 'slot_minutes': 30,
+                 'location': 'Department of Immigration and Emigration, Battaramulla'},
+    'license': {'weekday': ('08:00', '15:00'), 'saturday': None, 'slot_minutes': 30,
+                'location': 'Department of Motor Traffic, Werahera'},
+    'medical': {'weekday': ('08:00', '16:00'), 'saturday': ('08:00', '12:00'), 'slot_minutes': 20,
+                'location': 'NTMI Medical Centre, Narahenpita'}
+}
+LUNCH_BREAK = ('12:30', '13:30')
+
+# Relative booking demand by hour of day and by weekday (Monday first)
+HOUR_DEMAND = {8: 0.9, 9: 1.0, 10: 1.0, 11: 0.85, 12: 0.6, 13: 0.6, 14: 0.7, 15: 0.55}
+WEEKDAY_DEMAND = [1.0, 0.95, 0.9, 0.85, 0.75, 0.7, 0.0]
+
+# Highest chance of any one slot being booked
+MAX_OCCUPANCY = 0.9
+
+PAST_STATUSES = (['completed', 'no-show', 'cancelled', 'confirmed'], [72, 10, 10, 8])
+UPCOMING_STATUSES = (['confirmed', 'pending', 'cancelled'], [82, 10, 8])
+
+# Size of a qrcode PNG for a booking reference (see scripts/bench_payload_size.py)
+QR_PNG_BYTES = 650
+
+FIRST_NAMES = {
+    'male': ['Kamal', 'Saman', 'Nuwan', 'Ruwan', 'Chaminda', 'Kasun', 'Tharindu', 'Mohamed', 'Suresh',
+             'Arjun', 'Pradeep', 'Lahiru', 'Dinesh', 'Janaka', 'Rizwan', 'Kumar'],
+    'female': ['Nisha', 'Amara', 'Dilini', 'Sanduni', 'Nadeesha', 'Kavindi', 'Fathima', 'Priya',
+               'Tharushi', 'Ishara', 'Shalini', 'Madhavi', 'Hiruni', 'Anjali', 'Rukshana', 'Malini']
+}
+LAST_NAMES = ['Perera', 'Fernando', 'Silva', 'Jayawardena', 'Bandara', 'Wickramasinghe', 'Rajapaksa',
+              'Dissanayake', 'Gunawardena', 'Herath', 'Kumara', 'Rathnayake', 'Sivakumar', 'Nadarajah',
+              'Mohideen', 'Weerasinghe', 'Ekanayake', 'Senanayake']
+CITIES = ['Colombo', 'Kandy', 'Galle', 'Jaffna', 'Negombo', 'Kurunegala', 'Matara', 'Anuradhapura',
+          'Ratnapura', 'Batticaloa', 'Badulla', 'Trincomalee', 'Gampaha', 'Kalutara']
+CITY_WEIGHTS = [24, 10, 7, 6, 8, 6, 5, 4, 4, 3, 3, 3, 10, 7]
+STREETS = ['Galle Road', 'Kandy Road', 'Temple Road', 'Station Road', 'Main Street', 'Lake Road',
+           'Hospital Road', 'Church Street', 'School Lane', 'Market Road']
+BLOOD_GROUPS = (['O+', 'A+', 'B+', 'AB+', 'O-', 'A-', 'B-', 'AB-'], [38, 26, 24, 6, 3, 1.5, 1, 0.5])
+
+class SyntheticDataGenerator:
+    """Seeded document streams for citizens, time slots and appointments"""
+    
+    def __init__(self, citizens: int, appointments: Optional[int] = None, days_back: int = 60,
+                 days_ahead: int = 30, seed: int = SEED, today: Optional[date] = None):
+        self.citizen_count = citizens
+        self.appointment_count = citizens * 2 if appointments is None else appointments
+        self.days_back = days_back
+        self.days_ahead = days_ahead
+        self.seed = seed
+        self.today = today or date.today()
+        self.validator = DataValidator()
+        self._nics: Optional[List[str]] = None
+        
+        # Parallel service counters (and booking rate) sized to hit the appointment target
+        self.counters: Dict[str, int] = {}
+        self.occupancy: Dict[str, float] = {}
+        for department, share in DEPARTMENT_SHARES.items():
+            per_counter = sum(self._demand(offset, day, start)
+                              for offset, day in self._days(department)
+                              for start in self._slot_times(department, day))
+            target = self.appointment_count * share
+            self.counters[department] = max(1, math.ceil(target / (MAX_OCCUPANCY * per_counter)))
+            self.occupancy[department] = target / (self.counters[department] * per_counter)
+    
+    def collections(self) -> Iterator[Tuple[str, Iterator[Document]]]:
+        """(collection name, documents) for everything generated; citizens come first"""
+        yield CollectionNames.CITIZENS, self.citizens()
+        for department, (slot_collection, appointment_collection) in DEPARTMENT_COLLECTIONS.items():
+            yield slot_collection, self.time_slots(department)
+            yield appointment_collection, self.appointments(department)
+    
+    # --- Citizens ---
+    
+    def citizens(self) -> Iterator[Document]:
+        """Citizen profiles keyed by NIC, as registration writes them"""
+        rng = random.Random(f'{self.seed}:citizens')
+        serials: Dict[Tuple[int, int], int] = {}
+        nics = []
+        
+        for index in range(self.citizen_count):
+            gender = rng.choice(['male', 'female'])
+            while True:
+                # Adults, weighted towards working age
+                age_days = int((18 + rng.betavariate(2, 3.5) * 67) * 365.25)
+                birth_date = self.today - timedelta(days=age_days)
+                day_code = birth_date.timetuple().tm_yday + (500 if gender == 'female' else 0)
+                serial = serials.get((birth_date.year, day_code), 0)
+                if serial < 1000:
+                    serials[(birth_date.year, day_code)] = serial + 1
+                    break
+            
+            nic = self._nic(birth_date.year, day_code, serial, old_format=rng.random() < 0.3)
+            nics.append(nic)
+            
+            first_name = rng.choice(FIRST_NAMES[gender])
+            last_name = rng.choice(LAST_NAMES)
+            registered = datetime.combine(self.today, datetime.min.time()) - timedelta(
+                days=rng.randint(self.days_back, self.days_back + 730), seconds=rng.randint(0, 86399))
+            
+            yield nic, {
+                'fullName': f"{first_name} {last_name}",
+                'email': f"{first_name}.{last_name}{index}@example.lk".lower(),
+                'nic': nic,
+                'phoneNumber': f"+947{rng.choice('01245678')}{rng.randint(0, 9999999):07d}",
+                'bloodGroup': rng.choices(*BLOOD_GROUPS)[0],
+                'address': {
+                    'addressLine1': f"{rng.randint(1, 450)} {rng.choice(STREETS)}",
+                    'addressLine2': '',
+                    'city': rng.choices(CITIES, CITY_WEIGHTS)[0]
+                },
+                'dateOfBirth': datetime(birth_date.year, birth_date.month, birth_date.day),
+                'gender': gender,
+                'firebaseUid': f"synthetic-{rng.getrandbits(96):024x}",
+                'isActive': True,
+                'profileImage': '',
+                UPDATED_AT_FIELD: registered
+            }
+        
+        self._nics = nics
+    
+    def _nic(self, year: int, day_code: int, serial: int, old_format: bool) -> str:
+        """NIC for a birth year, day code (day of year, +500 for women) and serial"""
+        # Old-format NICs carry a two-digit year; validate_nic reads years up to now as 20xx
+        if old_format and year < 2000 and year % 100 > datetime.now().year % 100:
+            body = f"{year % 100:02d}{day_code:03d}{serial:03d}"
+            nic = f"{body}{_check_digit(body)}V"
+        else:
+            body = f"{year}{day_code:03d}0{serial:03d}"
+            nic = f"{body}{_check_digit(body)}"
+        
+        if not self.validator.validate_nic(nic)['valid']:
+            raise ValueError(f"Generated an invalid NIC: {nic}")
+        return nic
+    
+    @property
+    def nics(self) -> List[str]:
+        """Every citizen NIC; generates the citizens if they haven't been streamed yet"""
+        if self._nics is None:
+            for _ in self.citizens():
+                pass
+        return self._nics
+    
+    # --- Calendar ---
+    
+    def time_slots(self, department: str) -> Iterator[Document]:
+        """Every slot of the department's calendar, booked or not"""
+        for slot_id, slot, _ in self._calendar(department):
+            yield slot_id, slot
+    
+    def appointments(self, department: str) -> Iterator[Document]:
+        """Appointments booked into the department's slots"""
+        for _, _, appointment in self._calendar(department):
+            if appointment is not None:
+                yield appointment['appointmentId'], appointment
+    
+    def _days(self, department: str) -> Iterator[Tuple[int, date]]:
+        """(offset from today, day) for each day the department is open"""
+        for offset in range(-self.days_back, self.days_ahead):
+            day = self.today + timedelta(days=offset)
+            if self._opening_hours(department, day):
+                yield offset, day
+    
+    def _opening_hours(self, department: str, day: date) -> Optional[Tuple[str, str]]:
+        if day.weekday() == 6:
+            return None
+        hours = DEPARTMENT_HOURS[department]
+        return hours['saturday'] if day.weekday() == 5 else hours['weekday']
+    
+    def _slot_times(self, department: str, day: date) -> List[datetime]:
+        opening, closing = self._opening_hours(department, day)
+        length = timedelta(minutes=DEPARTMENT_HOURS[department]['slot_minutes'])
+        current = datetime.combine(day, datetime.strptime(opening, '%H:%M').time())
+        end = datetime.combine(day, datetime.strptime(closing, '%H:%M').time())
+        lunch_start, lunch_end = (datetime.combine(day, datetime.strptime(value, '%H:%M').time())
+                                  for value in LUNCH_BREAK)
+        
+        times = []
+        while current + length <= end:
+            if not (lunch_start <= current < lunch_end):
+                times.append(current)
+            current += length
+        return times
+    
+    def _demand(self, offset: int, day: date, start: datetime) -> float:
+        """Relative chance of a slot being booked, before scaling by occupancy"""
+        demand = WEEKDAY_DEMAND[day.weekday()] * HOUR_DEMAND.get(start.hour, 0.5)
+        if offset >= 0:
+            # The next few days are nearly full; bookings thin out towards the horizon
+            demand *= max(0.15, 1 - offset / (self.days_ahead + 1)) ** 1.5
+        return demand
+    
+    def _calendar(self, department: str) -> Iterator[Tuple[str, Dict[str, Any], Optional[Dict[str, Any]]]]:
+        """(slot id, slot, appointment or None) for every slot, drawn from the department's seed"""
+        rng = random.Random(f'{self.seed}:{department}:calendar')
+        nics = self.nics
+        length = timedelta(minutes=DEPARTMENT_HOURS[department]['slot_minutes'])
+        location = DEPARTMENT_HOURS[department]['location']
+        
+        for offset, day in self._days(department):
+            created = datetime.combine(day, datetime.min.time()) - timedelta(days=45)
+            for start in self._slot_times(department, day):
+                chance = min(1.0, self.occupancy[department] * self._demand(offset, day, start))
+                for counter in range(1, self.counters[department] + 1):
+                    slot_id = f"{department}-{start:%Y%m%d-%H%M}-{counter:03d}"
+                    slot = {
+                        'date': day.isoformat(),
+                        'startTime': start.strftime('%H:%M'),
+                        'endTime': (start + length).strftime('%H:%M'),
+                        'availability': 'available',
+                        'department': department,
+                        'location': f"{location}, counter {counter}",
+                        'created_at': created,
+                        'capacity': 1,
+                        UPDATED_AT_FIELD: created
+                    }
+                    
+                    appointment = None
+                    if rng.random() < chance:
+                        # Frequent users: a quarter of the citizens make about half the bookings
+                        nic = nics[int(len(nics) * rng.random() ** 2)]
+                        appointment = self._appointment(rng, department, slot_id, start, offset, nic)
+                        if appointment['status'] != 'cancelled':
+                            slot.update({
+                                'availability': 'booked',
+                                'bookedBy': nic,
+                                'bookedAt': appointment[UPDATED_AT_FIELD],
+                                UPDATED_AT_FIELD: appointment[UPDATED_AT_FIELD]
+                            })
+                    
+                    yield slot_id, slot, appointment
+    
+    def _appointment(self, rng: random.Random, department: str, slot_id: str, start: datetime,
+                     offset: int, nic: str) -> Dict[str, Any]:
+        """An appointment shaped like GovConnectServer._build_appointment_data's"""
+        statuses = PAST_STATUSES if offset < 0 else UPCOMING_STATUSES
+        # Most bookings are made a few days ahead
+        booked_at = start - timedelta(hours=2 + rng.expovariate(1 / 120))
+        booked_at = min(booked_at, datetime.combine(self.today, datetime.min.time()))
+        appointment_id = str(uuid.UUID(int=rng.getrandbits(128), version=4))
+        reference = f"{department.upper()}-{booked_at:%Y%m%d%H%M}-{rng.randint(1000, 9999)}"
+        
+        appointment = {
+            'appointmentId': appointment_id,
+            'nic': nic,
+            'timeSlotId': slot_id,
+            'scheduledDateTime': start.isoformat(),
+            'status': rng.choices(*statuses)[0],
+            'qrCode': base64.b64encode(rng.randbytes(QR_PNG_BYTES)).decode(),
+            'reference': reference,
+            'feedback': '',
+            UPDATED_AT_FIELD: booked_at
+        }
+        
+        if department == 'medical':
+            appointment['reports'] = ''
+        else:
+            appointment.update({
+                'applicationForm': f"https://storage.googleapis.com/govconnect/forms/{appointment_id}.pdf",
+                'supportingDocuments': [
+                    f"https://storage.googleapis.com/govconnect/documents/{appointment_id}/{n}.pdf"
+                    for n in range(rng.randint(1, 4))
+                ],
+                'deliveryStatus': 'pending'
+            })
+            if department == 'passport':
+                appointment['remarks'] = ''
+            else:
+                appointment['appointmentType'] = rng.choices(['new license', 'renewal'], [35, 65])[0]
+        
+        return appointment
+
+def _check_digit(body: str) -> int:
+    return sum((position + 2) * int(digit) for position, digit in enumerate(reversed(body))) % 11 % 10
+
+def write_ndjson(generator: SyntheticDataGenerator, output_dir: str,
+                 compression: Optional[str] = None) -> str:
+    """Write every collection to a dump directory (NDJSON files + manifest); returns its manifest path"""
+    from database_dump import (COMPRESSION_EXTENSIONS, DUMP_VERSION, MANIFEST_FILENAME,
+                               default_compression, write_dump_file)
+    from database.backup_codec import CODEC_NAME
+    
+    compression = compression or default_compression()
+    os.makedirs(output_dir, exist_ok=True)
+    started = datetime.utcnow()
+    start = time.perf_counter()
+    results = {}
+    
+    for collection_name, documents in generator.collections():
+        collection_start = time.perf_counter()
+        filename = collection_name + COMPRESSION_EXTENSIONS[compression]
+        path = os.path.join(output_dir, filename)
+        doc_count, sha256 = write_dump_file(path, compression, documents)
+        elapsed = time.perf_counter() - collection_start
+        results[collection_name] = {
+            'file': filename,
+            'mode': 'full',
+            'since': None,
+            'documents': doc_count,
+            'sha256': sha256,
+            'bytes': os.path.getsize(path),
+            'seconds': round(elapsed, 2)
+        }
+        print(f"   ✅ {collection_name}: {doc_count:,} documents in {elapsed:.1f}s "
+              f"({doc_count / elapsed if elapsed > 0 else 0:,.0f} docs/sec)")
+    
+    manifest = {
+        'metadata': {
+            'dump_timestamp': datetime.now().isoformat(),
+            'dump_version': DUMP_VERSION,
+            'type': 'full',
+            'base_dump': None,
+            'backup_started': started.isoformat(),
+            'format': 'ndjson',
+            'codec': CODEC_NAME,
+            'compression': compression,
+            'total_collections': len(results),
+            'total_documents': sum(result['documents'] for result in results.values()),
+            'duration_seconds': round(time.perf_counter() - start, 2),
+            'source': 'synthetic',
+            'generator': {
+                'seed': generator.seed,
+                'citizens': generator.citizen_count,
+                'appointments_target': generator.appointment_count,
+                'today': generator.today.isoformat(),
+                'days_back': generator.days_back,
+                'days_ahead': generator.days_ahead,
+                'counters': generator.counters
+            }
+        },
+        'collections': results
+    }
+    
+    manifest_path = os.path.join(output_dir, MANIFEST_FILENAME)
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    return manifest_path
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic GovConnect data as NDJSON dump files")
+    parser.add_argument('citizens', type=int, help="number of citizens")
+    parser.add_argument('--out', required=True, help="output dump directory")
+    parser.add_argument('--appointments', type=int, help="target number of appointments (default: 2 per citizen)")
+    parser.add_argument('--days-back', type=int, default=60, help="days of past calendar (default: 60)")
+    parser.add_argument('--days-ahead', type=int, default=30, help="days of upcoming calendar (default: 30)")
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--today', type=date.fromisoformat, help="calendar anchor date, YYYY-MM-DD (default: today)")
+    parser.add_argument('--compression', choices=['gzip', 'zstd', 'none'])
+    args = parser.parse_args()
+    
+    generator = SyntheticDataGenerator(args.citizens, args.appointments, args.days_back, args.days_ahead,
+                                       args.seed, args.today)
+    print(f"🧪 Generating {args.citizens:,} citizens and ~{generator.appointment_count:,} appointments "
+          f"(seed {args.seed}, counters {generator.counters})")
+    manifest_path = write_ndjson(generator, args.out, args.compression)
+    print(f"✅ Synthetic dump written: {manifest_path}")
+    print(f"   Load it with: python database_restore.py {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -4,27 +4,43 @@ Unified Backend Server
 """
 
 import os
+import asyncio
+import inspect
 import logging
 import uuid
-import qrcode
 import io
 import base64
+import mimetypes
 import random
 from datetime import datetime, timedelta
 from functools import wraps
-from typing import Dict, Any, Optional, List, Union
+from typing import Dict, Any, Optional, List, Sequence, Union
 
-from flask import Flask, request, jsonify, g
+from flask import Flask, request, jsonify, g, redirect, send_file
 from flask_cors import CORS
-from flask_mail import Mail, Message
-from flask_socketio import SocketIO, emit, join_room
+from flask_mail import Mail
+from flask_socketio import SocketIO
+from werkzeug.utils import secure_filename
 
-import firebase_admin
-from firebase_admin import credentials, auth, firestore, storage
 import jwt
-from werkzeug.security import check_password_hash, generate_password_hash
 
-from database.firebase_config import initialize_firebase, get_db, get_storage, firebase_manager
+from health import HealthProber, smtp_check
+from database.firebase_config import (
+    configure_firebase, lazy_async_db, lazy_auth as auth, lazy_db, lazy_bucket, firebase_manager
+)
+from database.validation import get_validator
+from database.citizen_import import CitizenImporter, FORMATS, citizen_profile, detect_format
+from database.storage import StorageBackend, UploadTooLarge, create_storage
+from database.content_store import ContentStore, is_content_key
+from database.storage_gc import StorageGC
+from database.availability import get_availability_index
+from database.schema import DEPARTMENT_COLLECTIONS
+from database.document_processing import DocumentProcessor, derived_keys
+from database.repositories import (
+    AppointmentRepository, TimeSlotRepository, CitizenRepository, DocumentRepository, StorageUsageRepository,
+    ID_ONLY_FIELDS, STATUS_FIELDS, SCHEDULE_FIELDS, PROCESSING_TIME_FIELDS,
+    APPOINTMENT_SUMMARY_FIELDS, DOCUMENT_LIST_FILTERS, DOCUMENT_PAGE_SIZE, parse_field_list, stamp_updated_at
+)
 from config import Config
 
 # Setup logging
@@ -35,6 +51,18 @@ logger = logging.getLogger(__name__)
 db = None
 bucket = None
 
+# Reported for a department whose processing times could not be read
+NO_PROCESSING_TIME_DATA = {
+    'appointments_processed': 0,
+    'avg_seconds': 0,
+    'avg_hours': 0,
+    'avg_days': 0,
+    'human_readable': "No data"
+}
+
+# File types accepted for document uploads
+DOCUMENT_EXTENSIONS = {'.pdf', '.jpg', '.jpeg', '.png', '.doc', '.docx'}
+
 class GovConnectServer:
     """Main server class integrating all components"""
     
@@ -42,6 +70,12 @@ class GovConnectServer:
         self.app: Optional[Flask] = None
         self.mail: Optional[Mail] = None
         self.socketio: Optional[SocketIO] = None
+        self.health: Optional[HealthProber] = None
+        self.citizen_importer: Optional[CitizenImporter] = None
+        self.storage: Optional[StorageBackend] = None
+        self.content_store: Optional[ContentStore] = None
+        self.storage_gc: Optional[StorageGC] = None
+        self.document_processor: Optional[DocumentProcessor] = None
         
     def create_app(self):
         """Create and configure the Flask application"""
@@ -59,6 +93,9 @@ class GovConnectServer:
         # Initialize extensions
         self._initialize_extensions()
         
+        # Start background health probing
+        self._initialize_health_prober()
+        
         # Register routes
         self._register_routes()
         
@@ -69,7 +106,7 @@ class GovConnectServer:
         return self.app
     
     def _initialize_firebase(self):
-        """Initialize Firebase Admin SDK using database configuration"""
+        """Configure Firebase Admin SDK; the connection is opened on first use"""
         global db, bucket
         
         try:
@@ -78,14 +115,14 @@ class GovConnectServer:
             if not os.path.exists(firebase_key_path):
                 raise FileNotFoundError(f"Firebase key file not found: {firebase_key_path}")
             
-            # Use the professional database configuration
-            initialize_firebase(firebase_key_path)
+            # Defer SDK import and client creation to the first request that needs them
+            configure_firebase(firebase_key_path)
             
-            # Get database and storage instances
-            db = get_db()
-            bucket = get_storage()
+            # Database and storage handles that resolve lazily
+            db = lazy_db
+            bucket = lazy_bucket
             
-            logger.info("Firebase initialized successfully using database configuration")
+            logger.info("Firebase configured (lazy initialization)")
             
         except Exception as e:
             logger.error(f"Firebase initialization failed: {e}")
@@ -103,6 +140,31 @@ class GovConnectServer:
         # Setup SocketIO events
         self._setup_socketio()
     
+    def _initialize_health_prober(self):
+        """Probe Firestore, Storage, SMTP and Socket.IO in the background"""
+        config = self.app.config
+        self.health = HealthProber(
+            interval=config.get('HEALTH_PROBE_INTERVAL', 15),
+            timeout=config.get('HEALTH_PROBE_TIMEOUT', 5)
+        )
+        
+        self.health.register('database', firebase_manager.health_check)
+        self.health.register('storage', firebase_manager.storage_health_check, critical=False)
+        self.health.register(
+            'realtime',
+            lambda timeout: self.socketio is not None and self.socketio.server is not None,
+            critical=False
+        )
+        if config.get('MAIL_USERNAME'):
+            self.health.register(
+                'email',
+                smtp_check(config['MAIL_SERVER'], config['MAIL_PORT'], config.get('MAIL_USE_TLS', False)),
+                critical=False
+            )
+        
+        if config.get('HEALTH_PROBE_ENABLED', True):
+            self.health.start()
+    
     def _setup_socketio(self):
         """Setup SocketIO events"""
         
@@ -117,29 +179,47 @@ class GovConnectServer:
     def _register_routes(self):
         """Register all application routes"""
         
-        # Health check
+        # Health check (served from the prober's cache, never queries dependencies)
         @self.app.route('/health')
         def health_check():
+            readiness = self.health.readiness()
+            checks = readiness['checks']
             return jsonify({
-                'status': 'healthy',
+                'status': 'healthy' if readiness['ready'] else 'degraded',
                 'timestamp': datetime.utcnow().isoformat(),
                 'version': '1.0.0',
                 'components': {
                     'authentication': True,
-                    'database': firebase_manager.health_check(),
+                    'database': checks['database']['healthy'],
                     'booking': True,
                     'analytics': True,
                     'feedback': True,
                     'complaints': True,
                     'notifications': True
-                }
+                },
+                'checks': checks
             })
         
+        # Liveness: the process is up and serving; no dependency is consulted
+        @self.app.route('/health/live')
+        def liveness_check():
+            return jsonify(self.health.liveness())
+        
+        # Readiness: critical dependencies were healthy at the last probe
+        @self.app.route('/health/ready')
+        def readiness_check():
+            readiness = self.health.readiness()
+            readiness['timestamp'] = datetime.utcnow().isoformat()
+            return jsonify(readiness), 200 if readiness['ready'] else 503
+        
         # Database-specific health check
         @self.app.route('/health/database')
         def database_health():
+            database = self.health.snapshot()['database']
             return jsonify({
-                'database_connected': firebase_manager.health_check(),
+                'database_connected': database['healthy'],
+                'checked_at': database.get('checked_at'),
+                'latency_ms': database.get('latency_ms'),
                 'timestamp': datetime.utcnow().isoformat()
             })
         
@@ -164,8 +244,18 @@ class GovConnectServer:
         # === OFFICER DASHBOARD ROUTES ===
         self._register_officer_routes()
         
+        # === BULK CITIZEN IMPORT (admin) ===
+        self._register_import_routes()
+        
         # === DOCUMENT MANAGEMENT ROUTES ===
         self._register_document_routes()
+        
+        # === STORAGE GC (admin) ===
+        self._register_storage_gc_routes()
+        
+        # === ASYNC VIEWS (opt-in via ASYNC_VIEWS) ===
+        if self.app.config.get('ASYNC_VIEWS'):
+            self._register_async_routes()
     
     def _track_analytics_event(self, event_type: str, nic: str, department: str = None, additional_data: dict = None):
         """Track an analytics event for user activity monitoring"""
@@ -186,7 +276,7 @@ class GovConnectServer:
             
             # Add to analytics_events collection
             db = get_db()
-            db.collection('analytics_events').add(event_data)
+            db.collection('analytics_events').add(stamp_updated_at(event_data))
             
             logger.info(f"Analytics event tracked: {event_type} for NIC {nic}")
             
@@ -194,6 +284,34 @@ class GovConnectServer:
             # Don't let analytics tracking errors break the main functionality
             logger.error(f"Analytics tracking error: {e}")
     
+    def _validate_contact_fields(self, data: Dict[str, Any], phone_field: str) -> Optional[str]:
+        """
+        Validate the NIC, email and phone in a request body and normalize them in place
+        
+        Only fields that are present are checked; an empty phone is left as is.
+        
+        Returns:
+            Error message for a 400 response, or None when the fields are valid
+        """
+        fields = {field: data[field] for field in ('nic', 'email') if field in data}
+        if data.get(phone_field):
+            fields['phoneNumber'] = data[phone_field]
+        for field, value in fields.items():
+            if not isinstance(value, str):
+                return f'{field} must be a string'
+        
+        result = get_validator().validate_citizen_data(fields)
+        if not result['valid']:
+            return '; '.join(result['errors'])
+        
+        sanitized = result['sanitized_data']
+        for field in ('nic', 'email'):
+            if field in sanitized:
+                data[field] = sanitized[field]
+        if 'phoneNumber' in sanitized:
+            data[phone_field] = sanitized['phoneNumber']
+        return None
+    
     def _register_auth_routes(self):
         """Authentication routes"""
         
@@ -208,6 +326,11 @@ class GovConnectServer:
                     if not data.get(field):
                         return jsonify({'error': f'{field} is required'}), 400
                 
+                # Validate and normalize NIC, email and phone
+                validation_error = self._validate_contact_fields(data, 'phone')
+                if validation_error:
+                    return jsonify({'error': validation_error}), 400
+                
                 # Create Firebase Auth user
                 user_record = auth.create_user(
                     email=data['email'],
@@ -220,27 +343,12 @@ class GovConnectServer:
                 auth.set_custom_user_claims(user_record.uid, {'role': role})
                 
                 # Store profile in Firestore with new schema
-                user_profile = {
-                    'fullName': data['name'],  # Updated field name
-                    'email': data['email'],
-                    'nic': data['nic'],
-                    'phoneNumber': data.get('phone', ''),
-                    'bloodGroup': data.get('blood_group', 'O+'),
-                    'address': {
-                        'addressLine1': data.get('address', ''),
-                        'addressLine2': '',
-                        'city': data.get('city', '')
-                    },
-                    'dateOfBirth': datetime.strptime(data.get('date_of_birth', '1990-01-01'), '%Y-%m-%d') if data.get('date_of_birth') else datetime(1990, 1, 1),
-                    'gender': data.get('gender', 'other'),
-                    'firebaseUid': user_record.uid,
-                    'isActive': True,
-                    'profileImage': ''
-                }
+                date_of_birth = datetime.strptime(data['date_of_birth'], '%Y-%m-%d') if data.get('date_of_birth') else None
+                user_profile = citizen_profile(data, user_record.uid, date_of_birth)
                 
                 if role == 'citizen':
                     # Use NIC as document ID for citizens
-                    db.collection('citizens').document(data['nic']).set(user_profile)
+                    CitizenRepository().set(data['nic'], user_profile)
                     
                     # Track user registration analytics
                     self._track_analytics_event('user_registered', data['nic'])
@@ -255,7 +363,7 @@ class GovConnectServer:
                         'created_at': datetime.utcnow(),
                         'is_active': True
                     }
-                    db.collection('users').document(user_record.uid).set(officer_profile)
+                    db.collection('users').document(user_record.uid).set(stamp_updated_at(officer_profile))
                 
                 return jsonify({
                     'message': 'User registered successfully',
@@ -291,9 +399,8 @@ class GovConnectServer:
                 # Track login analytics for citizens
                 try:
                     if role == 'citizen':
-                        citizens = db.collection('citizens').where('firebaseUid', '==', uid).limit(1).get()
-                        if citizens:
-                            nic = citizens[0].id
+                        nic = CitizenRepository().nic_for_firebase_uid(uid)
+                        if nic:
                             self._track_analytics_event('user_login', nic)
                 except Exception as analytics_error:
                     logger.error(f"Analytics tracking error for login: {analytics_error}")
@@ -316,9 +423,9 @@ class GovConnectServer:
                 uid = g.user['uid']
                 
                 # Update last_login timestamp to help with token validation
-                db.collection('users').document(uid).update({
+                db.collection('users').document(uid).update(stamp_updated_at({
                     'last_logout': datetime.utcnow()
-                })
+                }))
                 
                 return jsonify({'message': 'Logged out successfully'}), 200
                 
@@ -378,13 +485,10 @@ class GovConnectServer:
                 role = g.user['role']
                 
                 if role == 'citizen':
-                    # Get citizen profile by firebaseUid
-                    citizens = db.collection('citizens').where('firebaseUid', '==', uid).limit(1).get()
-                    if citizens:
-                        profile = citizens[0].to_dict()
-                        if profile:
-                            profile['id'] = citizens[0].id  # This will be the NIC
-                            return jsonify(profile), 200
+                    # Get citizen profile by firebaseUid ('id' is the NIC)
+                    profile = CitizenRepository().find_by_firebase_uid(uid)
+                    if profile:
+                        return jsonify(profile), 200
                 else:
                     # Get staff/admin profile
                     user_doc = db.collection('users').document(uid).get()
@@ -417,19 +521,27 @@ class GovConnectServer:
                 
                 if role == 'citizen':
                     # Update citizen profile using firebaseUid
-                    citizens = db.collection('citizens').where('firebaseUid', '==', uid).limit(1).get()
-                    if citizens:
-                        citizen_doc = citizens[0]
+                    citizens = CitizenRepository()
+                    nic = citizens.nic_for_firebase_uid(uid)
+                    if nic:
                         # Map any field name updates
                         if 'name' in data:
                             data['fullName'] = data.pop('name')
                         if 'phone' in data:
                             data['phoneNumber'] = data.pop('phone')
-                            
-                        db.collection('citizens').document(citizen_doc.id).update(data)
+                        
+                        validation_error = self._validate_contact_fields(data, 'phoneNumber')
+                        if validation_error:
+                            return jsonify({'error': validation_error}), 400
+                        
+                        citizens.update(nic, data)
                         return jsonify({'message': 'Profile updated successfully'}), 200
                 else:
                     # Update staff/admin profile
+                    validation_error = self._validate_contact_fields(data, 'phone')
+                    if validation_error:
+                        return jsonify({'error': validation_error}), 400
+                    
                     db.collection('users').document(uid).update(data)
                     return jsonify({'message': 'Profile updated successfully'}), 200
                 
@@ -520,37 +632,18 @@ class GovConnectServer:
                     return jsonify({'error': 'Date parameter required'}), 400
                 
                 department_id = department.lower()
-                collections_map = {
-                    'medical': 'medicalTimeSlots',
-                    'passport': 'passportTimeSlots',
-                    'license': 'licenseTimeSlots'
-                }
-                
-                if department_id not in collections_map:
+                slots = TimeSlotRepository.for_department(department_id)
+                if not slots:
                     return jsonify({'error': 'Invalid department'}), 400
                 
-                slot_collection = collections_map[department_id]
-                
                 # Query available slots for the date
-                slots = db.collection(slot_collection)\
-                    .where('date', '==', date)\
-                    .where('availability', '==', 'available')\
-                    .order_by('startTime')\
-                    .get()
-                
-                available_slots = []
-                for slot in slots:
-                    slot_data = slot.to_dict()
-                    if slot_data:
-                        slot_data['id'] = slot.id
-                        available_slots.append(slot_data)
+                available_slots = slots.available_on(date)
                 
                 # Track timeslot search analytics for citizens
                 try:
                     if g.user.get('role') == 'citizen':
-                        citizens = db.collection('citizens').where('firebaseUid', '==', g.user['uid']).limit(1).get()
-                        if citizens:
-                            nic = citizens[0].id
+                        nic = CitizenRepository().nic_for_firebase_uid(g.user['uid'])
+                        if nic:
                             self._track_analytics_event('timeslot_search', nic, department_id, {
                                 'searchDate': date,
                                 'slotsFound': len(available_slots)
@@ -564,6 +657,67 @@ class GovConnectServer:
                 logger.error(f"Get timeslots error: {e}")
                 return jsonify({'error': str(e)}), 500
         
+        @self.app.route('/api/availability/earliest', methods=['GET'])
+        @self._require_auth
+        def find_earliest_availability():
+            """Earliest available slots in a date window (?department= or all, ?from=, ?to=, ?limit=)"""
+            try:
+                department = (request.args.get('department') or 'all').lower()
+                if department == 'all':
+                    departments = list(DEPARTMENT_COLLECTIONS)
+                elif department in DEPARTMENT_COLLECTIONS:
+                    departments = [department]
+                else:
+                    return jsonify({'error': 'Invalid department'}), 400
+                
+                now = datetime.now()
+                max_days = self.app.config.get('AVAILABILITY_SEARCH_DAYS', 90)
+                try:
+                    from_date = datetime.strptime(request.args['from'], '%Y-%m-%d') if request.args.get('from') else now
+                    to_date = datetime.strptime(request.args['to'], '%Y-%m-%d') if request.args.get('to') \
+                        else from_date + timedelta(days=30)
+                except ValueError:
+                    return jsonify({'error': 'from and to must be YYYY-MM-DD dates'}), 400
+                start = max(from_date, now)
+                if to_date.date() < start.date():
+                    return jsonify({'error': 'to must not be before from'}), 400
+                if (to_date.date() - start.date()).days > max_days:
+                    return jsonify({'error': f'Search window is limited to {max_days} days'}), 400
+                limit = min(max(request.args.get('limit', 5, type=int), 1), 50)
+                
+                index = get_availability_index()
+                if not index.ready:
+                    response = jsonify({'error': 'Availability index is loading, retry shortly'})
+                    response.headers['Retry-After'] = '1'
+                    return response, 503
+                
+                end_date = to_date.strftime('%Y-%m-%d')
+                slots = index.earliest(departments, start, end_date, limit)
+                
+                # One analytics event per search, instead of one per probed day
+                try:
+                    if g.user.get('role') == 'citizen':
+                        nic = CitizenRepository().nic_for_firebase_uid(g.user['uid'])
+                        if nic:
+                            self._track_analytics_event('availability_search', nic, department, {
+                                'from': start.strftime('%Y-%m-%d'),
+                                'to': end_date,
+                                'slotsFound': len(slots)
+                            })
+                except Exception as analytics_error:
+                    logger.error(f"Analytics tracking error for availability search: {analytics_error}")
+                
+                return jsonify({
+                    'from': start.strftime('%Y-%m-%d'),
+                    'to': end_date,
+                    'slots': slots,
+                    'departments': index.earliest_by_department(departments, start, end_date)
+                }), 200
+            
+            except Exception as e:
+                logger.error(f"Earliest availability error: {e}")
+                return jsonify({'error': str(e)}), 500
+        
         @self.app.route('/api/departments/<department>/timeslots', methods=['POST'])
         @self._require_auth
         def create_timeslots(department):
@@ -582,17 +736,10 @@ class GovConnectServer:
                     return jsonify({'error': 'Date, start_time, and end_time required'}), 400
                 
                 department_id = department.lower()
-                collections_map = {
-                    'medical': 'medicalTimeSlots',
-                    'passport': 'passportTimeSlots',
-                    'license': 'licenseTimeSlots'
-                }
-                
-                if department_id not in collections_map:
+                slots = TimeSlotRepository.for_department(department_id)
+                if not slots:
                     return jsonify({'error': 'Invalid department'}), 400
                 
-                slot_collection = collections_map[department_id]
-                
                 # Generate time slots
                 start = datetime.strptime(f"{date} {start_time}", "%Y-%m-%d %H:%M")
                 end = datetime.strptime(f"{date} {end_time}", "%Y-%m-%d %H:%M")
@@ -613,8 +760,7 @@ class GovConnectServer:
                     }
                     
                     # Add slot to database
-                    doc_ref = db.collection(slot_collection).add(slot_data)
-                    slot_data['id'] = doc_ref[1].id
+                    slot_data['id'] = slots.add(slot_data)
                     created_slots.append(slot_data)
                     
                     current += delta
@@ -637,88 +783,37 @@ class GovConnectServer:
                 
                 # Get user's NIC
                 if g.user['role'] == 'citizen':
-                    citizens = db.collection('citizens').where('uid', '==', user_id).limit(1).get()
-                    if not citizens:
+                    citizen = CitizenRepository().find_one([('uid', '==', user_id)], fields=ID_ONLY_FIELDS)
+                    if not citizen:
                         return jsonify({'error': 'Citizen profile not found'}), 404
-                    nic = citizens[0].id
+                    nic = citizen['id']
                 else:
                     return jsonify({'error': 'Only citizens can book appointments'}), 403
                 
-                # Validate department and get collections
+                # Validate department and get repositories
                 department_id = department.lower()
-                collections_map = {
-                    'medical': ('medicalTimeSlots', 'medicalAppointments'),
-                    'passport': ('passportTimeSlots', 'passportAppointments'),
-                    'license': ('licenseTimeSlots', 'licenseAppointments')
-                }
-                
-                if department_id not in collections_map:
+                slots = TimeSlotRepository.for_department(department_id)
+                appointments = AppointmentRepository.for_department(department_id)
+                if not slots:
                     return jsonify({'error': 'Invalid department'}), 400
                 
-                slot_collection, appointment_collection = collections_map[department_id]
                 slot_id = data.get('timeSlotId')
                 
                 # Check slot availability
-                slot_ref = db.collection(slot_collection).document(slot_id)
-                slot_doc = slot_ref.get()
-                
-                if not slot_doc.exists:
+                slot_data = slots.get(slot_id)
+                if slot_data is None:
                     return jsonify({'error': 'Time slot not found'}), 404
                 
-                slot_data = slot_doc.to_dict()
-                if not slot_data:
-                    return jsonify({'error': 'Invalid slot data'}), 500
-                    
                 if slot_data.get('availability') != 'available':
                     return jsonify({'error': 'Time slot not available'}), 400
                 
                 # Generate appointment
-                appointment_id = str(uuid.uuid4())
-                ref_code = f"{department.upper()}-{datetime.now().strftime('%Y%m%d%H%M')}-{random.randint(1000, 9999)}"
-                
-                # Generate QR code
-                qr = qrcode.QRCode(version=1, box_size=10, border=5)
-                qr.add_data(ref_code)
-                qr.make(fit=True)
-                qr_img = qr.make_image(fill_color="black", back_color="white")
-                buffer = io.BytesIO()
-                qr_img.save(buffer, format='PNG')
-                qr_base64 = base64.b64encode(buffer.getvalue()).decode()
-                
-                # Create appointment data with new schema fields
-                appointment_data = {
-                    'appointmentId': appointment_id,
-                    'nic': nic,
-                    'timeSlotId': slot_id,
-                    'scheduledDateTime': slot_data['startTime'],
-                    'status': 'confirmed',
-                    'qrCode': qr_base64,
-                    'reference': ref_code,
-                    'feedback': ''
-                }
-                
-                # Add department-specific fields according to new schema
-                if department_id == 'medical':
-                    appointment_data.update({
-                        'reports': ''  # URL to medical reports
-                    })
-                elif department_id == 'passport':
-                    appointment_data.update({
-                        'applicationForm': data.get('applicationForm', ''),  # URL to uploaded PDF
-                        'supportingDocuments': data.get('supportingDocuments', []),  # Array of URLs
-                        'deliveryStatus': 'pending',
-                        'remarks': data.get('remarks', '')
-                    })
-                elif department_id == 'license':
-                    appointment_data.update({
-                        'applicationForm': data.get('applicationForm', ''),  # URL to uploaded PDF
-                        'supportingDocuments': data.get('supportingDocuments', []),  # Array of URLs
-                        'appointmentType': data.get('appointmentType', 'new license'),
-                        'deliveryStatus': 'pending'
-                    })
+                appointment_data = self._build_appointment_data(department, nic, slot_id, slot_data, data)
+                appointment_id = appointment_data['appointmentId']
+                ref_code = appointment_data['reference']
                 
                 # Save appointment
-                db.collection(appointment_collection).document(appointment_id).set(appointment_data)
+                appointments.set(appointment_id, appointment_data)
                 
                 # Track booking analytics
                 self._track_analytics_event('booking_created', nic, department_id, {
@@ -727,7 +822,7 @@ class GovConnectServer:
                 })
                 
                 # Update slot
-                slot_ref.update({
+                slots.update(slot_id, {
                     'availability': 'booked',
                     'bookedBy': nic,
                     'bookedAt': datetime.utcnow()
@@ -744,9 +839,9 @@ class GovConnectServer:
                     'message': 'Appointment created successfully',
                     'appointmentId': appointment_id,
                     'reference': ref_code,
-                    'qrCode': qr_base64
+                    'qrCode': appointment_data['qrCode']
                 }), 201
-                
+            
             except Exception as e:
                 logger.error(f"Create appointment error: {e}")
                 return jsonify({'error': str(e)}), 500
@@ -759,25 +854,122 @@ class GovConnectServer:
                 user_role = g.user.get('role')
                 if user_role == 'citizen':
                     # Citizens can only see their own appointments
-                    citizens = db.collection('citizens').where('firebaseUid', '==', g.user['uid']).limit(1).get()
-                    if not citizens or citizens[0].id != nic:
+                    if CitizenRepository().nic_for_firebase_uid(g.user['uid']) != nic:
                         return jsonify({'error': 'Access denied'}), 403
                 
-                appointments = []
-                collections = ['medicalAppointments', 'passportAppointments', 'licenseAppointments']
+                try:
+                    fields = self._requested_fields()
+                except ValueError as e:
+                    return jsonify({'error': str(e)}), 400
                 
-                for collection_name in collections:
-                    docs = db.collection(collection_name).where('nic', '==', nic).get()
-                    for doc in docs:
-                        appointment = doc.to_dict()
-                        if appointment:  # Null safety check
-                            appointment['id'] = doc.id
-                            appointments.append(appointment)
+                appointments = []
+                for repository in AppointmentRepository.all_departments():
+                    for appointment in repository.find_by_nic(nic, fields=fields):
+                        appointment['department'] = repository.department
+                        appointments.append(appointment)
                 
                 return jsonify({'appointments': appointments})
                 
             except Exception as e:
                 return jsonify({'error': str(e)}), 500
+        
+        @self.app.route('/api/appointments/<department>/<appointment_id>', methods=['GET'])
+        @self._require_auth
+        def get_appointment_detail(department, appointment_id):
+            """Full appointment document, including the QR code and attachments"""
+            try:
+                appointments = AppointmentRepository.for_department(department)
+                if not appointments:
+                    return jsonify({'error': 'Invalid department'}), 400
+                
+                appointment = appointments.get(appointment_id)
+                if appointment is None:
+                    return jsonify({'error': 'Appointment not found'}), 404
+                
+                if g.user.get('role') == 'citizen':
+                    # Citizens can only see their own appointments
+                    if CitizenRepository().nic_for_firebase_uid(g.user['uid']) != appointment.get('nic'):
+                        return jsonify({'error': 'Access denied'}), 403
+                
+                appointment['department'] = appointments.department
+                return jsonify(appointment)
+            
+            except Exception as e:
+                return jsonify({'error': str(e)}), 500
+    
+    def _requested_fields(self, required: Sequence[str] = ()) -> Optional[List[str]]:
+        """Projection for an appointment list from the ?fields= query parameter
+        
+        No parameter returns the compact summary, fields=all returns whole
+        documents and fields=a,b returns just those fields (plus any the
+        handler needs itself). Raises ValueError for malformed field names.
+        """
+        raw = request.args.get('fields')
+        if raw is None:
+            fields = list(APPOINTMENT_SUMMARY_FIELDS)
+        elif raw.strip().lower() in ('all', '*'):
+            return None
+        else:
+            fields = parse_field_list(raw)
+        
+        fields.extend(field for field in required if field not in fields)
+        return fields
+    
+    def _generate_qr_code(self, data: str) -> str:
+        """Render data as a QR code PNG, base64-encoded"""
+        # qrcode pulls in PIL; only booking needs it, so import on first use
+        import qrcode
+        
+        qr = qrcode.QRCode(version=1, box_size=10, border=5)
+        qr.add_data(data)
+        qr.make(fit=True)
+        qr_img = qr.make_image(fill_color="black", back_color="white")
+        buffer = io.BytesIO()
+        qr_img.save(buffer, format='PNG')
+        return base64.b64encode(buffer.getvalue()).decode()
+    
+    def _build_appointment_data(self, department: str, nic: str, slot_id: str,
+                                slot_data: Dict[str, Any], data: Dict[str, Any]) -> Dict[str, Any]:
+        """Build a new appointment document for a booked slot"""
+        department_id = department.lower()
+        
+        # Generate appointment
+        appointment_id = str(uuid.uuid4())
+        ref_code = f"{department.upper()}-{datetime.now().strftime('%Y%m%d%H%M')}-{random.randint(1000, 9999)}"
+        
+        # Create appointment data with new schema fields
+        appointment_data = {
+            'appointmentId': appointment_id,
+            'nic': nic,
+            'timeSlotId': slot_id,
+            'scheduledDateTime': slot_data['startTime'],
+            'status': 'confirmed',
+            'qrCode': self._generate_qr_code(ref_code),
+            'reference': ref_code,
+            'feedback': ''
+        }
+        
+        # Add department-specific fields according to new schema
+        if department_id == 'medical':
+            appointment_data.update({
+                'reports': ''  # URL to medical reports
+            })
+        elif department_id == 'passport':
+            appointment_data.update({
+                'applicationForm': data.get('applicationForm', ''),  # URL to uploaded PDF
+                'supportingDocuments': data.get('supportingDocuments', []),  # Array of URLs
+                'deliveryStatus': 'pending',
+                'remarks': data.get('remarks', '')
+            })
+        elif department_id == 'license':
+            appointment_data.update({
+                'applicationForm': data.get('applicationForm', ''),  # URL to uploaded PDF
+                'supportingDocuments': data.get('supportingDocuments', []),  # Array of URLs
+                'appointmentType': data.get('appointmentType', 'new license'),
+                'deliveryStatus': 'pending'
+            })
+        
+        return appointment_data
     
     def _register_analytics_routes(self):
         """Analytics routes"""
@@ -792,31 +984,10 @@ class GovConnectServer:
                     'generated_at': datetime.utcnow().isoformat()
                 }
                 
-                collections = {
-                    'medical': 'medicalAppointments',
-                    'passport': 'passportAppointments',
-                    'license': 'licenseAppointments'
-                }
-                
-                for dept, collection_name in collections.items():
-                    docs = list(db.collection(collection_name).get())
-                    total = len(docs)
-                    summary['total_appointments'] += total
-                    
-                    # Count by status
-                    status_counts = {}
-                    for doc in docs:
-                        doc_data = doc.to_dict()
-                        if doc_data:
-                            status = doc_data.get('status', 'unknown')
-                        else:
-                            status = 'unknown'
-                        status_counts[status] = status_counts.get(status, 0) + 1
-                    
-                    summary['departments'][dept] = {
-                        'total': total,
-                        'status_breakdown': status_counts
-                    }
+                for repository in AppointmentRepository.all_departments():
+                    breakdown = self._appointment_status_breakdown(repository.scan(fields=STATUS_FIELDS))
+                    summary['total_appointments'] += breakdown['total']
+                    summary['departments'][repository.department] = breakdown
                 
                 return jsonify(summary)
                 
@@ -829,38 +1000,9 @@ class GovConnectServer:
             """Get peak booking hours across all departments"""
             try:
                 hour_counts = {}
-                collections = ['medicalAppointments', 'passportAppointments', 'licenseAppointments']
-                
-                for collection_name in collections:
-                    appointments = db.collection(collection_name).stream()
-                    for doc in appointments:
-                        data = doc.to_dict()
-                        if not data:
-                            continue
-                            
-                        scheduled_dt = data.get("scheduledDateTime")
-                        if scheduled_dt:
-                            try:
-                                # Handle different datetime formats
-                                if isinstance(scheduled_dt, str):
-                                    # Try different parsing methods
-                                    try:
-                                        dt = datetime.fromisoformat(scheduled_dt.replace('Z', '+00:00'))
-                                    except:
-                                        try:
-                                            dt = datetime.strptime(scheduled_dt, "%B %d, %Y at %I:%M:%S %p UTC%z")
-                                        except:
-                                            continue
-                                else:
-                                    # Firestore timestamp
-                                    dt = scheduled_dt
-                                
-                                hour = dt.hour
-                                hour_counts[hour] = hour_counts.get(hour, 0) + 1
-                                
-                            except Exception as e:
-                                logger.error(f"Error parsing datetime: {e}")
-                                continue
+                
+                for repository in AppointmentRepository.all_departments():
+                    self._count_peak_hours(repository.scan(fields=SCHEDULE_FIELDS), hour_counts)
                 
                 return jsonify(hour_counts)
                 
@@ -873,20 +1015,14 @@ class GovConnectServer:
         def department_load():
             """Get appointment load per department"""
             try:
-                departments = {
-                    'medical': 'medicalAppointments',
-                    'passport': 'passportAppointments', 
-                    'license': 'licenseAppointments'
-                }
                 load = {}
                 
-                for dept_name, collection_name in departments.items():
+                for repository in AppointmentRepository.all_departments():
                     try:
-                        appointments = list(db.collection(collection_name).stream())
-                        load[dept_name] = len(appointments)
+                        load[repository.department] = repository.count()
                     except Exception as e:
-                        logger.error(f"Error getting load for {dept_name}: {e}")
-                        load[dept_name] = 0
+                        logger.error(f"Error getting load for {repository.department}: {e}")
+                        load[repository.department] = 0
                 
                 return jsonify(load)
                 
@@ -899,40 +1035,14 @@ class GovConnectServer:
         def no_show_rate():
             """Calculate no-show rate per department"""
             try:
-                departments = {
-                    'medical': 'medicalAppointments',
-                    'passport': 'passportAppointments',
-                    'license': 'licenseAppointments'
-                }
                 rates = {}
                 
-                for dept_name, collection_name in departments.items():
-                    total = 0
-                    no_show = 0
-                    
+                for repository in AppointmentRepository.all_departments():
                     try:
-                        for doc in db.collection(collection_name).stream():
-                            data = doc.to_dict()
-                            if data:
-                                total += 1
-                                if data.get("status") == "no-show":
-                                    no_show += 1
-                        
-                        rates[dept_name] = {
-                            'total_appointments': total,
-                            'no_shows': no_show,
-                            'no_show_rate': (no_show / total) if total > 0 else 0,
-                            'percentage': f"{((no_show / total) * 100):.1f}%" if total > 0 else "0.0%"
-                        }
-                        
+                        rates[repository.department] = self._no_show_stats(repository.scan(fields=STATUS_FIELDS))
                     except Exception as e:
-                        logger.error(f"Error calculating no-show rate for {dept_name}: {e}")
-                        rates[dept_name] = {
-                            'total_appointments': 0,
-                            'no_shows': 0,
-                            'no_show_rate': 0,
-                            'percentage': "0.0%"
-                        }
+                        logger.error(f"Error calculating no-show rate for {repository.department}: {e}")
+                        rates[repository.department] = self._no_show_stats([])
                 
                 return jsonify(rates)
                 
@@ -945,68 +1055,15 @@ class GovConnectServer:
         def avg_processing_time():
             """Calculate average processing time per department"""
             try:
-                departments = {
-                    'medical': 'medicalAppointments',
-                    'passport': 'passportAppointments',
-                    'license': 'licenseAppointments'
-                }
                 avg_times = {}
                 
-                for dept_name, collection_name in departments.items():
-                    total_time = 0
-                    count = 0
-                    
+                for repository in AppointmentRepository.all_departments():
                     try:
-                        for doc in db.collection(collection_name).stream():
-                            data = doc.to_dict()
-                            if not data:
-                                continue
-                                
-                            created = data.get("createdAt") or data.get("created_at")
-                            processed = data.get("processedAt") or data.get("processed_at")
-                            
-                            if created and processed:
-                                try:
-                                    # Handle different datetime formats
-                                    if isinstance(created, str):
-                                        t1 = datetime.fromisoformat(created.replace('Z', '+00:00'))
-                                    else:
-                                        t1 = created
-                                        
-                                    if isinstance(processed, str):
-                                        t2 = datetime.fromisoformat(processed.replace('Z', '+00:00'))
-                                    else:
-                                        t2 = processed
-                                    
-                                    processing_time = (t2 - t1).total_seconds()
-                                    total_time += processing_time
-                                    count += 1
-                                    
-                                except Exception as parse_error:
-                                    logger.error(f"Error parsing dates for processing time: {parse_error}")
-                                    continue
-                        
-                        avg_seconds = (total_time / count) if count > 0 else 0
-                        avg_hours = avg_seconds / 3600
-                        avg_days = avg_hours / 24
-                        
-                        avg_times[dept_name] = {
-                            'appointments_processed': count,
-                            'avg_seconds': round(avg_seconds, 2),
-                            'avg_hours': round(avg_hours, 2),
-                            'avg_days': round(avg_days, 2),
-                            'human_readable': f"{round(avg_days, 1)} days" if avg_days >= 1 else f"{round(avg_hours, 1)} hours"
-                        }
-                        
+                        records = repository.scan(fields=PROCESSING_TIME_FIELDS)
+                        avg_times[repository.department] = self._processing_time_stats(records)
                     except Exception as e:
-                        logger.error(f"Error calculating processing time for {dept_name}: {e}")
-                        avg_times[dept_name] = {
-                            'appointments_processed': 0,
-                            'avg_seconds': 0,
-                            'avg_hours': 0,
-                            'avg_days': 0,
-                            'human_readable': "No data"
-                        }
+                        logger.error(f"Error calculating processing time for {repository.department}: {e}")
+                        avg_times[repository.department] = dict(NO_PROCESSING_TIME_DATA)
                 
                 return jsonify(avg_times)
                 
@@ -1031,34 +1088,13 @@ class GovConnectServer:
                 }
                 
                 # Get summary data (reuse existing logic)
-                collections = {
-                    'medical': 'medicalAppointments',
-                    'passport': 'passportAppointments',
-                    'license': 'licenseAppointments'
-                }
-                
                 total_appointments = 0
                 departments_summary = {}
                 
-                for dept, collection_name in collections.items():
-                    docs = list(db.collection(collection_name).get())
-                    total = len(docs)
-                    total_appointments += total
-                    
-                    # Count by status
-                    status_counts = {}
-                    for doc in docs:
-                        doc_data = doc.to_dict()
-                        if doc_data:
-                            status = doc_data.get('status', 'unknown')
-                        else:
-                            status = 'unknown'
-                        status_counts[status] = status_counts.get(status, 0) + 1
-                    
-                    departments_summary[dept] = {
-                        'total': total,
-                        'status_breakdown': status_counts
-                    }
+                for repository in AppointmentRepository.all_departments():
+                    breakdown = self._appointment_status_breakdown(repository.scan(fields=STATUS_FIELDS))
+                    departments_summary[repository.department] = breakdown
+                    total_appointments += breakdown['total']
                 
                 dashboard_data['summary'] = {
                     'total_appointments': total_appointments,
@@ -1067,32 +1103,12 @@ class GovConnectServer:
                 
                 # Get user activity from analytics_events
                 try:
-                    analytics_events = list(db.collection('analytics_events').stream())
-                    event_types = {}
-                    departments_activity = {}
-                    
-                    for event_doc in analytics_events:
-                        event_data = event_doc.to_dict()
-                        if event_data:
-                            event_type = event_data.get('type', 'unknown')
-                            department = event_data.get('department', 'general')
-                            
-                            event_types[event_type] = event_types.get(event_type, 0) + 1
-                            departments_activity[department] = departments_activity.get(department, 0) + 1
-                    
-                    dashboard_data['user_activity'] = {
-                        'total_events': len(analytics_events),
-                        'event_types': event_types,
-                        'department_activity': departments_activity
-                    }
+                    records = (doc.to_dict() for doc in db.collection('analytics_events').stream())
+                    dashboard_data['user_activity'] = self._user_activity_stats(records)
                     
                 except Exception as e:
                     logger.error(f"Error getting user activity analytics: {e}")
-                    dashboard_data['user_activity'] = {
-                        'total_events': 0,
-                        'event_types': {},
-                        'department_activity': {}
-                    }
+                    dashboard_data['user_activity'] = self._user_activity_stats([])
                 
                 return jsonify(dashboard_data)
                 
@@ -1100,6 +1116,139 @@ class GovConnectServer:
                 logger.error(f"Analytics dashboard error: {e}")
                 return jsonify({'error': str(e)}), 500
     
+    # --- Analytics aggregations (shared by the sync and async handlers) ---
+    
+    def _appointment_status_breakdown(self, records) -> Dict[str, Any]:
+        """Count appointment documents per status"""
+        total = 0
+        status_counts = {}
+        
+        for data in records:
+            total += 1
+            status = data.get('status', 'unknown') if data else 'unknown'
+            status_counts[status] = status_counts.get(status, 0) + 1
+        
+        return {
+            'total': total,
+            'status_breakdown': status_counts
+        }
+    
+    def _count_peak_hours(self, records, hour_counts: Dict[int, int]) -> Dict[int, int]:
+        """Accumulate booking counts per hour of scheduledDateTime into hour_counts"""
+        for data in records:
+            if not data:
+                continue
+            
+            scheduled_dt = data.get("scheduledDateTime")
+            if scheduled_dt:
+                try:
+                    # Handle different datetime formats
+                    if isinstance(scheduled_dt, str):
+                        # Try different parsing methods
+                        try:
+                            dt = datetime.fromisoformat(scheduled_dt.replace('Z', '+00:00'))
+                        except:
+                            try:
+                                dt = datetime.strptime(scheduled_dt, "%B %d, %Y at %I:%M:%S %p UTC%z")
+                            except:
+                                continue
+                    else:
+                        # Firestore timestamp
+                        dt = scheduled_dt
+                    
+                    hour = dt.hour
+                    hour_counts[hour] = hour_counts.get(hour, 0) + 1
+                
+                except Exception as e:
+                    logger.error(f"Error parsing datetime: {e}")
+                    continue
+        
+        return hour_counts
+    
+    def _no_show_stats(self, records) -> Dict[str, Any]:
+        """No-show counts and rate for one department"""
+        total = 0
+        no_show = 0
+        
+        for data in records:
+            if data:
+                total += 1
+                if data.get("status") == "no-show":
+                    no_show += 1
+        
+        return {
+            'total_appointments': total,
+            'no_shows': no_show,
+            'no_show_rate': (no_show / total) if total > 0 else 0,
+            'percentage': f"{((no_show / total) * 100):.1f}%" if total > 0 else "0.0%"
+        }
+    
+    def _processing_time_stats(self, records) -> Dict[str, Any]:
+        """Average created -> processed time for one department"""
+        total_time = 0
+        count = 0
+        
+        for data in records:
+            if not data:
+                continue
+            
+            created = data.get("createdAt") or data.get("created_at")
+            processed = data.get("processedAt") or data.get("processed_at")
+            
+            if created and processed:
+                try:
+                    # Handle different datetime formats
+                    if isinstance(created, str):
+                        t1 = datetime.fromisoformat(created.replace('Z', '+00:00'))
+                    else:
+                        t1 = created
+                    
+                    if isinstance(processed, str):
+                        t2 = datetime.fromisoformat(processed.replace('Z', '+00:00'))
+                    else:
+                        t2 = processed
+                    
+                    processing_time = (t2 - t1).total_seconds()
+                    total_time += processing_time
+                    count += 1
+                
+                except Exception as parse_error:
+                    logger.error(f"Error parsing dates for processing time: {parse_error}")
+                    continue
+        
+        avg_seconds = (total_time / count) if count > 0 else 0
+        avg_hours = avg_seconds / 3600
+        avg_days = avg_hours / 24
+        
+        return {
+            'appointments_processed': count,
+            'avg_seconds': round(avg_seconds, 2),
+            'avg_hours': round(avg_hours, 2),
+            'avg_days': round(avg_days, 2),
+            'human_readable': f"{round(avg_days, 1)} days" if avg_days >= 1 else f"{round(avg_hours, 1)} hours"
+        }
+    
+    def _user_activity_stats(self, records) -> Dict[str, Any]:
+        """Event type and department breakdown of analytics_events"""
+        total_events = 0
+        event_types = {}
+        departments_activity = {}
+        
+        for event_data in records:
+            total_events += 1
+            if event_data:
+                event_type = event_data.get('type', 'unknown')
+                department = event_data.get('department', 'general')
+                
+                event_types[event_type] = event_types.get(event_type, 0) + 1
+                departments_activity[department] = departments_activity.get(department, 0) + 1
+        
+        return {
+            'total_events': total_events,
+            'event_types': event_types,
+            'department_activity': departments_activity
+        }
+    
     def _register_feedback_routes(self):
         """Feedback system routes"""
         
@@ -1119,30 +1268,18 @@ class GovConnectServer:
                     return jsonify({'error': 'Missing required fields'}), 400
                 
                 # Validate appointment exists and belongs to user
-                collections_map = {
-                    'medical': 'medicalAppointments',
-                    'passport': 'passportAppointments',
-                    'license': 'licenseAppointments'
-                }
-                
-                collection_name = collections_map.get(appointment_type)
-                if not collection_name:
+                appointments = AppointmentRepository.for_department(appointment_type)
+                if not appointments:
                     return jsonify({'error': 'Invalid appointment type'}), 400
                 
-                appointment_ref = db.collection(collection_name).document(appointment_id)
-                appointment_doc = appointment_ref.get()
-                
-                if not appointment_doc.exists:
+                appointment_data = appointments.get(appointment_id, fields=['userId'])
+                if appointment_data is None:
                     return jsonify({'error': 'Appointment not found'}), 404
-                
-                appointment_data = appointment_doc.to_dict()
-                if not appointment_data:
-                    return jsonify({'error': 'Invalid appointment data'}), 500
                 if appointment_data.get('userId') != user_id:
                     return jsonify({'error': 'Access denied'}), 403
                 
                 # Update appointment with feedback
-                appointment_ref.update({
+                appointments.update(appointment_id, {
                     'feedback': feedback_text,
                     'rating': rating,
                     'feedbackSubmittedAt': datetime.utcnow()
@@ -1165,10 +1302,10 @@ class GovConnectServer:
                 
                 # Get user's NIC
                 if g.user['role'] == 'citizen':
-                    citizens = db.collection('citizens').where('uid', '==', user_id).limit(1).get()
-                    if not citizens:
+                    citizen = CitizenRepository().find_one([('uid', '==', user_id)], fields=ID_ONLY_FIELDS)
+                    if not citizen:
                         return jsonify({'error': 'Citizen profile not found'}), 404
-                    nic = citizens[0].id
+                    nic = citizen['id']
                 else:
                     return jsonify({'error': 'Only citizens can submit complaints'}), 403
                 
@@ -1189,7 +1326,7 @@ class GovConnectServer:
                     'createdAt': datetime.utcnow()
                 }
                 
-                db.collection('complaints').document(complaint_id).set(complaint_data)
+                db.collection('complaints').document(complaint_id).set(stamp_updated_at(complaint_data))
                 
                 # Track complaint analytics
                 self._track_analytics_event('complaint_submitted', nic, department, {
@@ -1211,8 +1348,8 @@ class GovConnectServer:
                 # Check access permissions
                 user_role = g.user.get('role')
                 if user_role == 'citizen':
-                    citizens = db.collection('citizens').where('uid', '==', g.user['uid']).limit(1).get()
-                    if not citizens or citizens[0].id != nic:
+                    citizen = CitizenRepository().find_one([('uid', '==', g.user['uid'])], fields=ID_ONLY_FIELDS)
+                    if not citizen or citizen['id'] != nic:
                         return jsonify({'error': 'Access denied'}), 403
                 
                 complaints = []
@@ -1241,7 +1378,7 @@ class GovConnectServer:
                 notifications = []
                 docs = db.collection('notifications')\
                     .where('user_id', '==', user_id)\
-                    .order_by('created_at', direction=firestore.Query.DESCENDING)\
+                    .order_by('created_at', direction='DESCENDING')\
                     .limit(50).get()
                 
                 for doc in docs:
@@ -1259,10 +1396,10 @@ class GovConnectServer:
         @self._require_auth
         def mark_notification_read(notification_id):
             try:
-                db.collection('notifications').document(notification_id).update({
+                db.collection('notifications').document(notification_id).update(stamp_updated_at({
                     'is_read': True,
                     'read_at': datetime.utcnow()
-                })
+                }))
                 
                 return jsonify({'message': 'Notification marked as read'})
                 
@@ -1304,7 +1441,7 @@ class GovConnectServer:
                     }
                     
                     # Store notification in database
-                    doc_ref = db.collection('notifications').add(notification_data)
+                    doc_ref = db.collection('notifications').add(stamp_updated_at(notification_data))
                     
                     # Send real-time notification
                     self._send_realtime_notification(user_id, notification_data)
@@ -1335,17 +1472,17 @@ class GovConnectServer:
                 # Get preferences from appropriate collection
                 if role == 'citizen':
                     # Get from citizens collection using firebaseUid
-                    citizens = db.collection('citizens').where('firebaseUid', '==', user_id).limit(1).get()
-                    if citizens:
-                        citizen_data = citizens[0].to_dict()
-                        if citizen_data:
-                            preferences = citizen_data.get('notification_preferences', {
-                                'email_notifications': True,
-                                'appointment_reminders': True,
-                                'status_updates': True,
-                                'system_announcements': True
-                            })
-                            return jsonify(preferences), 200
+                    citizen_data = CitizenRepository().find_by_firebase_uid(
+                        user_id, fields=['notification_preferences']
+                    )
+                    if citizen_data:
+                        preferences = citizen_data.get('notification_preferences', {
+                            'email_notifications': True,
+                            'appointment_reminders': True,
+                            'status_updates': True,
+                            'system_announcements': True
+                        })
+                        return jsonify(preferences), 200
                 else:
                     # Get from users collection for officers
                     user_doc = db.collection('users').document(user_id).get()
@@ -1377,9 +1514,10 @@ class GovConnectServer:
                 # Update preferences in appropriate collection
                 if role == 'citizen':
                     # Update in citizens collection
-                    citizens = db.collection('citizens').where('firebaseUid', '==', user_id).limit(1).get()
-                    if citizens:
-                        db.collection('citizens').document(citizens[0].id).update({
+                    citizens = CitizenRepository()
+                    nic = citizens.nic_for_firebase_uid(user_id)
+                    if nic:
+                        citizens.update(nic, {
                             'notification_preferences': data
                         })
                 else:
@@ -1410,24 +1548,14 @@ class GovConnectServer:
                     return jsonify({'error': 'appointment_id and department required'}), 400
                 
                 # Get appointment details
-                collection_map = {
-                    'medical': 'medicalAppointments',
-                    'passport': 'passportAppointments',
-                    'license': 'licenseAppointments'
-                }
-                
-                collection_name = collection_map.get(department)
-                if not collection_name:
+                appointments = AppointmentRepository.for_department(department)
+                if not appointments:
                     return jsonify({'error': 'Invalid department'}), 400
                 
-                appointment_doc = db.collection(collection_name).document(appointment_id).get()
-                if not appointment_doc.exists:
+                appointment_data = appointments.get(appointment_id, fields=['userId', 'scheduledDateTime'])
+                if appointment_data is None:
                     return jsonify({'error': 'Appointment not found'}), 404
                 
-                appointment_data = appointment_doc.to_dict()
-                if not appointment_data:
-                    return jsonify({'error': 'Invalid appointment data'}), 500
-                    
                 user_id = appointment_data.get('userId')
                 scheduled_time = appointment_data.get('scheduledDateTime')
                 
@@ -1445,7 +1573,7 @@ class GovConnectServer:
                 }
                 
                 # Store reminder
-                db.collection('notifications').add(reminder_data)
+                db.collection('notifications').add(stamp_updated_at(reminder_data))
                 
                 return jsonify({'message': 'Reminder scheduled successfully'}), 200
                 
@@ -1556,17 +1684,20 @@ If you need assistance, please contact our office directly.
                 status = request.args.get('status', 'all')
                 date_filter = request.args.get('date', 'today')
                 
+                try:
+                    # scheduledDateTime drives the date filter and the sort
+                    fields = self._requested_fields(required=['scheduledDateTime'])
+                except ValueError as e:
+                    return jsonify({'error': str(e)}), 400
+                
                 appointments = []
                 
                 # Define collections to search
-                collections = ['medicalAppointments', 'passportAppointments', 'licenseAppointments']
+                repositories = AppointmentRepository.all_departments()
                 if department != 'all':
-                    collection_map = {
-                        'medical': ['medicalAppointments'],
-                        'passport': ['passportAppointments'],
-                        'license': ['licenseAppointments']
-                    }
-                    collections = collection_map.get(department, collections)
+                    repository = AppointmentRepository.for_department(department)
+                    if repository:
+                        repositories = [repository]
                 
                 # Build date filter
                 today = datetime.utcnow().date()
@@ -1583,30 +1714,20 @@ If you need assistance, please contact our office directly.
                     start_date = None
                     end_date = None
                 
-                for collection_name in collections:
-                    query = db.collection(collection_name)
-                    
+                for repository in repositories:
                     # Apply status filter
-                    if status != 'all':
-                        query = query.where('status', '==', status)
-                    
-                    docs = query.order_by('scheduledDateTime').get()
-                    
-                    for doc in docs:
-                        appointment = doc.to_dict()
-                        if appointment:
-                            appointment['id'] = doc.id
-                            appointment['department'] = collection_name.replace('Appointments', '')
-                            
-                            # Apply date filter if specified
-                            if start_date and end_date:
-                                scheduled_date = datetime.fromisoformat(
-                                    appointment.get('scheduledDateTime', '')
-                                ).date()
-                                if not (start_date <= scheduled_date <= end_date):
-                                    continue
-                            
-                            appointments.append(appointment)
+                    for appointment in repository.list(status if status != 'all' else None, fields=fields):
+                        appointment['department'] = repository.department
+                        
+                        # Apply date filter if specified
+                        if start_date and end_date:
+                            scheduled_date = datetime.fromisoformat(
+                                appointment.get('scheduledDateTime', '')
+                            ).date()
+                            if not (start_date <= scheduled_date <= end_date):
+                                continue
+                        
+                        appointments.append(appointment)
                 
                 # Sort by scheduled time
                 appointments.sort(key=lambda x: x.get('scheduledDateTime', ''))
@@ -1645,14 +1766,8 @@ If you need assistance, please contact our office directly.
                     return jsonify({'error': f'Invalid status. Must be one of: {valid_statuses}'}), 400
                 
                 # Find appointment in correct collection
-                collection_map = {
-                    'medical': 'medicalAppointments',
-                    'passport': 'passportAppointments',
-                    'license': 'licenseAppointments'
-                }
-                
-                collection_name = collection_map.get(department)
-                if not collection_name:
+                appointments = AppointmentRepository.for_department(department)
+                if not appointments:
                     return jsonify({'error': 'Invalid department'}), 400
                 
                 # Update appointment
@@ -1665,12 +1780,11 @@ If you need assistance, please contact our office directly.
                 if notes:
                     update_data['officer_notes'] = notes
                 
-                db.collection(collection_name).document(appointment_id).update(update_data)
+                appointments.update(appointment_id, update_data)
                 
                 # Send notification to user
-                appointment_doc = db.collection(collection_name).document(appointment_id).get()
-                if appointment_doc.exists:
-                    appointment_data = appointment_doc.to_dict()
+                appointment_data = appointments.get(appointment_id, fields=['userId'])
+                if appointment_data:
                     user_id = appointment_data.get('userId')
                     
                     if user_id:
@@ -1684,7 +1798,7 @@ If you need assistance, please contact our office directly.
                             'appointment_id': appointment_id
                         }
                         
-                        db.collection('notifications').add(notification_data)
+                        db.collection('notifications').add(stamp_updated_at(notification_data))
                         self._send_realtime_notification(user_id, notification_data)
                 
                 return jsonify({'message': 'Appointment status updated successfully'})
@@ -1707,17 +1821,10 @@ If you need assistance, please contact our office directly.
                     'departments': {'medical': 0, 'passport': 0, 'license': 0}
                 }
                 
-                collections = ['medicalAppointments', 'passportAppointments', 'licenseAppointments']
-                
-                for collection_name in collections:
-                    docs = db.collection(collection_name).get()
-                    department = collection_name.replace('Appointments', '')
+                for repository in AppointmentRepository.all_departments():
+                    department = repository.department
                     
-                    for doc in docs:
-                        appointment = doc.to_dict()
-                        if not appointment:
-                            continue
-                        
+                    for appointment in repository.scan(fields=SCHEDULE_FIELDS):
                         scheduled_date = datetime.fromisoformat(
                             appointment.get('scheduledDateTime', '')
                         ).date()
@@ -1758,14 +1865,8 @@ If you need assistance, please contact our office directly.
                 if not all([new_datetime, department]):
                     return jsonify({'error': 'scheduledDateTime and department required'}), 400
                 
-                collection_map = {
-                    'medical': 'medicalAppointments',
-                    'passport': 'passportAppointments',
-                    'license': 'licenseAppointments'
-                }
-                
-                collection_name = collection_map.get(department)
-                if not collection_name:
+                appointments = AppointmentRepository.for_department(department)
+                if not appointments:
                     return jsonify({'error': 'Invalid department'}), 400
                 
                 # Update appointment
@@ -1778,12 +1879,11 @@ If you need assistance, please contact our office directly.
                     'updated_at': datetime.utcnow()
                 }
                 
-                db.collection(collection_name).document(appointment_id).update(update_data)
+                appointments.update(appointment_id, update_data)
                 
                 # Send notification to user
-                appointment_doc = db.collection(collection_name).document(appointment_id).get()
-                if appointment_doc.exists:
-                    appointment_data = appointment_doc.to_dict()
+                appointment_data = appointments.get(appointment_id, fields=['userId'])
+                if appointment_data:
                     user_id = appointment_data.get('userId')
                     
                     if user_id:
@@ -1797,7 +1897,7 @@ If you need assistance, please contact our office directly.
                             'appointment_id': appointment_id
                         }
                         
-                        db.collection('notifications').add(notification_data)
+                        db.collection('notifications').add(stamp_updated_at(notification_data))
                         self._send_realtime_notification(user_id, notification_data)
                         self._send_email_notification(user_id, 'Appointment Rescheduled', notification_data['message'])
                 
@@ -1806,103 +1906,369 @@ If you need assistance, please contact our office directly.
             except Exception as e:
                 return jsonify({'error': str(e)}), 500
     
+    def _register_import_routes(self):
+        """Bulk citizen import routes"""
+        self.citizen_importer = CitizenImporter(
+            workers=self.app.config.get('IMPORT_WORKERS', 2),
+            spool_dir=self.app.config.get('IMPORT_SPOOL_DIR')
+        )
+        
+        @self.app.route('/api/admin/citizens/import', methods=['POST'])
+        @self._require_role(['admin'])
+        def import_citizens():
+            """Queue a CSV or NDJSON upload of citizens (raw body or multipart 'file')"""
+            try:
+                upload = request.files.get('file') if request.mimetype == 'multipart/form-data' else None
+                if upload:
+                    fmt = request.args.get('format') or detect_format(upload.mimetype, upload.filename)
+                    stream = upload.stream
+                else:
+                    fmt = request.args.get('format') or detect_format(request.mimetype)
+                    stream = request.stream
+                
+                if fmt not in FORMATS:
+                    return jsonify({'error': 'Upload CSV (text/csv) or NDJSON (application/x-ndjson)'}), 400
+                
+                # Returns once the upload is spooled; rows are imported in the background
+                job = self.citizen_importer.start(stream, fmt, created_by=g.user['uid'])
+                return jsonify({
+                    'job_id': job.id,
+                    'status': job.status,
+                    'status_url': f'/api/admin/citizens/import/{job.id}'
+                }), 202
+            
+            except Exception as e:
+                logger.error(f"Citizen import error: {e}")
+                return jsonify({'error': str(e)}), 500
+        
+        @self.app.route('/api/admin/citizens/import/<job_id>', methods=['GET'])
+        @self._require_role(['admin'])
+        def citizen_import_status(job_id):
+            """Progress of an import and a page of its row errors"""
+            job = self.citizen_importer.get(job_id)
+            if not job:
+                return jsonify({'error': 'Import job not found'}), 404
+            
+            offset = max(request.args.get('errors_offset', 0, type=int), 0)
+            limit = min(max(request.args.get('errors_limit', 100, type=int), 0), 1000)
+            return jsonify(job.to_dict(offset, limit)), 200
+    
     def _register_document_routes(self):
         """Document management routes"""
+        config = self.app.config
+        self.storage = create_storage(
+            config.get('STORAGE_BACKEND', 'cloud'),
+            config.get('UPLOAD_FOLDER', 'uploads'),
+            signing_secret=config.get('STORAGE_SIGNING_SECRET'),
+            local_url=config.get('LOCAL_STORAGE_URL', 'http://localhost:5001')
+        )
+        self.content_store = ContentStore(self.storage, db)
+        self.storage_gc = StorageGC(
+            self.storage,
+            db,
+            min_age=config.get('STORAGE_GC_MIN_AGE_HOURS', 24) * 3600,
+            quarantine_days=config.get('STORAGE_GC_QUARANTINE_DAYS', 7)
+        )
+        self.document_processor = DocumentProcessor(
+            self.storage,
+            workers=config.get('DOCUMENT_PROCESSING_WORKERS', 4),
+            process_workers=config.get('DOCUMENT_PROCESSING_PROCESSES')
+        )
         
         @self.app.route('/api/documents/upload', methods=['POST'])
         @self._require_auth  
         def upload_document():
-            """Upload a document"""
+            """Upload a document (multipart 'file', or the raw body with ?filename=)"""
             try:
-                if 'file' not in request.files:
-                    return jsonify({'error': 'No file provided'}), 400
+                if request.mimetype == 'multipart/form-data':
+                    if 'file' not in request.files:
+                        return jsonify({'error': 'No file provided'}), 400
+                    file = request.files['file']
+                    filename, stream, content_type, size = file.filename, file.stream, file.mimetype, None
+                    fields = request.form
+                else:
+                    # Raw body: streamed to storage as it arrives
+                    filename = request.args.get('filename', '')
+                    stream, content_type, size = request.stream, request.mimetype, request.content_length
+                    fields = request.args
                 
-                file = request.files['file']
-                document_type = request.form.get('type', 'general')
-                appointment_id = request.form.get('appointment_id')
+                document_type = fields.get('type', 'general')
+                appointment_id = fields.get('appointment_id')
                 
-                if file.filename == '':
+                if not filename:
                     return jsonify({'error': 'No file selected'}), 400
                 
                 # Validate file type
-                allowed_extensions = {'.pdf', '.jpg', '.jpeg', '.png', '.doc', '.docx'}
-                file_ext = os.path.splitext(file.filename)[1].lower()
-                
-                if file_ext not in allowed_extensions:
-                    return jsonify({'error': f'File type not allowed. Allowed: {", ".join(allowed_extensions)}'}), 400
+                file_ext = os.path.splitext(filename)[1].lower()
                 
-                # Generate unique filename
-                unique_filename = f"{g.user['uid']}_{datetime.utcnow().timestamp()}_{file.filename}"
+                if file_ext not in DOCUMENT_EXTENSIONS:
+                    return jsonify({'error': f'File type not allowed. Allowed: {", ".join(DOCUMENT_EXTENSIONS)}'}), 400
                 
-                # Save file locally
-                upload_dir = os.path.join(self.app.config.get('UPLOAD_FOLDER', 'uploads'), g.user['uid'])
-                os.makedirs(upload_dir, exist_ok=True)
+                quota_error = self._check_document_quota(g.user['uid'], size)
+                if quota_error:
+                    return quota_error
+                # A multipart file's size isn't known until it has been read: stop it at the quota
+                max_size = self.app.config.get('MAX_CONTENT_LENGTH')
+                remaining = self._remaining_document_quota(g.user['uid'])
+                quota_limited = remaining is not None and (not max_size or remaining < max_size)
+                if quota_limited:
+                    max_size = remaining
                 
-                file_path = os.path.join(upload_dir, unique_filename)
-                file.save(file_path)
+                # Generate unique filename
+                unique_filename = f"{g.user['uid']}_{datetime.utcnow().timestamp()}_{secure_filename(filename)}"
+                
+                # Stream to storage, hashing on the way; identical content is stored once
+                stored, deduplicated = self.content_store.put(
+                    stream,
+                    content_type=content_type,
+                    size=size,
+                    max_size=max_size
+                )
                 
                 # Store metadata in database
                 document_data = {
                     'user_id': g.user['uid'],
-                    'filename': file.filename,
+                    'filename': filename,
                     'unique_filename': unique_filename,
-                    'file_path': file_path,
                     'document_type': document_type,
-                    'file_size': os.path.getsize(file_path),
+                    **stored.to_dict(),
+                    'deduplicated': deduplicated,
                     'uploaded_at': datetime.utcnow(),
-                    'status': 'uploaded'
+                    'status': 'uploaded',
+                    'processing_status': 'pending'
                 }
                 
                 if appointment_id:
                     document_data['appointment_id'] = appointment_id
                 
-                doc_ref = db.collection('documents').add(document_data)
+                doc_ref = db.collection('documents').add(stamp_updated_at(document_data))
                 document_id = doc_ref[1].id
+                StorageUsageRepository().record(g.user['uid'], stored.size)
                 
-                # Track document upload analytics (get NIC for citizens)
-                try:
-                    if g.user.get('role') == 'citizen':
-                        citizens = db.collection('citizens').where('firebaseUid', '==', g.user['uid']).limit(1).get()
-                        if citizens:
-                            nic = citizens[0].id
-                            self._track_analytics_event('document_uploaded', nic, None, {
-                                'documentId': document_id,
-                                'documentType': document_type,
-                                'filename': file.filename
-                            })
-                except Exception as analytics_error:
-                    logger.error(f"Analytics tracking error for document upload: {analytics_error}")
+                # MIME sniffing, thumbnails and page counts happen after the response
+                self.document_processor.submit(document_id, document_data)
+                
+                self._track_document_upload(document_id, document_type, filename)
                 
                 return jsonify({
                     'message': 'Document uploaded successfully',
                     'document_id': document_id,
-                    'filename': file.filename
+                    'filename': filename,
+                    'file_size': stored.size,
+                    'sha256': stored.sha256,
+                    'deduplicated': deduplicated
                 }), 200
                 
+            except UploadTooLarge as e:
+                if quota_limited:
+                    return self._check_document_quota(g.user['uid'], remaining + 1)
+                return jsonify({'error': str(e)}), 413
             except Exception as e:
                 return jsonify({'error': str(e)}), 500
         
-        @self.app.route('/api/documents', methods=['GET'])
+        @self.app.route('/api/documents/upload-url', methods=['POST'])
         @self._require_auth
-        def get_user_documents():
-            """Get user's documents"""
+        def create_upload_url():
+            """Create a pending document and a signed URL the client PUTs its file to"""
             try:
-                docs = db.collection('documents')\
-                    .where('user_id', '==', g.user['uid'])\
-                    .order_by('uploaded_at', direction=firestore.Query.DESCENDING)\
-                    .get()
+                data = request.get_json() or {}
+                filename = data.get('filename', '')
+                document_type = data.get('type', 'general')
+                max_size = self.app.config.get('MAX_CONTENT_LENGTH')
+                
+                if not filename:
+                    return jsonify({'error': 'filename is required'}), 400
+                
+                file_ext = os.path.splitext(filename)[1].lower()
+                if file_ext not in DOCUMENT_EXTENSIONS:
+                    return jsonify({'error': f'File type not allowed. Allowed: {", ".join(DOCUMENT_EXTENSIONS)}'}), 400
+                
+                size = data.get('size')
+                if size is not None and (not isinstance(size, int) or size < 0):
+                    return jsonify({'error': 'size must be a non-negative integer'}), 400
+                if size is not None and max_size and size > max_size:
+                    return jsonify({'error': f'File exceeds {max_size} bytes'}), 413
+                quota_error = self._check_document_quota(g.user['uid'], size)
+                if quota_error:
+                    return quota_error
+                
+                content_type = data.get('content_type') or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+                unique_filename = f"{g.user['uid']}_{datetime.utcnow().timestamp()}_{secure_filename(filename)}"
+                storage_key = f"documents/{g.user['uid']}/{unique_filename}"
                 
-                documents = []
-                for doc in docs:
-                    document = doc.to_dict()
-                    if document:
-                        document['id'] = doc.id
-                        # Don't expose file system path
-                        del document['file_path']
-                        documents.append(document)
+                document_data = {
+                    'user_id': g.user['uid'],
+                    'filename': filename,
+                    'unique_filename': unique_filename,
+                    'document_type': document_type,
+                    'storage_backend': self.storage.name,
+                    'storage_key': storage_key,
+                    'content_type': content_type,
+                    'requested_at': datetime.utcnow(),
+                    'status': 'pending_upload'
+                }
+                if data.get('appointment_id'):
+                    document_data['appointment_id'] = data['appointment_id']
+                
+                document_id = db.collection('documents').add(stamp_updated_at(document_data))[1].id
+                upload = self.storage.signed_upload_url(
+                    storage_key, content_type, max_size, self.app.config.get('SIGNED_URL_EXPIRES', 900)
+                )
+                
+                return jsonify({
+                    'document_id': document_id,
+                    'upload': upload.to_dict(),
+                    'complete_url': f"/api/documents/{document_id}/complete"
+                }), 201
+            
+            except Exception as e:
+                return jsonify({'error': str(e)}), 500
+        
+        @self.app.route('/api/documents/<document_id>/complete', methods=['POST'])
+        @self._require_auth
+        def complete_upload(document_id):
+            """Finalize a signed upload once the client has PUT the file"""
+            try:
+                doc_ref = db.collection('documents').document(document_id)
+                doc = doc_ref.get()
                 
-                return jsonify({'documents': documents})
+                if not doc.exists:
+                    return jsonify({'error': 'Document not found'}), 404
+                
+                document = doc.to_dict()
+                if document['user_id'] != g.user['uid']:
+                    return jsonify({'error': 'Access denied'}), 403
+                if document.get('status') != 'pending_upload':
+                    return jsonify({'message': 'Document already uploaded', 'document_id': document_id}), 200
+                
+                stored = self.storage.stat(document['storage_key'])
+                if stored is None:
+                    return jsonify({'error': 'File has not been uploaded'}), 409
+                
+                max_size = self.app.config.get('MAX_CONTENT_LENGTH')
+                if max_size and stored.size > max_size:
+                    rejection = jsonify({'error': f'File exceeds {max_size} bytes'}), 413
+                else:
+                    # The size given for the upload URL was the client's word; check what was stored
+                    rejection = self._check_document_quota(document['user_id'], stored.size)
+                if rejection:
+                    # A rejected upload keeps neither its record nor its file; a complete that won the race keeps both
+                    if DocumentRepository().discard_pending(document_id):
+                        self.storage.delete(document['storage_key'])
+                    return rejection
+                
+                updates = {
+                    'file_size': stored.size,
+                    'md5': stored.md5,
+                    'content_type': stored.content_type or document.get('content_type'),
+                    'uploaded_at': datetime.utcnow(),
+                    'status': 'uploaded',
+                    'processing_status': 'pending'
+                }
+                if stored.sha256:
+                    updates['sha256'] = stored.sha256
+                # Concurrent completes both see pending_upload above; only the one that flips it counts the upload
+                if not DocumentRepository().mark_uploaded(document_id, updates):
+                    return jsonify({'message': 'Document already uploaded', 'document_id': document_id}), 200
+                StorageUsageRepository().record(document['user_id'], stored.size)
+                self.document_processor.submit(document_id, {**document, **updates})
+                
+                self._track_document_upload(document_id, document.get('document_type'), document.get('filename'))
                 
+                return jsonify({
+                    'message': 'Document uploaded successfully',
+                    'document_id': document_id,
+                    'filename': document.get('filename'),
+                    'file_size': stored.size
+                }), 200
+            
+            except Exception as e:
+                return jsonify({'error': str(e)}), 500
+        
+        @self.app.route('/api/documents/<document_id>/download-url', methods=['GET'])
+        @self._require_auth
+        def get_download_url(document_id):
+            """Signed URL to download a document straight from storage"""
+            try:
+                doc = db.collection('documents').document(document_id).get()
+                
+                if not doc.exists:
+                    return jsonify({'error': 'Document not found'}), 404
+                
+                document = doc.to_dict()
+                if document['user_id'] != g.user['uid'] and g.user['role'] not in ['admin', 'staff']:
+                    return jsonify({'error': 'Access denied'}), 403
+                if document.get('status') == 'pending_upload' or not document.get('storage_key'):
+                    return jsonify({'error': 'Document file is not available for download'}), 409
+                
+                download = self.storage.signed_download_url(
+                    document['storage_key'],
+                    secure_filename(document.get('filename', '')) or None,
+                    self.app.config.get('SIGNED_URL_EXPIRES', 900)
+                )
+                return jsonify({'document_id': document_id, 'download': download.to_dict()})
+            
+            except Exception as e:
+                return jsonify({'error': str(e)}), 500
+        
+        @self.app.route('/api/documents/<document_id>/download', methods=['GET'])
+        @self._require_auth
+        def download_document(document_id):
+            """Download a document's file (supports Range and If-None-Match)"""
+            try:
+                doc = db.collection('documents').document(document_id).get()
+                
+                if not doc.exists:
+                    return jsonify({'error': 'Document not found'}), 404
+                
+                document = doc.to_dict()
+                
+                # Check ownership or admin access
+                if document['user_id'] != g.user['uid'] and g.user['role'] not in ['admin', 'staff']:
+                    return jsonify({'error': 'Access denied'}), 403
+                if document.get('status') == 'pending_upload':
+                    return jsonify({'error': 'Document file is not available for download'}), 409
+                
+                return self._send_document(document)
+            
+            except Exception as e:
+                return jsonify({'error': str(e)}), 500
+        
+        @self.app.route('/api/documents', methods=['GET'])
+        @self._require_auth
+        def get_user_documents():
+            """Get a page of the user's documents (?limit=, ?cursor=, ?document_type=, ?appointment_id=)"""
+            try:
+                filters = {field: request.args.get(field) for field in DOCUMENT_LIST_FILTERS}
+                try:
+                    documents, next_cursor = DocumentRepository().list_for_user(
+                        g.user['uid'],
+                        filters,
+                        limit=request.args.get('limit', DOCUMENT_PAGE_SIZE, type=int),
+                        cursor=request.args.get('cursor')
+                    )
+                except ValueError as e:
+                    return jsonify({'error': str(e)}), 400
+                
+                for document in documents:
+                    # Don't expose file system paths or storage keys
+                    document.pop('file_path', None)
+                    document.pop('storage_key', None)
+                    document.pop('thumbnail_key', None)
+                    document.pop('optimized_key', None)
+                
+                return jsonify({'documents': documents, 'next_cursor': next_cursor})
+            
+            except Exception as e:
+                return jsonify({'error': str(e)}), 500
+        
+        @self.app.route('/api/documents/usage', methods=['GET'])
+        @self._require_auth
+        def get_document_usage():
+            """Bytes and number of documents the user has stored, and their quota"""
+            try:
+                usage = StorageUsageRepository().usage(g.user['uid'])
+                return jsonify({**usage, 'quota_bytes': self.app.config.get('DOCUMENT_QUOTA_BYTES') or None})
             except Exception as e:
                 return jsonify({'error': str(e)}), 500
         
@@ -1924,19 +2290,395 @@ If you need assistance, please contact our office directly.
                 if document['user_id'] != g.user['uid'] and g.user['role'] not in ['admin', 'staff']:
                     return jsonify({'error': 'Access denied'}), 403
                 
-                # Delete physical file
+                # Delete the stored file (documents from before storage backends have a local path)
                 file_path = document.get('file_path')
-                if file_path and os.path.exists(file_path):
-                    os.remove(file_path)
-                
-                # Delete from database
-                doc_ref.delete()
+                if is_content_key(document.get('storage_key')):
+                    # Shared blob: only removed, with its thumbnails, once nothing references it. The record
+                    # is deleted in the same transaction as the reference, so a retry can't release it twice
+                    released = self.content_store.release(document['sha256'], document_ref=doc_ref)
+                    if released is None:
+                        return jsonify({'error': 'Document not found'}), 404
+                    if released:
+                        for key in derived_keys(document):
+                            self.storage.delete(key)
+                else:
+                    if document.get('storage_key'):
+                        for key in [document['storage_key']] + derived_keys(document):
+                            self.storage.delete(key)
+                    elif file_path and os.path.exists(file_path):
+                        os.remove(file_path)
+                    
+                    # Delete from database
+                    doc_ref.delete()
+                if document.get('status') != 'pending_upload':
+                    StorageUsageRepository().record(document['user_id'], -(document.get('file_size') or 0), -1)
                 
                 return jsonify({'message': 'Document deleted successfully'})
                 
             except Exception as e:
                 return jsonify({'error': str(e)}), 500
     
+    def _register_storage_gc_routes(self):
+        """Storage garbage collection routes"""
+        
+        @self.app.route('/api/admin/storage/gc', methods=['POST'])
+        @self._require_role(['admin'])
+        def start_storage_gc():
+            """Start a GC run in the background (?dry_run=true only counts orphans)"""
+            try:
+                dry_run = request.args.get('dry_run', 'false').lower() == 'true'
+                run = self.storage_gc.start(dry_run, started_by=g.user['uid'])
+                return jsonify({**run.to_dict(), 'status_url': f'/api/admin/storage/gc/{run.id}'}), 202
+            except Exception as e:
+                logger.error(f"Storage GC error: {e}")
+                return jsonify({'error': str(e)}), 500
+        
+        @self.app.route('/api/admin/storage/gc/<run_id>', methods=['GET'])
+        @self._require_role(['admin'])
+        def storage_gc_status(run_id):
+            """Progress and reclaimed bytes of a GC run"""
+            run = self.storage_gc.get(run_id)
+            if not run:
+                return jsonify({'error': 'GC run not found'}), 404
+            return jsonify(run.to_dict()), 200
+    
+    def _remaining_document_quota(self, uid: str) -> Optional[int]:
+        """Bytes the user may still store under DOCUMENT_QUOTA_BYTES, or None without a quota"""
+        quota = self.app.config.get('DOCUMENT_QUOTA_BYTES')
+        if not quota:
+            return None
+        return max(quota - StorageUsageRepository().usage(uid)['bytes'], 0)
+    
+    def _check_document_quota(self, uid: str, size: Optional[int]):
+        """Error response if storing size more bytes would take the user over DOCUMENT_QUOTA_BYTES"""
+        quota = self.app.config.get('DOCUMENT_QUOTA_BYTES')
+        if not quota:
+            return None
+        usage = StorageUsageRepository().usage(uid)
+        if usage['bytes'] + (size or 0) > quota:
+            return jsonify({'error': 'Storage quota exceeded', 'used_bytes': usage['bytes'], 'quota_bytes': quota}), 403
+        return None
+    
+    def _send_document(self, document: Dict[str, Any]):
+        """Response serving a document's file without reading it into the app"""
+        filename = secure_filename(document.get('filename', '')) or 'document'
+        mimetype = (document.get('mime_type') or document.get('content_type')
+                    or mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+        # Stored content never changes under a key, so its checksum is a strong validator
+        etag = document.get('sha256') or document.get('md5')
+        
+        if etag and request.if_none_match.contains_weak(etag):
+            response = self.app.response_class(status=304)
+            response.set_etag(etag)
+            return response
+        
+        key = document.get('storage_key')
+        path = self.storage.local_path(key) if key else document.get('file_path')
+        if path is None:
+            # Cloud Storage serves the bytes (and ranges) itself
+            download = self.storage.signed_download_url(key, filename, self.app.config.get('SIGNED_URL_EXPIRES', 900))
+            return redirect(download.url, code=302)
+        if not os.path.isfile(path):
+            return jsonify({'error': 'Document file is missing from storage'}), 404
+        
+        accel_prefix = self.app.config.get('DOCUMENT_ACCEL_REDIRECT')
+        if accel_prefix and key:
+            # nginx sends the file, including Range requests, from an internal location
+            response = self.app.response_class(mimetype=mimetype)
+            response.headers['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + key
+            response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+            if etag:
+                response.set_etag(etag)
+        else:
+            # conditional=True answers Range and If-Range requests with 206; the file goes out
+            # via wsgi.file_wrapper (sendfile under gunicorn) or X-Sendfile with USE_X_SENDFILE
+            response = send_file(path, mimetype=mimetype, as_attachment=True, download_name=filename,
+                                 conditional=True, etag=etag or True)
+        response.cache_control.private = True
+        return response
+    
+    def _track_document_upload(self, document_id: str, document_type: Optional[str], filename: Optional[str]):
+        """Track document upload analytics (get NIC for citizens)"""
+        try:
+            if g.user.get('role') == 'citizen':
+                nic = CitizenRepository().nic_for_firebase_uid(g.user['uid'])
+                if nic:
+                    self._track_analytics_event('document_uploaded', nic, None, {
+                        'documentId': document_id,
+                        'documentType': document_type,
+                        'filename': filename
+                    })
+        except Exception as analytics_error:
+            logger.error(f"Analytics tracking error for document upload: {analytics_error}")
+    
+    def _register_async_routes(self):
+        """Swap the hot booking and analytics handlers for asyncio variants
+        
+        The URL rules registered above are kept as-is; only the view function
+        behind each endpoint is replaced, so sync and async modes share one
+        route table. Independent Firestore round trips are issued concurrently
+        through the async client instead of one after another.
+        
+        Every async view runs on firebase_manager's one long-lived loop, which
+        owns the shared async client, rather than on a fresh loop per request.
+        """
+        def async_to_sync(view):
+            @wraps(view)
+            def run_on_shared_loop(*args, **kwargs):
+                return firebase_manager.run(view(*args, **kwargs))
+            return run_on_shared_loop
+        
+        self.app.async_to_sync = async_to_sync
+        
+        # Registering the views touches no client: Firebase is initialized by the first request
+        adb = lazy_async_db
+        
+        async def read_collection(collection_name: str) -> List[Optional[Dict[str, Any]]]:
+            return [doc.to_dict() async for doc in adb.collection(collection_name).stream()]
+        
+        async def read_appointment_collections(fields: Optional[List[str]] = None,
+                                               return_exceptions: bool = False) -> Dict[str, Any]:
+            repositories = AppointmentRepository.all_departments(db=adb)
+            results = await asyncio.gather(
+                *(repository.fetch_async('scan', repository.query(fields=fields)) for repository in repositories),
+                return_exceptions=return_exceptions
+            )
+            return {repository.department: records for repository, records in zip(repositories, results)}
+        
+        async def create_appointment(department):
+            try:
+                data = request.get_json()
+                user_id = g.user['uid']
+                
+                if g.user['role'] != 'citizen':
+                    return jsonify({'error': 'Only citizens can book appointments'}), 403
+                
+                department_id = department.lower()
+                slots = TimeSlotRepository.for_department(department_id, db=adb)
+                appointments = AppointmentRepository.for_department(department_id, db=adb)
+                if not slots:
+                    return jsonify({'error': 'Invalid department'}), 400
+                
+                slot_id = data.get('timeSlotId')
+                
+                # Citizen lookup and slot read are independent
+                citizen, slot_data = await asyncio.gather(
+                    CitizenRepository(db=adb).find_one_async([('uid', '==', user_id)], fields=ID_ONLY_FIELDS),
+                    slots.get_async(slot_id)
+                )
+                
+                if not citizen:
+                    return jsonify({'error': 'Citizen profile not found'}), 404
+                nic = citizen['id']
+                
+                if slot_data is None:
+                    return jsonify({'error': 'Time slot not found'}), 404
+                
+                if slot_data.get('availability') != 'available':
+                    return jsonify({'error': 'Time slot not available'}), 400
+                
+                appointment_data = self._build_appointment_data(department, nic, slot_id, slot_data, data)
+                appointment_id = appointment_data['appointmentId']
+                ref_code = appointment_data['reference']
+                
+                await asyncio.gather(
+                    appointments.set_async(appointment_id, appointment_data),
+                    slots.update_async(slot_id, {
+                        'availability': 'booked',
+                        'bookedBy': nic,
+                        'bookedAt': datetime.utcnow()
+                    })
+                )
+                
+                # Analytics and notifications go through the sync helpers, off the event loop
+                await asyncio.gather(
+                    asyncio.to_thread(self._track_analytics_event, 'booking_created', nic, department_id, {
+                        'appointmentId': appointment_id,
+                        'reference': ref_code
+                    }),
+                    asyncio.to_thread(
+                        self._send_notification,
+                        user_id,
+                        'Appointment Confirmed',
+                        f'Your {department} appointment has been confirmed. Reference: {ref_code}'
+                    )
+                )
+                
+                return jsonify({
+                    'message': 'Appointment created successfully',
+                    'appointmentId': appointment_id,
+                    'reference': ref_code,
+                    'qrCode': appointment_data['qrCode']
+                }), 201
+            
+            except Exception as e:
+                logger.error(f"Create appointment error: {e}")
+                return jsonify({'error': str(e)}), 500
+        
+        async def get_user_appointments(nic):
+            try:
+                if g.user.get('role') == 'citizen':
+                    citizen = await CitizenRepository(db=adb).find_one_async(
+                        [('firebaseUid', '==', g.user['uid'])], fields=ID_ONLY_FIELDS
+                    )
+                    if not citizen or citizen['id'] != nic:
+                        return jsonify({'error': 'Access denied'}), 403
+                
+                try:
+                    fields = self._requested_fields()
+                except ValueError as e:
+                    return jsonify({'error': str(e)}), 400
+                
+                repositories = AppointmentRepository.all_departments(db=adb)
+                results = await asyncio.gather(*(
+                    repository.fetch_async('find_by_nic', repository.by_nic_query(nic, fields))
+                    for repository in repositories
+                ))
+                
+                appointments = []
+                for repository, records in zip(repositories, results):
+                    for appointment in records:
+                        appointment['department'] = repository.department
+                        appointments.append(appointment)
+                
+                return jsonify({'appointments': appointments})
+            
+            except Exception as e:
+                return jsonify({'error': str(e)}), 500
+        
+        async def analytics_summary():
+            try:
+                summary = {
+                    'total_appointments': 0,
+                    'departments': {},
+                    'generated_at': datetime.utcnow().isoformat()
+                }
+                
+                for dept, records in (await read_appointment_collections(STATUS_FIELDS)).items():
+                    breakdown = self._appointment_status_breakdown(records)
+                    summary['total_appointments'] += breakdown['total']
+                    summary['departments'][dept] = breakdown
+                
+                return jsonify(summary)
+            
+            except Exception as e:
+                return jsonify({'error': str(e)}), 500
+        
+        async def peak_booking_hours():
+            try:
+                hour_counts = {}
+                for records in (await read_appointment_collections(SCHEDULE_FIELDS)).values():
+                    self._count_peak_hours(records, hour_counts)
+                
+                return jsonify(hour_counts)
+            
+            except Exception as e:
+                logger.error(f"Peak hours analytics error: {e}")
+                return jsonify({'error': str(e)}), 500
+        
+        async def department_load():
+            try:
+                load = {}
+                loaded = await read_appointment_collections(ID_ONLY_FIELDS, return_exceptions=True)
+                for dept_name, records in loaded.items():
+                    if isinstance(records, Exception):
+                        logger.error(f"Error getting load for {dept_name}: {records}")
+                        load[dept_name] = 0
+                    else:
+                        load[dept_name] = len(records)
+                
+                return jsonify(load)
+            
+            except Exception as e:
+                logger.error(f"Department load analytics error: {e}")
+                return jsonify({'error': str(e)}), 500
+        
+        async def no_show_rate():
+            try:
+                rates = {}
+                loaded = await read_appointment_collections(STATUS_FIELDS, return_exceptions=True)
+                for dept_name, records in loaded.items():
+                    if isinstance(records, Exception):
+                        logger.error(f"Error calculating no-show rate for {dept_name}: {records}")
+                        records = []
+                    rates[dept_name] = self._no_show_stats(records)
+                
+                return jsonify(rates)
+            
+            except Exception as e:
+                logger.error(f"No-show rate analytics error: {e}")
+                return jsonify({'error': str(e)}), 500
+        
+        async def avg_processing_time():
+            try:
+                avg_times = {}
+                loaded = await read_appointment_collections(PROCESSING_TIME_FIELDS, return_exceptions=True)
+                for dept_name, records in loaded.items():
+                    if isinstance(records, Exception):
+                        logger.error(f"Error calculating processing time for {dept_name}: {records}")
+                        avg_times[dept_name] = dict(NO_PROCESSING_TIME_DATA)
+                    else:
+                        avg_times[dept_name] = self._processing_time_stats(records)
+                
+                return jsonify(avg_times)
+            
+            except Exception as e:
+                logger.error(f"Processing time analytics error: {e}")
+                return jsonify({'error': str(e)}), 500
+        
+        async def analytics_dashboard():
+            try:
+                appointments, events = await asyncio.gather(
+                    read_appointment_collections(STATUS_FIELDS),
+                    read_collection('analytics_events'),
+                    return_exceptions=True
+                )
+                if isinstance(appointments, Exception):
+                    raise appointments
+                
+                departments_summary = {
+                    dept: self._appointment_status_breakdown(records)
+                    for dept, records in appointments.items()
+                }
+                
+                if isinstance(events, Exception):
+                    logger.error(f"Error getting user activity analytics: {events}")
+                    events = []
+                
+                return jsonify({
+                    'generated_at': datetime.utcnow().isoformat(),
+                    'summary': {
+                        'total_appointments': sum(d['total'] for d in departments_summary.values()),
+                        'departments': departments_summary
+                    },
+                    'peak_hours': {},
+                    'department_load': {},
+                    'no_show_rates': {},
+                    'processing_times': {},
+                    'user_activity': self._user_activity_stats(events)
+                })
+            
+            except Exception as e:
+                logger.error(f"Analytics dashboard error: {e}")
+                return jsonify({'error': str(e)}), 500
+        
+        analytics_role = self._require_role(['admin', 'officer'])
+        async_views = {
+            'create_appointment': self._require_auth(create_appointment),
+            'get_user_appointments': self._require_auth(get_user_appointments),
+            'analytics_summary': analytics_role(analytics_summary),
+            'peak_booking_hours': analytics_role(peak_booking_hours),
+            'department_load': analytics_role(department_load),
+            'no_show_rate': analytics_role(no_show_rate),
+            'avg_processing_time': analytics_role(avg_processing_time),
+            'analytics_dashboard': analytics_role(analytics_dashboard)
+        }
+        
+        for endpoint, view in async_views.items():
+            self.app.view_functions[endpoint] = view
+        
+        logger.info(f"Async views enabled for {len(async_views)} endpoints")
+    
     def _setup_error_handlers(self):
         """Setup error handlers"""
         
@@ -1957,32 +2699,59 @@ If you need assistance, please contact our office directly.
         def unauthorized(error):
             return jsonify({'error': 'Authentication required'}), 401
     
+    def _authenticate_request(self):
+        """Decode the bearer token into g.user; returns an error response on failure"""
+        auth_header = request.headers.get('Authorization')
+        
+        if not auth_header or not auth_header.startswith('Bearer '):
+            return jsonify({'error': 'Authorization header required'}), 401
+        
+        token = auth_header.split(' ')[1]
+        
+        try:
+            payload = jwt.decode(token, self.app.config['SECRET_KEY'], algorithms=['HS256'])
+            g.user = payload
+        except jwt.ExpiredSignatureError:
+            return jsonify({'error': 'Token has expired'}), 401
+        except jwt.InvalidTokenError:
+            return jsonify({'error': 'Invalid token'}), 401
+        
+        return None
+    
     def _require_auth(self, f):
-        """Authentication decorator"""
+        """Authentication decorator (works for sync and async views)"""
+        if inspect.iscoroutinefunction(f):
+            @wraps(f)
+            async def decorated_coroutine(*args, **kwargs):
+                error = self._authenticate_request()
+                if error:
+                    return error
+                return await f(*args, **kwargs)
+            
+            return decorated_coroutine
+        
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            auth_header = request.headers.get('Authorization')
-            
-            if not auth_header or not auth_header.startswith('Bearer '):
-                return jsonify({'error': 'Authorization header required'}), 401
-            
-            token = auth_header.split(' ')[1]
-            
-            try:
-                payload = jwt.decode(token, self.app.config['SECRET_KEY'], algorithms=['HS256'])
-                g.user = payload
-            except jwt.ExpiredSignatureError:
-                return jsonify({'error': 'Token has expired'}), 401
-            except jwt.InvalidTokenError:
-                return jsonify({'error': 'Invalid token'}), 401
-            
+            error = self._authenticate_request()
+            if error:
+                return error
             return f(*args, **kwargs)
         
         return decorated_function
     
     def _require_role(self, allowed_roles):
-        """Role-based access decorator"""
+        """Role-based access decorator (works for sync and async views)"""
         def decorator(f):
+            if inspect.iscoroutinefunction(f):
+                @wraps(f)
+                @self._require_auth
+                async def decorated_coroutine(*args, **kwargs):
+                    user_role = g.user.get('role')
+                    if user_role not in allowed_roles:
+                        return jsonify({'error': 'Insufficient permissions'}), 403
+                    return await f(*args, **kwargs)
+                return decorated_coroutine
+            
             @wraps(f)
             @self._require_auth
             def decorated_function(*args, **kwargs):
@@ -2015,7 +2784,7 @@ If you need assistance, please contact our office directly.
                 'is_read': False
             }
             
-            doc_ref = db.collection('notifications').add(notification_data)
+            doc_ref = db.collection('notifications').add(stamp_updated_at(notification_data))
             
             # Send real-time notification via SocketIO
             self.socketio.emit('new_notification', {
@@ -0,0 +1,98 @@
+"""
+Availability index against a fake Firestore snapshot listener
+
+Run with: python -m pytest tests
+"""
+
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from database.availability import AvailabilityIndex
+from database.change_feed import ChangeFeedHub
+
+T0 = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+class FakeDocument:
+    def __init__(self, doc_id, data, time=T0):
+        self.id = doc_id
+        self._data = data
+        self.create_time = self.update_time = time
+    
+    def to_dict(self):
+        return dict(self._data)
+
+
+class FakeWatch:
+    def __init__(self, callback):
+        self.callback = callback
+        self.is_active = True
+    
+    def unsubscribe(self):
+        self.is_active = False
+    
+    def snapshot(self, documents, changes, read_time):
+        changes = [SimpleNamespace(type=SimpleNamespace(name=kind), document=document) for kind, document in changes]
+        self.callback(documents, changes, read_time)
+
+
+class FakeQuery:
+    def __init__(self, db, collection, where=None):
+        self.db, self.collection, self.where_args = db, collection, where
+    
+    def where(self, *args):
+        return FakeQuery(self.db, self.collection, args)
+    
+    def on_snapshot(self, callback):
+        watch = FakeWatch(callback)
+        self.db.watches.setdefault(self.collection, []).append((watch, self.where_args))
+        return watch
+
+
+class FakeDB:
+    def __init__(self):
+        self.watches = {}
+    
+    def collection(self, name):
+        return FakeQuery(self, name)
+    
+    def watch(self, collection):
+        """The collection's current (latest) listener"""
+        return self.watches[collection][-1][0]
+
+
+def slot(date, start='09:00'):
+    return {'date': date, 'startTime': start, 'availability': 'available'}
+
+
+def test_index_joins_running_feed():
+    db = FakeDB()
+    hub = ChangeFeedHub(db)
+    tomorrow = (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d')
+    first = FakeDocument('p1', slot(tomorrow))
+    
+    # Another subscriber already runs the passport feed, unscoped
+    hub.subscribe('passportTimeSlots', lambda event: None, name='early')
+    db.watch('passportTimeSlots').snapshot([first], [('ADDED', first)], T0)
+    
+    index = AvailabilityIndex(hub)
+    index.start()
+    assert not index.ready
+    
+    # set_scope restarted the passport feed; a resumed listener reports no changes for unchanged documents
+    assert len(db.watches['passportTimeSlots']) == 2
+    assert db.watches['passportTimeSlots'][-1][1][:2] == ('date', '>=')
+    second = FakeDocument('p2', slot(tomorrow, '10:00'), T0 + timedelta(hours=1))
+    db.watch('passportTimeSlots').snapshot([first, second], [('ADDED', second)], T0 + timedelta(hours=1))
+    for collection in ('licenseTimeSlots', 'medicalTimeSlots'):
+        db.watch(collection).snapshot([], [], T0 + timedelta(hours=1))
+    
+    assert index.ready
+    assert [s['id'] for s in index.earliest(['passport'], datetime.now(), tomorrow)] == ['p1', 'p2']
+    
+    # A second index joins the now scoped feeds without restarting them and is filled by a replay
+    late = AvailabilityIndex(hub)
+    late.start()
+    assert len(db.watches['passportTimeSlots']) == 2
+    assert late.ready
+    assert [s['id'] for s in late.earliest(['passport'], datetime.now(), tomorrow)] == ['p1', 'p2']